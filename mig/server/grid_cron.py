@@ -78,8 +78,8 @@ from mig.shared.cmdapi import parse_command_args
 from mig.shared.conf import get_configuration_object
 from mig.shared.defaults import crontab_name, atjobs_name, cron_output_dir, \
     cron_log_name, cron_log_size, cron_log_cnt, csrf_field
-from mig.shared.events import get_time_expand_map, parse_crontab, cron_match, \
-    parse_atjobs, at_remain
+from mig.shared.cronschedule import CronSchedule
+from mig.shared.events import get_time_expand_map, parse_crontab, parse_atjobs
 from mig.shared.fileio import makedirs_rec
 from mig.shared.handlers import get_csrf_limit, make_csrf_token
 from mig.shared.job import fill_mrsl_template, new_job
@@ -90,6 +90,10 @@ from mig.shared.output import txt_format
 
 all_crontabs, all_atjobs = {}, {}
 
+# Global schedule with the next fire time of all crontab and atjobs entries
+
+cron_schedule = CronSchedule()
+
 # TODO: we only run ONE handler process - eliminate shared state?
 
 # Global state helpers used in a number of functions and methods
@@ -294,6 +298,7 @@ class MiGCrontabEventHandler(PatternMatchingEventHandler):
             # Replace crontabs for this user
 
             all_crontabs[src_path] = cur_crontab
+            cron_schedule.set_crontab(src_path, cur_crontab)
             logger.debug('(%s) all crontabs: %s' % (pid, all_crontabs))
         elif os.path.basename(src_path) == atjobs_name:
             logger.debug('(%s) %s -> Updating atjobs for: %s' % (pid,
@@ -316,6 +321,7 @@ class MiGCrontabEventHandler(PatternMatchingEventHandler):
             # Replace atjobs for this user
 
             all_atjobs[src_path] = cur_atjobs
+            cron_schedule.set_atjobs(src_path, cur_atjobs)
             logger.debug('(%s) all atjobs: %s' % (pid, all_atjobs))
         else:
             logger.debug('(%s) %s skipping non-cron file: %s' % (pid,
@@ -528,39 +534,20 @@ def monitor(configuration):
         try:
             loop_start = datetime.datetime.now()
             loop_minute = loop_start.replace(second=0, microsecond=0)
-            logger.debug('main loop started with %d crontabs and %d atjobs' %
-                         (len(all_crontabs), len(all_atjobs)))
-            for crontab_path, user_crontab in all_crontabs.items():
-                client_dir = os.path.basename(os.path.dirname(crontab_path))
-                client_id = client_dir_id(client_dir)
-                for entry in user_crontab:
-                    logger.debug('inspect cron entry for %s: %s' %
-                                 (client_id, entry))
-                    if cron_match(configuration, loop_minute, entry):
-                        logger.info('run matching cron entry: %s' % entry)
-                        run_handler(configuration, client_id, loop_minute,
-                                    entry)
-            for atjobs_path, user_atjobs in all_atjobs.items():
-                client_dir = os.path.basename(os.path.dirname(atjobs_path))
+            logger.debug('main loop started with %d crontabs and %d atjobs'
+                         ' holding %d scheduled entries' %
+                         (len(all_crontabs), len(all_atjobs),
+                          len(cron_schedule)))
+            (due, missed) = cron_schedule.pop_due(loop_minute)
+            for (path, entry, when) in missed:
+                # NOTE: cron entries only run in their exact minute
+                logger.warning('skip entry missed at %s: %s' % (when, entry))
+            for (path, entry) in due:
+                client_dir = os.path.basename(os.path.dirname(path))
                 client_id = client_dir_id(client_dir)
-                remaining = []
-                for entry in user_atjobs:
-                    logger.debug('inspect atjobs entry for %s: %s' %
-                                 (client_id, entry))
-                    remain_mins = at_remain(configuration, loop_minute, entry)
-                    if remain_mins == 0:
-                        logger.info('run matching at entry: %s' % entry)
-                        run_handler(configuration, client_id, loop_minute,
-                                    entry)
-                    elif remain_mins > 0:
-                        remaining.append(entry)
-                    else:
-                        logger.info('removing expired at job: %s' % entry)
-                # Update remaining jobs to clean up expired
-                if remaining:
-                    all_atjobs[atjobs_path] = remaining
-                else:
-                    del all_atjobs[atjobs_path]
+                logger.info('run due %s entry for %s: %s' %
+                            (os.path.basename(path), client_id, entry))
+                run_handler(configuration, client_id, loop_minute, entry)
         except KeyboardInterrupt:
             print('(%s) caught interrupt' % pid)
             stop_running.set()
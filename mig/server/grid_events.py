@@ -35,14 +35,12 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import datetime
-import fnmatch
 import glob
 import itertools
 import logging
 import logging.handlers
 import multiprocessing
 import os
-import re
 import shutil
 import signal
 import sys
@@ -77,12 +75,15 @@ else:
         sys.exit(1)
 
 try:
-    from mig.shared.base import force_utf8
+    from mig.shared.base import force_utf8, force_native_str
     from mig.shared.cmdapi import parse_command_args
     from mig.shared.conf import get_configuration_object
     from mig.shared.defaults import valid_trigger_changes, workflows_log_name, \
-        workflows_log_size, workflows_log_cnt, csrf_field, default_vgrid
-    from mig.shared.events import get_path_expand_map
+        workflows_log_size, workflows_log_cnt, csrf_field, default_vgrid, \
+        dir_cache_max_parallel_scans
+    from mig.shared.dircache import DirCache, scan_dir_tree
+    from mig.shared.events import get_path_expand_map, \
+        build_trigger_matcher, match_trigger_rules
     from mig.shared.fileio import makedirs_rec, pickle, unpickle, walk
     from mig.shared.handlers import get_csrf_limit, make_csrf_token
     from mig.shared.job import fill_mrsl_template, new_job
@@ -119,6 +120,12 @@ shared_state['file_inotify'] = None
 shared_state['file_handler'] = None
 shared_state['rule_handler'] = None
 shared_state['rule_inotify'] = None
+shared_state['scan_slots'] = None
+
+# Precompiled trigger matcher for all_rules - replaced as a whole on rule
+# updates so that event handling always works on a consistent snapshot.
+
+shared_state['rule_matcher'] = build_trigger_matcher(all_rules)
 
 # Only cache rule misses for one minute at a time to catch rule updates.
 # Run complete expire cycle if miss cache exceeds expire size.
@@ -639,6 +646,12 @@ class MiGRuleEventHandler(PatternMatchingEventHandler):
                 all_rules[abs_path] = all_rules.get(abs_path, []) \
                     + [entry]
 
+            # Rebuild the compiled matcher once per rule file update
+
+            shared_state['rule_matcher'] = build_trigger_matcher(all_rules)
+            logger.debug('(%s) rebuilt trigger matcher with %d patterns' %
+                         (pid, shared_state['rule_matcher']['patterns']))
+
             # logger.debug('(%s) all rules:\n%s' % (pid, all_rules))
         # else:
         #    logger.debug('(%s) %s skipping _NON_ rule file: %s' % (pid,
@@ -1122,7 +1135,15 @@ class MiGFileEventHandler(PatternMatchingEventHandler):
 
         # If dir_modified is due to a file event we ignore it
 
-        if is_directory and state == 'created':
+        if is_directory and state == 'deleted':
+            src_path = self.__get_masked_event_path(event)
+            rel_path = strip_base_dirs(src_path)
+            vgrid_name = rel_path.split(os.sep)[0]
+
+            # Keep dir cache in sync so that it never has to be rebuilt
+
+            get_vgrid_dir_cache(vgrid_name).remove(rel_path)
+        elif is_directory and state == 'created':
             src_path = self.__get_masked_event_path(event)
 
             rel_path = strip_base_dirs(src_path)
@@ -1131,21 +1152,18 @@ class MiGFileEventHandler(PatternMatchingEventHandler):
             # extracts vgrid_name and specific dir_cache ?
 
             vgrid_name = rel_path.split(os.sep)[0]
-            if vgrid_name not in dir_cache:
-                dir_cache[vgrid_name] = {}
-            vgrid_dir_cache = dir_cache[vgrid_name]
+            vgrid_dir_cache = get_vgrid_dir_cache(vgrid_name)
 
             # logger.debug('(%s) Updating file monitor for src_path: %s, event: %s'
             #              % (pid, src_path, state))
 
             if os.path.exists(src_path) and os.path.isdir(src_path):
                 try:
-                    vgrid_dir_cache[rel_path] = {}
                     rel_path_ctime = os.path.getctime(src_path)
                     rel_path_mtime = os.path.getmtime(src_path)
                     add_vgrid_file_monitor_watch(configuration,
                                                  rel_path)
-                    vgrid_dir_cache[rel_path]['mtime'] = rel_path_mtime
+                    vgrid_dir_cache.set_mtime(rel_path, rel_path_mtime)
 
                     # Check if sub paths or files were changed
                     # For create this occurs by eg. mkdir -p 'path/subpath/subpath2'
@@ -1154,11 +1172,11 @@ class MiGFileEventHandler(PatternMatchingEventHandler):
                     for ent in scandir(src_path):
                         if ent.is_dir(follow_symlinks=True):
                             vgrid_sub_path = strip_base_dirs(ent.path)
+                            vgrid_sub_mtime = vgrid_dir_cache.get_mtime(
+                                vgrid_sub_path)
 
-                            if not vgrid_sub_path in \
-                                    vgrid_dir_cache or \
-                                    vgrid_dir_cache[vgrid_sub_path]['mtime'] \
-                                    < rel_path_ctime:
+                            if vgrid_sub_mtime is None or \
+                                    vgrid_sub_mtime < rel_path_ctime:
 
                                 # logger.debug('(%s) %s -> Dispatch DirCreatedEvent for: %s'
                                 #         % (pid, src_path, ent.path))
@@ -1291,103 +1309,93 @@ class MiGFileEventHandler(PatternMatchingEventHandler):
 
         rule_hit = False
 
-        # Each target_path pattern has one or more rules associated
-
-        for (target_path, rule_list) in all_rules.items():
-
-            # Do not use ordinary fnmatch as it lets '*' match anything
-            # including '/' which leads to greedy matching in subdirs
-
-            recursive_regexp = fnmatch.translate(target_path)
-            direct_regexp = recursive_regexp.replace('.*', '[^/]*')
-            recursive_hit = re.match(recursive_regexp, src_path)
-            direct_hit = re.match(direct_regexp, src_path)
+        # Each target_path pattern has one or more rules associated. The
+        # precompiled matcher only returns the patterns matching src_path
+        # either directly or recursively.
 
-            if direct_hit or recursive_hit:
+        rule_matcher = shared_state['rule_matcher']
+        for (target_path, rule_list, direct_hit) in \
+                match_trigger_rules(rule_matcher, src_path):
 
-                # logger.debug('(%s) matched %s for %s and/or %s' % (pid,
-                #             src_path, direct_regexp, recursive_regexp))
+            # logger.debug('(%s) matched %s for %s' % (pid, src_path,
+            #             target_path))
 
-                for rule in rule_list:
+            for rule in rule_list:
 
-                    # Rules may listen for only file or dir events and with
-                    # recursive directory search
+                # Rules may listen for only file or dir events and with
+                # recursive directory search
 
-                    if is_directory and not rule.get('match_dirs',
-                                                     False):
+                if is_directory and not rule.get('match_dirs',
+                                                 False):
 
-                        # logger.debug('(%s) skip event %s handling for dir: %s'
-                        #              % (pid, rule['rule_id'], src_path))
+                    # logger.debug('(%s) skip event %s handling for dir: %s'
+                    #              % (pid, rule['rule_id'], src_path))
 
-                        continue
-                    if not is_directory and not rule.get('match_files',
-                                                         True):
+                    continue
+                if not is_directory and not rule.get('match_files',
+                                                     True):
 
-                        # logger.debug('(%s) skip %s event handling for file: %s'
-                        #             % (pid, rule['rule_id'], src_path))
+                    # logger.debug('(%s) skip %s event handling for file: %s'
+                    #             % (pid, rule['rule_id'], src_path))
 
-                        continue
-                    if not direct_hit and not rule.get('match_recursive',
-                                                       False):
+                    continue
+                if not direct_hit and not rule.get('match_recursive',
+                                                   False):
 
-                        # logger.debug('(%s) skip %s recurse event handling for: %s'
-                        #              % (pid, rule['rule_id'], src_path))
+                    # logger.debug('(%s) skip %s recurse event handling for: %s'
+                    #              % (pid, rule['rule_id'], src_path))
 
-                        continue
-                    if not state in rule['changes']:
+                    continue
+                if not state in rule['changes']:
 
-                        # logger.debug('(%s) skip %s %s event handling for: %s'
-                        #         % (pid, rule['rule_id'], state,
-                        #        src_path))
+                    # logger.debug('(%s) skip %s %s event handling for: %s'
+                    #         % (pid, rule['rule_id'], state,
+                    #        src_path))
 
-                        continue
-
-                    # IMPORTANT: keep this vgrid access check last!
-                    # It is far more computationally expensive than the simple
-                    # checks above. We particularly want to filter the common
-                    # storm of events from the system_imagesettings_dir_deleted
-                    # trigger for '*' but only on dirs, before it gets here.
+                    continue
 
-                    # User may have been removed from vgrid - log and ignore
+                # IMPORTANT: keep this vgrid access check last!
+                # It is far more computationally expensive than the simple
+                # checks above. We particularly want to filter the common
+                # storm of events from the system_imagesettings_dir_deleted
+                # trigger for '*' but only on dirs, before it gets here.
 
-                    # logger.debug('(%s) check valid user %s in %s for %s' % \
-                    #              (pid, rule['run_as'], rule['vgrid_name'],
-                    #               rule['rule_id']))
+                # User may have been removed from vgrid - log and ignore
 
-                    if not check_vgrid_access(configuration, rule['run_as'],
-                                              rule['vgrid_name']):
-                        logger.warning('(%s) no such user in vgrid: %s'
-                                       % (pid, rule['run_as']))
-                        continue
+                # logger.debug('(%s) check valid user %s in %s for %s' % \
+                #              (pid, rule['run_as'], rule['vgrid_name'],
+                #               rule['rule_id']))
 
-                    logger.info('(%s) trigger %s for src_path: %s -> %s'
-                                % (pid, rule['action'], src_path,
-                                    rule))
+                if not check_vgrid_access(configuration, rule['run_as'],
+                                          rule['vgrid_name']):
+                    logger.warning('(%s) no such user in vgrid: %s'
+                                   % (pid, rule['run_as']))
+                    continue
 
-                    rule_hit = True
+                logger.info('(%s) trigger %s for src_path: %s -> %s'
+                            % (pid, rule['action'], src_path,
+                                rule))
 
-                    # TODO: Replace try/catch with an event queue or thread
-                    #       pool setup
+                rule_hit = True
 
-                    waiting_for_thread_resources = True
-                    while waiting_for_thread_resources:
-                        try:
-                            worker = \
-                                threading.Thread(target=self.__handle_trigger,
-                                                 args=(event, target_path, rule))
-                            worker.daemon = True
-                            worker.start()
-                            waiting_for_thread_resources = False
-                        except threading.ThreadError as exc:
+                # TODO: Replace try/catch with an event queue or thread
+                #       pool setup
 
-                            # logger.debug('(%s) Waiting for thread resources to handle trigger: %s'
-                            #              % (pid, event))
+                waiting_for_thread_resources = True
+                while waiting_for_thread_resources:
+                    try:
+                        worker = \
+                            threading.Thread(target=self.__handle_trigger,
+                                             args=(event, target_path, rule))
+                        worker.daemon = True
+                        worker.start()
+                        waiting_for_thread_resources = False
+                    except threading.ThreadError as exc:
 
-                            time.sleep(1)
+                        # logger.debug('(%s) Waiting for thread resources to handle trigger: %s'
+                        #              % (pid, event))
 
-            # else:
-            #    logger.debug('(%s) skip %s with no matching rules'
-            #                 % (pid, target_path))
+                        time.sleep(1)
 
         # Finally update rule miss cache for this event
 
@@ -1481,45 +1489,42 @@ def add_vgrid_file_monitor(configuration, vgrid_name, path):
 
     pid = multiprocessing.current_process().pid
 
-    # Make sure we only have utf8 everywhere to avoid encoding issues
-    path = force_utf8(path)
+    # Make sure we only have native strings everywhere to avoid encoding
+    # issues and to match the text keys in the dir cache
+    path = force_native_str(path)
 
     retval = True
-    vgrid_dir_cache = dir_cache[vgrid_name]
+    vgrid_dir_cache = get_vgrid_dir_cache(vgrid_name)
     vgrid_files_path = os.path.join(configuration.vgrid_files_home, path)
 
     if os.path.exists(vgrid_files_path):
         vgrid_files_path_mtime = os.path.getmtime(vgrid_files_path)
 
-        # NOTE: make sure cache entry always gets initialized before use
-        vgrid_dir_cache[path] = vgrid_dir_cache.get(path, {})
-        vgrid_dir_cache[path]['mtime'] = vgrid_dir_cache[path].get('mtime', 0)
-
         try:
             add_vgrid_file_monitor_watch(configuration, path)
 
-            if vgrid_files_path_mtime != vgrid_dir_cache[path]['mtime']:
+            if vgrid_files_path_mtime != vgrid_dir_cache.get_mtime(path, 0):
 
                 # Traverse dirs for subdirs created since last run
 
                 for ent in scandir(vgrid_files_path):
                     if ent.is_dir(follow_symlinks=True):
                         vgrid_sub_path = strip_base_dirs(ent.path)
-                        # Force utf8 everywhere to avoid encoding issues
-                        vgrid_sub_path = force_utf8(vgrid_sub_path)
+                        # Force native strings to avoid encoding issues
+                        vgrid_sub_path = force_native_str(vgrid_sub_path)
                         if not vgrid_sub_path in vgrid_dir_cache:
                             retval &= add_vgrid_file_monitor(configuration,
                                                              vgrid_name,
                                                              vgrid_sub_path)
 
-                vgrid_dir_cache[path]['mtime'] = vgrid_files_path_mtime
+                vgrid_dir_cache.set_mtime(path, vgrid_files_path_mtime)
         except OSError as exc:
             # If we get an OSError, src_path was most likely deleted
             # after os.path.exists check or somehow not accessible
 
             logger.warning('(%s) add_vgrid_file_monitor failed on %s: %s' %
                            (pid, path, exc))
-            del vgrid_dir_cache[path]
+            vgrid_dir_cache.remove(path)
             return False
 
     return retval
@@ -1532,12 +1537,11 @@ def add_vgrid_file_monitors(configuration, vgrid_name):
 
     pid = multiprocessing.current_process().pid
 
-    vgrid_dir_cache = dir_cache[vgrid_name]
+    vgrid_dir_cache = get_vgrid_dir_cache(vgrid_name)
 
-    vgrid_dir_cache_keys = list(vgrid_dir_cache)
-    for path in vgrid_dir_cache_keys:
-        # Make sure we only have utf8 everywhere to avoid encoding issues
-        path = force_utf8(path)
+    for path in vgrid_dir_cache.paths(vgrid_name):
+        # Make sure we only have native strings to avoid encoding issues
+        path = force_native_str(path)
         vgrid_files_path = os.path.join(configuration.vgrid_files_home,
                                         path)
         if os.path.exists(vgrid_files_path):
@@ -1547,145 +1551,128 @@ def add_vgrid_file_monitors(configuration, vgrid_name):
             # logger.debug('(%s) Removing deleted dir: %s from dir_cache'
             #             % (pid, path))
 
-            del vgrid_dir_cache[path]
+            vgrid_dir_cache.remove(path)
 
+    vgrid_dir_cache.flush()
     return True
 
 
+def get_vgrid_dir_cache(vgrid_name):
+    """Return the directory cache for *vgrid_name* from the global dir_cache.
+    Vgrids not loaded in this process get a transient cache.
+    """
+    if vgrid_name not in dir_cache:
+        dir_cache[vgrid_name] = DirCache(':memory:', logger)
+    return dir_cache[vgrid_name]
+
+
 def generate_vgrid_dir_cache(configuration, vgrid_base_path):
     """Generate directory cache for *vgrid_base_path*, using the global
-    dir_cache.
+    dir_cache. The number of vgrids scanned at the same time by the monitor
+    processes is limited by the shared scan_slots semaphore if set.
     """
 
     pid = multiprocessing.current_process().pid
+    vgrid_dir_cache = get_vgrid_dir_cache(vgrid_base_path)
+    scan_slots = shared_state['scan_slots']
+    if scan_slots is not None:
+        scan_slots.acquire()
+    try:
+        scan_t1 = time.time()
+        found = scan_dir_tree(vgrid_dir_cache, configuration.vgrid_files_home,
+                              vgrid_base_path, followlinks=True)
+        scan_t2 = time.time()
+    finally:
+        if scan_slots is not None:
+            scan_slots.release()
+    logger.info('(%s) generated dir cache for: %s with %d dirs in %.3f secs'
+                % (pid, vgrid_base_path, found, scan_t2 - scan_t1))
 
-    vgrid_path = os.path.join(configuration.vgrid_files_home,
-                              vgrid_base_path)
-
-    if vgrid_base_path not in dir_cache:
-        dir_cache[vgrid_base_path] = {}
-
-    vgrid_dir_cache = dir_cache[vgrid_base_path]
-
-    # Add VGrid root to directory cache
-
-    vgrid_dir_cache[vgrid_base_path] = {}
-    vgrid_dir_cache[vgrid_base_path]['mtime'] = \
-        os.path.getmtime(vgrid_path)
-
-    # logger.debug('(%s) Updating dir_cache %s: %s' % (pid,
-    #             vgrid_base_path,
-    #             vgrid_dir_cache[vgrid_base_path]['mtime']))
-
-    # Add VGrid subdirs to directory cache
-
-    for (root, dir_names, _) in walk(vgrid_path, followlinks=True):
-        for dir_name in dir_names:
-            dir_path = os.path.join(root, dir_name)
-            dir_cache_path = strip_base_dirs(dir_path)
-            if dir_cache_path not in vgrid_dir_cache:
-                vgrid_dir_cache[dir_cache_path] = {}
-                vgrid_dir_cache[dir_cache_path]['mtime'] = \
-                    os.path.getmtime(dir_path)
+    return True
 
-                # logger.debug('(%s) Updating dir_cache %s: %s' % (pid,
-                #             dir_cache_path,
-                #             vgrid_dir_cache[dir_cache_path]['mtime']))
 
+def import_old_dir_cache(vgrid_dir_cache, old_cache_filepath):
+    """Import entries from a pickled dir cache of an older version into the
+    *vgrid_dir_cache* index. Returns boolean indicating success.
+    """
+    loaded_dir_cache = unpickle(old_cache_filepath, logger,
+                                allow_missing=False)
+    if loaded_dir_cache is False:
+        return False
+    # NOTE: old entries may be bytes or lack mtime after failed updates
+    vgrid_dir_cache.set_many([(force_native_str(path), entry['mtime'])
+                              for (path, entry) in loaded_dir_cache.items()
+                              if 'mtime' in entry])
+    vgrid_dir_cache.flush()
     return True
 
 
 def load_dir_cache(configuration, vgrid_name):
-    """Load directory cache for *vgrid_name*, into the global dir_cache"""
+    """Load directory cache for *vgrid_name*, into the global dir_cache.
+    The cache index is opened right away but entries are only read on use.
+    It is imported from any old pickled cache or generated from scratch if
+    not yet available.
+    """
 
     result = True
 
     pid = multiprocessing.current_process().pid
 
     vgrid_home_path = os.path.join(configuration.vgrid_home, vgrid_name)
-    vgrid_dir_cache_filename = '.%s.dir_cache' \
-        % configuration.vgrid_triggers
-    vgrid_dir_cache_filepath = os.path.join(vgrid_home_path,
-                                            vgrid_dir_cache_filename)
+    old_cache_filepath = os.path.join(vgrid_home_path, '.%s.dir_cache'
+                                      % configuration.vgrid_triggers)
+    vgrid_dir_cache_filepath = '%s.db' % old_cache_filepath
 
     # logger.debug('(%s) loading dir cache for: %s from: %s' % (pid,
-    #             vgrid_name, vgrid_dir_cache_filename))
-
-    # Load dir cache or generate new cache
-
-    if os.path.exists(vgrid_dir_cache_filepath):
-
-        # cache_t1 = time.time()
+    #             vgrid_name, vgrid_dir_cache_filepath))
 
-        loaded_dir_cache = unpickle(vgrid_dir_cache_filepath, logger,
-                                    allow_missing=False)
+    cache_t1 = time.time()
+    vgrid_dir_cache = DirCache(vgrid_dir_cache_filepath, logger)
+    dir_cache[vgrid_name] = vgrid_dir_cache
 
-        # cache_t2 = time.time()
-        # logger.debug('(%s) Loaded vgrid_dir_cache for: %s in %s secs'
-        #             % (pid, vgrid_name, (cache_t2 - cache_t1))
+    # NOTE: the vgrid root entry is saved last and marks a complete cache
 
-        if loaded_dir_cache is False:
-            generate_cache = True
-            logger.error('(%s) Failed to load vgrid_dir_cache for: %s from file: %s'
-                         % (pid, vgrid_name, vgrid_dir_cache_filepath))
-        else:
-            generate_cache = False
-            # TODO: once all caches are migrated we can remove this loop again
-            # Make sure we only have utf8 everywhere to avoid encoding issues
-            for old_path in [i for i in loaded_dir_cache if i != force_utf8(i)]:
-                print("NOTE: forcing old cache entry %s to utf8" % [old_path])
-                new_path = force_utf8(old_path)
-                entry = loaded_dir_cache[old_path]
-                del loaded_dir_cache[old_path]
-                loaded_dir_cache[new_path] = entry
-
-            dir_cache[vgrid_name] = loaded_dir_cache
-    else:
-        generate_cache = True
-
-    if generate_cache:
-        logger.info('(%s) Force generation of vgrid_dir_cache for: %s' %
-                    (pid, vgrid_name))
-
-        # cache_t1 = time.time()
-
-        dir_cache[vgrid_name] = {}
-        generate_vgrid_dir_cache(configuration, vgrid_name)
+    if vgrid_name in vgrid_dir_cache:
+        cache_t2 = time.time()
+        logger.info('(%s) opened dir cache for: %s in %.3f secs'
+                    % (pid, vgrid_name, cache_t2 - cache_t1))
+        return result
 
-        # cache_t2 = time.time()
-        # logger.debug('(%s) Generated new dir_cache for: %s in %s secs'
-        #             % (pid, vgrid_name, (cache_t2 - cache_t1))
+    if os.path.exists(old_cache_filepath) and \
+            import_old_dir_cache(vgrid_dir_cache, old_cache_filepath) and \
+            vgrid_name in vgrid_dir_cache:
+        cache_t2 = time.time()
+        logger.info('(%s) imported old dir cache for: %s in %.3f secs'
+                    % (pid, vgrid_name, cache_t2 - cache_t1))
+        return result
 
-        result = save_dir_cache(vgrid_name)
+    logger.info('(%s) Force generation of vgrid_dir_cache for: %s' %
+                (pid, vgrid_name))
+    try:
+        result = generate_vgrid_dir_cache(configuration, vgrid_name)
+    except OSError as exc:
+        logger.error('(%s) Failed to generate vgrid_dir_cache for: %s: %s'
+                     % (pid, vgrid_name, exc))
+        result = False
 
     return result
 
 
 def save_dir_cache(vgrid_name):
-    """Save directory cache for *vgrid_name*, from the global dir_cache"""
+    """Save directory cache for *vgrid_name*, from the global dir_cache.
+    The cache is updated continuously so this only commits pending changes.
+    """
 
     pid = multiprocessing.current_process().pid
 
     result = True
 
-    dir_cache_filename = '.%s.dir_cache' % configuration.vgrid_triggers
     vgrid_dir_cache = dir_cache.get(vgrid_name, None)
 
     if vgrid_dir_cache is not None:
-        vgrid_home_path = os.path.join(configuration.vgrid_home,
-                                       vgrid_name)
-        dir_cache_filepath = os.path.join(vgrid_home_path,
-                                          dir_cache_filename)
-        vgrid_dir_cache_keys = [key for key in vgrid_dir_cache if key == vgrid_name
-                                or key.startswith('%s%s' % (vgrid_name,
-                                                            os.sep))]
-        if len(vgrid_dir_cache_keys) == 0:
-            logger.info('(%s) no dirs in cache for: %s' % (pid,
-                                                           vgrid_name))
-        else:
-            logger.info('(%s) saving cache for: %s to file: %s' %
-                        (pid, vgrid_name, dir_cache_filepath))
-            pickle(vgrid_dir_cache, dir_cache_filepath, logger)
+        logger.info('(%s) saving cache for: %s to file: %s' %
+                    (pid, vgrid_name, vgrid_dir_cache.db_path))
+        vgrid_dir_cache.flush()
 
     return result
 
@@ -1701,12 +1688,14 @@ def active_targets(configuration, vgrid_name, base_dir):
     return active
 
 
-def monitor(configuration, vgrid_name):
+def monitor(configuration, vgrid_name, scan_slots=None):
     """Monitors the filesystem for changes and match/apply trigger rules.
     Each top vgrid gets its own process.
     Handling new vgrids is done through a special root vgrid with vgrid_name='.'.
     New vgrids are handled by '.' until grid_events is restarted, after restart
     they get their own process.
+    The optional scan_slots semaphore limits how many monitor processes can
+    generate their directory cache at the same time.
     """
 
     pid = multiprocessing.current_process().pid
@@ -1726,6 +1715,7 @@ def monitor(configuration, vgrid_name):
     shared_state['writable_dir'] = os.path.join(
         configuration.vgrid_files_writable)
     shared_state['writable_dir_len'] = len(shared_state['writable_dir'])
+    shared_state['scan_slots'] = scan_slots
 
     # Allow e.g. logrotate to force log re-open after rotates
     register_hangup_handler(configuration)
@@ -1872,14 +1862,13 @@ def monitor(configuration, vgrid_name):
         pass
     else:
 
-        # load_dir_cache_t1 = time.time()
+        load_dir_cache_t1 = time.time()
 
         load_status = load_dir_cache(configuration, vgrid_name)
 
-        # load_dir_cache_t2 = time.time()
-        # logger.debug('(%s) load_dir_cache for: %s in %s secs' % (pid,
-        #             vgrid_name, (load_dir_cache_t2
-        #             - load_dir_cache_t1))
+        load_dir_cache_t2 = time.time()
+        logger.info('(%s) load_dir_cache for: %s in %.3f secs' % (pid,
+                    vgrid_name, (load_dir_cache_t2 - load_dir_cache_t1)))
 
         if not load_status:
             logger.error('(%s) Failed to load / generate dir cache for: %s'
@@ -1922,6 +1911,11 @@ def monitor(configuration, vgrid_name):
             # Throttle down
 
             time.sleep(1)
+
+            # Commit dir cache changes from events in batches
+
+            for vgrid_dir_cache in list(dir_cache.values()):
+                vgrid_dir_cache.flush()
         except KeyboardInterrupt:
             print('(%s) caught interrupt' % pid)
             logger.info('(%s) caught interrupt' % pid)
@@ -1932,6 +1926,8 @@ def monitor(configuration, vgrid_name):
         print('(%s) Saving cache for vgrid: %s' % (pid, vgrid_name))
         logger.info('(%s) Saving cache for vgrid: %s' % (pid, vgrid_name))
         save_dir_cache(vgrid_name)
+    for vgrid_dir_cache in list(dir_cache.values()):
+        vgrid_dir_cache.close()
 
     print('(%s) Exiting monitor for vgrid: %s' % (pid, vgrid_name))
     logger.info('(%s) Exiting for vgrid: %s' % (pid, vgrid_name))
@@ -1981,6 +1977,9 @@ unless it is available in mig/server/MiGserver.conf
 
     vgrid_monitors = {}
 
+    # Limit the number of vgrid dir caches generated at the same time
+    scan_slots = multiprocessing.BoundedSemaphore(dir_cache_max_parallel_scans)
+
     # Start monitor for new/removed vgrids
 
     vgrid_name = '.'
@@ -1997,7 +1996,8 @@ unless it is available in mig/server/MiGserver.conf
             vgrid_name = ent.name
             vgrid_monitors[vgrid_name] = \
                 multiprocessing.Process(target=monitor,
-                                        args=(configuration, vgrid_name))
+                                        args=(configuration, vgrid_name,
+                                              scan_slots))
 
         # else:
         #    logger.debug('Skipping _NON_ vgrid: %s' % ent.path)
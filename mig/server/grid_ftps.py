@@ -101,7 +101,8 @@ from mig.shared.griddaemons.ftps import default_max_user_hits, \
     default_max_secret_hits, default_username_validator, \
     get_fs_path, acceptable_chmod, refresh_user_creds, refresh_share_creds, \
     update_login_map, login_map_lookup, hit_rate_limit, expire_rate_limit, \
-    check_twofactor_session, validate_auth_attempt
+    check_twofactor_session, validate_auth_attempt, get_hash_cache, \
+    log_hash_cache_stats, LoginStore
 from mig.shared.logger import daemon_logger, register_hangup_handler
 from mig.shared.pwcrypto import make_simple_hash
 from mig.shared.tlsserver import hardened_openssl_context
@@ -239,6 +240,7 @@ class MiGUserAuthorizer(DummyAuthorizer):
             self.last_expire = time.time()
             expire_rate_limit(configuration, "ftps",
                               expire_delay=self.min_expire_delay)
+            log_hash_cache_stats(configuration, daemon_conf['hash_cache'])
         if hit_rate_limit(configuration, 'ftps', client_ip, username,
                           max_user_hits=max_user_hits):
             exceeded_rate_limit = True
@@ -573,10 +575,9 @@ unless it is available in mig/server/MiGserver.conf
         'user_alias': configuration.user_ftps_alias,
         # No creds locking needed here due to central auth
         'creds_lock': None,
-        'users': [],
-        'shares': [],
+        'login_store': LoginStore(),
         'login_map': {},
-        'hash_cache': {},
+        'hash_cache': get_hash_cache(configuration),
         'time_stamp': 0,
         'logger': logger,
         'nossl': nossl,
@@ -48,6 +48,9 @@ from mig.shared.vgridaccess import get_vgrid_map_vgrids
 
 configuration, logger = None, None
 
+# Walk all job files for changes not in the job event stream this often
+FULL_WALK_INTERVAL = 3600
+
 
 def create_monitor(vgrid_name):
     """Write monitor HTML file for vgrid_name"""
@@ -736,6 +739,7 @@ unless it is available in mig/server/MiGserver.conf
             logger.error('Failed to create default VGrid home: %s' % ose)
 
     keep_running = True
+    last_full_walk = 0
     while keep_running:
         try:
             vgrids_list = get_vgrid_map_vgrids(configuration, caching=True)
@@ -743,9 +747,15 @@ unless it is available in mig/server/MiGserver.conf
             # create global statistics ("")
             # vgrids_list.append("")
 
+            # Stats are updated from the job event stream but we still
+            # look for job changes outside grid_script once in a while
+
             print('Updating cache.')
+            full_walk = last_full_walk + FULL_WALK_INTERVAL < time.time()
+            if full_walk:
+                last_full_walk = time.time()
             grid_stat = GridStat(configuration, logger)
-            grid_stat.update()
+            grid_stat.update(full_walk)
             for vgrid_name in vgrids_list:
                 print('creating monitor for vgrid: %s' % vgrid_name)
                 create_monitor(vgrid_name)
@@ -36,20 +36,83 @@ import os
 import multiprocessing
 import signal
 import sys
+import threading
 import time
 from datetime import datetime
 
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    # NOTE: we fall back to listing notify_home in every round without it
+    Observer = None
+    FileSystemEventHandler = object
+
 from mig.shared.base import extract_field, expand_openid_alias
 from mig.shared.conf import get_configuration_object
+from mig.shared.defaults import notify_spool_offset_suffix, \
+    notify_spool_segment_secs
 from mig.shared.fileio import unpickle, delete_file
 from mig.shared.logger import daemon_logger, \
     register_hangup_handler
-from mig.shared.notification import send_email
+from mig.shared.notification import send_email, SMTPSession
+from mig.shared.notifyspool import is_spool_segment, is_spool_offset, \
+    read_spool_segment, load_spool_offset, save_spool_offset, \
+    spool_offset_path
 
 
 stop_running = multiprocessing.Event()
 notify_interval = 60
 received_notifications = {}
+# Notification files reported by the notify_home monitor but not yet read
+pending_notifications = set()
+pending_lock = threading.Lock()
+# Seconds between full notify_home listings with stale file clean up. With
+# the monitor active the listing is only a safety net for missed events.
+stale_scan_interval = 3600
+stale_notify_secs = 86400
+# Read offset for each spool segment seen and a dictionary mapping the
+# client_ids with undelivered notifications in it to the offset of the first
+# of them. The offset up to which everything is delivered is saved next to
+# the segment in spool_saved so that a restart does not send it again.
+spool_offsets = {}
+spool_refs = {}
+spool_saved = {}
+# Give up delivery to a user after this many failed rounds
+notify_max_failures = 3
+delivery_stats = {'rounds': 0, 'sent': 0, 'failed': 0, 'connects': 0,
+                  'seconds': 0.0}
+
+
+class MiGNotifyEventHandler(FileSystemEventHandler):
+
+    """Notify home event handler to register new notification files for
+    reading in the next round.
+    """
+
+    def add_notification(self, path):
+        """Register path as a pending notification"""
+
+        with pending_lock:
+            pending_notifications.add(path)
+
+    def on_created(self, event):
+        """Handle new notification file"""
+
+        if not event.is_directory:
+            self.add_notification(event.src_path)
+
+    def on_modified(self, event):
+        """Handle notification file written after create"""
+
+        if not event.is_directory:
+            self.add_notification(event.src_path)
+
+    def on_moved(self, event):
+        """Handle notification file moved into place"""
+
+        if not event.is_directory:
+            self.add_notification(event.dest_path)
 
 
 def stop_handler(sig, frame):
@@ -61,7 +124,8 @@ def stop_handler(sig, frame):
 
 def cleanup_notify_home(configuration, notified_users=[], timestamp=None):
     """Delete notification files based on either *notified_users* and/or
-    file created timestamp"""
+    file created timestamp, where the latter removes all files created before
+    timestamp"""
 
     logger = configuration.logger
     # logger.debug("cleanup_notify_home: %s, %s"
@@ -72,36 +136,93 @@ def cleanup_notify_home(configuration, notified_users=[], timestamp=None):
     for client_id in notified_users:
         cleanup_files = received_notifications.get(
             client_id, {}).get('files', [])
-        if not cleanup_files:
+        cleanup_segments = received_notifications.get(
+            client_id, {}).get('segments', [])
+        # NOTE: notifications may come from files, segments or both
+        if not cleanup_files and not cleanup_segments:
             logger.error(
-                "Expected _NON_ empty files list for client_id: '%s'"
-                % client_id)
+                "Expected _NON_ empty files or segments list for client_id: "
+                "'%s'" % client_id)
         for filepath in cleanup_files:
             # logger.debug("Removing notification file: '%s'" % filepath)
             delete_file(filepath, logger)
+        for segment_path in cleanup_segments:
+            spool_refs.get(segment_path, {}).pop(client_id, None)
+
+    cleanup_spool_segments(configuration)
 
     # Remove notification files based on timestamp
 
     if timestamp is not None:
         notify_home = configuration.notify_home
-        now_timestamp = time.time()
-        cleanuptime = now_timestamp - timestamp
         for direntry in os.listdir(notify_home):
             filepath = os.path.join(notify_home, direntry)
-            ctime = os.path.getctime(filepath)
-            if ctime > cleanuptime:
-                # logger.debug("Removing OLD notification file: '%s'"
-                #              + ", ctime: %s, cleanuptime: %s"
-                #              % (filepath, ctime, cleanuptime))
+            # Spool segments are removed in cleanup_spool_segments
+            if is_spool_segment(filepath):
+                continue
+            # Just clean up offsets left behind if removal was interrupted
+            if is_spool_offset(filepath) and os.path.exists(
+                    filepath[:-len(notify_spool_offset_suffix)]):
+                continue
+            try:
+                ctime = os.path.getctime(filepath)
+            except OSError:
+                continue
+            if ctime < timestamp:
+                logger.warning("Removing stale notification file: '%s'"
+                               % filepath)
                 delete_file(filepath, logger)
 
 
-def send_notifications(configuration):
-    """Generate message and send notification to users"""
+def cleanup_spool_segments(configuration):
+    """Delete spool segments that no process appends to any longer once all
+    their notifications are read and delivered or given up. Save the offset
+    up to which all notifications are delivered for the remaining ones.
+    Any torn record left at the end of a stale segment by a producer that
+    died or ran out of space mid-write is logged and ignored.
+    """
     logger = configuration.logger
-    # logger.debug("send_notifications")
-    result = []
-    for (client_id, client_dict) in received_notifications.iteritems():
+    # NOTE: producers never append to segments this old, see notifyspool
+    stale_timestamp = time.time() - 2 * notify_spool_segment_secs
+    for (segment_path, offset) in list(spool_offsets.items()):
+        refs = spool_refs.get(segment_path, None)
+        try:
+            segment_stat = os.stat(segment_path)
+        except OSError:
+            segment_stat = None
+        if not refs and segment_stat is not None and \
+                segment_stat.st_size > offset and \
+                segment_stat.st_mtime <= stale_timestamp:
+            logger.warning("Ignoring %d bytes of torn record at end of stale "
+                           "spool segment: '%s'" %
+                           (segment_stat.st_size - offset, segment_path))
+        elif refs or segment_stat is not None and \
+                (segment_stat.st_size > offset or
+                 segment_stat.st_mtime > stale_timestamp):
+            delivered = offset
+            if refs:
+                delivered = min(refs.values())
+            if segment_stat is not None and \
+                    spool_saved.get(segment_path, 0) != delivered and \
+                    save_spool_offset(segment_path, delivered, logger):
+                spool_saved[segment_path] = delivered
+            continue
+        # logger.debug("Removing spool segment: '%s'" % segment_path)
+        # NOTE: remove offset last to never read segment from start again
+        if segment_stat is not None:
+            delete_file(segment_path, logger)
+        offset_path = spool_offset_path(segment_path)
+        if os.path.exists(offset_path):
+            delete_file(offset_path, logger)
+        del spool_offsets[segment_path]
+        spool_refs.pop(segment_path, None)
+        spool_saved.pop(segment_path, None)
+
+
+def build_notifications(configuration):
+    """Generate the bulked notification message for each user"""
+    outgoing = []
+    for (client_id, client_dict) in received_notifications.items():
         timestamp = client_dict.get('timestamp', 0)
 
         timestr = (datetime.fromtimestamp(timestamp)
@@ -113,11 +234,11 @@ def send_notifications(configuration):
         total_events = 0
         notify_message = ""
         messages_dict = client_dict.get('messages', {})
-        for (header, value) in messages_dict.iteritems():
+        for (header, value) in messages_dict.items():
             if notify_message:
                 notify_message += "\n\n"
             notify_message += "= %s =\n" % header
-            for (message, events) in value.iteritems():
+            for (message, events) in value.items():
                 notify_message += "#%s : %s\n" % (events, message)
                 total_events += events
         subject = "%s system notification: %s new events" % \
@@ -125,32 +246,125 @@ def send_notifications(configuration):
         notify_message = "Found %s new events since: %s\n\n" \
             % (total_events, timestr) \
             + notify_message
-        status = send_email(
-            recipient,
-            subject,
-            notify_message,
-            logger,
-            configuration)
-        if status:
-            logger.info("Send email with %s events to: %s"
-                        % (total_events, recipient))
-            result.append(client_id)
-        else:
-            logger.error("Failed to send email to: '%s', '%s'" %
-                         (recipient, client_id))
+        outgoing.append((client_id, recipient, subject, notify_message,
+                         total_events))
+    return outgoing
+
 
+def deliver_notifications(configuration, outgoing):
+    """Send the outgoing notifications built in build_notifications through
+    a pool of site_notify_smtp_workers threads, each reusing a persistent
+    SMTP session for all its messages. Returns the list of client_ids
+    successfully notified.
+    """
+    logger = configuration.logger
+    result = []
+    if not outgoing:
+        return result
+    start = time.time()
+    todo = list(outgoing)
+    todo_lock = threading.Lock()
+    sessions = []
+
+    def __deliver_worker():
+        """Send messages from todo until it is empty"""
+        session = SMTPSession(configuration,
+                              configuration.site_notify_smtp_session_messages)
+        sessions.append(session)
+        try:
+            while True:
+                with todo_lock:
+                    if not todo:
+                        break
+                    (client_id, recipient, subject, notify_message,
+                     total_events) = todo.pop(0)
+                status = send_email(recipient, subject, notify_message,
+                                    logger, configuration,
+                                    smtp_session=session)
+                if status:
+                    logger.info("Send email with %s events to: %s"
+                                % (total_events, recipient))
+                    result.append(client_id)
+                else:
+                    logger.error("Failed to send email to: '%s', '%s'" %
+                                 (recipient, client_id))
+        finally:
+            session.close()
+
+    worker_count = max(1, min(configuration.site_notify_smtp_workers,
+                              len(outgoing)))
+    workers = []
+    for _ in range(worker_count):
+        worker = threading.Thread(target=__deliver_worker)
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.time() - start
+    connects = sum([i.connects for i in sessions])
+    failed = len(outgoing) - len(result)
+    delivery_stats['rounds'] += 1
+    delivery_stats['sent'] += len(result)
+    delivery_stats['failed'] += failed
+    delivery_stats['connects'] += connects
+    delivery_stats['seconds'] += elapsed
+    logger.info("Delivered %d of %d notifications with %d workers over %d "
+                "SMTP connections in %.2fs (%.1f msgs/s)" %
+                (len(result), len(outgoing), worker_count, connects, elapsed,
+                 len(outgoing) / max(elapsed, 0.001)))
+    logger.info("Delivery totals: %(sent)d sent, %(failed)d failed over "
+                "%(connects)d SMTP connections in %(rounds)d rounds" %
+                delivery_stats)
     return result
 
 
+def send_notifications(configuration):
+    """Generate message and send notification to users"""
+    outgoing = build_notifications(configuration)
+    return deliver_notifications(configuration, outgoing)
+
+
 def recv_notification(configuration, path):
     """Read notification event from file"""
     logger = configuration.logger
     # logger.debug("read_notification: %s" % file)
-    status = True
     new_notification = unpickle(path, logger)
     if not new_notification:
         logger.error("Failed to unpickle: %s" % path)
         return False
+    return register_notification(configuration, new_notification, path)
+
+
+def recv_spool_segment(configuration, path):
+    """Read all new notification events appended to spool segment at path
+    since last read. Segments not seen before are read from any offset saved
+    before a restart.
+    """
+    logger = configuration.logger
+    if not path in spool_offsets:
+        spool_saved[path] = load_spool_offset(path, logger)
+    offset = spool_offsets.get(path, spool_saved[path])
+    try:
+        (notifications, offset) = read_spool_segment(path, offset, logger)
+    except Exception as err:
+        logger.error("Failed to read spool segment %s: %s" % (path, err))
+        return False
+    spool_offsets[path] = offset
+    for new_notification in notifications:
+        register_notification(configuration, new_notification, path,
+                              segment=True)
+    return True
+
+
+def register_notification(configuration, new_notification, path,
+                          segment=False):
+    """Add notification event read from path, which is a spool segment if
+    segment is set and otherwise a notification file.
+    """
+    logger = configuration.logger
+    status = True
     user_id = new_notification.get('user_id', '')
     # logger.debug("Received user_id: '%s'" % user_id)
     if not user_id:
@@ -181,29 +395,77 @@ def recv_notification(configuration, path):
         files_list = client_dict.get('files', [])
         if not files_list:
             client_dict['files'] = files_list
-        if path in files_list:
+        if segment:
+            # NOTE: segment offsets rule out duplicates
+            client_dict['segments'] = client_dict.get('segments', set())
+            client_dict['segments'].add(path)
+            spool_refs[path] = spool_refs.get(path, {})
+            spool_refs[path].setdefault(client_id,
+                                        new_notification.get('offset', 0))
+        elif path in files_list:
             logger.warning(
                 "Skipping previously received notification: '%s'" % path)
+            return status
         else:
             files_list.append(path)
-            client_dict['timestamp'] = min(
-                client_dict.get('timestamp', sys.maxsize),
-                new_timestamp)
-            messages_dict = client_dict.get('messages', {})
-            if not messages_dict:
-                client_dict['messages'] = messages_dict
-            header = " ".join(category)
-            if not header:
-                header = '* UNKNOWN *'
-            body_dict = messages_dict.get(header, {})
-            if not body_dict:
-                messages_dict[header] = body_dict
-            message_count = body_dict.get(message, 0)
-            body_dict[message] = message_count + 1
+        client_dict['timestamp'] = min(
+            client_dict.get('timestamp', sys.maxsize),
+            new_timestamp)
+        messages_dict = client_dict.get('messages', {})
+        if not messages_dict:
+            client_dict['messages'] = messages_dict
+        header = " ".join(category)
+        if not header:
+            header = '* UNKNOWN *'
+        body_dict = messages_dict.get(header, {})
+        if not body_dict:
+            messages_dict[header] = body_dict
+        message_count = body_dict.get(message, 0)
+        body_dict[message] = message_count + 1
 
     return status
 
 
+def add_pending_notifications(paths):
+    """Register paths as pending notifications for the next round"""
+    with pending_lock:
+        pending_notifications.update(paths)
+
+
+def pop_pending_notifications():
+    """Return and reset the set of pending notification paths"""
+    with pending_lock:
+        pending = set(pending_notifications)
+        pending_notifications.clear()
+    return pending
+
+
+def scan_notify_home(configuration):
+    """Register all files in notify_home as pending notifications"""
+    notify_home = configuration.notify_home
+    add_pending_notifications([os.path.join(notify_home, direntry) for
+                               direntry in os.listdir(notify_home)])
+
+
+def expire_failed_notifications(configuration, notified_users):
+    """Keep notifications for users not notified in this round for a retry
+    in the next round unless they already failed notify_max_failures times.
+    """
+    logger = configuration.logger
+    for client_id in notified_users:
+        received_notifications.pop(client_id, None)
+    expired = []
+    for (client_id, client_dict) in received_notifications.items():
+        client_dict['failures'] = client_dict.get('failures', 0) + 1
+        if client_dict['failures'] >= notify_max_failures:
+            logger.error("Giving up notify of '%s' after %d failed attempts"
+                         % (client_id, client_dict['failures']))
+            expired.append(client_id)
+    cleanup_notify_home(configuration, notified_users=expired)
+    for client_id in expired:
+        del received_notifications[client_id]
+
+
 def handle_notifications(configuration):
     """Main handler for notification events"""
     logger = configuration.logger
@@ -213,23 +475,59 @@ def handle_notifications(configuration):
         err_msg = "Missing notify_home: '%s'" % notify_home
         return (1, err_msg)
 
+    # Monitor notify_home for new notifications if possible and fall back to
+    # listing it in every round otherwise.
+    notify_monitor = None
+    if Observer is None:
+        logger.warning("No watchdog module - polling notify_home")
+    else:
+        notify_monitor = Observer()
+        notify_monitor.schedule(MiGNotifyEventHandler(), notify_home,
+                                recursive=False)
+        notify_monitor.start()
+
+    last_scan = 0
     try:
         while not stop_running.is_set():
-            for direntry in os.listdir(notify_home):
-                abspath = os.path.join(notify_home, direntry)
-                if os.path.isfile(abspath):
-                    recv_notification(configuration, abspath)
+            now = time.time()
+            stale_timestamp = None
+            if notify_monitor is None or \
+                    now - last_scan > stale_scan_interval:
+                scan_notify_home(configuration)
+                if now - last_scan > stale_scan_interval:
+                    stale_timestamp = now - stale_notify_secs
+                last_scan = now
+            for abspath in pop_pending_notifications():
+                if not os.path.isfile(abspath) or is_spool_offset(abspath):
+                    continue
+                if is_spool_segment(abspath):
+                    # NOTE: last record may still be being appended unless
+                    #       the segment is stale and thus left torn
+                    if recv_spool_segment(configuration, abspath) and \
+                            os.path.getsize(abspath) > \
+                            spool_offsets[abspath] and \
+                            now - os.path.getmtime(abspath) <= \
+                            2 * notify_spool_segment_secs:
+                        add_pending_notifications([abspath])
+                    continue
+                if not recv_notification(configuration, abspath) and \
+                        now - os.path.getmtime(abspath) < notify_interval:
+                    # NOTE: may still be in the process of being written
+                    add_pending_notifications([abspath])
             notified_users = send_notifications(configuration)
-            last_notification = time.time()
             cleanup_notify_home(configuration,
                                 notified_users=notified_users,
-                                timestamp=last_notification - 84600)
-            received_notifications.clear()
+                                timestamp=stale_timestamp)
+            expire_failed_notifications(configuration, notified_users)
             logger.debug("----- Sleeping %s seconds -----" % notify_interval)
             time.sleep(notify_interval)
     except Exception as err:
         err_msg = "handle_notifications failed: %s" % err
         return (1, err_msg)
+    finally:
+        if notify_monitor is not None:
+            notify_monitor.stop()
+            notify_monitor.join()
 
     # We received stop signal
 
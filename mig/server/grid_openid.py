@@ -91,7 +91,7 @@ from mig.shared.griddaemons.openid import default_max_user_hits, \
     default_user_abuse_hits, default_proto_abuse_hits, \
     default_username_validator, refresh_user_creds, update_login_map, \
     login_map_lookup, hit_rate_limit, expire_rate_limit, \
-    validate_auth_attempt
+    validate_auth_attempt, LoginStore
 from mig.shared.htmlgen import openid_page_template
 from mig.shared.logger import daemon_logger, register_hangup_handler
 from mig.shared.pwcrypto import make_simple_hash
@@ -1695,7 +1695,7 @@ i4HdbgS6M21GvqIfhN2NncJ00aJukr5L29JrKFgSCPP9BDRb9Jgy0gu1duhTv0C0
         'allow_publickey': 'publickey' in configuration.user_openid_auth,
         'user_alias': configuration.user_openid_alias,
         'host_rsa_key': host_rsa_key,
-        'users': [],
+        'login_store': LoginStore(),
         'login_map': {},
         'time_stamp': 0,
         'logger': logger,
@@ -100,7 +100,8 @@ from mig.shared.griddaemons.sftp import default_username_validator, \
     refresh_jupyter_creds, update_login_map, login_map_lookup, \
     hit_rate_limit, expire_rate_limit, clear_sessions, \
     track_open_session, track_close_session, expire_dead_sessions, \
-    active_sessions, check_twofactor_session, validate_auth_attempt, authlog
+    active_sessions, check_twofactor_session, validate_auth_attempt, \
+    authlog, get_hash_cache, log_hash_cache_stats, LoginStore
 from mig.shared.logger import daemon_logger, daemon_gdp_logger, \
     register_hangup_handler
 from mig.shared.notification import send_system_notification
@@ -1719,6 +1720,7 @@ def start_service(configuration):
             last_expire = time.time()
             expire_rate_limit(configuration, "sftp",
                               expire_delay=min_expire_delay)
+            log_hash_cache_stats(configuration, daemon_conf['hash_cache'])
 
 
 if __name__ == "__main__":
@@ -1850,12 +1852,9 @@ i4HdbgS6M21GvqIfhN2NncJ00aJukr5L29JrKFgSCPP9BDRb9Jgy0gu1duhTv0C0
         'host_rsa_key': host_rsa_key,
         # Lock needed here due to threaded creds updates
         'creds_lock': threading.Lock(),
-        'users': [],
-        'jobs': [],
-        'shares': [],
-        'jupyter_mounts': [],
+        'login_store': LoginStore(),
         'login_map': {},
-        'hash_cache': {},
+        'hash_cache': get_hash_cache(configuration),
         'time_stamp': 0,
         'logger': logger,
         'auth_timeout': 60,
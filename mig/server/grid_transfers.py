@@ -43,9 +43,18 @@ import multiprocessing
 import os
 import signal
 import sys
+import threading
 import time
 import traceback
 
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import PatternMatchingEventHandler
+except ImportError:
+    # NOTE: we fall back to periodic polling of transfer files without it
+    Observer = None
+    PatternMatchingEventHandler = object
+
 from mig.shared.base import client_dir_id, client_id_dir
 from mig.shared.conf import get_configuration_object
 from mig.shared.defaults import datatransfers_filename, transfers_log_size, \
@@ -59,17 +68,32 @@ from mig.shared.safeeval import subprocess_popen, subprocess_pipe, \
 from mig.shared.transferfunctions import blind_pw, load_data_transfers, \
     update_data_transfer, get_status_dir, sub_pid_list, add_sub_pid, \
     del_sub_pid, kill_sub_pid, add_worker_transfer, del_worker_transfer, \
-    all_worker_transfers, get_worker_transfer
+    all_worker_transfers, get_worker_transfer, schedule_worker_transfers
 from mig.shared.validstring import valid_user_path
 
 # Global helper dictionaries with requests for all users
 
 all_transfers = {}
 all_workers = {}
+# Index of the non-terminal transfer IDs of each user and the FIFO queue of
+# (client_id, transfer_id) tuples waiting for a free worker slot
+live_transfers = {}
+queued_transfers = []
+# Client dirs with changed transfer files reported by the file monitor
+changed_clients = set()
+changed_lock = threading.Lock()
+changed_event = threading.Event()
 sub_pid_map = None
 stop_running = multiprocessing.Event()
 (configuration, logger, last_update) = (None, None, 0)
 
+# Transfer states that never need a worker again
+terminal_states = ("DONE", "FAILED", "PAUSED")
+# Seconds between full scans of all transfer files. With the file monitor
+# active it is only a safety net for missed events.
+full_scan_interval = 3600
+poll_scan_interval = 30
+
 # Tune default lftp buffer size - the built-in size is 32k, but a 128k buffer
 # was experimentally determined to provide significantly better throughput on
 # fast networks:
@@ -810,54 +834,206 @@ def handle_transfer(configuration, client_id, transfer_dict):
                         transfer_dict['fqdn'], exc))
 
 
-def manage_transfers(configuration):
-    """Manage all updates of saved user data transfer requests"""
+class MiGTransfersEventHandler(PatternMatchingEventHandler):
 
-    logger.debug('manage transfers')
-    old_transfers = {}
+    """Transfers pattern-matching event handler to register changed user data
+    transfer files for reload in the main loop.
+    """
+
+    def __init__(
+        self,
+        patterns=None,
+        ignore_patterns=None,
+        ignore_directories=True,
+        case_sensitive=True,
+    ):
+        """Constructor"""
+
+        PatternMatchingEventHandler.__init__(self, patterns,
+                                             ignore_patterns,
+                                             ignore_directories,
+                                             case_sensitive)
+
+    def update_transfers(self, event):
+        """Mark the client dir of the changed transfer file for reload"""
+
+        client_dir = os.path.basename(os.path.dirname(event.src_path))
+        mark_transfers_changed(client_dir)
+
+    def on_modified(self, event):
+        """Handle modified transfers file"""
+
+        self.update_transfers(event)
+
+    def on_created(self, event):
+        """Handle new transfers file"""
+
+        self.update_transfers(event)
+
+    def on_deleted(self, event):
+        """Handle deleted transfers file"""
+
+        self.update_transfers(event)
+
+    def on_moved(self, event):
+        """Handle transfers file moved into or out of place"""
+
+        self.update_transfers(event)
+
+
+def mark_transfers_changed(client_dir):
+    """Register that the transfers file of client_dir changed and wake up the
+    main loop.
+    """
+    with changed_lock:
+        changed_clients.add(client_dir)
+    changed_event.set()
+
+
+def pop_changed_transfers():
+    """Return and reset the set of client dirs with changed transfer files"""
+    with changed_lock:
+        changed = set(changed_clients)
+        changed_clients.clear()
+        changed_event.clear()
+    return changed
+
+
+def reload_transfers(configuration, client_dir):
+    """Reload the saved transfers of the user with client_dir and update the
+    index of non-terminal transfers accordingly.
+    """
+    logger.debug('extracted client dir: %s' % client_dir)
+    client_id = client_dir_id(client_dir)
+    logger.debug('loading transfers for: %s' % client_id)
+    (load_status, transfers) = load_data_transfers(configuration, client_id)
+    if not load_status:
+        logger.error('could not load transfers for %s: %s' %
+                     (client_id, transfers))
+        return False
+
+    if transfers:
+        all_transfers[client_id] = transfers
+    else:
+        all_transfers.pop(client_id, None)
+    live = set([transfer_id for (transfer_id, transfer_dict) in
+                transfers.items() if transfer_dict['status'] not in
+                terminal_states])
+    if live:
+        live_transfers[client_id] = live
+    else:
+        live_transfers.pop(client_id, None)
+    return True
+
+
+def scan_transfers(configuration, changed_since):
+    """Reload transfers for all users with a transfers file modified since
+    the changed_since timestamp. A changed_since value of 0 triggers a full
+    reload, which also drops any users without a transfers file.
+    """
     src_pattern = os.path.join(configuration.user_settings, '*',
                                datatransfers_filename)
+    found = set()
     for transfers_path in glob.glob(src_pattern):
-        if os.path.getmtime(transfers_path) < last_update:
-            # logger.debug('skip transfer update for unchanged path: %s' % \
-            #              transfers_path)
-            continue
+        client_dir = os.path.basename(os.path.dirname(transfers_path))
+        found.add(client_dir_id(client_dir))
+        try:
+            if os.path.getmtime(transfers_path) < changed_since:
+                # logger.debug('skip transfer update for unchanged path: %s' % \
+                #              transfers_path)
+                continue
+        except OSError:
+            # Removed since glob - the reload below handles that
+            pass
         logger.debug('handling update of transfers file: %s' % transfers_path)
-        abs_client_dir = os.path.dirname(transfers_path)
-        client_dir = os.path.basename(abs_client_dir)
-        logger.debug('extracted client dir: %s' % client_dir)
-        client_id = client_dir_id(client_dir)
-        logger.debug('loading transfers for: %s' % client_id)
-        (load_status, transfers) = load_data_transfers(configuration,
-                                                       client_id)
-        if not load_status:
-            logger.error('could not load transfer for path: %s' %
-                         transfers_path)
-            continue
+        reload_transfers(configuration, client_dir)
+    if not changed_since:
+        for client_id in list(all_transfers) + list(live_transfers):
+            if client_id not in found:
+                all_transfers.pop(client_id, None)
+                live_transfers.pop(client_id, None)
 
-        old_transfers[client_id] = all_transfers.get(client_id, {})
-        all_transfers[client_id] = transfers
 
-    for (client_id, transfers) in all_transfers.items():
-        for (transfer_id, transfer_dict) in transfers.items():
-            #logger.debug('inspecting transfer:\n%s' % blind_pw(transfer_dict))
-            transfer_status = transfer_dict['status']
-            if transfer_status in ("DONE", "FAILED", "PAUSED"):
-                # logger.debug('skip %(status)s transfer %(transfer_id)s' % \
-                #             transfer_dict)
+def queue_transfers(configuration):
+    """Queue all non-terminal transfers without a worker for launch and prune
+    the queue for any transfers that were paused, removed or already running.
+    """
+    queued = set()
+    waiting = []
+    for (client_id, transfer_id) in queued_transfers:
+        if transfer_id in live_transfers.get(client_id, []) and \
+                not get_worker_transfer(configuration, all_workers, client_id,
+                                        transfer_id):
+            queued.add((client_id, transfer_id))
+            waiting.append((client_id, transfer_id))
+    for (client_id, transfer_ids) in live_transfers.items():
+        for transfer_id in sorted(transfer_ids):
+            if (client_id, transfer_id) in queued:
                 continue
-            if transfer_status in ("ACTIVE", ):
-                if get_worker_transfer(configuration, all_workers, client_id,
-                                       transfer_id):
-                    logger.debug('wait for transfer %(transfer_id)s' %
-                                 transfer_dict)
-                    continue
-                else:
-                    logger.info('restart transfer %(transfer_id)s' %
-                                transfer_dict)
-            logger.info('handle %(status)s transfer %(transfer_id)s' %
-                        transfer_dict)
-            handle_transfer(configuration, client_id, transfer_dict)
+            if get_worker_transfer(configuration, all_workers, client_id,
+                                   transfer_id):
+                # NOTE: worker may not yet have saved the ACTIVE status
+                logger.debug('wait for transfer %s' % transfer_id)
+                continue
+            waiting.append((client_id, transfer_id))
+    queued_transfers[:] = waiting
+
+
+def launch_transfers(configuration):
+    """Launch queued transfers as long as the global and per-user worker
+    limits allow it.
+    """
+    (launch, waiting) = schedule_worker_transfers(
+        configuration, queued_transfers, all_workers,
+        configuration.site_transfers_max_workers,
+        configuration.site_transfers_max_user_workers)
+    queued_transfers[:] = waiting
+    for (client_id, transfer_id) in launch:
+        transfer_dict = all_transfers[client_id][transfer_id]
+        #logger.debug('inspecting transfer:\n%s' % blind_pw(transfer_dict))
+        if transfer_dict['status'] in ("ACTIVE", ):
+            logger.info('restart transfer %(transfer_id)s' % transfer_dict)
+        logger.info('handle %(status)s transfer %(transfer_id)s' %
+                    transfer_dict)
+        handle_transfer(configuration, client_id, transfer_dict)
+        if not get_worker_transfer(configuration, all_workers, client_id,
+                                   transfer_id):
+            # Launch failed - retry in next round
+            queued_transfers.append((client_id, transfer_id))
+
+
+def log_transfer_metrics(configuration, last_metrics=None):
+    """Log the current worker and queue counts unless they are unchanged from
+    last_metrics. Returns the current counts for use in the next call.
+    """
+    active = all_worker_transfers(configuration, all_workers)
+    live = sum([len(i) for i in live_transfers.values()])
+    metrics = (len(active), len(queued_transfers), live, len(live_transfers))
+    if metrics != last_metrics:
+        logger.info('transfer metrics: %d active workers, %d queued, %d live '
+                    'transfers for %d users' % metrics)
+    return metrics
+
+
+def manage_transfers(configuration, changed=None):
+    """Manage all updates of saved user data transfer requests. The optional
+    changed argument is a set of client dirs with changed transfer files to
+    reload. Without it all transfer files changed since last scan are
+    reloaded.
+    """
+    global last_update
+
+    logger.debug('manage transfers')
+    if changed is None:
+        scan_start = time.time()
+        scan_transfers(configuration, last_update)
+        last_update = scan_start
+    else:
+        for client_dir in changed:
+            reload_transfers(configuration, client_dir)
+
+    queue_transfers(configuration)
+    launch_transfers(configuration)
 
 
 if __name__ == '__main__':
@@ -911,9 +1087,34 @@ unless it is available in mig/server/MiGserver.conf
     # Ignore bogus "Instance of 'SyncManager' has no 'dict' member (no-member)"
     sub_pid_map = transfer_manager.dict()  # pylint: disable=no-member
 
+    # Monitor transfer files for changes if possible and fall back to polling
+    # them all for changes in every iteration otherwise.
+    transfers_monitor = None
+    if Observer is None:
+        logger.warning('no watchdog module - polling all transfer files')
+    else:
+        transfers_monitor = Observer()
+        transfers_pattern = os.path.join(configuration.user_settings, '*',
+                                         datatransfers_filename)
+        transfers_handler = MiGTransfersEventHandler(
+            patterns=[transfers_pattern])
+        transfers_monitor.schedule(transfers_handler,
+                                   configuration.user_settings,
+                                   recursive=True)
+        transfers_monitor.start()
+
+    (last_scan, last_metrics) = (0, None)
     while not stop_running.is_set():
         try:
-            manage_transfers(configuration)
+            changed = pop_changed_transfers()
+            now = time.time()
+            if transfers_monitor is None or \
+                    now - last_scan > full_scan_interval:
+                # NOTE: the mtime scan also covers any popped changes
+                manage_transfers(configuration)
+                last_scan = now
+            else:
+                manage_transfers(configuration, changed)
 
             for (client_id, transfer_id, worker) in \
                     all_worker_transfers(configuration, all_workers):
@@ -921,7 +1122,7 @@ unless it is available in mig/server/MiGserver.conf
                     continue
                 logger.debug('Checking if %s %s with pid %d is finished' %
                              (client_id, transfer_id, worker.pid))
-                worker.join(1)
+                worker.join(0.1)
                 if worker.is_alive():
                     logger.debug('Worker for %s %s running with pid %d' %
                                  (client_id, transfer_id, worker.pid))
@@ -929,14 +1130,23 @@ unless it is available in mig/server/MiGserver.conf
                     logger.info('Removing finished %s %s with pid %d' %
                                 (client_id, transfer_id, worker.pid))
                     clean_transfer(configuration, client_id, transfer_id)
+                    # Make sure the final status is loaded before relaunch
+                    mark_transfers_changed(client_id_dir(client_id))
+
+            last_metrics = log_transfer_metrics(configuration, last_metrics)
 
-            # Throttle down
+            # Throttle down but wake up early on transfer changes
 
-            time.sleep(30)
+            changed_event.wait(poll_scan_interval)
+            time.sleep(1)
         except Exception as exc:
             print('Caught unexpected exception: %s' % exc)
             time.sleep(10)
 
+    if transfers_monitor is not None:
+        transfers_monitor.stop()
+        transfers_monitor.join()
+
     print('Cleaning up active transfers')
     logger.info('Cleaning up workers to prepare for exit')
     for (client_id, transfer_id, worker) in \
@@ -82,7 +82,7 @@ from mig.shared.griddaemons.davs import get_fs_path, acceptable_chmod, \
     update_login_map, login_map_lookup, hit_rate_limit, expire_rate_limit, \
     add_user_object, track_open_session, clear_sessions, track_close_session, \
     track_close_expired_sessions, get_active_session, \
-    check_twofactor_session, validate_auth_attempt
+    check_twofactor_session, validate_auth_attempt, LoginStore
 from mig.shared.logger import daemon_logger, daemon_gdp_logger, \
     register_hangup_handler
 from mig.shared.notification import send_system_notification
@@ -1740,8 +1740,7 @@ unless it is available in mig/server/MiGserver.conf
         'user_alias': configuration.user_davs_alias,
         # Lock needed here due to threaded creds updates
         'creds_lock': threading.Lock(),
-        'users': [],
-        'shares': [],
+        'login_store': LoginStore(),
         'login_map': {},
         # NOTE: enable for litmus test (http://www.webdav.org/neon/litmus/)
         #
@@ -116,7 +116,8 @@ from mig.shared.griddaemons.davs import get_fs_path, acceptable_chmod, \
     update_login_map, login_map_lookup, hit_rate_limit, expire_rate_limit, \
     add_user_object, track_open_session, clear_sessions, track_close_session, \
     track_close_expired_sessions, get_active_session, get_open_sessions, \
-    check_twofactor_session, validate_auth_attempt
+    check_twofactor_session, validate_auth_attempt, get_hash_cache, \
+    log_hash_cache_stats, LoginStore
 from mig.shared.logger import daemon_logger, daemon_gdp_logger, \
     register_hangup_handler
 from mig.shared.notification import send_system_notification
@@ -565,7 +566,15 @@ class MiGDomainController(SimpleDomainController):
             # Expire password hashes after N expire runs
             # logger.debug("expire hash caches")
             expired = 0
-            for cache_id in list(self.config['mig_dc']['hash_cache']):
+            hash_cache = self.config['mig_dc']['hash_cache']
+            if isinstance(hash_cache, dict):
+                hash_ids = list(hash_cache)
+            else:
+                # NOTE: shared credential cache handles size and TTL itself
+                hash_cache.expire()
+                log_hash_cache_stats(configuration, hash_cache)
+                hash_ids = []
+            for cache_id in hash_ids:
                 if self.config['mig_dc']['hash_cache_age'].get(cache_id, -1) > \
                         max_cache_age:
                     # logger.debug("expire aging hash cache entry for %s" %
@@ -579,7 +588,7 @@ class MiGDomainController(SimpleDomainController):
                          (expired, len(self.config['mig_dc']['hash_cache'])))
 
             # Update age counters with lazy init
-            for cache_id in list(self.config['mig_dc']['hash_cache']):
+            for cache_id in [i for i in hash_ids if i in hash_cache]:
                 cache_age = self.config['mig_dc']['hash_cache_age'].get(
                     cache_id, 0)
                 self.config['mig_dc']['hash_cache_age'][cache_id] = cache_age + 1
@@ -1855,7 +1864,7 @@ def run(configuration):
             "root_dir": daemon_conf["root_dir"],
             "last_expire": time.time(),
             "min_expire_delay": 300,
-            "hash_cache": {},
+            "hash_cache": daemon_conf['hash_cache'],
             "hash_cache_age": {},
             "digest_cache": {},
             "digest_cache_age": {},
@@ -2090,9 +2099,9 @@ unless it is available in mig/server/MiGserver.conf
         'user_alias': configuration.user_davs_alias,
         # Lock needed here due to threaded creds updates
         'creds_lock': threading.Lock(),
-        'users': [],
-        'shares': [],
+        'login_store': LoginStore(),
         'login_map': {},
+        'hash_cache': get_hash_cache(configuration),
         # NOTE: enable for litmus test (http://www.webdav.org/neon/litmus/)
         #
         # USAGE:
@@ -53,7 +53,7 @@ def print_job(job_dict, detail=['JOB_ID']):
 
 class JobQueue:
 
-    """Simple job queue implemantation using a list"""
+    """Simple job queue implemantation using a list with a job ID index"""
 
     # TODO: change to better data structure - perhaps circular buffer
     # or real linked list.
@@ -61,22 +61,174 @@ class JobQueue:
     # -Must support virtually unlimited queue length
     # Built-in Queue class does *not* support inspection!
 
+    # NOTE: the queue list is kept as the ordered storage for positional
+    #       access in the schedulers. The index dicts map JOB_ID, owner and
+    #       vgrid to the queued jobs so that duplicate detection and lookups
+    #       avoid scanning the whole queue. Dequeue marks the slot of the job
+    #       with a None tombstone and only compacts the list in later
+    #       mutators, so that removal by JOB_ID is O(1). Positional reads in
+    #       get_job never compact as they may run without the scheduler lock
+    #       like in the executing queue timeout thread. Instead they use a
+    #       list of the live jobs cached until the next change of the queue.
+    #       Positions are recorded relative to a head offset, which is simply
+    #       bumped when the first job is dequeued like in FIFO scheduling.
+    #       An optional QueueJournal attached with its attach method records
+    #       every enqueue, dequeue and update so that the queue can be
+    #       recovered after a crash. Callers changing a queued job in place
+    #       must call update_job for the change to be recorded.
+
     queue = None
+    head = 0
+    tombstones = 0
+    generation = 0
+    positions = None
+    index = None
+    owner_index = None
+    vgrid_index = None
     logger = None
+    journal = None
+    journal_name = None
+    __live_cache = None
 
     def __init__(self, logger):
         """Init"""
 
         self.queue = []
         self.logger = logger
+        self.rebuild_index()
         self.logger.info('initialised queue')
 
+    def __setstate__(self, state):
+        """Restore pickled queue and rebuild any missing indexes if it was
+        saved with an older version without them.
+        """
+
+        self.__dict__.update(state)
+        if self.index is None or self.positions is None:
+            self.rebuild_index()
+
+    def __getstate__(self):
+        """Pickle queue without any attached journal and logger"""
+
+        state = self.__dict__.copy()
+        state.pop('journal', None)
+        state.pop('journal_name', None)
+        state.pop('_JobQueue__live_cache', None)
+        state['logger'] = None
+        return state
+
+    def __journal(self, op, *args):
+        """Record op with args in any attached journal"""
+
+        if self.journal is not None:
+            self.journal.record(self.journal_name, op, args)
+
+    def rebuild_index(self):
+        """Build all indexes from scratch based on the queue list"""
+
+        self.queue = [job for job in self.queue if job is not None]
+        self.head = 0
+        self.tombstones = 0
+        self.generation += 1
+        self.positions = {}
+        self.index = {}
+        self.owner_index = {}
+        self.vgrid_index = {}
+        for (slot, job) in enumerate(self.queue):
+            self.__index_job(job, slot)
+
+    def __compact(self):
+        """Remove any tombstones left from dequeue to restore the positions
+        of all jobs in the queue list.
+        """
+
+        if not self.tombstones:
+            return
+        self.queue = [job for job in self.queue if job is not None]
+        self.head = 0
+        self.tombstones = 0
+        self.__update_positions(0)
+
+    def __update_positions(self, first):
+        """Update positions of all jobs in slots from first and on"""
+
+        for slot in range(first, len(self.queue)):
+            job_id = self.queue[slot].get('JOB_ID', None)
+            if job_id is not None:
+                self.positions[job_id] = self.head + slot
+
+    def __job_vgrids(self, job):
+        """Extract list of vgrids of job"""
+
+        vgrids = job.get('VGRID', [])
+        if not isinstance(vgrids, list):
+            vgrids = [vgrids]
+        return vgrids
+
+    def __index_job(self, job, slot):
+        """Add job in slot to the indexes"""
+
+        self.generation += 1
+        job_id = job.get('JOB_ID', None)
+        if job_id is None:
+            return
+        self.positions[job_id] = self.head + slot
+        self.index[job_id] = job
+        owner = job.get('USER_CERT', None)
+        if owner is not None:
+            self.owner_index[owner] = self.owner_index.get(owner, {})
+            self.owner_index[owner][job_id] = job
+        for vgrid in self.__job_vgrids(job):
+            self.vgrid_index[vgrid] = self.vgrid_index.get(vgrid, {})
+            self.vgrid_index[vgrid][job_id] = job
+
+    def __unindex_job(self, job):
+        """Remove job from the indexes"""
+
+        self.generation += 1
+        job_id = job.get('JOB_ID', None)
+        if job_id is None:
+            return
+        self.positions.pop(job_id, None)
+        self.index.pop(job_id, None)
+        owner = job.get('USER_CERT', None)
+        owner_jobs = self.owner_index.get(owner, {})
+        owner_jobs.pop(job_id, None)
+        if not owner_jobs:
+            self.owner_index.pop(owner, None)
+        for vgrid in self.__job_vgrids(job):
+            vgrid_jobs = self.vgrid_index.get(vgrid, {})
+            vgrid_jobs.pop(job_id, None)
+            if not vgrid_jobs:
+                self.vgrid_index.pop(vgrid, None)
+
+    def __remove_slot(self, slot):
+        """Remove job in slot from queue and indexes and return it"""
+
+        job = self.queue[slot]
+        if slot == len(self.queue) - 1:
+            self.queue.pop()
+        elif slot == 0:
+            del self.queue[0]
+            self.head += 1
+        else:
+            self.queue[slot] = None
+            self.tombstones += 1
+        self.__unindex_job(job)
+        self.__journal('dequeue', job.get('JOB_ID', None))
+        # Limit the space wasted on tombstones in queues without scans
+        if self.tombstones > len(self.queue) // 2:
+            self.__compact()
+        return job
+
     def format_queue(self, detail=['JOB_ID']):
         """Format queue contents for printing"""
 
         out = []
         if self.queue_length() > 0:
             for j in self.queue:
+                if j is None:
+                    continue
                 out.append('\n'.join(format_job(j, detail)))
         else:
             out.append('\t-Empty-')
@@ -91,7 +243,12 @@ class JobQueue:
     def queue_length(self):
         """Count number of jobs in queue"""
 
-        return len(self.queue)
+        return len(self.queue) - self.tombstones
+
+    def has_job(self, jobid):
+        """Check if job with jobid is in queue"""
+
+        return jobid in self.index
 
     def enqueue_job(self, job, index):
         """Insert job at index in queue list"""
@@ -101,18 +258,26 @@ class JobQueue:
             # check if a job with that job_id is in the queue to avoid multiple occurences
 
             try:
-                for queue_job in self.queue:
-                    if queue_job['JOB_ID'] == job['JOB_ID']:
-                        self.logger.error('enqueue_job called with a job already in the queue! Skipping enqueue_job for job_id %s!'
-                                          % job['JOB_ID'])
-                        return False
+                if job['JOB_ID'] in self.index:
+                    self.logger.error('enqueue_job called with a job already in the queue! Skipping enqueue_job for job_id %s!'
+                                      % job['JOB_ID'])
+                    return False
             except Exception as exc:
                 self.logger.error('enqueue_job exception when checking if specified job already is in the queue: %s'
                                   % exc)
 
             # job must be wrapped
 
-            self.queue[index:index] = [job]
+            if index == self.queue_length():
+                # Common append case keeps any tombstones for later
+                self.queue.append(job)
+                self.__index_job(job, len(self.queue) - 1)
+            else:
+                self.__compact()
+                self.queue[index:index] = [job]
+                self.__index_job(job, index)
+                self.__update_positions(index + 1)
+            self.__journal('enqueue', index, job)
 
             # self.logger.info("NEW JOB! after enqueue len is %d", self.queue_length())
 
@@ -122,12 +287,48 @@ class JobQueue:
             out of range! (qlen %d)", index, self.queue_length())
         return False
 
+    def update_job(self, job):
+        """Register in-place changes like a new STATUS of the queued job with
+        the same JOB_ID as job, which it replaces if it is another dict.
+        Returns True if such a job is queued and False otherwise.
+        """
+
+        job_id = job.get('JOB_ID', None)
+        if not job_id in self.positions:
+            self.logger.error('update_job: Failed to update job - jobid: %s '
+                              % job_id)
+            return False
+        slot = self.positions[job_id] - self.head
+        self.__unindex_job(self.queue[slot])
+        self.queue[slot] = job
+        self.__index_job(job, slot)
+        self.__journal('update', job)
+        return True
+
+    def __live_jobs(self):
+        """Returns list of the queued jobs without any tombstones. It is
+        cached until the next change of the queue and building it leaves the
+        queue itself untouched.
+        """
+
+        cached = self.__live_cache
+        if cached is not None and cached[0] == self.generation:
+            return cached[1]
+        # NOTE: a concurrent change makes the generation differ next time
+        generation = self.generation
+        if not self.tombstones:
+            return self.queue
+        live = [job for job in self.queue[:] if job is not None]
+        self.__live_cache = (generation, live)
+        return live
+
     def get_job(self, index):
         """Find and return job found at index in queue list"""
 
         job = None
-        if self.queue_length() > index:
-            job = self.queue[index]
+        live = self.__live_jobs()
+        if -len(live) <= index < len(live):
+            job = live[index]
         else:
             self.logger.error("get_job: Failed to get job - index %d \
             out of range! (qlen %d)", index, self.queue_length())
@@ -138,10 +339,7 @@ class JobQueue:
 
         job = None
         if self.queue_length() > 0:
-            for j in self.queue:
-                if j['JOB_ID'] == jobid:
-                    job = j
-                    break
+            job = self.index.get(jobid, None)
         elif log_errors:
             self.logger.error('get_job_by_id: Queue empty.')
 
@@ -150,13 +348,27 @@ class JobQueue:
                               % jobid)
         return job
 
+    def get_jobs_by_owner(self, owner):
+        """Find and return list of all queued jobs owned by owner. Please
+        note that the jobs are not necessarily in queue order.
+        """
+
+        return list(self.owner_index.get(owner, {}).values())
+
+    def get_jobs_by_vgrid(self, vgrid):
+        """Find and return list of all queued jobs submitted to vgrid. Please
+        note that the jobs are not necessarily in queue order.
+        """
+
+        return list(self.vgrid_index.get(vgrid, {}).values())
+
     def dequeue_job(self, index):
         """Dequeue and return job found at index in queue list"""
 
         job = None
         if self.queue_length() > index:
-            job = self.queue[index]
-            self.queue[index:index + 1] = []
+            self.__compact()
+            job = self.__remove_slot(index)
         else:
             self.logger.error("dequeue_job: Failed to dequeue job - index %d \
             out of range! (qlen %d)", index, self.queue_length())
@@ -166,14 +378,9 @@ class JobQueue:
         """Dequeue and return job with id: 'jobid'"""
 
         job = None
-        index = 0
         if self.queue_length() > 0:
-            for j in self.queue:
-                if j['JOB_ID'] == jobid:
-                    job = self.queue[index]
-                    self.dequeue_job(index)
-                    break
-                index += 1
+            if jobid in self.positions:
+                job = self.__remove_slot(self.positions[jobid] - self.head)
         elif log_errors:
             self.logger.error('dequeue_job_by_id: Queue empty.')
 
@@ -181,3 +388,55 @@ class JobQueue:
             self.logger.error('dequeue_job_by_id: Failed to dequeue job - jobid: %s '
                               % jobid)
         return job
+
+
+if __name__ == '__main__':
+    import random
+    import sys
+    import time
+
+    from mig.shared.logger import null_logger
+
+    lookups = 1000
+    for size in [int(i) for i in sys.argv[1:]] or [10000, 100000]:
+        print('Benchmark job queue with %d jobs and %d lookups' %
+              (size, lookups))
+        job_queue = JobQueue(null_logger('jobqueue'))
+        job_ids = ['%d_%d' % (time.time(), i) for i in range(size)]
+        before = time.time()
+        for (i, job_id) in enumerate(job_ids):
+            job_queue.enqueue_job({'JOB_ID': job_id,
+                                   'USER_CERT': 'user%d' % (i % 100),
+                                   'VGRID': ['vgrid%d' % (i % 10)]},
+                                  job_queue.queue_length())
+        print('enqueue:    %.2fus per job' %
+              ((time.time() - before) * 1e6 / size))
+        sample = random.sample(job_ids, lookups)
+        before = time.time()
+        for job_id in sample:
+            job_queue.enqueue_job({'JOB_ID': job_id}, 0)
+        print('duplicate:  %.2fus per job' %
+              ((time.time() - before) * 1e6 / lookups))
+        before = time.time()
+        for job_id in sample:
+            job_queue.get_job_by_id(job_id)
+        print('get by id:  %.2fus per job' %
+              ((time.time() - before) * 1e6 / lookups))
+        before = time.time()
+        for job_id in sample[:lookups // 10]:
+            [j for j in job_queue.queue if j['JOB_ID'] == job_id]
+        print('scan by id: %.2fus per job (old linear lookup)' %
+              ((time.time() - before) * 1e6 / (lookups // 10)))
+        before = time.time()
+        job_queue.get_jobs_by_owner('user42')
+        print('by owner:   %.2fus' % ((time.time() - before) * 1e6))
+        before = time.time()
+        for job_id in sample:
+            job_queue.dequeue_job_by_id(job_id)
+        print('dequeue id: %.2fus per job' %
+              ((time.time() - before) * 1e6 / lookups))
+        before = time.time()
+        for _ in range(lookups):
+            job_queue.dequeue_job(0)
+        print('dequeue 0:  %.2fus per job' %
+              ((time.time() - before) * 1e6 / lookups))
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# migrateentitymaps - Copy pickled user, resource and vgrid maps to sqlite db
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Migrate the pickled user, resource and vgrid maps in mig_system_files to
+the per-entity sqlite backend selected with entity_map_backend = sqlite in the
+SITE section of MiGserver.conf. Run it before switching the backend to avoid
+a full refresh of all maps on first use.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import getopt
+import os
+import sys
+
+from mig.shared.conf import get_configuration_object
+from mig.shared.vgridaccess import migrate_entity_map_to_db
+
+map_kinds = ['user', 'resource', 'vgrid']
+
+
+def usage(name='migrateentitymaps.py'):
+    """Usage help"""
+
+    print("""Migrate pickled entity maps to the sqlite entity map backend.
+Usage:
+%(name)s [OPTIONS] [KIND ...]
+Where KIND is one or more of %(kinds)s (default all) and OPTIONS may be one
+or more of:
+   -c CONF_FILE        Use CONF_FILE as server configuration
+   -h                  Show this help
+   -v                  Verbose output
+""" % {'name': name, 'kinds': ', '.join(map_kinds)})
+
+
+if '__main__' == __name__:
+    args = sys.argv[1:]
+    conf_path = None
+    verbose = False
+    opt_args = 'c:hv'
+    try:
+        (opts, args) = getopt.getopt(args, opt_args)
+    except getopt.GetoptError as err:
+        print('Error: ', err.msg)
+        usage()
+        sys.exit(1)
+
+    for (opt, val) in opts:
+        if opt == '-c':
+            conf_path = val
+        elif opt == '-h':
+            usage()
+            sys.exit(0)
+        elif opt == '-v':
+            verbose = True
+        else:
+            print('Error: %s not supported!' % opt)
+
+    if conf_path and not os.path.isfile(conf_path):
+        print('Failed to read configuration file: %s' % conf_path)
+        sys.exit(1)
+
+    kinds = args or map_kinds
+    for kind in kinds:
+        if not kind in map_kinds:
+            print('Error: invalid map kind %r' % kind)
+            usage()
+            sys.exit(1)
+
+    configuration = get_configuration_object(conf_path)
+    retval = 0
+    for kind in kinds:
+        if verbose:
+            print('Migrating %s map' % kind)
+        migrated = migrate_entity_map_to_db(configuration, kind)
+        if migrated < 0:
+            print('Failed to migrate %s map - see log for details' % kind)
+            retval = 1
+        else:
+            print('Migrated %d %s map entities' % (migrated, kind))
+
+    sys.exit(retval)
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# migratepickles - Rewrite pickled state files with another pickle protocol
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Rewrite pickled state files like the entity maps in mig_system_files or
+the job mRSL files in place using another pickle protocol. Can also be used to
+just benchmark size and load time of the files with the current and the
+requested protocol. Files that do not contain a pickle are left untouched.
+
+Reading works with any protocol so the migration is optional, but please note
+that python 2 processes can only read pickles up to protocol 2. Stop the
+services writing the files or run it during a maintenance window since
+concurrent updates may otherwise be lost.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import getopt
+import os
+import pickletools
+import shutil
+import sys
+import tempfile
+import time
+
+from mig.shared.conf import get_configuration_object
+from mig.shared.fileio import walk
+from mig.shared.serial import dumps, loads, parse_pickle_protocol
+
+
+def usage(name='migratepickles.py'):
+    """Usage help"""
+
+    print("""Rewrite or benchmark pickled state files with another protocol.
+Usage:
+%(name)s [OPTIONS] PATH [PATH ...]
+Where PATH is a pickle file or a directory to recursively handle all files in
+and where OPTIONS may be one or more of:
+   -b                  Benchmark only without rewriting any files
+   -c CONF_FILE        Use CONF_FILE as server configuration
+   -f                  Force rewrite even if file already uses protocol
+   -h                  Show this help
+   -p PROTOCOL         Use PROTOCOL (number, legacy, compat or highest) rather
+                       than the pickle_protocol from configuration
+   -v                  Verbose output
+""" % {'name': name})
+
+
+def pickle_protocol(data):
+    """Detect protocol of pickled data. Protocol 2+ pickles start with an
+    explicit protocol opcode whereas 0 and 1 are told apart by scanning for
+    any of the binary opcodes introduced in protocol 1. Pickles of simple
+    objects like None are the same in both and reported as 0.
+    """
+    if data[:1] == b'\x80':
+        return bytearray(data[1:2])[0]
+    try:
+        for (opcode, _, _) in pickletools.genops(data):
+            if opcode.proto >= 1:
+                return 1
+    except Exception:
+        pass
+    return 0
+
+
+def expand_paths(paths):
+    """Expand directories in paths to all the files inside them"""
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, _, files) in walk(path):
+                for name in files:
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def migrate_pickle(path, protocol, benchmark=False, force=False):
+    """Load pickle in path and write it back with given protocol unless in
+    benchmark mode. The file mode and time stamps are preserved since e.g.
+    the map refresh relies on them.
+    Returns a dictionary with sizes and load times before and after or None
+    if path is not a pickle file.
+    """
+    with open(path, 'rb') as pickle_fd:
+        data = pickle_fd.read()
+    before = time.time()
+    try:
+        obj = loads(data)
+    except Exception:
+        return None
+    old_load = time.time() - before
+    old_protocol = pickle_protocol(data)
+    new_data = dumps(obj, protocol)
+    before = time.time()
+    loads(new_data)
+    new_load = time.time() - before
+    stats = {'old_protocol': old_protocol, 'old_size': len(data),
+             'old_load': old_load, 'new_size': len(new_data),
+             'new_load': new_load, 'migrated': False}
+    # NOTE: identical data also covers pickles with the same bytes in both
+    #       protocol 0 and 1
+    if benchmark or (not force and (old_protocol == protocol or
+                                    new_data == data)):
+        return stats
+    (tmp_fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path),
+                                          prefix='.migratepickle')
+    try:
+        os.write(tmp_fd, new_data)
+        os.close(tmp_fd)
+        shutil.copystat(path, tmp_path)
+        os.rename(tmp_path, path)
+        stats['migrated'] = True
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return stats
+
+
+if '__main__' == __name__:
+    args = sys.argv[1:]
+    conf_path = None
+    benchmark = False
+    force = False
+    protocol = None
+    verbose = False
+    opt_args = 'bc:fhp:v'
+    try:
+        (opts, args) = getopt.getopt(args, opt_args)
+    except getopt.GetoptError as err:
+        print('Error: ', err.msg)
+        usage()
+        sys.exit(1)
+
+    for (opt, val) in opts:
+        if opt == '-b':
+            benchmark = True
+        elif opt == '-c':
+            conf_path = val
+        elif opt == '-f':
+            force = True
+        elif opt == '-h':
+            usage()
+            sys.exit(0)
+        elif opt == '-p':
+            try:
+                protocol = parse_pickle_protocol(val)
+            except ValueError as vae:
+                print('Error: invalid protocol %r: %s' % (val, vae))
+                sys.exit(1)
+        elif opt == '-v':
+            verbose = True
+        else:
+            print('Error: %s not supported!' % opt)
+
+    if not args:
+        usage()
+        sys.exit(1)
+
+    if protocol is None:
+        configuration = get_configuration_object(conf_path, skip_log=True)
+        protocol = configuration.site_pickle_protocol
+
+    totals = {'files': 0, 'migrated': 0, 'old_size': 0, 'new_size': 0,
+              'old_load': 0.0, 'new_load': 0.0}
+    retval = 0
+    for path in expand_paths(args):
+        try:
+            stats = migrate_pickle(path, protocol, benchmark, force)
+        except Exception as exc:
+            print('Failed to handle %s: %s' % (path, exc))
+            retval = 1
+            continue
+        if stats is None:
+            if verbose:
+                print('Skipped non-pickle file %s' % path)
+            continue
+        totals['files'] += 1
+        if stats['migrated']:
+            totals['migrated'] += 1
+        for name in ('old_size', 'new_size', 'old_load', 'new_load'):
+            totals[name] += stats[name]
+        if verbose:
+            print('%s: protocol %d -> %d, %d -> %d bytes, load %.4fs -> %.4fs'
+                  % (path, stats['old_protocol'], protocol, stats['old_size'],
+                     stats['new_size'], stats['old_load'], stats['new_load']))
+
+    print('Handled %(files)d pickle files and rewrote %(migrated)d' % totals)
+    if totals['files']:
+        print('Total size %d -> %d bytes and load time %.3fs -> %.3fs' %
+              (totals['old_size'], totals['new_size'], totals['old_load'],
+               totals['new_load']))
+    sys.exit(retval)
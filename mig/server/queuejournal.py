@@ -0,0 +1,309 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# queuejournal - write-ahead journal for the grid_script job queues
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Write-ahead journal of the grid_script job queues.
+
+The job queues used to be pickled only on clean shutdown, so after a crash
+grid_script either loaded stale queues or had to unpickle every mRSL file to
+rebuild them. Queues attached to a QueueJournal instead append a small record
+for each enqueue and dequeue to a journal file in mig_system_files. Most job
+status changes in grid_script are moves between the job and executing queue
+so they are covered by those records. In-place changes to queued jobs like
+freeze and thaw are recorded as updates with the entire changed job through
+JobQueue.update_job. Every snapshot_interval records all attached queues are
+saved in a snapshot and the journal is truncated. On restart recover loads
+the latest snapshot and replays only the journal tail written after it.
+
+Records are length prefixed pickles with an increasing sequence number. The
+snapshot holds the sequence number of the last record it includes, so records
+left over from a crash between writing the snapshot and truncating the
+journal are simply skipped, and a torn last record is ignored.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import struct
+import threading
+
+from mig.server.jobqueue import JobQueue
+from mig.shared.defaults import job_journal_snapshot_interval
+from mig.shared.serial import dumps, loads, COMPAT_PROTOCOL
+
+_snapshot_filename = 'job_queues.snapshot'
+_journal_filename = 'job_queues.journal'
+_record_header = struct.Struct('!I')
+
+
+class QueueJournal(object):
+    """Journal and snapshots of named JobQueue objects"""
+
+    def __init__(self, state_dir, logger,
+                 snapshot_interval=job_journal_snapshot_interval, sync=False):
+        """Init journal in state_dir without touching any files yet. The sync
+        argument makes every record fsync the journal to survive power loss
+        and not just a crash of grid_script.
+        """
+        self.snapshot_path = os.path.join(state_dir, _snapshot_filename)
+        self.journal_path = os.path.join(state_dir, _journal_filename)
+        self.logger = logger
+        self.snapshot_interval = snapshot_interval
+        self.sync = sync
+        self.queues = {}
+        self.seq = 0
+        self.pending = 0
+        self._lock = threading.RLock()
+        self.__journal_fd = None
+
+    def _load_snapshot(self):
+        """Returns tuple with sequence number and dictionary of queues from
+        the latest snapshot or (0, None) if there is none.
+        """
+        if not os.path.exists(self.snapshot_path):
+            return (0, None)
+        try:
+            with open(self.snapshot_path, 'rb') as snapshot_fd:
+                state = loads(snapshot_fd.read())
+            return (state['seq'], state['queues'])
+        except Exception as exc:
+            self.logger.error("could not load queue snapshot %s: %s" %
+                              (self.snapshot_path, exc))
+            return (0, None)
+
+    def _load_records(self):
+        """Returns a list of all complete (seq, name, op, args) records in
+        the journal and truncates any torn record at the end.
+        """
+        records = []
+        if not os.path.exists(self.journal_path):
+            return records
+        good_offset = 0
+        with open(self.journal_path, 'rb') as journal_fd:
+            while True:
+                header = journal_fd.read(_record_header.size)
+                if len(header) < _record_header.size:
+                    break
+                (size, ) = _record_header.unpack(header)
+                data = journal_fd.read(size)
+                if len(data) < size:
+                    break
+                try:
+                    records.append(loads(data))
+                except Exception as exc:
+                    self.logger.error("could not load queue journal record:"
+                                      " %s" % exc)
+                    break
+                good_offset = journal_fd.tell()
+        if good_offset < os.path.getsize(self.journal_path):
+            self.logger.warning("dropping torn record at end of %s" %
+                                self.journal_path)
+            with open(self.journal_path, 'r+b') as journal_fd:
+                journal_fd.truncate(good_offset)
+        return records
+
+    def recover(self):
+        """Load the latest snapshot and replay the journal records written
+        after it. Returns a dictionary mapping queue names to the recovered
+        JobQueue objects or None if no journal state was found.
+        """
+        with self._lock:
+            (seq, queues) = self._load_snapshot()
+            records = self._load_records()
+            if queues is None and not records:
+                return None
+            if queues is None:
+                queues = {}
+            for queue in queues.values():
+                queue.logger = self.logger
+            replayed = 0
+            for (rec_seq, name, op, args) in records:
+                if rec_seq <= seq:
+                    continue
+                if not name in queues:
+                    queues[name] = JobQueue(self.logger)
+                queue = queues[name]
+                if op == 'enqueue':
+                    (index, job) = args
+                    queue.enqueue_job(job, min(index, queue.queue_length()))
+                elif op == 'dequeue':
+                    queue.dequeue_job_by_id(args[0], log_errors=False)
+                elif op == 'update':
+                    if queue.has_job(args[0].get('JOB_ID', None)):
+                        queue.update_job(args[0])
+                else:
+                    self.logger.warning("ignoring unknown journal op %s" % op)
+                seq = rec_seq
+                replayed += 1
+            self.seq = seq
+            self.logger.info("recovered %s from snapshot and %d journal "
+                             "records" % (', '.join(["%s with %d jobs" %
+                                                     (name, i.queue_length())
+                                                     for (name, i) in
+                                                     queues.items()]),
+                                          replayed))
+            return queues
+
+    def attach(self, name, queue):
+        """Record all changes to queue under name from now on and include it
+        in snapshots.
+        """
+        with self._lock:
+            queue.journal = self
+            queue.journal_name = name
+            self.queues[name] = queue
+
+    def record(self, name, op, args):
+        """Append a record of op with the args tuple for the queue with name
+        and take a snapshot if enough records piled up since the last one.
+        """
+        with self._lock:
+            self.seq += 1
+            data = dumps((self.seq, name, op, args), COMPAT_PROTOCOL)
+            try:
+                if self.__journal_fd is None:
+                    self.__journal_fd = open(self.journal_path, 'ab')
+                self.__journal_fd.write(_record_header.pack(len(data)) + data)
+                self.__journal_fd.flush()
+                if self.sync:
+                    os.fsync(self.__journal_fd.fileno())
+            except Exception as exc:
+                self.logger.error("could not write queue journal %s: %s" %
+                                  (self.journal_path, exc))
+            self.pending += 1
+            if self.pending >= self.snapshot_interval:
+                self.snapshot()
+
+    def snapshot(self):
+        """Save all attached queues in a new snapshot and truncate the
+        journal. Returns True on success and False otherwise.
+        """
+        with self._lock:
+            tmp_path = '%s.tmp' % self.snapshot_path
+            try:
+                data = dumps({'seq': self.seq, 'queues': self.queues},
+                             COMPAT_PROTOCOL)
+                with open(tmp_path, 'wb') as snapshot_fd:
+                    snapshot_fd.write(data)
+                    snapshot_fd.flush()
+                    os.fsync(snapshot_fd.fileno())
+                os.rename(tmp_path, self.snapshot_path)
+            except Exception as exc:
+                self.logger.error("could not save queue snapshot %s: %s" %
+                                  (self.snapshot_path, exc))
+                return False
+            self.close()
+            # NOTE: records up to seq are now in the snapshot
+            open(self.journal_path, 'wb').close()
+            self.pending = 0
+            return True
+
+    def close(self):
+        """Close the journal file"""
+        with self._lock:
+            if self.__journal_fd is not None:
+                self.__journal_fd.close()
+                self.__journal_fd = None
+
+
+if __name__ == "__main__":
+    import logging
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    from mig.shared.fileio import pickle
+    from mig.shared.gridscript import check_mrsl_files
+
+    class FakeConfiguration(object):
+        """Just the values used here"""
+
+        def __init__(self, base_dir, logger):
+            self.logger = logger
+            self.mrsl_files_dir = os.path.join(base_dir, 'mrsl_files') + \
+                os.sep
+            self.mig_system_files = os.path.join(base_dir, 'mig_system_files')
+            self.mig_system_run = self.mig_system_files
+
+    print("Benchmark queue recovery from journal against mRSL scan")
+    logger = logging.getLogger('queuejournal')
+    job_count = int((sys.argv[1:] or [20000])[0])
+    base_dir = tempfile.mkdtemp()
+    configuration = FakeConfiguration(base_dir, logger)
+    os.makedirs(configuration.mig_system_files)
+    try:
+        journal = QueueJournal(configuration.mig_system_files, logger,
+                               snapshot_interval=job_count)
+        job_queue = JobQueue(logger)
+        executing_queue = JobQueue(logger)
+        journal.attach('job_queue', job_queue)
+        journal.attach('executing_queue', executing_queue)
+        statuses = ['FINISHED'] * 6 + ['QUEUED'] * 3 + ['EXECUTING']
+        for i in range(job_count):
+            user_dir = os.path.join(configuration.mrsl_files_dir,
+                                    'user-%d' % (i % 100))
+            if not os.path.isdir(user_dir):
+                os.makedirs(user_dir)
+            job_dict = {'JOB_ID': '%d_bench' % i, 'USER_CERT': 'user-%d' %
+                        (i % 100), 'STATUS': statuses[i % len(statuses)],
+                        'EXECUTE': ['echo job %d' % i] * 10}
+            pickle(job_dict, os.path.join(user_dir, '%s.mRSL' %
+                                          job_dict['JOB_ID']), logger)
+            if job_dict['STATUS'] == 'QUEUED':
+                job_queue.enqueue_job(job_dict, job_queue.queue_length())
+            elif job_dict['STATUS'] == 'EXECUTING':
+                executing_queue.enqueue_job(job_dict,
+                                            executing_queue.queue_length())
+        journal.snapshot()
+        # Leave a tail of moves from queued to executing after the snapshot
+        tail = job_queue.queue_length() // 10
+        for _ in range(tail):
+            job_dict = job_queue.dequeue_job(0)
+            job_dict['STATUS'] = 'EXECUTING'
+            executing_queue.enqueue_job(job_dict,
+                                        executing_queue.queue_length())
+        journal.close()
+
+        before = time.time()
+        scan_queue, scan_executing = JobQueue(logger), JobQueue(logger)
+        check_mrsl_files(configuration, scan_queue, scan_executing, False,
+                         logger)
+        scan_secs = time.time() - before
+        before = time.time()
+        queues = QueueJournal(configuration.mig_system_files,
+                              logger).recover()
+        recover_secs = time.time() - before
+        print("%d jobs with %d queued and %d executing:" %
+              (job_count, queues['job_queue'].queue_length(),
+               queues['executing_queue'].queue_length()))
+        print("    full mRSL scan: %.3fs" % scan_secs)
+        print("    snapshot and %d record journal tail: %.3fs" %
+              (2 * tail, recover_secs))
+    finally:
+        shutil.rmtree(base_dir)
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# rebuilddiskstats - Rebuild cached user disk use stats from scratch
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Helper to rebuild the cached disk use stats of users from scratch. Useful
+for recovery if the incrementally updated stats ever get out of sync with the
+actual user home contents.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import getopt
+import os
+import sys
+
+from mig.shared.base import client_dir_id
+from mig.shared.conf import get_configuration_object
+from mig.shared.usercache import refresh_disk_stats, OWN, VGRID, FILES, \
+    DIRECTORIES, BYTES
+
+
+def usage(name='rebuilddiskstats.py'):
+    """Usage help"""
+
+    print("""Rebuild cached disk use stats for users.
+Usage:
+%(name)s [OPTIONS] [CLIENT_ID ...]
+Where OPTIONS may be one or more of:
+   -a                  Rebuild for all users with cached disk stats
+   -h                  Show this help
+   -v                  Verbose output
+where CLIENT_ID is one or more specific users to rebuild the disk stats for.
+""" % {'name': name})
+
+
+if __name__ == '__main__':
+    args = None
+    all_users = False
+    verbose = False
+    opt_args = 'ahv'
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], opt_args)
+    except getopt.GetoptError as err:
+        print('Error: ', err.msg)
+        usage()
+        sys.exit(1)
+
+    for (opt, val) in opts:
+        if opt == '-a':
+            all_users = True
+        elif opt == '-h':
+            usage()
+            sys.exit(0)
+        elif opt == '-v':
+            verbose = True
+        else:
+            print('Error: %s not supported!' % opt)
+
+    configuration = get_configuration_object(skip_log=True)
+    client_ids = list(args)
+    if all_users:
+        for client_dir in sorted(os.listdir(configuration.user_cache)):
+            stats_path = os.path.join(configuration.user_cache, client_dir,
+                                      'disk-stats.pck')
+            if os.path.isfile(stats_path):
+                client_ids.append(client_dir_id(client_dir))
+    if not client_ids:
+        usage()
+        sys.exit(1)
+
+    retval = 0
+    for client_id in client_ids:
+        if verbose:
+            print('Rebuild disk stats for %s' % client_id)
+        try:
+            stats = refresh_disk_stats(configuration, client_id,
+                                       full_rebuild=True)
+        except Exception as exc:
+            print('Failed to rebuild disk stats for %s: %s' % (client_id,
+                                                               exc))
+            retval += 1
+            continue
+        if verbose:
+            for (title, total) in [('own', OWN), ('vgrid', VGRID)]:
+                print('  %s: %d files, %d dirs, %d bytes' %
+                      (title, stats[total][FILES],
+                       stats[total][DIRECTORIES], stats[total][BYTES]))
+    sys.exit(retval)
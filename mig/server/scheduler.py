@@ -44,7 +44,8 @@ from mig.server.jobqueue import print_job
 from mig.shared import safeeval
 from mig.shared.defaults import maxfill_fields, keyword_all
 from mig.shared.resource import anon_resource_id
-from mig.shared.vgrid import vgrid_access_match, validated_vgrid_list
+from mig.shared.vgrid import vgrid_access_match, validated_vgrid_list, \
+    vgrid_is_default
 
 
 class Scheduler:
@@ -137,6 +138,16 @@ class Scheduler:
 
     illegal_price = -42.0
     reschedule_interval = 1800
+
+    # Resource candidate index used to limit the resources that best_resource
+    # has to run the full job_fits_resource check on. The capacity fields are
+    # indexed in power of two buckets so that a job only needs to look at
+    # resources in the bucket of its own requirement and above.
+
+    use_resource_index = True
+    index_capacity_fields = ['NODECOUNT', 'CPUCOUNT', 'CPUTIME', 'DISK',
+                             'MEMORY']
+    __default_vgrid_key = None
     __schedule_fields = {
         'SCHEDULE_TIMESTAMP': None,
         'SCHEDULE_HINT': None,
@@ -160,6 +171,7 @@ class Scheduler:
         self.resources = {}
         self.servers = {}
         self.peers = config.peers
+        self.rebuild_resource_index()
         self.update_local_server()
 
     def _clone_dict(self, dictionary):
@@ -196,6 +208,7 @@ class Scheduler:
         (self.servers, self.resources, self.users) = cache
         for entities in (self.servers, self.resources, self.users):
             self.expire_entitites(entities)
+        self.rebuild_resource_index()
         self.update_local_server()
 
     def get_cache(self):
@@ -585,8 +598,140 @@ class Scheduler:
 
         res_id = res['RESOURCE_ID']
         self.resources[res_id] = res
+        self.index_resource(res_id, res)
         return res
 
+    def _capacity_bucket(self, value):
+        """Map a capacity value to its power of two bucket or None if the value
+        is not a valid integer.
+        """
+        try:
+            return max(int(value), 0).bit_length()
+        except (TypeError, ValueError):
+            return None
+
+    def _vgrid_keys(self, vgrid_list):
+        """Index keys for a list of vgrids. A job vgrid only fits a resource
+        vgrid if the top-level vgrid names are identical or if both are the
+        default vgrid in one of its spellings.
+        """
+        keys = set()
+        for vgrid in vgrid_list:
+            keys.add(vgrid.split('/')[0])
+            if vgrid_is_default(vgrid):
+                keys.add(self.__default_vgrid_key)
+        return keys
+
+    def _resource_index_keys(self, res):
+        """Extract the index keys for resource dictionary res"""
+
+        res_keys = {}
+        if 'ARCHITECTURE' in res:
+            res_keys['ARCHITECTURE'] = [res['ARCHITECTURE']]
+        res_keys['RUNTIMEENVIRONMENT'] = [
+            rre[0] for rre in res.get('RUNTIMEENVIRONMENT', [])]
+        res_keys['VGRID'] = list(self._vgrid_keys(res.get('VGRID', [])))
+        for attr in self.index_capacity_fields:
+            if attr in res:
+                bucket = self._capacity_bucket(res[attr])
+                if bucket is not None:
+                    res_keys[attr] = [bucket]
+        return res_keys
+
+    def rebuild_resource_index(self):
+        """Build the resource candidate index from scratch"""
+
+        self.__res_index = {}
+        self.__res_keys = {}
+        self.__res_order = {}
+        self.__res_counter = 0
+        for (res_id, res) in self.resources.items():
+            self.index_resource(res_id, res)
+
+    def index_resource(self, res_id, res):
+        """Add or refresh res_id in the resource candidate index"""
+
+        if res_id in self.__res_keys:
+            self.unindex_resource(res_id, keep_order=True)
+        else:
+            self.__res_counter += 1
+            self.__res_order[res_id] = self.__res_counter
+        res_keys = self._resource_index_keys(res)
+        for (field, keys) in res_keys.items():
+            field_index = self.__res_index.setdefault(field, {})
+            for key in keys:
+                field_index.setdefault(key, set()).add(res_id)
+        self.__res_keys[res_id] = res_keys
+
+    def unindex_resource(self, res_id, keep_order=False):
+        """Remove res_id from the resource candidate index"""
+
+        res_keys = self.__res_keys.pop(res_id, {})
+        for (field, keys) in res_keys.items():
+            field_index = self.__res_index.get(field, {})
+            for key in keys:
+                hits = field_index.get(key, None)
+                if hits is None:
+                    continue
+                hits.discard(res_id)
+                if not hits:
+                    del field_index[key]
+        if not keep_order:
+            self.__res_order.pop(res_id, None)
+
+    def resource_candidates(self, job):
+        """Return a list of (res_id, res) tuples for the resources that may fit
+        job according to the resource index. The list is a superset of the
+        resources accepted by job_fits_resource and it keeps the order in
+        which the resources were first seen.
+        """
+
+        if not self.use_resource_index:
+            return list(self.resources.items())
+
+        # Catch resources added or removed directly in the resources dict
+
+        if len(self.__res_keys) != len(self.resources):
+            self.logger.debug('rebuilding out of sync resource index')
+            self.rebuild_resource_index()
+
+        res_index = self.__res_index
+        narrowed = []
+        if job.get('ARCHITECTURE', None):
+            arch_index = res_index.get('ARCHITECTURE', {})
+            narrowed.append(arch_index.get(job['ARCHITECTURE'], set()))
+        re_index = res_index.get('RUNTIMEENVIRONMENT', {})
+        for jre in job.get('RUNTIMEENVIRONMENT', []):
+            narrowed.append(re_index.get(jre, set()))
+        vgrid_index = res_index.get('VGRID', {})
+        hits = set()
+        for key in self._vgrid_keys(validated_vgrid_list(self.conf, job)):
+            hits.update(vgrid_index.get(key, set()))
+        narrowed.append(hits)
+        for attr in self.index_capacity_fields:
+            if attr not in job:
+                continue
+            bucket = self._capacity_bucket(job[attr])
+            if bucket is None:
+                continue
+            hits = set()
+            for (res_bucket, res_ids) in res_index.get(attr, {}).items():
+                if res_bucket >= bucket:
+                    hits.update(res_ids)
+            narrowed.append(hits)
+
+        narrowed.sort(key=len)
+        candidates = set(narrowed[0])
+        for hits in narrowed[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(hits)
+
+        res_order = self.__res_order
+        ordered = sorted([res_id for res_id in candidates if res_id in
+                          self.resources], key=res_order.get)
+        return [(res_id, self.resources[res_id]) for res_id in ordered]
+
     # TODO: handle disappearing server-links somewhere
     # TODO: handle moved entities (detection: newer timestamp and different "SERVER")
     # TODO: make sure we follow vector clock update strategies...
@@ -664,7 +809,7 @@ class Scheduler:
         # and thus has been expired there.
         # In that way information about dead resources propagates.
 
-        for (cur_id, cur_res) in self.resources.items():
+        for (cur_id, cur_res) in list(self.resources.items()):
             if cur_res['SERVER'] != server_id:
                 continue
             if not cur_id in resources:
@@ -674,6 +819,7 @@ class Scheduler:
                 self.logger.info('prune_peer_resources: remove %s'
                                  % cur_id)
                 del self.resources[cur_id]
+                self.unindex_resource(cur_id)
 
     def prune_peer_users(self, server_id, users):
 
@@ -746,7 +892,7 @@ class Scheduler:
             del users[user_id]
 
     def remove_peer_resources(self, server_id, resources):
-        for (res_id, res) in resources.items():
+        for (res_id, res) in list(resources.items()):
 
             # ignore resources connected to other servers
 
@@ -760,6 +906,8 @@ class Scheduler:
             # self.logger.info("remove_peer_resources: remove %s from %s" % (res_id, server_id))
 
             del resources[res_id]
+            if resources is self.resources:
+                self.unindex_resource(res_id)
 
     def remove_peer_users(self, server_id, users):
         for (user_id, user) in users.items():
@@ -1449,8 +1597,9 @@ class Scheduler:
         job_id = job['JOB_ID']
 
         # self.logger.debug("best_resource: inspecting job %s" % job_id)
+        # Only resources left after the index pre-filter can possibly fit
 
-        for (res_id, res) in self.resources.items():
+        for (res_id, res) in self.resource_candidates(job):
 
             # self.logger.info("test job %s against %s" % (job_id, res_id))
 
@@ -93,6 +93,7 @@ try:
         register_hangup_handler
     from mig.shared.fileio import user_chroot_exceptions
     from mig.shared.conf import get_configuration_object
+    from mig.shared.griddaemons.login import LoginStore
     from mig.server.grid_sftp import SimpleSftpServer as SftpServerImpl
 except ImportError:
     print("ERROR: the migrid modules must be in PYTHONPATH")
@@ -195,10 +196,7 @@ if __name__ == '__main__':
         'user_alias': configuration.user_sftp_alias,
         # Lock needed here due to threaded creds updates
         'creds_lock': threading.Lock(),
-        'users': [],
-        'jobs': [],
-        'shares': [],
-        'jupyter_mounts': [],
+        'login_store': LoginStore(),
         'login_map': {},
         'hash_cache': {},
         'time_stamp': 0,
@@ -35,13 +35,20 @@ import fnmatch
 import getopt
 import os
 import pickle
+import re
 import sys
 import time
 
 from mig.shared.base import client_dir_id, distinguished_name_to_user
+from mig.shared.checksumcache import checksum_files
 from mig.shared.defaults import freeze_meta_filename, freeze_lock_filename, \
     public_archive_index, public_archive_files, public_archive_doi, \
     keyword_pending, keyword_final
+from mig.shared.pwcrypto import sorted_hash_algos
+
+# Recorded full checksums are plain hex digests while partial or unset ones
+# come with a note
+recorded_checksum = re.compile('^[0-9a-f]+$')
 
 
 def fuzzy_match(i, j, offset=2.0):
@@ -53,14 +60,57 @@ def fuzzy_match(i, j, offset=2.0):
     return (i - offset < j and j < i + offset)
 
 
-def check_archive_integrity(configuration, user_id, freeze_path, verbose=False):
+def check_archive_checksums(configuration, freeze_path, cache, meta_state,
+                            verbose=False):
+    """Compare the full checksums recorded in the pickled archive cache with
+    the actual file contents. Uses the checksum service so that each file is
+    read once for all recorded algorithms. The checksum cache is deliberately
+    bypassed so that every file is always read again.
+    """
+    expected = {}
+    hash_algos = []
+    for entry in cache:
+        archive_path = os.path.join(freeze_path, entry['name'])
+        for algo in sorted_hash_algos:
+            recorded = entry.get('%ssum' % algo, '')
+            if not recorded_checksum.match("%s" % recorded):
+                continue
+            expected[archive_path] = expected.get(archive_path, {})
+            expected[archive_path][algo] = recorded
+            if not algo in hash_algos:
+                hash_algos.append(algo)
+    if not expected:
+        return True
+    # NOTE: never trust cached checksums when verifying archive integrity as
+    #       bit rot or tampering that keeps size and mtime would go unnoticed
+    actual = checksum_files(configuration, list(expected), hash_algos,
+                            max_chunks=-1, cache=False)
+    for (archive_path, recorded_map) in expected.items():
+        mismatch = [algo for (algo, recorded) in recorded_map.items() if
+                    actual[archive_path][algo] != recorded]
+        if mismatch and meta_state == keyword_final:
+            print("Archive entry %s has wrong %s checksum (expected %s)"
+                  % (archive_path, ', '.join(mismatch),
+                     ', '.join([recorded_map[i] for i in mismatch])))
+            return False
+        elif mismatch and verbose:
+            print("ignore checksum mismatch on non-final %s" % archive_path)
+        elif verbose:
+            print("Archive entry %s passed checksum verification" %
+                  archive_path)
+    return True
+
+
+def check_archive_integrity(configuration, user_id, freeze_path, verbose=False,
+                            verify_checksums=False):
     """Inspect Archives in freeze_path and compare contents to pickled cache.
     The cache is a list with one dictionary per file using the format:
     {'sha512sum': '...', 'name': 'relpath/to/file.ext',
     'timestamp': 1624273389.482884, 'md5sum': '...', 'sha256sum': '...',
     'sha1sum': '...', 'size': 123247} and where the checksums are only actually
     informative if the user requested them on showfreeze. Thus, just check
-    timestamp and size in general.
+    timestamp and size in general and only compare any recorded checksums if
+    verify_checksums is set.
     """
     if verbose:
         print("Compare cache and contents for %s" % freeze_path)
@@ -125,6 +175,12 @@ def check_archive_integrity(configuration, user_id, freeze_path, verbose=False):
             return False
         if verbose:
             print("Archive entry %s passed verification" % archive_path)
+    if verify_checksums:
+        checked = [entry for entry in cache if not entry['name'] in
+                   ignore_files]
+        return check_archive_checksums(configuration, freeze_path, checked,
+                                       meta.get('STATE', keyword_pending),
+                                       verbose)
     return True
 
 
@@ -141,6 +197,7 @@ Where VERIFY_OPTIONS may be one or more of:
    -h                  Show this help
    -I CERT_DN          Filter to Archives of user ID (distinguished name pattern)
    -n ARCHIVE_NAME     Filter to specific Archive name(s) (pattern)
+   -s                  Also verify any recorded file checksums
    -v                  Verbose output
 """ % {'name': name})
 
@@ -148,7 +205,8 @@ Where VERIFY_OPTIONS may be one or more of:
 if '__main__' == __name__:
     conf_path = None
     verbose = False
-    opt_args = 'A:B:c:hI:n:v'
+    verify_checksums = False
+    opt_args = 'A:B:c:hI:n:sv'
     now = int(time.time())
     created_after, created_before = 0, now
     distinguished_name = '*'
@@ -188,6 +246,8 @@ if '__main__' == __name__:
             distinguished_name = val
         elif opt == '-n':
             archive_name = val
+        elif opt == '-s':
+            verify_checksums = True
         elif opt == '-v':
             verbose = True
         else:
@@ -239,7 +299,8 @@ if '__main__' == __name__:
     for (user_id, archive_list) in archive_hits.items():
         for freeze_path in archive_list:
             verified = check_archive_integrity(
-                configuration, user_id, freeze_path, verbose)
+                configuration, user_id, freeze_path, verbose,
+                verify_checksums)
             if verified:
                 print("%s [PASS]" % freeze_path)
             else:
@@ -29,11 +29,20 @@
 
 from __future__ import absolute_import
 
+import errno
 import os
+import sys
 import tarfile
+import threading
 import zipfile
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from mig.shared.base import client_id_dir, invisible_path, force_utf8
+from mig.shared.defaults import archive_stream_chunk_size, \
+    archive_stream_buffers
 from mig.shared.fileio import write_file, walk
 from mig.shared.job import new_job
 from mig.shared.safeinput import valid_user_path_name
@@ -562,3 +571,255 @@ def pack_archive(
  %s""" % msg
 
     return (status, msg)
+
+
+class ArchiveStreamAborted(IOError):
+    """Raised in the archive packer when the consumer gave up on a stream"""
+    pass
+
+
+class _ArchiveSink(object):
+    """Write-only file-like target for the zip and tar writers. Written data
+    is collected in chunks of chunk_size, which are put on the bounded chunks
+    queue for the consumer and optionally also written to save_fd. It is
+    unseekable on purpose, so that zipfile falls back to streaming mode.
+    """
+
+    def __init__(self, chunks, chunk_size, abort, save_fd=None):
+        """Init sink for chunks queue until abort event is set"""
+        self.chunks = chunks
+        self.chunk_size = chunk_size
+        self.abort = abort
+        self.save_fd = save_fd
+        self.discard = False
+        self.__buffer = []
+        self.__buffered = 0
+
+    def put(self, item):
+        """Put item on chunks queue waiting for room unless aborted"""
+        while not self.abort.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+        raise ArchiveStreamAborted("archive stream aborted")
+
+    def write(self, data):
+        """Buffer data and pass on any full chunk"""
+        if self.discard:
+            return len(data)
+        elif self.abort.is_set():
+            raise ArchiveStreamAborted("archive stream aborted")
+        if self.save_fd is not None:
+            self.save_fd.write(data)
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+        if self.__buffered >= self.chunk_size:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        """Pass on any buffered data as a chunk"""
+        if not self.__buffer:
+            return
+        chunk = b''.join(self.__buffer)
+        self.__buffer = []
+        self.__buffered = 0
+        self.put(chunk)
+
+
+def stream_archive_format(dst):
+    """Return the archive format and the matching tarfile stream mode for the
+    extension of the dst path. The format is None if not supported.
+    """
+    dst_lower = dst.lower()
+    if dst_lower.endswith('.zip'):
+        return ('zip', None)
+    elif dst_lower.endswith('.tar'):
+        return ('tar', 'w|')
+    elif dst_lower.endswith('.tar.gz') or dst_lower.endswith('.tgz'):
+        return ('tar', 'w|gz')
+    elif dst_lower.endswith('.tar.bz2') or dst_lower.endswith('.tbz'):
+        return ('tar', 'w|bz2')
+    return (None, None)
+
+
+def _pack_stream_entries(logger, real_srcs, real_dst, add_file, add_dir):
+    """Walk the real_srcs paths and call add_file or add_dir with the real
+    and the relative path of each visible file and empty dir. Failed entries
+    are logged and skipped. Returns the number of failed entries.
+    """
+    failed = 0
+    for real_src in real_srcs:
+        real_src_dir = os.path.dirname(real_src)
+        if os.path.isdir(real_src):
+            walker = walk(real_src)
+        else:
+            (root, filename) = os.path.split(real_src)
+            walker = ((root + os.sep, [], [filename]), )
+        for (root, _, files) in walker:
+            relative_root = root.replace(real_src_dir + os.sep, '')
+            for entry in files:
+                real_target = os.path.join(root, entry)
+                relative_target = os.path.join(relative_root, entry)
+                if invisible_path(real_target):
+                    logger.warning('skipping hidden file: %s' % real_target)
+                    continue
+                elif real_dst == real_target:
+                    continue
+                try:
+                    add_file(real_target, relative_target)
+                except ArchiveStreamAborted:
+                    raise
+                except Exception as exc:
+                    logger.error('write of %s failed: %s' % (real_target,
+                                                             exc))
+                    failed += 1
+            if not files and not invisible_path(relative_root):
+                try:
+                    add_dir(root, relative_root)
+                except ArchiveStreamAborted:
+                    raise
+                except Exception as exc:
+                    logger.error('write of %s failed: %s' % (root, exc))
+                    failed += 1
+    return failed
+
+
+def stream_archive(
+    configuration,
+    client_id,
+    src_list,
+    dst,
+    save=False,
+    chunk_size=archive_stream_chunk_size,
+    max_buffers=archive_stream_buffers,
+):
+    """Inside the user home of client_id: pack the src_list paths into a zip
+    or tar archive with the format given by the dst extension and return a
+    generator yielding the archive data in chunks as it is produced. Nothing
+    is written to disk unless save is set, in which case the archive is also
+    saved in dst. The archive is packed in a separate thread, so that reading
+    and compressing source files overlaps delivery of previous chunks, and at
+    most max_buffers chunks are held in memory no matter the archive size.
+    All paths are expected to be relative and checked for illegal directory
+    traversal attempts *before* getting here.
+    Raises ValueError on unsupported formats and IOError/OSError if save is
+    set and dst can't be created. The dst file is only opened once the
+    generator is consumed and it is closed again when it is exhausted or
+    closed.
+    """
+    logger = configuration.logger
+    client_dir = client_id_dir(client_id)
+
+    # Please note that base_dir must end in slash to avoid access to other
+    # user dirs when own name is a prefix of another user name
+
+    base_dir = os.path.abspath(os.path.join(configuration.user_home,
+                                            client_dir)) + os.sep
+    real_srcs = [os.path.join(base_dir, src.lstrip(os.sep)) for src in
+                 src_list]
+    real_dst = os.path.join(base_dir, dst.lstrip(os.sep))
+    (archive_format, tar_mode) = stream_archive_format(dst)
+    if archive_format is None:
+        raise ValueError("Unknown/unsupported archive format: %s" % dst)
+    # NOTE: zipfile only supports unseekable targets on python 3
+    if archive_format == 'zip' and sys.version_info[0] < 3:
+        raise ValueError("Streaming of zip archives requires python 3")
+
+    if save:
+        dst_dir = os.path.dirname(real_dst)
+        if os.path.isdir(real_dst):
+            raise IOError(errno.EISDIR, os.strerror(errno.EISDIR), real_dst)
+        if not os.path.isdir(dst_dir):
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), dst_dir)
+        if not os.access(dst_dir, os.W_OK):
+            raise IOError(errno.EACCES, os.strerror(errno.EACCES), dst_dir)
+    chunks = queue.Queue(max_buffers)
+    abort = threading.Event()
+    finished = threading.Event()
+    sink = _ArchiveSink(chunks, chunk_size, abort)
+
+    def __pack():
+        """Pack archive into sink and end stream with a None marker"""
+        logger.info("stream archive of %s as %s" % (src_list, dst))
+        (pack_file, failed, done) = (None, 0, False)
+        try:
+            if archive_format == 'zip':
+                # Force compression and allow files bigger than 2GB
+                pack_file = zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED,
+                                            allowZip64=True)
+
+                def add_file(real_path, relative_path):
+                    """Add file in streaming mode"""
+                    pack_file.write(real_path, relative_path)
+
+                def add_dir(real_path, relative_path):
+                    """Add empty dir"""
+                    pack_file.writestr(zipfile.ZipInfo(relative_path + os.sep),
+                                       '')
+            else:
+                pack_file = tarfile.open(fileobj=sink, mode=tar_mode)
+
+                def add_file(real_path, relative_path):
+                    """Add file in streaming mode"""
+                    pack_file.add(real_path, relative_path, recursive=False)
+                add_dir = add_file
+            failed = _pack_stream_entries(logger, real_srcs, real_dst,
+                                          add_file, add_dir)
+            pack_file.close()
+            sink.flush()
+            if failed:
+                logger.warning("streamed archive %s with %d error(s)" %
+                               (dst, failed))
+            done = True
+            finished.set()
+            sink.put(None)
+        except ArchiveStreamAborted:
+            logger.warning("streaming archive %s aborted by consumer" % dst)
+        except Exception as exc:
+            logger.error("streaming archive %s failed: %s" % (dst, exc))
+            try:
+                sink.put(None)
+            except ArchiveStreamAborted:
+                pass
+        finally:
+            # NOTE: close any unfinished archive without further output
+            sink.discard = True
+            if pack_file is not None and not done:
+                try:
+                    pack_file.close()
+                except Exception:
+                    pass
+
+    packer = threading.Thread(target=__pack)
+    packer.daemon = True
+
+    def __deliver():
+        """Yield chunks from the packer until the end marker"""
+        save_fd = None
+        try:
+            if save:
+                save_fd = sink.save_fd = open(real_dst, 'wb')
+            packer.start()
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            abort.set()
+            if packer.ident is not None:
+                packer.join()
+            if save_fd is not None:
+                save_fd.close()
+                # NOTE: never leave a truncated archive behind
+                if not finished.is_set():
+                    try:
+                        os.remove(real_dst)
+                    except Exception as exc:
+                        logger.error("remove partial %s failed: %s" %
+                                     (real_dst, exc))
+
+    return __deliver()
@@ -123,9 +123,13 @@ def filter_output_objects(configuration, out_obj, truncate_out_len=78,
             # NOTE: shallow copy so we must be careful not to edit original
             stripped_output = entry.copy()
             stripped_lines = stripped_output.get('lines', [])
-            stripped_output['lines'] = compact_lines(stripped_lines,
-                                                     truncate_max_lines,
-                                                     truncate_out_len)
+            # NOTE: never consume streamed lines just for logging
+            if not hasattr(stripped_lines, '__len__'):
+                stripped_output['lines'] = [' .... streamed line(s) ...']
+            else:
+                stripped_output['lines'] = compact_lines(stripped_lines,
+                                                         truncate_max_lines,
+                                                         truncate_out_len)
             out_filtered.append(stripped_output)
         elif entry.get('object_type', 'UNKNOWN') == 'binary':
             # NOTE: shallow copy so we must be careful not to edit original
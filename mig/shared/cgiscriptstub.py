@@ -47,7 +47,7 @@ from mig.shared.base import requested_backend, allow_script, \
     is_default_str_coding, force_default_str_coding_rec
 from mig.shared.conf import get_configuration_object
 from mig.shared.httpsclient import extract_client_id
-from mig.shared.output import format_output, reject_main
+from mig.shared.output import format_output, reject_main, is_stream
 from mig.shared.returnvalues import CLIENT_ERROR
 from mig.shared.scriptinput import fieldstorage_to_dict
 
@@ -108,7 +108,11 @@ def finish_cgi_script(configuration, backend, output_format, ret_code, ret_msg,
         logger.error("CGI %s output formatting failed!" % output_format)
         output = 'Error: output could not be correctly delivered!'
 
-    if output_format != 'file' and not is_default_str_coding(output):
+    # NOTE: streamed output is produced lazily while writing it
+    streamed = is_stream(output)
+
+    if not streamed and output_format != 'file' and \
+            not is_default_str_coding(output):
         logger.error(
             "Formatted output is NOT on default str coding: %s" % [output[:100]])
         err_mark = '__****__'
@@ -131,11 +135,14 @@ def finish_cgi_script(configuration, backend, output_format, ret_code, ret_msg,
         #logger.debug("flush stdout")
         sys.stdout.flush()
         #logger.debug("write content: %s" % [output[:64], '..', output[-64:]])
+        if not streamed:
+            output = [output]
         # NOTE: py2 does not have buffer but py3 needs binary output there
-        if sys.version_info[0] < 3:
-            sys.stdout.write(output)
-        else:
-            sys.stdout.buffer.write(output)
+        for chunk in output:
+            if sys.version_info[0] < 3:
+                sys.stdout.write(chunk)
+            else:
+                sys.stdout.buffer.write(chunk)
         # logger.debug("complete")
     except Exception as exc:
         logger.error("CGI output delivery crashed: %s" % exc)
@@ -0,0 +1,299 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# checksumcache - parallel and cached file checksums
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Checksum service for the chksum backend and the freeze archives.
+
+The checksum_files function hashes a list of files with any number of hash
+algorithms in a single read pass per file and spreads the files over a pool
+of threads. The hashlib functions release the GIL on big updates so threads
+give real parallelism without forking inside the web backends.
+
+Results are kept in an sqlite table in mig_system_files keyed by the device,
+inode, size and modification time of the file, so repeated requests for
+unchanged files skip reading them altogether. The table is bounded to the
+most recently used entries and any failure to use it just disables caching.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+from mig.shared.defaults import default_chunk_size, default_max_chunks, \
+    checksum_workers, checksum_cache_max_entries
+from mig.shared.fileio import checksum_file_multi
+from mig.shared.sqlitedb import open_sqlite_db
+
+_checksum_cache_filename = "checksum_cache.db"
+# Prune the table after this many stores in a process
+_prune_interval = 256
+
+
+def _stat_key(path):
+    """Identify the current version of the file in path by device, inode,
+    size and modification time. Raises OSError if path is gone.
+    """
+    path_stat = os.stat(path)
+    mtime = getattr(path_stat, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = repr(path_stat.st_mtime)
+    return (path_stat.st_dev, path_stat.st_ino, path_stat.st_size,
+            "%s" % mtime)
+
+
+def _limit_bytes(size, chunk_size, max_chunks):
+    """Number of bytes hashed for a file of size or 0 if hashed in full. Thus
+    small files share cache entries for full and limited checksums.
+    """
+    limit = chunk_size * max_chunks
+    if max_chunks < 1 or size <= limit:
+        return 0
+    return limit
+
+
+class ChecksumCache(object):
+    """Bounded table of file checksums keyed by file identity and version"""
+
+    def __init__(self, configuration, max_entries=checksum_cache_max_entries,
+                 db_path=None):
+        """Init cache without opening the table yet"""
+        self.configuration = configuration
+        self.max_entries = max_entries
+        self.__conn = None
+        self.__stores = 0
+        if db_path is None:
+            db_path = os.path.join(configuration.mig_system_files,
+                                   _checksum_cache_filename)
+        self.db_path = db_path
+
+    def _open_db(self):
+        """Lazy open the table"""
+        if self.__conn is None:
+            conn = open_sqlite_db(self.db_path)
+            conn.execute("""CREATE TABLE IF NOT EXISTS checksums (
+                            dev INTEGER NOT NULL,
+                            ino INTEGER NOT NULL,
+                            size INTEGER NOT NULL,
+                            mtime TEXT NOT NULL,
+                            algo TEXT NOT NULL,
+                            limit_bytes INTEGER NOT NULL,
+                            checksum TEXT NOT NULL,
+                            used REAL NOT NULL,
+                            PRIMARY KEY (dev, ino, size, mtime, algo,
+                                         limit_bytes))""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS checksums_used
+                            ON checksums (used)""")
+            conn.commit()
+            self.__conn = conn
+        return self.__conn
+
+    def _call(self, action, *args):
+        """Run action on the table and disable caching on errors so that a
+        broken table never breaks checksums.
+        """
+        if not self.db_path:
+            return None
+        try:
+            return action(self._open_db(), *args)
+        except Exception as exc:
+            self.configuration.logger.error(
+                "disabling checksum cache in %s: %s" % (self.db_path, exc))
+            self.db_path = None
+            return None
+
+    def lookup(self, stat_key, hash_algos, limit_bytes):
+        """Return a dictionary with the cached checksums for the hash_algos
+        of the file version in stat_key.
+        """
+        (dev, ino, size, mtime) = stat_key
+
+        def _lookup(conn):
+            found = {}
+            for algo in hash_algos:
+                row = conn.execute(
+                    "SELECT checksum FROM checksums WHERE dev=? AND ino=? "
+                    "AND size=? AND mtime=? AND algo=? AND limit_bytes=?",
+                    (dev, ino, size, mtime, algo, limit_bytes)).fetchone()
+                if row is not None:
+                    found[algo] = row[0]
+            if found:
+                conn.execute(
+                    "UPDATE checksums SET used=? WHERE dev=? AND ino=? AND "
+                    "size=? AND mtime=? AND limit_bytes=?",
+                    (time.time(), dev, ino, size, mtime, limit_bytes))
+                conn.commit()
+            return found
+        return self._call(_lookup) or {}
+
+    def store(self, stat_key, checksums, limit_bytes):
+        """Save the checksums dictionary mapping algos to checksums for the
+        file version in stat_key and drop any entries for older versions.
+        """
+        (dev, ino, size, mtime) = stat_key
+        self.__stores += 1
+        prune = (self.__stores % _prune_interval == 0)
+
+        def _store(conn):
+            now = time.time()
+            conn.execute("DELETE FROM checksums WHERE dev=? AND ino=? AND "
+                         "(size!=? OR mtime!=?)", (dev, ino, size, mtime))
+            for (algo, checksum) in checksums.items():
+                conn.execute("INSERT OR REPLACE INTO checksums (dev, ino, "
+                             "size, mtime, algo, limit_bytes, checksum, used)"
+                             " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (dev, ino, size, mtime, algo, limit_bytes,
+                              checksum, now))
+            if prune:
+                conn.execute("DELETE FROM checksums WHERE rowid IN (SELECT "
+                             "rowid FROM checksums ORDER BY used DESC LIMIT "
+                             "-1 OFFSET ?)", (self.max_entries, ))
+            conn.commit()
+        self._call(_store)
+
+    def close(self):
+        """Close the connection to the table"""
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+
+def checksum_files(configuration, paths, hash_algos,
+                   chunk_size=default_chunk_size,
+                   max_chunks=default_max_chunks, workers=checksum_workers,
+                   cache=True):
+    """Checksum all files in the paths list with all algorithms in the
+    hash_algos list. Files are read once for all algorithms and hashed in up
+    to workers parallel threads. The chunk_size and max_chunks arguments work
+    like in checksum_file. Unless cache is False the cached checksums are
+    used for unchanged files and new ones saved. The cache argument can also
+    be a ChecksumCache to use. Returns a dictionary mapping each path to a
+    dictionary of algorithms and the same result string as checksum_file
+    would return.
+    """
+    _logger = configuration.logger
+    own_cache = False
+    if cache is True:
+        cache = ChecksumCache(configuration)
+        own_cache = True
+    results = {}
+    todo = []
+    for path in paths:
+        results[path] = {}
+        try:
+            stat_key = _stat_key(path)
+        except OSError:
+            stat_key = None
+        if cache and stat_key is not None:
+            limit_bytes = _limit_bytes(stat_key[2], chunk_size, max_chunks)
+            results[path].update(cache.lookup(stat_key, hash_algos,
+                                              limit_bytes))
+        missing = [algo for algo in hash_algos if not algo in results[path]]
+        if missing:
+            todo.append((path, stat_key, missing))
+
+    def __checksum_one(task):
+        """Hash a single file with the missing algos"""
+        (path, stat_key, missing) = task
+        return (path, stat_key, checksum_file_multi(path, missing, chunk_size,
+                                                    max_chunks, _logger))
+
+    if workers > 1 and len(todo) > 1:
+        pool = ThreadPool(min(workers, len(todo)))
+        try:
+            hashed = pool.map(__checksum_one, todo)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        hashed = [__checksum_one(task) for task in todo]
+
+    for (path, stat_key, checksums) in hashed:
+        results[path].update(checksums)
+        if not cache or stat_key is None:
+            continue
+        # Only save if file was not changed or removed while hashing
+        try:
+            if _stat_key(path) != stat_key:
+                continue
+        except OSError:
+            continue
+        failed = "checksum %r failed" % os.path.basename(path)
+        if failed in checksums.values():
+            continue
+        limit_bytes = _limit_bytes(stat_key[2], chunk_size, max_chunks)
+        cache.store(stat_key, checksums, limit_bytes)
+    if own_cache:
+        cache.close()
+    return results
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    from mig.shared.fileio import checksum_file
+
+    class FakeConfiguration(object):
+        """Just the values used here"""
+
+        def __init__(self, base_dir):
+            import logging
+            self.logger = logging.getLogger('checksumcache')
+            self.mig_system_files = base_dir
+
+    print("Benchmark checksum service against plain checksum_file")
+    base_dir = tempfile.mkdtemp()
+    conf = FakeConfiguration(base_dir)
+    algos = ['md5', 'sha1', 'sha256', 'sha512']
+    paths = []
+    for i in range(8):
+        path = os.path.join(base_dir, 'data-%d.bin' % i)
+        with open(path, 'wb') as data_fd:
+            data_fd.write(os.urandom(16 * 1024 * 1024))
+        paths.append(path)
+    try:
+        start = time.time()
+        for path in paths:
+            for algo in algos:
+                checksum_file(path, algo, max_chunks=-1)
+        plain_secs = time.time() - start
+        start = time.time()
+        checksum_files(conf, paths, algos, max_chunks=-1, cache=False)
+        multi_secs = time.time() - start
+        checksum_files(conf, paths, algos, max_chunks=-1)
+        start = time.time()
+        checksum_files(conf, paths, algos, max_chunks=-1)
+        cached_secs = time.time() - start
+        print("%d files of 16MB with %d algos:" % (len(paths), len(algos)))
+        print("    plain checksum_file loop: %.3fs" % plain_secs)
+        print("    one pass and %d threads: %.3fs" % (checksum_workers,
+                                                       multi_secs))
+        print("    cached: %.3fs" % cached_secs)
+    finally:
+        shutil.rmtree(base_dir)
@@ -28,17 +28,25 @@
 """Configuration functions"""
 from __future__ import absolute_import
 
+import copy
 import os
 import sys
+import threading
 
 from mig.shared.fileio import unpickle
 
+# Process-wide cache of parsed configuration objects for long-running
+# processes like the WSGI workers. Maps the resolved config file path and
+# skip_log flag to a (mtime, configuration) tuple.
+__configuration_cache = {}
+__configuration_cache_lock = threading.Lock()
 
-def get_configuration_object(config_file=None, skip_log=False):
-    """Simple helper to call the general configuration init. Optional skip_log
-    argument is passed on to allow skipping the default log initialization.
+
+def _resolve_config_file(config_file=None):
+    """Find the configuration file path to use. Explicit config_file takes
+    precedence over MIG_CONF from environment and the default location
+    relative to the running application.
     """
-    from mig.shared.configuration import Configuration
     if config_file:
         _config_file = config_file
     elif os.environ.get('MIG_CONF', None):
@@ -50,10 +58,60 @@ def get_configuration_object(config_file=None, skip_log=False):
         else:
             _config_file = os.path.join(app_dir, '..', 'server',
                     'MiGserver.conf')
+    return _config_file
+
+
+def get_configuration_object(config_file=None, skip_log=False):
+    """Simple helper to call the general configuration init. Optional skip_log
+    argument is passed on to allow skipping the default log initialization.
+    """
+    from mig.shared.configuration import Configuration
+    _config_file = _resolve_config_file(config_file)
     configuration = Configuration(_config_file, False, skip_log)
     return configuration
 
 
+def get_cached_configuration_object(config_file=None, skip_log=False):
+    """Like get_configuration_object but reuse a previously parsed
+    configuration for the same config file in this process as long as the
+    file modification time is unchanged. Intended for long-running processes
+    like the WSGI workers where the full parse on every request is costly.
+    The returned object is a shallow copy of the cached one so that the usual
+    per-request attribute assignments in backends do not leak into other
+    requests, while the logger and other heavy objects remain shared.
+    Use invalidate_configuration_cache to force a full reload e.g. on SIGHUP.
+    """
+    _config_file = os.path.abspath(_resolve_config_file(config_file))
+    cache_key = (_config_file, skip_log)
+    try:
+        conf_mtime = os.path.getmtime(_config_file)
+    except OSError:
+        # NOTE: let the usual init handle and report the missing file
+        conf_mtime = -1
+    with __configuration_cache_lock:
+        (cached_mtime, configuration) = __configuration_cache.get(
+            cache_key, (None, None))
+        if configuration is None or cached_mtime != conf_mtime:
+            configuration = get_configuration_object(_config_file, skip_log)
+            __configuration_cache[cache_key] = (conf_mtime, configuration)
+    return copy.copy(configuration)
+
+
+def invalidate_configuration_cache(config_file=None):
+    """Drop cached configuration objects for config_file or all cached
+    configurations if config_file is not provided. The next call to
+    get_cached_configuration_object then does a full parse.
+    """
+    with __configuration_cache_lock:
+        if config_file is None:
+            __configuration_cache.clear()
+            return
+        _config_file = os.path.abspath(config_file)
+        for cache_key in list(__configuration_cache):
+            if cache_key[0] == _config_file:
+                del __configuration_cache[cache_key]
+
+
 def get_resource_configuration(resource_home, unique_resource_name,
                                logger):
     """Load a resource configuration from file"""
@@ -196,3 +254,25 @@ def get_all_store_vgrids(unique_resource_name):
     store_units = [store for store in store_units if store['name']]
     store_vgrids = dict([(store['name'], store['vgrid']) for store in store_units])
     return store_vgrids
+
+
+if __name__ == "__main__":
+    import time
+    rounds = 100
+    if sys.argv[1:]:
+        rounds = int(sys.argv[1])
+    print("Benchmark configuration loading with %d rounds" % rounds)
+    start = time.time()
+    for _ in range(rounds):
+        conf = get_configuration_object(skip_log=True)
+    fresh_time = time.time() - start
+    print("fresh: %.4fs per load, %.1f loads/s" % (fresh_time / rounds,
+                                                   rounds / fresh_time))
+    invalidate_configuration_cache()
+    start = time.time()
+    for _ in range(rounds):
+        conf = get_cached_configuration_object(skip_log=True)
+    cached_time = time.time() - start
+    print("cached: %.4fs per load, %.1f loads/s" % (cached_time / rounds,
+                                                    rounds / cached_time))
+    print("speedup: %.1fx" % (fresh_time / cached_time))
@@ -52,10 +52,14 @@ try:
         duplicati_protocol_choices, default_css_filename, keyword_any, \
         cert_valid_days, oid_valid_days, generic_valid_days, keyword_all, \
         keyword_file, keyword_env, DEFAULT_USER_ID_FORMAT, \
-        valid_user_id_formats, valid_filter_methods, default_twofactor_auth_apps
+        valid_user_id_formats, valid_filter_methods, \
+        default_twofactor_auth_apps, entity_map_backends, \
+        rate_limit_backends, session_backends, credential_cache_backends
     from mig.shared.logger import Logger, SYSLOG_GDP
     from mig.shared.htmlgen import menu_items, vgrid_items
     from mig.shared.fileio import read_file, load_json, write_file
+    from mig.shared.serial import LEGACY_PROTOCOL, parse_pickle_protocol, \
+        set_pickle_protocol
 except ImportError as ioe:
     print("could not import migrid modules")
 
@@ -395,6 +399,7 @@ class Configuration:
     log_dir = ''
     re_home = ''
     grid_stdin = ''
+    grid_socket = ''
     im_notify_stdin = ''
     gridstat_files_dir = ''
     mig_server_home = ''
@@ -478,6 +483,15 @@ class Configuration:
     site_password_cracklib = False
     site_extra_userpage_scripts = ""
     site_extra_userpage_styles = ""
+    site_entity_map_backend = 'pickle'
+    site_rate_limit_backend = 'pickle'
+    site_session_backend = 'pickle'
+    site_credential_cache_backend = 'dict'
+    site_pickle_protocol = LEGACY_PROTOCOL
+    site_transfers_max_workers = 32
+    site_transfers_max_user_workers = 4
+    site_notify_smtp_workers = 4
+    site_notify_smtp_session_messages = 100
     hg_path = ''
     hgweb_scripts = ''
     trac_admin_path = ''
@@ -958,6 +972,8 @@ location.""" % self.config_file)
                                                 'workflows_db_home')
         if config.has_option('GLOBAL', 'notify_home'):
             self.notify_home = config.get('GLOBAL', 'notify_home')
+        if config.has_option('GLOBAL', 'grid_socket'):
+            self.grid_socket = config.get('GLOBAL', 'grid_socket')
         if config.has_option('GLOBAL', 'vm_home'):
             self.vm_home = config.get('GLOBAL', 'vm_home')
         if config.has_option('GLOBAL', 'freeze_home'):
@@ -1349,6 +1365,16 @@ location.""" % self.config_file)
                 'SITE', 'enable_notify')
         else:
             self.site_enable_notify = False
+        if config.has_option('SITE', 'notify_smtp_workers'):
+            self.site_notify_smtp_workers = config.getint(
+                'SITE', 'notify_smtp_workers')
+        else:
+            self.site_notify_smtp_workers = 4
+        if config.has_option('SITE', 'notify_smtp_session_messages'):
+            self.site_notify_smtp_session_messages = config.getint(
+                'SITE', 'notify_smtp_session_messages')
+        else:
+            self.site_notify_smtp_session_messages = 100
         if config.has_option('SITE', 'enable_imnotify'):
             self.site_enable_imnotify = config.getboolean(
                 'SITE', 'enable_imnotify')
@@ -1972,6 +1998,53 @@ location.""" % self.config_file)
             self.site_enable_wsgi = config.getboolean('SITE', 'enable_wsgi')
         else:
             self.site_enable_wsgi = False
+        if config.has_option('SITE', 'entity_map_backend'):
+            map_backend = config.get('SITE', 'entity_map_backend')
+            if map_backend in entity_map_backends:
+                self.site_entity_map_backend = map_backend
+            else:
+                logger.warning("ignoring invalid entity_map_backend: %s" %
+                               map_backend)
+        else:
+            self.site_entity_map_backend = 'pickle'
+        if config.has_option('SITE', 'rate_limit_backend'):
+            limit_backend = config.get('SITE', 'rate_limit_backend')
+            if limit_backend in rate_limit_backends:
+                self.site_rate_limit_backend = limit_backend
+            else:
+                logger.warning("ignoring invalid rate_limit_backend: %s" %
+                               limit_backend)
+        else:
+            self.site_rate_limit_backend = 'pickle'
+        if config.has_option('SITE', 'session_backend'):
+            session_backend = config.get('SITE', 'session_backend')
+            if session_backend in session_backends:
+                self.site_session_backend = session_backend
+            else:
+                logger.warning("ignoring invalid session_backend: %s" %
+                               session_backend)
+        else:
+            self.site_session_backend = 'pickle'
+        if config.has_option('SITE', 'credential_cache_backend'):
+            cache_backend = config.get('SITE', 'credential_cache_backend')
+            if cache_backend in credential_cache_backends:
+                self.site_credential_cache_backend = cache_backend
+            else:
+                logger.warning("ignoring invalid credential_cache_backend: %s"
+                               % cache_backend)
+        else:
+            self.site_credential_cache_backend = 'dict'
+        # NOTE: the protocol applies to all pickles written by this process
+        if config.has_option('SITE', 'pickle_protocol'):
+            try:
+                self.site_pickle_protocol = parse_pickle_protocol(
+                    config.get('SITE', 'pickle_protocol'))
+            except ValueError as vae:
+                logger.warning("ignoring invalid pickle_protocol: %s" % vae)
+                self.site_pickle_protocol = LEGACY_PROTOCOL
+        else:
+            self.site_pickle_protocol = LEGACY_PROTOCOL
+        set_pickle_protocol(self.site_pickle_protocol)
         if config.has_option('SITE', 'enable_widgets'):
             self.site_enable_widgets = config.getboolean(
                 'SITE', 'enable_widgets')
@@ -2151,6 +2224,17 @@ location.""" % self.config_file)
             self.site_transfer_log = config.get('SITE', 'transfer_log')
         else:
             self.site_transfer_log = "transfer.log"
+        # NOTE: a limit of 0 or less means no limit on concurrent transfers
+        if config.has_option('SITE', 'transfers_max_workers'):
+            self.site_transfers_max_workers = config.getint(
+                'SITE', 'transfers_max_workers')
+        else:
+            self.site_transfers_max_workers = 32
+        if config.has_option('SITE', 'transfers_max_user_workers'):
+            self.site_transfers_max_user_workers = config.getint(
+                'SITE', 'transfers_max_user_workers')
+        else:
+            self.site_transfers_max_user_workers = 4
         # Fall back to server_fqdn if not set or no valid entries
         if not self.site_transfers_from:
             self.site_transfers_from = [self.server_fqdn]
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# cronschedule - priority queue of precomputed cron and at job fire times
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Schedule of crontab and atjobs entries ordered by their next fire time.
+
+Each crontab entry is compiled once into its time field value sets and the
+next matching minute is kept in a heap together with all the at jobs. The
+cron daemon then only pops the entries that are due instead of matching every
+entry of every user on each tick. Entries are replaced per crontab or atjobs
+file when the file changes. Replaced entries stay in the heap until they
+reach the top, but they are recognized and dropped by their generation.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import datetime
+import heapq
+import itertools
+import threading
+
+from mig.shared.events import compile_cron_entry, cron_next_fire
+
+
+class CronSchedule(object):
+    """Thread-safe heap of the next fire times for crontab and atjobs entries
+    loaded from any number of files.
+    """
+
+    def __init__(self):
+        """Init empty schedule"""
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        # Current generation and number of scheduled entries for each path
+        self._generation = {}
+        self._live = {}
+
+    def __len__(self):
+        """Number of scheduled entries"""
+        with self._lock:
+            return sum(self._live.values())
+
+    def _push(self, when, path, generation, entry, compiled):
+        """Add entry to heap and count it as live for path"""
+        heapq.heappush(self._heap, (when, next(self._seq), path, generation,
+                                    entry, compiled))
+        self._live[path] = self._live.get(path, 0) + 1
+
+    def _replace(self, path):
+        """Invalidate any scheduled entries for path and return the new
+        generation to use for path.
+        """
+        generation = self._generation.get(path, 0) + 1
+        self._generation[path] = generation
+        self._live.pop(path, None)
+        # Rebuild heap without stale items once they make up the majority
+        if len(self._heap) > 2 * max(sum(self._live.values()), 1024):
+            self._heap = [i for i in self._heap
+                          if self._generation.get(i[2], 0) == i[3]]
+            heapq.heapify(self._heap)
+        return generation
+
+    def set_crontab(self, path, entries, now=None):
+        """Replace all scheduled entries for path with the crontab entries.
+        Entries with invalid time fields or no future fire time are skipped.
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        now = now.replace(second=0, microsecond=0)
+        scheduled = []
+        for entry in entries:
+            try:
+                compiled = compile_cron_entry(entry)
+            except ValueError:
+                continue
+            # NOTE: schedule from previous minute to include the current one
+            when = cron_next_fire(compiled, now - datetime.timedelta(minutes=1))
+            if when is not None:
+                scheduled.append((when, entry, compiled))
+        with self._lock:
+            generation = self._replace(path)
+            for (when, entry, compiled) in scheduled:
+                self._push(when, path, generation, entry, compiled)
+
+    def set_atjobs(self, path, entries):
+        """Replace all scheduled entries for path with the atjobs entries"""
+        with self._lock:
+            generation = self._replace(path)
+            for entry in entries:
+                self._push(entry['time_stamp'], path, generation, entry, None)
+
+    def remove(self, path):
+        """Remove all scheduled entries for path"""
+        with self._lock:
+            self._replace(path)
+            del self._generation[path]
+
+    def next_fire(self):
+        """Return the earliest scheduled fire time or None if empty"""
+        with self._lock:
+            while self._heap:
+                (when, _, path, generation, _, _) = self._heap[0]
+                if self._generation.get(path, 0) == generation:
+                    return when
+                heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Pop all entries due at or before the whole minute of the datetime
+        now. Returns a tuple with the list of (path, entry) tuples to run now
+        and the list of (path, entry, when) tuples missed in earlier minutes.
+        Crontab entries are rescheduled at their next fire time after now.
+        """
+        now = now.replace(second=0, microsecond=0)
+        (due, missed) = ([], [])
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                (when, _, path, generation, entry, compiled) = \
+                    heapq.heappop(self._heap)
+                if self._generation.get(path, 0) != generation:
+                    continue
+                if when == now:
+                    due.append((path, entry))
+                else:
+                    missed.append((path, entry, when))
+                self._live[path] -= 1
+                if compiled is not None:
+                    when = cron_next_fire(compiled, now)
+                    if when is not None:
+                        self._push(when, path, generation, entry, compiled)
+        return (due, missed)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    print("Benchmark cron schedule against plain cron_match scan")
+
+    class FakeConfiguration(object):
+        """Just the logger for cron_match"""
+
+        def __init__(self):
+            import logging
+            self.logger = logging.getLogger('cronschedule')
+
+    from mig.shared.events import cron_match
+    conf = FakeConfiguration()
+    field_samples = [
+        ['*', '*/5', '*/15', '0', '30', '0-29/10', '1,31,45'],
+        ['*', '*/2', '3', '9-17', '0,12'],
+        ['*', '*', '1', '1-7,15'],
+        ['*', '*', '*', '1-6/2'],
+        ['*', '*', '0-4', '5,6']]
+    entry_count = 100000
+    path_count = 10000
+    random.seed(42)
+    entries_map = {}
+    for i in range(entry_count):
+        entry = {'minute': random.choice(field_samples[0]),
+                 'hour': random.choice(field_samples[1]),
+                 'dayofmonth': random.choice(field_samples[2]),
+                 'month': random.choice(field_samples[3]),
+                 'dayofweek': random.choice(field_samples[4]),
+                 'command': ['ls'], 'run_as': 'user-%d' % (i % path_count)}
+        path = '/settings/user-%d/crontab' % (i % path_count)
+        entries_map[path] = entries_map.get(path, []) + [entry]
+    start = datetime.datetime(2024, 1, 1, 0, 0)
+    minutes = [start + datetime.timedelta(minutes=i) for i in range(10)]
+
+    before = time.time()
+    scan_hits = 0
+    for tick in minutes:
+        for user_entries in entries_map.values():
+            for entry in user_entries:
+                if cron_match(conf, tick, entry):
+                    scan_hits += 1
+    scan_secs = time.time() - before
+
+    before = time.time()
+    schedule = CronSchedule()
+    for (path, user_entries) in entries_map.items():
+        schedule.set_crontab(path, user_entries, start)
+    build_secs = time.time() - before
+    before = time.time()
+    heap_hits = 0
+    for tick in minutes:
+        (due, missed) = schedule.pop_due(tick)
+        heap_hits += len(due)
+    heap_secs = time.time() - before
+    print("%d entries over %d ticks:" % (entry_count, len(minutes)))
+    print("    plain scan: %d hits in %.3fs per tick" %
+          (scan_hits, scan_secs / len(minutes)))
+    print("    schedule: %d hits in %.3fs per tick (built in %.3fs)" %
+          (heap_hits, heap_secs / len(minutes), build_secs))
@@ -326,6 +326,10 @@ upload_tmp_dir = '.upload-cache'
 # Please read the chunk note in wsgi handler before tuning this value above 1G!
 # 256M = 268435456
 download_block_size = 268435456
+# Streamed archives are passed on in 256K chunks and with up to 16 chunks
+# buffered between the archive packer and the download
+archive_stream_chunk_size = 262144
+archive_stream_buffers = 16
 wwwpublic_alias = 'public'
 public_archive_dir = 'archives'
 public_archive_index = 'published-archive.html'
@@ -350,6 +354,9 @@ workflows_log_cnt = 2
 
 workflows_db_filename = 'workflows_db.pickle'
 workflows_db_lockfile = 'workflows_db.lock'
+# Max seconds between full listings of the workflow objects when refreshing
+# the workflow maps, so that changes never marked as modified get caught too
+workflows_map_full_refresh_secs = 600
 
 atjobs_name = 'atjobs'
 crontab_name = 'crontab'
@@ -447,6 +454,56 @@ duplicati_protocol_choices = [('SFTP', 'sftp'), ('FTPS', 'ftps'),
 duplicati_schedule_choices = [('Daily', '1D'), ('Weekly', '1W'),
                               ('Monthly', '1M'), ('Never', '')]
 
+# Storage backends for the user, resource and vgrid entity maps
+entity_map_backends = ['pickle', 'sqlite']
+
+# User DB fields with secondary indexes for search_users queries
+user_db_index_fields = ['distinguished_name', 'email', 'organization',
+                        'country', 'role', 'status']
+
+# Storage backends for the grid daemon auth rate limits
+rate_limit_backends = ['pickle', 'mmap']
+
+# Seconds to wait for locks held by concurrent writers on the sqlite backed
+# caches and maps
+sqlite_lock_timeout = 30
+
+# Storage backends for the grid daemon session tracking
+session_backends = ['pickle', 'sqlite']
+
+# Verified credential caches for the grid daemon password hash checks and the
+# max number of entries and seconds to keep them in the shared and local cache
+credential_cache_backends = ['dict', 'shared']
+credential_cache_max_entries = 4096
+credential_cache_ttl = 3600
+credential_cache_local_ttl = 60
+
+# Max number of threads to hash files in parallel and max number of cached
+# file checksums to keep
+checksum_workers = 4
+checksum_cache_max_entries = 100000
+
+# Max number of threads to scan each vgrid directory tree for the event
+# directory cache and max number of vgrids to scan at the same time
+dir_cache_scan_workers = 4
+dir_cache_max_parallel_scans = 4
+
+# Max seconds for clients of the optional grid_script socket command channel
+# to wait for acknowledgement and max bytes in a single batch of commands
+grid_script_ack_timeout = 10
+grid_script_max_frame = 1048576
+
+# Number of job queue journal records between full snapshots of the queues
+job_journal_snapshot_interval = 10000
+
+# File name suffix of grid_notify spool segments and max bytes and seconds
+# each process appends notifications to a segment before starting a new one.
+# The offset suffix is added to segment names for the saved read offsets.
+notify_spool_suffix = '.spool'
+notify_spool_offset_suffix = '.offset'
+notify_spool_segment_bytes = 4194304
+notify_spool_segment_secs = 300
+
 # Session timeout in seconds for IO services,
 io_session_timeout = {'davs': 60}
 io_session_stale = {'davs': 120,
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# dircache - persistent directory index for the vgrid event monitors
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Directory index used by the grid_events monitor processes to find the
+directories to watch in each vgrid and to detect changes since last run.
+
+The index maps directory paths relative to vgrid_files_home to their last
+seen modification time. It is kept in a small sqlite table per vgrid, so
+opening it is instant and entries are only read when a path or subtree is
+looked up instead of unpickling the entire cache on startup. The monitors
+update it one directory at a time as they see directory events and commit
+the changes in batches. The initial scan of a vgrid without an index walks
+the top level sub directories in parallel threads and each monitor process
+has its own index file, so several vgrids can be scanned at the same time
+with dir_cache_max_parallel_scans limiting how many.
+
+All paths are stored as native strings, so paths given as utf8 bytes are
+converted first to always find the same entry.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from mig.shared.base import force_native_str
+from mig.shared.defaults import dir_cache_scan_workers
+from mig.shared.fileio import walk
+from mig.shared.sqlitedb import open_sqlite_db
+
+# Commit automatically once this many changes are pending
+_max_pending = 1000
+
+
+def _subtree_bounds(path):
+    """Return the half-open range of paths strictly below path. The slash is
+    followed by the zero in the ASCII table so all sub paths sort between
+    path/ and path0 without catching siblings like path-old.
+    """
+    return ('%s%s' % (path, os.sep), '%s%s' % (path, chr(ord(os.sep) + 1)))
+
+
+class DirCache(object):
+    """Persistent mapping of relative directory paths to modification times
+    with thread-safe access from the event handler threads.
+    """
+
+    def __init__(self, db_path, logger):
+        """Init index in db_path without opening it yet. The special
+        ':memory:' path gives a transient index.
+        """
+        self.db_path = db_path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.__conn = None
+        self.__pending = 0
+
+    def _open_db(self):
+        """Lazy open the table falling back to a transient in-memory table if
+        the file can't be used.
+        """
+        if self.__conn is not None:
+            return self.__conn
+        try:
+            conn = self._connect(self.db_path)
+        except Exception as exc:
+            self.logger.error("could not open dir cache %s: %s" %
+                              (self.db_path, exc))
+            self.db_path = ':memory:'
+            conn = self._connect(self.db_path)
+        self.__conn = conn
+        return conn
+
+    def _connect(self, db_path):
+        """Connect to db_path and make sure the table exists"""
+        conn = open_sqlite_db(db_path, synchronous='NORMAL',
+                              check_same_thread=False, native_text=True)
+        conn.execute("""CREATE TABLE IF NOT EXISTS dirs (
+                        path TEXT PRIMARY KEY NOT NULL,
+                        mtime REAL NOT NULL) WITHOUT ROWID""")
+        conn.commit()
+        return conn
+
+    def _changed(self, conn, count=1):
+        """Register count pending changes and commit if there are many"""
+        self.__pending += count
+        if self.__pending >= _max_pending:
+            conn.commit()
+            self.__pending = 0
+
+    def __len__(self):
+        """Number of directories in index"""
+        with self._lock:
+            conn = self._open_db()
+            return conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+
+    def __contains__(self, path):
+        """Check if path is in index"""
+        return self.get_mtime(path) is not None
+
+    def get_mtime(self, path, default=None):
+        """Return the saved modification time of path or default if not in
+        index.
+        """
+        with self._lock:
+            conn = self._open_db()
+            row = conn.execute("SELECT mtime FROM dirs WHERE path=?",
+                               (force_native_str(path), )).fetchone()
+        if row is None:
+            return default
+        return row[0]
+
+    def set_mtime(self, path, mtime):
+        """Save the modification time of path"""
+        with self._lock:
+            conn = self._open_db()
+            conn.execute("INSERT OR REPLACE INTO dirs (path, mtime) VALUES "
+                         "(?, ?)", (force_native_str(path), mtime))
+            self._changed(conn)
+
+    def set_many(self, entries):
+        """Save the modification times of all (path, mtime) tuples in the
+        entries iterable.
+        """
+        entries = [(force_native_str(path), mtime) for (path, mtime) in
+                   entries]
+        with self._lock:
+            conn = self._open_db()
+            conn.executemany("INSERT OR REPLACE INTO dirs (path, mtime) "
+                             "VALUES (?, ?)", entries)
+            self._changed(conn, len(entries))
+
+    def remove(self, path):
+        """Remove path and all paths below it from index"""
+        path = force_native_str(path)
+        (low, high) = _subtree_bounds(path)
+        with self._lock:
+            conn = self._open_db()
+            conn.execute("DELETE FROM dirs WHERE path=? OR (path>=? AND "
+                         "path<?)", (path, low, high))
+            self._changed(conn)
+
+    def paths(self, path=None):
+        """Return a sorted list of path and all indexed paths below it or of
+        all paths if path is None. Only the requested subtree is loaded.
+        """
+        with self._lock:
+            conn = self._open_db()
+            if path is None:
+                rows = conn.execute("SELECT path FROM dirs ORDER BY path")
+            else:
+                path = force_native_str(path)
+                (low, high) = _subtree_bounds(path)
+                rows = conn.execute("SELECT path FROM dirs WHERE path=? OR "
+                                    "(path>=? AND path<?) ORDER BY path",
+                                    (path, low, high))
+            return [row[0] for row in rows]
+
+    def flush(self):
+        """Commit any pending changes"""
+        with self._lock:
+            if self.__conn is not None and self.__pending:
+                self.__conn.commit()
+                self.__pending = 0
+
+    def close(self):
+        """Commit pending changes and close index"""
+        self.flush()
+        with self._lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+
+def _scan_subtree(base_dir, top_path, followlinks):
+    """Return (path, mtime) tuples for top_path and all dirs below it with
+    paths relative to base_dir.
+    """
+    base_len = len(base_dir.rstrip(os.sep)) + 1
+    found = []
+    try:
+        found.append((top_path[base_len:], os.path.getmtime(top_path)))
+    except OSError:
+        return found
+    for (root, dir_names, _) in walk(top_path, followlinks=followlinks):
+        for dir_name in dir_names:
+            dir_path = os.path.join(root, dir_name)
+            try:
+                found.append((dir_path[base_len:],
+                              os.path.getmtime(dir_path)))
+            except OSError:
+                # Removed since listing
+                continue
+    return found
+
+
+def scan_dir_tree(dir_cache, base_dir, rel_path, followlinks=True,
+                  workers=dir_cache_scan_workers):
+    """Scan rel_path in base_dir and save all directories in it with their
+    modification times in the dir_cache index. The top level sub directories
+    are scanned in up to workers parallel threads and saved as soon as each
+    one is done. The rel_path entry itself is saved last so that it marks a
+    complete scan. Returns the number of directories found.
+    """
+    root_path = os.path.join(base_dir, rel_path)
+    root_mtime = os.path.getmtime(root_path)
+    top_paths = []
+    for name in os.listdir(root_path):
+        top_path = os.path.join(root_path, name)
+        if os.path.isdir(top_path) and \
+                (followlinks or not os.path.islink(top_path)):
+            top_paths.append(top_path)
+    found = 1
+
+    def __scan(top_path):
+        """Scan a single sub tree"""
+        return _scan_subtree(base_dir, top_path, followlinks)
+
+    if workers > 1 and len(top_paths) > 1:
+        pool = ThreadPool(min(workers, len(top_paths)))
+        try:
+            for entries in pool.imap_unordered(__scan, top_paths):
+                dir_cache.set_many(entries)
+                found += len(entries)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for top_path in top_paths:
+            entries = __scan(top_path)
+            dir_cache.set_many(entries)
+            found += len(entries)
+    dir_cache.set_mtime(rel_path, root_mtime)
+    dir_cache.flush()
+    return found
+
+
+if __name__ == "__main__":
+    import logging
+    import shutil
+    import sys
+    import tempfile
+    print("Benchmark dir cache startup against full pickled cache")
+    from mig.shared.fileio import pickle, unpickle
+    logger = logging.getLogger('dircache')
+    base_dir = tempfile.mkdtemp()
+    vgrid_name = 'bench'
+    dir_count = int((sys.argv[1:] or [20000])[0])
+    try:
+        for i in range(dir_count):
+            os.makedirs(os.path.join(base_dir, vgrid_name, 'top-%d' % (i % 16),
+                                     'sub-%d' % (i // 16)))
+        before = time.time()
+        old_cache = {}
+        old_cache[vgrid_name] = {'mtime': 0}
+        for (root, dir_names, _) in walk(os.path.join(base_dir, vgrid_name),
+                                         followlinks=True):
+            for dir_name in dir_names:
+                dir_path = os.path.join(root, dir_name)
+                old_cache[dir_path[len(base_dir) + 1:]] = {
+                    'mtime': os.path.getmtime(dir_path)}
+        serial_scan_secs = time.time() - before
+        pickle_path = os.path.join(base_dir, 'old.dir_cache')
+        pickle(old_cache, pickle_path, logger)
+        before = time.time()
+        unpickle(pickle_path, logger)
+        pickle_load_secs = time.time() - before
+
+        db_path = os.path.join(base_dir, 'new.dir_cache.db')
+        dir_cache = DirCache(db_path, logger)
+        before = time.time()
+        found = scan_dir_tree(dir_cache, base_dir, vgrid_name)
+        parallel_scan_secs = time.time() - before
+        dir_cache.close()
+        before = time.time()
+        dir_cache = DirCache(db_path, logger)
+        top_paths = dir_cache.paths(os.path.join(vgrid_name, 'top-3'))
+        lazy_load_secs = time.time() - before
+        dir_cache.close()
+        print("%d dirs:" % found)
+        print("    serial scan: %.3fs" % serial_scan_secs)
+        print("    parallel scan into index: %.3fs" % parallel_scan_secs)
+        print("    unpickle full cache: %.3fs" % pickle_load_secs)
+        print("    open index and load one subtree of %d dirs: %.3fs" %
+              (len(top_paths), lazy_load_secs))
+    finally:
+        shutil.rmtree(base_dir)
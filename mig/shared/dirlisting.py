@@ -0,0 +1,215 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# dirlisting - scandir based directory listing with sorting and paging
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Directory listing helpers for ls and the file manager.
+
+Entries come from scandir, so file type checks of plain entries are answered
+from the directory read itself and every entry is stat'ed at most once with
+the result cached on the entry. Listings sorted by name are sorted and paged
+before any stat calls, so only the entries on the requested page are stat'ed.
+Sorting on a stat field like size or modification time needs a stat of all
+entries, but still just one each.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import stat
+
+# NOTE: Use faster scandir if available - it is built-in on python 3
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from distutils.version import StrictVersion
+        from scandir import scandir, __version__ as scandir_version
+        if StrictVersion(scandir_version) < StrictVersion("1.3"):
+            # Important os.scandir compatibility utf8 fixes were not added
+            # until 1.3
+            raise ImportError(
+                "scandir version is too old: fall back to os.listdir")
+    except ImportError:
+        scandir = None
+
+# Map sort names to the stat field to sort on and None for plain name sort
+sort_fields = {'name': None, 'size': 'st_size', 'modified': 'st_mtime',
+               'created': 'st_ctime', 'accessed': 'st_atime'}
+
+
+class _ListdirEntry(object):
+    """Minimal stand-in for scandir entries when scandir is unavailable"""
+
+    def __init__(self, dir_path, name):
+        """Init entry without touching the file system"""
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+        self._stat = None
+
+    def stat(self):
+        """Cached stat of entry following links"""
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_file(self):
+        """Check if entry is a file or a link to one"""
+        try:
+            return stat.S_ISREG(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def scan_entries(path, include_hidden=False):
+    """Returns a list of scandir-like entries for everything in path except
+    dot entries unless include_hidden is set. Raises OSError if path cannot
+    be listed.
+    """
+    if scandir is None:
+        entries = [_ListdirEntry(path, i) for i in os.listdir(path)]
+    else:
+        # NOTE: the py2 scandir iterator has no context manager support
+        entries = list(scandir(path))
+    if not include_hidden:
+        entries = [i for i in entries if not i.name.startswith('.')]
+    return entries
+
+
+def entry_stat(entry):
+    """Returns the cached stat result for entry or None if it is a broken
+    link or vanished since listing.
+    """
+    try:
+        return entry.stat()
+    except OSError:
+        return None
+
+
+def entry_is_file(entry):
+    """Check if entry is a file. Like the ls and file manager listings always
+    did anything else is treated as a directory.
+    """
+    try:
+        return entry.is_file()
+    except OSError:
+        return False
+
+
+def sort_entries(entries, sort_by='name', descending=False):
+    """Sort entries in place on the sort_fields name sort_by with entries
+    ordered by name if they otherwise compare equal.
+    """
+    field = sort_fields.get(sort_by, None)
+    if field is None:
+        entries.sort(key=lambda entry: entry.name, reverse=descending)
+        return entries
+
+    def __stat_key(entry):
+        """Sort value of the selected stat field"""
+        stat_info = entry_stat(entry)
+        if stat_info is None:
+            return (0, entry.name)
+        return (getattr(stat_info, field), entry.name)
+    entries.sort(key=__stat_key, reverse=descending)
+    return entries
+
+
+def list_dir(path, include_hidden=False, sort_by='name', descending=False,
+             offset=0, limit=None, entry_filter=None):
+    """Returns a tuple with the total number of entries in path and a list of
+    the sorted entries from offset and up to limit entries on. A limit of
+    None means all remaining entries. The optional entry_filter function is
+    called with each entry before counting and paging and only entries for
+    which it returns True are kept. Raises OSError if path cannot be listed.
+    """
+    entries = scan_entries(path, include_hidden)
+    if entry_filter is not None:
+        entries = [i for i in entries if entry_filter(i)]
+    total = len(entries)
+    sort_entries(entries, sort_by, descending)
+    offset = max(offset, 0)
+    if limit is None:
+        return (total, entries[offset:])
+    return (total, entries[offset:offset + max(limit, 0)])
+
+
+if __name__ == "__main__":
+    import shutil
+    import sys
+    import tempfile
+    import time
+    print("Benchmark scandir listing against listdir and repeated stats")
+    file_count = int((sys.argv[1:] or [100000])[0])
+    page_size = 1000
+    base_dir = tempfile.mkdtemp()
+    try:
+        for i in range(file_count):
+            if i % 50 == 0:
+                os.mkdir(os.path.join(base_dir, 'dir-%06d' % i))
+            else:
+                open(os.path.join(base_dir, 'file-%06d.txt' % i), 'w').close()
+
+        def old_listing():
+            """What ls did for each entry with file info enabled"""
+            listing = []
+            contents = sorted(os.listdir(base_dir))
+            for name in contents:
+                path = base_dir + os.sep + name
+                info = {'size': 0, 'created': 0, 'modified': 0,
+                        'accessed': 0, 'ext': ''}
+                os.path.isfile(path)
+                if os.path.exists(path):
+                    ext = 'dir'
+                    if not os.path.isdir(path):
+                        ext = os.path.splitext(path)[1].lstrip('.')
+                    info['ext'] = ext
+                    info['size'] = os.path.getsize(path)
+                    info['created'] = os.path.getctime(path)
+                    info['modified'] = os.path.getmtime(path)
+                    info['accessed'] = os.path.getatime(path)
+                listing.append((name, info))
+            return listing
+
+        def new_listing(**kwargs):
+            """List with a single stat per returned entry"""
+            (total, entries) = list_dir(base_dir, **kwargs)
+            return [(i.name, entry_is_file(i), entry_stat(i)) for i in
+                    entries]
+
+        for (label, func, kwargs) in (
+                ('listdir with six stats per entry', old_listing, {}),
+                ('scandir with one stat per entry', new_listing, {}),
+                ('scandir sorted by size', new_listing, {'sort_by': 'size'}),
+                ('scandir page of %d by name' % page_size, new_listing,
+                 {'offset': file_count // 2, 'limit': page_size})):
+            before = time.time()
+            found = len(func(**kwargs))
+            print("%s: %d entries in %.3fs" % (label, found,
+                                              time.time() - before))
+    finally:
+        shutil.rmtree(base_dir)
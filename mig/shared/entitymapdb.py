@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# entitymapdb - sqlite backed storage of the user, resource and vgrid maps
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Alternative per-entity storage of the entity maps used in vgridaccess.
+
+The default pickle backend keeps each of the user, resource and vgrid maps as
+a single pickled dictionary, which must be loaded and rewritten in full on
+every refresh. This module instead stores one row per entity in an sqlite
+database in mig_system_files, so that refresh only writes the changed entities
+and lookups can fetch just the rows they need.
+
+The flat user and resource maps use the FLAT_SECTION for all entities whereas
+the vgrid map uses its usual top-level sections as row sections.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sqlite3
+
+from mig.shared.serial import dumps, loads
+from mig.shared.sqlitedb import open_sqlite_db
+
+# Section used for entities in the flat user and resource maps
+FLAT_SECTION = ''
+# Name used for the map time stamp in the stamps table
+MAP_STAMP = 'map_stamp'
+
+
+def entity_db_path(configuration, kind):
+    """Path of the sqlite db holding the entity map of given kind"""
+    return os.path.join(configuration.mig_system_files, "%s.db" % kind)
+
+
+def _open_entity_db(configuration, kind):
+    """Open and return a connection to the entity db of given kind, creating
+    the tables first if needed.
+    """
+    conn = open_sqlite_db(entity_db_path(configuration, kind),
+                          native_text=True)
+    conn.execute("""CREATE TABLE IF NOT EXISTS entities (
+                    section TEXT NOT NULL,
+                    entity_id TEXT NOT NULL,
+                    data BLOB,
+                    PRIMARY KEY (section, entity_id))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS stamps (
+                    name TEXT PRIMARY KEY,
+                    stamp REAL)""")
+    conn.commit()
+    return conn
+
+
+def _pack(data):
+    """Serialize entity data for a db row"""
+    return sqlite3.Binary(dumps(data))
+
+
+def _unpack(blob):
+    """Deserialize entity data from a db row"""
+    return loads(bytes(blob))
+
+
+def load_entity_db(configuration, kind, sections=None):
+    """Load full entity map of given kind from the db. The optional sections
+    list is used to tell which map sections to nest entities under in the
+    result and should be left unset for the flat user and resource maps.
+    Returns tuple with map and time stamp of last map modification just like
+    the pickle based load_entity_map in vgridaccess.
+    """
+    _logger = configuration.logger
+    entity_map = {}
+    if not os.path.exists(entity_db_path(configuration, kind)):
+        _logger.warning("No %s map db to load" % kind)
+        return (entity_map, -1)
+    try:
+        conn = _open_entity_db(configuration, kind)
+        cur = conn.execute("SELECT stamp FROM stamps WHERE name=?",
+                           (MAP_STAMP, ))
+        row = cur.fetchone()
+        if row is None:
+            _logger.warning("No %s map saved in db" % kind)
+            conn.close()
+            return (entity_map, -1)
+        map_stamp = row[0]
+        for section in sections or []:
+            entity_map[section] = {}
+        for (section, entity_id, blob) in conn.execute(
+                "SELECT section, entity_id, data FROM entities"):
+            if section == FLAT_SECTION:
+                entity_map[entity_id] = _unpack(blob)
+            else:
+                entity_map[section] = entity_map.get(section, {})
+                entity_map[section][entity_id] = _unpack(blob)
+        conn.close()
+    except Exception as exc:
+        _logger.error("failed to load %s map db: %s" % (kind, exc))
+        return ({}, -1)
+    return (entity_map, map_stamp)
+
+
+def load_entity_db_entries(configuration, kind, entity_ids,
+                           section=FLAT_SECTION):
+    """Load only the entities with given entity_ids from the section in the
+    entity db of given kind. Returns a dictionary mapping each of the found
+    entity IDs to their entity data.
+    """
+    _logger = configuration.logger
+    entries = {}
+    entity_ids = list(entity_ids)
+    if not entity_ids or \
+            not os.path.exists(entity_db_path(configuration, kind)):
+        return entries
+    try:
+        conn = _open_entity_db(configuration, kind)
+        # NOTE: sqlite limits the number of host parameters in a query
+        chunk_size = 500
+        for i in range(0, len(entity_ids), chunk_size):
+            chunk = entity_ids[i:i + chunk_size]
+            query = "SELECT entity_id, data FROM entities WHERE " + \
+                    "section=? AND entity_id IN (%s)" % \
+                    ', '.join(['?' for _ in chunk])
+            for (entity_id, blob) in conn.execute(query, [section] + chunk):
+                entries[entity_id] = _unpack(blob)
+        conn.close()
+    except Exception as exc:
+        _logger.error("failed to load %s map db entries: %s" % (kind, exc))
+    return entries
+
+
+def save_entity_db(configuration, kind, entity_map, dirty, map_stamp,
+                   sections=None):
+    """Save changes to entity map of given kind in the db. The dirty argument
+    is a dictionary mapping sections to lists of changed entity IDs, which
+    are then either updated from entity_map or removed if no longer in there.
+    The optional sections list must be given for the nested vgrid map just
+    like in load_entity_db. If dirty is None all rows are replaced with the
+    contents of entity_map, which is used e.g. for a clean refresh and for
+    migration from the pickle backend.
+    """
+    _logger = configuration.logger
+    replace_all = dirty is None
+    if replace_all:
+        if sections:
+            dirty = dict([(section, list(entity_map.get(section, {})))
+                          for section in sections])
+        else:
+            dirty = {FLAT_SECTION: list(entity_map)}
+    try:
+        conn = _open_entity_db(configuration, kind)
+        cur = conn.cursor()
+        if replace_all:
+            cur.execute("DELETE FROM entities")
+        upsert, remove = [], []
+        for (section, entity_ids) in dirty.items():
+            if section == FLAT_SECTION:
+                section_map = entity_map
+            else:
+                section_map = entity_map.get(section, {})
+            for entity_id in set(entity_ids):
+                if entity_id in section_map:
+                    upsert.append((section, entity_id,
+                                   _pack(section_map[entity_id])))
+                else:
+                    remove.append((section, entity_id))
+        cur.executemany("INSERT OR REPLACE INTO entities " +
+                        "(section, entity_id, data) VALUES (?, ?, ?)", upsert)
+        cur.executemany("DELETE FROM entities WHERE section=? " +
+                        "AND entity_id=?", remove)
+        cur.execute("INSERT OR REPLACE INTO stamps (name, stamp) " +
+                    "VALUES (?, ?)", (MAP_STAMP, map_stamp))
+        conn.commit()
+        conn.close()
+    except Exception as exc:
+        _logger.error("failed to save %s map db: %s" % (kind, exc))
+        return False
+    _logger.info("saved %d changed and %d removed entries in %s map db" %
+                 (len(upsert), len(remove), kind))
+    return True
@@ -30,6 +30,7 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
+import bisect
 import datetime
 import fnmatch
 import os
@@ -42,9 +43,18 @@ from mig.shared.fileio import read_file, read_file_lines, write_file
 
 # Init global crontab regexp once and for all
 # Format: minute hour dayofmonth month dayofweek command
-crontab_pattern = "^(\*|[0-9]{1,2}) (\*|[0-9]{1,2}) (\*|[0-9]{1,2}) "
-crontab_pattern += "(\*|[0-9]{1,2}) (\*|[0-6]) (.*)$"
+# Each time field is a comma-separated list of '*', values or ranges, which
+# may all have a '/step' suffix. The values are checked in compile_cron_entry.
+crontab_field = "([0-9*,/-]+)"
+crontab_pattern = "^%s (.*)$" % ' '.join([crontab_field] * 5)
 crontab_expr = re.compile(crontab_pattern)
+# Valid value ranges for the crontab time fields. NOTE: day of week follows
+# the python weekday() convention with monday as 0.
+cron_field_limits = [('minute', 0, 59), ('hour', 0, 23), ('dayofmonth', 1, 31),
+                     ('month', 1, 12), ('dayofweek', 0, 6)]
+# Give up searching for the next cron fire time after this many days, which
+# only happens for impossible dates like 31st of February.
+cron_search_days = 5 * 366
 # Init global atjobs regexp once and for all
 # ISO format with space between date and time and without msecs:
 # YYYY-MM-DD HH:MM:SS COMMAND
@@ -52,6 +62,16 @@ atjobs_pattern = "^([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):"
 atjobs_pattern += "([0-9]{2}) (.*)$"
 atjobs_expr = re.compile(atjobs_pattern)
 
+# Cache of compiled trigger path regexps to avoid repeated fnmatch translation
+# and compilation for every file event. Trigger paths rarely change so the
+# cache is only pruned when rebuilding the matcher.
+_trigger_regexp_cache = {}
+_wildcard_chars = '*?['
+# Cache of expanded crontab time fields since the same few fields are used in
+# most crontab entries
+_cron_field_cache = {}
+_cron_field_cache_size = 4096
+
 
 def get_path_expand_map(trigger_path, rule, state_change):
     """Generate a dictionary with the supported variables to be expanded and
@@ -81,6 +101,77 @@ def get_path_expand_map(trigger_path, rule, state_change):
     return expand_map
 
 
+def compile_trigger_regexps(target_path):
+    """Return a cached tuple of compiled recursive and direct regexps for the
+    trigger target_path pattern. We do not use plain fnmatch since it lets '*'
+    match anything including '/', which leads to greedy matching in subdirs.
+    The direct regexp limits wildcards to a single path component.
+    """
+    cached = _trigger_regexp_cache.get(target_path, None)
+    if cached is None:
+        recursive_regexp = fnmatch.translate(target_path)
+        direct_regexp = recursive_regexp.replace('.*', '[^/]*')
+        cached = (re.compile(recursive_regexp), re.compile(direct_regexp))
+        _trigger_regexp_cache[target_path] = cached
+    return cached
+
+
+def trigger_literal_dir(target_path):
+    """Find the longest directory prefix of target_path without wildcards.
+    Any path matching target_path must start with this directory prefix.
+    """
+    literal_end = len(target_path)
+    for char in _wildcard_chars:
+        pos = target_path.find(char)
+        if pos != -1 and pos < literal_end:
+            literal_end = pos
+    return target_path[:target_path.rfind('/', 0, literal_end) + 1]
+
+
+def build_trigger_matcher(rules_map):
+    """Compile the rules_map dictionary of trigger target path patterns and
+    associated rule lists into a matcher for use in match_trigger_rules.
+    The patterns are grouped by their literal directory prefix so that each
+    event only has to be tested against the patterns in its parent dirs.
+    """
+    by_dir = {}
+    for (index, (target_path, rule_list)) in enumerate(rules_map.items()):
+        (recursive_re, direct_re) = compile_trigger_regexps(target_path)
+        literal_dir = trigger_literal_dir(target_path)
+        by_dir.setdefault(literal_dir, []).append(
+            (index, target_path, rule_list, recursive_re, direct_re))
+
+    # Drop compiled regexps for patterns no longer in use
+
+    for target_path in list(_trigger_regexp_cache):
+        if target_path not in rules_map:
+            del _trigger_regexp_cache[target_path]
+    return {'dirs': by_dir, 'patterns': len(rules_map)}
+
+
+def match_trigger_rules(matcher, src_path):
+    """Find the trigger patterns in matcher that match src_path. Returns a
+    list of (target_path, rule_list, direct_hit) tuples in the order of the
+    rules_map used to build matcher. The direct_hit value tells if the pattern
+    matched without wildcards crossing directory boundaries.
+    """
+    by_dir = matcher['dirs']
+    candidates = by_dir.get('', [])
+    pos = src_path.find('/')
+    while pos != -1:
+        found = by_dir.get(src_path[:pos + 1], None)
+        if found:
+            candidates = candidates + found
+        pos = src_path.find('/', pos + 1)
+    hits = []
+    for (index, target_path, rule_list, recursive_re, direct_re) in \
+            sorted(candidates, key=lambda entry: entry[0]):
+        direct_hit = direct_re.match(src_path) is not None
+        if direct_hit or recursive_re.match(src_path):
+            hits.append((target_path, rule_list, direct_hit))
+    return hits
+
+
 def get_time_expand_map(timestamp, rule):
     """Generate a dictionary with the supported variables to be expanded and
     the actual expanded values based on datetime timestamp and crontab rule
@@ -152,6 +243,12 @@ def parse_crontab_contents(configuration, client_id, crontab_lines):
                  'dayofmonth': hit.group(3), 'month': hit.group(4),
                  'dayofweek': hit.group(5),
                  'command': shlex.split(hit.group(6)), 'run_as': client_id}
+        try:
+            compile_cron_entry(entry)
+        except ValueError as exc:
+            _logger.warning("Skip invalid crontab line for %s: %s (%s)" %
+                            (client_id, line, exc))
+            continue
         crontab_entries.append(entry)
     return crontab_entries
 
@@ -255,16 +352,112 @@ def parse_and_save_atjobs(atjobs, client_id, configuration):
     return (status, msg)
 
 
+def parse_cron_field(field, low, high):
+    """Expand the crontab time field string into the set of integer values
+    it covers in the range from low to high. Supports '*', single values,
+    ranges like 1-5 and steps like */15 or 0-30/10 as well as comma-separated
+    lists of those. Raises ValueError on invalid fields.
+    """
+    cache_key = (field, low, high)
+    values = _cron_field_cache.get(cache_key, None)
+    if values is None:
+        values = __expand_cron_field(field, low, high)
+        if len(_cron_field_cache) >= _cron_field_cache_size:
+            _cron_field_cache.clear()
+        _cron_field_cache[cache_key] = values
+    return values
+
+
+def __expand_cron_field(field, low, high):
+    """Helper for parse_cron_field doing the actual expansion"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            (part, step_str) = part.split('/', 1)
+            step = int(step_str)
+            if step < 1:
+                raise ValueError("invalid step in %r" % field)
+        if part == '*':
+            (first, last) = (low, high)
+        elif '-' in part:
+            (first_str, last_str) = part.split('-', 1)
+            (first, last) = (int(first_str), int(last_str))
+        else:
+            first = int(part)
+            # NOTE: like in vixie cron a single value with step means to end
+            if step > 1:
+                last = high
+            else:
+                last = first
+        if first < low or last > high or first > last:
+            raise ValueError("%r is out of range %d-%d" % (field, low, high))
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+def compile_cron_entry(entry):
+    """Expand the time fields of the crontab entry dictionary into a
+    dictionary with the set of matching integer values for each time field.
+    Raises ValueError on invalid fields.
+    """
+    compiled = {}
+    for (name, low, high) in cron_field_limits:
+        compiled[name] = parse_cron_field(entry[name], low, high)
+    return compiled
+
+
+def cron_next_fire(compiled, after):
+    """Find the first whole minute strictly after the datetime after, where
+    the compiled crontab entry time fields all match. Returns None if no such
+    time exists within cron_search_days.
+    """
+    minutes = sorted(compiled['minute'])
+    hours = sorted(compiled['hour'])
+    when = after.replace(second=0, microsecond=0) + \
+        datetime.timedelta(minutes=1)
+    give_up = when + datetime.timedelta(days=cron_search_days)
+    while when < give_up:
+        if when.month not in compiled['month']:
+            # Jump to first day of next month
+            year = when.year + when.month // 12
+            month = when.month % 12 + 1
+            when = when.replace(year=year, month=month, day=1, hour=0,
+                                minute=0)
+            continue
+        if when.day not in compiled['dayofmonth'] or \
+                when.weekday() not in compiled['dayofweek']:
+            when = when.replace(hour=0, minute=0) + \
+                datetime.timedelta(days=1)
+            continue
+        hour_index = bisect.bisect_left(hours, when.hour)
+        if hour_index == len(hours):
+            when = when.replace(hour=0, minute=0) + \
+                datetime.timedelta(days=1)
+            continue
+        if hours[hour_index] != when.hour:
+            when = when.replace(hour=hours[hour_index], minute=0)
+        minute_index = bisect.bisect_left(minutes, when.minute)
+        if minute_index == len(minutes):
+            when = when.replace(minute=0) + datetime.timedelta(hours=1)
+            continue
+        return when.replace(minute=minutes[minute_index])
+    return None
+
+
 def cron_match(configuration, cron_time, entry):
     """Check if cron_time matches the time specs in entry"""
     _logger = configuration.logger
     time_vals = {'minute': cron_time.minute, 'hour': cron_time.hour,
                  'month': cron_time.month, 'dayofmonth': cron_time.day,
                  'dayofweek': cron_time.weekday()}
-    # TODO: extend to support e.g. */5 and the likes?
+    try:
+        compiled = compile_cron_entry(entry)
+    except ValueError as exc:
+        _logger.warning("cron_match on invalid entry %s: %s" % (entry, exc))
+        return False
     for (name, val) in time_vals.items():
-        # Strip any leading zeros before integer match
-        if not fnmatch.fnmatch("%s" % val, entry[name].lstrip('0')):
+        if not val in compiled[name]:
             _logger.debug("cron_match failed on %s: %s vs %s" %
                           (name, val, entry[name]))
             return False
@@ -323,3 +516,47 @@ if __name__ == '__main__':
             remain = at_remain(conf, timestamp, rule)
             print("At %s job is %dm in the future for rule" % (
                 timestamp, remain))
+
+    print("Benchmark trigger rule matching:")
+    import random
+    import time
+    vgrid_files_home = '/home/mig/state/vgrid_files_home'
+    rules_map = {}
+    for vgrid_index in range(50):
+        vgrid_prefix = os.path.join(vgrid_files_home, 'vgrid-%d' %
+                                    vgrid_index, '')
+        for rule_index in range(10):
+            target_path = os.path.join(vgrid_prefix, 'dir-%d' % rule_index,
+                                       '*.dat')
+            rules_map[target_path] = [trigger_rule]
+        rules_map[os.path.join(vgrid_prefix, '*')] = [trigger_rule]
+    event_paths = [os.path.join(vgrid_files_home, 'vgrid-%d' %
+                                random.randint(0, 99), 'dir-%d' %
+                                random.randint(0, 19), 'sub',
+                                'file-%d.dat' % i) for i in range(500)]
+
+    start = time.time()
+    plain_hits = 0
+    for src_path in event_paths:
+        for target_path in rules_map:
+            recursive_regexp = fnmatch.translate(target_path)
+            direct_regexp = recursive_regexp.replace('.*', '[^/]*')
+            if re.match(direct_regexp, src_path) or \
+                    re.match(recursive_regexp, src_path):
+                plain_hits += 1
+    plain_secs = time.time() - start
+
+    start = time.time()
+    matcher = build_trigger_matcher(rules_map)
+    build_secs = time.time() - start
+    start = time.time()
+    compiled_hits = 0
+    for src_path in event_paths:
+        compiled_hits += len(match_trigger_rules(matcher, src_path))
+    compiled_secs = time.time() - start
+    print("Matched %d events against %d patterns:" % (len(event_paths),
+                                                      len(rules_map)))
+    print("    plain fnmatch loop: %d hits at %d events/s" %
+          (plain_hits, len(event_paths) / plain_secs))
+    print("    compiled matcher: %d hits at %d events/s (built in %.3fs)" %
+          (compiled_hits, len(event_paths) / compiled_secs, build_secs))
@@ -32,6 +32,7 @@ from __future__ import absolute_import
 
 import errno
 import fcntl
+import itertools
 import os
 import shutil
 import sys
@@ -60,8 +61,10 @@ else:
         listdir = os.listdir
 
 try:
-    from mig.shared.base import force_utf8_rec
+    from mig.shared.base import force_native_str, force_utf8_rec
     from mig.shared.defaults import default_chunk_size, default_max_chunks
+    from mig.shared.gridscriptchannel import send_commands, \
+        CommandsUnacknowledged
     from mig.shared.logger import null_logger
     from mig.shared.pwcrypto import valid_hash_algos, default_algo
     from mig.shared.serial import dump, load
@@ -212,34 +215,73 @@ def read_file_lines(path, logger, mode='r'):
     return contents.splitlines(True)
 
 
+def _stream_file(path, logger, mode, read_helper):
+    """Check that path can be read right away and return a generator yielding
+    the parts that read_helper produces from the file. The file is only opened
+    once the generator is consumed so that building many streams up front does
+    not hold a file descriptor for each. Access errors are raised to the
+    caller while later open and read errors are logged and end the stream.
+    The file is closed when the generator is exhausted or closed.
+    """
+    if not logger:
+        logger = null_logger("dummy")
+    if os.path.isdir(path):
+        raise IOError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+    if not os.access(path, os.R_OK):
+        err = errno.EACCES
+        if not os.path.exists(path):
+            err = errno.ENOENT
+        raise IOError(err, os.strerror(err), path)
+
+    def _stream():
+        """Open path and yield parts from it until done"""
+        try:
+            with open(path, mode) as stream_fd:
+                for part in read_helper(stream_fd):
+                    yield part
+        except Exception as exc:
+            logger.error("could not stream %r: %s" % (path, exc))
+    return _stream()
+
+
+def stream_file(path, logger, mode='r', chunk_size=default_chunk_size):
+    """Stream contents of path as chunks of at most chunk_size with bounded
+    memory use regardless of file size. Raises IOError/OSError if path can't
+    be opened.
+    """
+    def _read_chunks(stream_fd):
+        """Yield chunks until EOF"""
+        while True:
+            chunk = stream_fd.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    return _stream_file(path, logger, mode, _read_chunks)
+
+
+def stream_file_lines(path, logger, mode='r'):
+    """Stream lines of content from path one at a time. Raises IOError/OSError
+    if path can't be opened.
+    """
+    return _stream_file(path, logger, mode, iter)
+
+
 def read_head_lines(path, lines, logger, mode='r'):
     """Read first lines from path"""
     if not logger:
         logger = null_logger("dummy")
     # logger.debug("loading %d first lines from %r" % (lines, path))
-    contents = ''
     out_lines = []
     try:
         if not os.path.exists(path):
             return out_lines
+        # NOTE: only read the requested lines no matter how big the file is
         head_fd = open(path, mode)
-        head_fd.seek(0, os.SEEK_END)
-        size = head_fd.tell()
-        head_fd.seek(0, os.SEEK_SET)
-        pos = head_fd.tell()
-        step_size = 128 * lines
-        # Keep reading in growing chunks until we have enough lines
-        # NOTE: last line is likely truncated when read like this
-        while pos < size and contents.count('\n') < lines:
-            pos = head_fd.tell()
-            # logger.debug("read %db at pos %d from %r" % (step_size, pos, path))
-            contents += head_fd.read(step_size)
-            step_size *= 2
+        out_lines = list(itertools.islice(head_fd, lines))
         head_fd.close()
-        out_lines = contents.splitlines(True)
     except Exception as exc:
         logger.error("reading %d lines from %r: %s" % (lines, path, exc))
-    return out_lines[:lines]
+    return out_lines
 
 
 def read_tail_lines(path, lines, logger, mode='r'):
@@ -251,21 +293,24 @@ def read_tail_lines(path, lines, logger, mode='r'):
     try:
         if not os.path.exists(path):
             return out_lines
-        tail_fd = open(path, mode)
+        # NOTE: python3 only allows seek relative to end in binary mode
+        tail_fd = open(path, mode.replace('b', '') + 'b')
         tail_fd.seek(0, os.SEEK_END)
         size = tail_fd.tell()
-        pos = tail_fd.tell()
         step_size = 128 * lines
-        # locate last X lines
-        while pos > 0 and len(out_lines) < lines:
-            offset = min(lines * step_size, size)
+        # Read growing chunks from the end until we have enough lines
+        while True:
+            offset = min(step_size, size)
             # logger.debug("seek to offset %d from end of %r" % (offset, path))
             tail_fd.seek(-offset, os.SEEK_END)
-            pos = tail_fd.tell()
             out_lines = tail_fd.readlines()
+            # NOTE: first line is likely truncated unless read from the start
+            if offset == size or len(out_lines) > lines:
+                break
             step_size *= 2
-            # logger.debug("reading %d lines from %r" % (lines, path))
         tail_fd.close()
+        if sys.version_info[0] > 2 and 'b' not in mode:
+            out_lines = [force_native_str(line) for line in out_lines]
     except Exception as exc:
         logger.error("could not read %d lines from %r: %s" %
                      (lines, path, exc))
@@ -444,9 +489,25 @@ def save_json(data_object, path, logger):
 
 
 def send_message_to_grid_script(message, logger, configuration):
-    """Write an instruction to the grid_script name pipe input"""
+    """Write an instruction to the grid_script name pipe input or send it on
+    the socket command channel if enabled. Falls back to the pipe if the
+    channel is unavailable or refused it, but not if it was sent without an
+    acknowledgement since grid_script may still handle it then.
+    """
     if not logger:
         logger = null_logger("dummy")
+    grid_socket = getattr(configuration, 'grid_socket', '')
+    if grid_socket:
+        try:
+            send_commands(grid_socket, [message])
+            return True
+        except CommandsUnacknowledged as err:
+            logger.error("sent %r on %s without acknowledgement: %s" %
+                         (message, grid_socket, err))
+            return False
+        except Exception as err:
+            logger.warning("could not send %r on %s - using pipe: %s" %
+                           (message, grid_socket, err))
     logger.debug("write %r to grid_stdin: %s" %
                  (message, configuration.grid_stdin))
     try:
@@ -770,33 +831,51 @@ def checksum_file(path, hash_algo, chunk_size=default_chunk_size,
     files a partial checksum of the first chunk_size * max_chunks bytes will
     be returned.
     """
+    return checksum_file_multi(path, [hash_algo], chunk_size, max_chunks,
+                               logger)[hash_algo]
+
+
+def checksum_file_multi(path, hash_algos, chunk_size=default_chunk_size,
+                        max_chunks=default_max_chunks, logger=None):
+    """Checksum path with all the hash algorithms in the hash_algos list in a
+    single pass over the data. Returns a dictionary mapping each algorithm to
+    the same result string as checksum_file would return for it.
+    """
     if not logger:
         logger = null_logger("dummy")
-    checksum = valid_hash_algos.get(
-        hash_algo, valid_hash_algos[default_algo])()
+    checksums = [(algo, valid_hash_algos.get(
+        algo, valid_hash_algos[default_algo])()) for algo in hash_algos]
     chunks_read = 0
     msg = ''
     try:
         file_fd = open(path, 'rb')
-        while max_chunks < 1 or chunks_read < max_chunks:
-            block = file_fd.read(chunk_size)
-            if not block:
-                break
-            checksum.update(block)
-            chunks_read += 1
-        if file_fd.read(1):
-            msg = ' (of first %d bytes)' % (chunk_size * max_chunks)
+        try:
+            while max_chunks < 1 or chunks_read < max_chunks:
+                block = file_fd.read(chunk_size)
+                if not block:
+                    break
+                for (_, checksum) in checksums:
+                    checksum.update(block)
+                chunks_read += 1
+            if file_fd.read(1):
+                msg = ' (of first %d bytes)' % (chunk_size * max_chunks)
+        finally:
+            file_fd.close()
 
         # NOTE: some algos are variable sized and need a length arg to digest.
         #       They include the shake_X algos and can be identified by a zero
         #       digest_length value. The hexdigest generally has double length.
-        if checksum.digest_size > 0:
-            return "%s%s" % (checksum.hexdigest(), msg)
-        else:
-            return "%s%s" % (checksum.hexdigest(32), msg)
+        results = {}
+        for (algo, checksum) in checksums:
+            if checksum.digest_size > 0:
+                results[algo] = "%s%s" % (checksum.hexdigest(), msg)
+            else:
+                results[algo] = "%s%s" % (checksum.hexdigest(32), msg)
+        return results
     except Exception as exc:
         logger.error("checksum %r failed: %s" % (path, exc))
-        return "checksum %r failed" % os.path.basename(path)
+        failed = "checksum %r failed" % os.path.basename(path)
+        return dict([(algo, failed) for algo in hash_algos])
 
 
 def md5sum_file(path, chunk_size=default_chunk_size,
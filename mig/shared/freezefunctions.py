@@ -39,14 +39,15 @@ import time
 
 from mig.shared.base import client_id_dir, distinguished_name_to_user, \
     brief_list, pretty_format_user, get_site_base_url
+from mig.shared.checksumcache import checksum_files
 from mig.shared.defaults import freeze_meta_filename, freeze_lock_filename, \
     wwwpublic_alias, public_archive_dir, public_archive_index, \
     public_archive_files, public_archive_doi, freeze_flavors, keyword_final, \
     keyword_pending, keyword_updating, keyword_auto, keyword_any, \
     keyword_all, max_freeze_files, archives_cache_filename, \
     freeze_on_tape_filename, archive_marks_dir, csrf_field
-from mig.shared.fileio import checksum_file, write_file, copy_file, copy_rec, \
-    move_file, move_rec, remove_rec, delete_file, delete_symlink, \
+from mig.shared.fileio import write_file, copy_file, copy_rec, move_file, \
+    move_rec, remove_rec, delete_file, delete_symlink, \
     makedirs_rec, make_symlink, make_temp_dir, acquire_file_lock, \
     release_file_lock, walk, listdir
 from mig.shared.filemarks import get_filemark, update_filemark
@@ -709,6 +710,7 @@ def get_frozen_files(client_id, freeze_id, configuration,
     # TODO: switch to combined list and stat with scandir instead of walk?
     files = []
     updates = 0
+    pending_checksums = []
     for (root, _, filenames) in walk(arch_dir):
         for name in filenames:
             if name in __meta_archive_internals + __public_archive_internals:
@@ -737,13 +739,23 @@ def get_frozen_files(client_id, freeze_id, configuration,
                 chksum_field = '%ssum' % algo
                 entry[chksum_field] = entry.get(chksum_field, __chksum_unset)
             # Update checksum (entire file) if requested and not there already
-            for algo in checksum_list:
-                chksum_field = '%ssum' % algo
-                if entry[chksum_field] == __chksum_unset:
-                    entry[chksum_field] = checksum_file(frozen_path, algo,
-                                                        max_chunks=max_chunks)
-                    updates += 1
+            missing = [algo for algo in checksum_list if
+                       entry['%ssum' % algo] == __chksum_unset]
+            if missing:
+                pending_checksums.append((entry, frozen_path, missing))
             files.append(entry)
+    if pending_checksums:
+        # Hash all files in one go for a single read pass with all algos
+        hash_algos = []
+        for (_, _, missing) in pending_checksums:
+            hash_algos += [i for i in missing if not i in hash_algos]
+        all_checksums = checksum_files(configuration,
+                                       [i[1] for i in pending_checksums],
+                                       hash_algos, max_chunks=max_chunks)
+        for (entry, frozen_path, missing) in pending_checksums:
+            for algo in missing:
+                entry['%ssum' % algo] = all_checksums[frozen_path][algo]
+                updates += 1
     if updates > 0:
         # Save updated cache
         try:
@@ -35,8 +35,8 @@ import os
 
 from mig.shared import returnvalues
 from mig.shared.base import client_id_dir
-from mig.shared.fileio import read_file, read_file_lines, write_file, \
-    write_file_lines
+from mig.shared.fileio import read_file, read_file_lines, stream_file, \
+    stream_file_lines, write_file, write_file_lines
 from mig.shared.functional import validate_input_and_cert, REJECT_UNSET
 from mig.shared.handlers import safe_handler, get_csrf_limit
 from mig.shared.init import initialize_main_variables, start_download
@@ -163,15 +163,24 @@ CSRF-filtered POST requests to prevent unintended updates'''
                           'accessed',
                           [relative_path])
 
-                if force_file:
+                # NOTE: stream output to keep memory use bounded
+                if not dst and force_file:
+                    output_lines = stream_file(abs_path, logger,
+                                               mode=src_mode)
+                elif not dst:
+                    output_lines = stream_file_lines(abs_path, logger,
+                                                     mode=src_mode)
+                elif force_file:
                     content = read_file(abs_path, logger, mode=src_mode)
-                    lines = [content]
+                    if content is None:
+                        raise Exception("could not read file")
+                    output_lines += [content]
                 else:
-                    content = lines = read_file_lines(abs_path, logger,
-                                                      mode=src_mode)
-                if content is None:
-                    raise Exception("could not read file")
-                output_lines += lines
+                    content = read_file_lines(abs_path, logger,
+                                              mode=src_mode)
+                    if content is None:
+                        raise Exception("could not read file")
+                    output_lines += content
             except Exception as exc:
                 if not isinstance(exc, GDPIOLogError):
                     gdp_iolog(configuration,
@@ -236,8 +245,9 @@ CSRF-filtered POST requests to prevent unintended updates'''
                     entry['path'] = relative_path
                 # Force download of files when output_format == 'file'
                 if force_file:
-                    download_marker = start_download(configuration, abs_path,
-                                                     output_lines)
+                    download_marker = start_download(
+                        configuration, abs_path, output_lines,
+                        size=os.path.getsize(abs_path))
                     output_objects.append(download_marker)
                 output_objects.append(entry)
 
@@ -34,8 +34,9 @@ import glob
 
 from mig.shared import returnvalues
 from mig.shared.base import client_id_dir
+from mig.shared.checksumcache import checksum_files
 from mig.shared.defaults import default_max_chunks
-from mig.shared.fileio import checksum_file, write_file, check_write_access
+from mig.shared.fileio import write_file, check_write_access
 from mig.shared.functional import validate_input_and_cert, REJECT_UNSET
 from mig.shared.handlers import safe_handler, get_csrf_limit
 from mig.shared.init import initialize_main_variables
@@ -159,7 +160,7 @@ def main(client_id, user_arguments_dict):
                  relative_dest})
             return (output_objects, returnvalues.CLIENT_ERROR)
 
-    all_lines = []
+    all_matches = []
     for pattern in pattern_list:
 
         # Check directory traversal attempts before actual handling to avoid
@@ -190,29 +191,38 @@ def main(client_id, user_arguments_dict):
                                    'name': pattern})
             status = returnvalues.FILE_NOT_FOUND
 
-        for abs_path in match:
-            relative_path = abs_path.replace(base_dir, '')
-            output_lines = []
-            for hash_algo in algo_list:
-                try:
-                    checksum = checksum_file(abs_path, hash_algo,
-                                             max_chunks=max_chunks)
-                    line = "%s %s\n" % (checksum, relative_path)
-                    logger.info("%s %s of %s: %s" % (op_name, hash_algo,
-                                                     abs_path, checksum))
-                    output_lines.append(line)
-                except Exception as exc:
-                    output_objects.append(
-                        {'object_type': 'error_text', 'text':
-                         "%s failed on %r" % (op_name, relative_path)})
-                    logger.error("%s: failed on '%s': %s" % (op_name,
-                                                             relative_path, exc))
-                    status = returnvalues.SYSTEM_ERROR
-                    continue
-            entry = {'object_type': 'file_output',
-                     'lines': output_lines}
-            output_objects.append(entry)
-            all_lines += output_lines
+        all_matches += match
+
+    # Hash all matched files at once to read each file once for all algos
+    # and to spread files over parallel workers
+
+    try:
+        all_checksums = checksum_files(configuration, set(all_matches),
+                                       algo_list, max_chunks=max_chunks)
+    except Exception as exc:
+        logger.error("%s: failed on %s: %s" % (op_name, all_matches, exc))
+        all_checksums = {}
+
+    all_lines = []
+    for abs_path in all_matches:
+        relative_path = abs_path.replace(base_dir, '')
+        output_lines = []
+        for hash_algo in algo_list:
+            checksum = all_checksums.get(abs_path, {}).get(hash_algo, None)
+            if checksum is None:
+                output_objects.append(
+                    {'object_type': 'error_text', 'text':
+                     "%s failed on %r" % (op_name, relative_path)})
+                status = returnvalues.SYSTEM_ERROR
+                continue
+            line = "%s %s\n" % (checksum, relative_path)
+            logger.info("%s %s of %s: %s" % (op_name, hash_algo,
+                                             abs_path, checksum))
+            output_lines.append(line)
+        entry = {'object_type': 'file_output',
+                 'lines': output_lines}
+        output_objects.append(entry)
+        all_lines += output_lines
 
     if dst and not write_file(''.join(all_lines), abs_dest, logger):
         output_objects.append({'object_type': 'error_text',
@@ -43,6 +43,7 @@ from mig.shared.init import initialize_main_variables
 from mig.shared.parseflags import verbose, recursive, force
 from mig.shared.safeinput import valid_path_pattern
 from mig.shared.sharelinks import extract_mode_id
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.userio import GDPIOLogError, gdp_iolog
 from mig.shared.validstring import valid_user_path
 from mig.shared.vgrid import in_vgrid_share
@@ -360,6 +361,7 @@ copy parent placeholders for %s shared folders!""" %
                     shutil.copytree(abs_path, abs_target)
                 else:
                     shutil.copy(abs_path, abs_target)
+                mark_disk_stats_path(configuration, abs_target)
                 logger.info('%s %s %s done' % (op_name, abs_path, abs_target))
             except Exception as exc:
                 if not isinstance(exc, GDPIOLogError):
@@ -208,7 +208,9 @@ Please contact the %s site support (%s) if you think it should be enabled.
 #
 # To define the time you can provide concrete values for minute (m), hour (h),
 # day of month (dom), month (mon), and day of week (dow) or use '*' in these
-# fields (for 'any').
+# fields (for 'any'). Ranges like 9-17, lists like 0,30 and steps like */15 or
+# 0-30/10 are also supported. Day of week counts from 0 for Monday to 6 for
+# Sunday.
 #
 # For example, if you have a Documents folder and want to create a backup of it
 # at 5 a.m every week, you can do so by adding a rule like:
@@ -36,6 +36,7 @@ import time
 
 from mig.shared import returnvalues
 from mig.shared.base import client_id_dir
+from mig.shared.fileio import stream_file_lines
 from mig.shared.functional import validate_input_and_cert, REJECT_UNSET
 from mig.shared.init import initialize_main_variables
 from mig.shared.parseflags import verbose, binary
@@ -51,29 +52,32 @@ def signature():
     return ['file_output', defaults]
 
 
-def pattern_match_file(pattern, filename, allowed_time=5.0):
-    """Return lines in file which match the provided pattern"""
-
-    # Allow comparison to take up to allowed_time seconds
-
-    fit = []
-    start_time = time.time()
-    file_fd = open(filename, 'r')
-    for line in file_fd:
-        compare_time = time.time() - start_time
-        if compare_time > allowed_time:
-
-            # print "Template fit of %s against %s timed out after %d lines (%d seconds)" % (template, filename, i, compare_time)
-
-            break
-
-        if re.search(pattern, line.strip()):
-            fit.append(line)
-    file_fd.close()
-
-    # print "Comparison of %s against %s done in %.4f seconds" % (template, filename, compare_time)
-
-    return fit
+def pattern_match_file(pattern, filename, allowed_time=5.0, logger=None):
+    """Lazily yield lines in file which match the provided pattern, which may
+    also be a precompiled regular expression. Access errors are raised to the
+    caller right away while the file is only opened once the lines are used.
+    """
+
+    if not hasattr(pattern, 'search'):
+        pattern = re.compile(pattern)
+    file_lines = stream_file_lines(filename, logger)
+
+    def _matching():
+        """Yield matches until allowed_time is spent on comparison"""
+        # NOTE: only count comparison time - not the time spent waiting for
+        #       the consumer to deliver previous matches
+        compare_time = 0.0
+        last_time = time.time()
+        for line in file_lines:
+            fit = pattern.search(line.strip())
+            compare_time += time.time() - last_time
+            if compare_time > allowed_time:
+                break
+            if fit:
+                yield line
+            last_time = time.time()
+        file_lines.close()
+    return _matching()
 
 
 def main(client_id, user_arguments_dict):
@@ -101,6 +105,15 @@ def main(client_id, user_arguments_dict):
     patterns = accepted['path']
     search = accepted['pattern'][-1]
 
+    # Compile the pattern once for all lines in all files
+    try:
+        search_re = re.compile(search)
+    except re.error as err:
+        output_objects.append({'object_type': 'error_text', 'text':
+                               "%s: invalid pattern %r: %s" % (op_name, search,
+                                                                err)})
+        return (output_objects, returnvalues.CLIENT_ERROR)
+
     # Please note that base_dir must end in slash to avoid access to other
     # user dirs when own name is a prefix of another user name
 
@@ -144,11 +157,10 @@ def main(client_id, user_arguments_dict):
 
         for abs_path in match:
             relative_path = abs_path.replace(base_dir, '')
-            output_lines = []
             try:
-                matching = pattern_match_file(search, abs_path)
-                for line in matching:
-                    output_lines.append(line)
+                # NOTE: matching lines are streamed to keep memory use bounded
+                output_lines = pattern_match_file(search_re, abs_path,
+                                                  logger=logger)
             except Exception as exc:
                 logger.error("%s: failed on %r: %s" % (op_name, relative_path,
                                                        exc))
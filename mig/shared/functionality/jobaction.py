@@ -42,6 +42,7 @@ from mig.shared.fileio import unpickle, unpickle_and_change_status, \
 from mig.shared.functional import validate_input_and_cert, REJECT_UNSET
 from mig.shared.handlers import safe_handler, get_csrf_limit
 from mig.shared.init import initialize_main_variables
+from mig.shared.jobevents import log_job_event
 from mig.shared.validstring import valid_user_path
 
 
@@ -225,6 +226,8 @@ jobs!''' % (job_id, action)
                                    'Job status could not be changed to %s!'
                                    % new_state})
             status = returnvalues.SYSTEM_ERROR
+        else:
+            log_job_event(configuration, filepath, new_state, logger)
 
         # Avoid key error and make sure grid_script gets expected number of
         # arguments
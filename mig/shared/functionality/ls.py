@@ -39,6 +39,8 @@ import time
 from mig.shared import returnvalues
 from mig.shared.base import client_id_dir, invisible_path
 from mig.shared.defaults import seafile_ro_dirname, trash_destdir, csrf_field
+from mig.shared.dirlisting import list_dir, entry_is_file, entry_stat, \
+    sort_fields
 from mig.shared.functional import validate_input
 from mig.shared.handlers import get_csrf_limit, make_csrf_token
 from mig.shared.htmlgen import fancy_upload_js, fancy_upload_html, confirm_js, \
@@ -57,7 +59,8 @@ from mig.shared.vgrid import in_vgrid_share, in_vgrid_priv_web, in_vgrid_pub_web
 def signature():
     """Signature of the main function"""
     defaults = {'flags': [''], 'path': ['.'], 'share_id': [''],
-                'current_dir': ['.']}
+                'current_dir': ['.'], 'sort': ['name'], 'order': ['asc'],
+                'offset': ['0'], 'limit': ['']}
     return ['dir_listings', defaults]
 
 
@@ -111,36 +114,45 @@ function selectedFilesAction() {
     """
 
 
-def fileinfo_stat(path):
-    """Additional stat information for file manager"""
+def fileinfo_stat(path, stat_info=None):
+    """Additional stat information for file manager. The optional stat_info
+    is the already known stat result for path.
+    """
     file_information = {'size': 0, 'created': 0, 'modified': 0, 'accessed': 0,
                         'ext': ''}
-    if os.path.exists(path):
-        ext = 'dir'
-        if not os.path.isdir(path):
-            ext = os.path.splitext(path)[1].lstrip('.')
-        file_information['ext'] = ext
+
+    # Make a single stat call and extract all info from it
+
+    if stat_info is None:
         try:
-            file_information['size'] = os.path.getsize(path)
-            file_information['created'] = os.path.getctime(path)
-            file_information['modified'] = os.path.getmtime(path)
-            file_information['accessed'] = os.path.getatime(path)
-        except OSError as ose:
-            pass
+            stat_info = os.stat(path)
+        except OSError:
+            return file_information
+    ext = 'dir'
+    if not stat.S_ISDIR(stat_info.st_mode):
+        ext = os.path.splitext(path)[1].lstrip('.')
+    file_information['ext'] = ext
+    file_information['size'] = stat_info.st_size
+    file_information['created'] = stat_info.st_ctime
+    file_information['modified'] = stat_info.st_mtime
+    file_information['accessed'] = stat_info.st_atime
     return file_information
 
 
-def long_format(path):
-    """output extra info like filesize about the file located at path"""
+def long_format(path, stat_info=None):
+    """output extra info like filesize about the file located at path. The
+    optional stat_info is the already known stat result for path.
+    """
     format_line = ''
     perms = ''
 
     # Make a single stat call and extract all info from it
 
-    try:
-        stat_info = os.stat(path)
-    except Exception:
-        return 'Internal error: stat failed!'
+    if stat_info is None:
+        try:
+            stat_info = os.stat(path)
+        except Exception:
+            return 'Internal error: stat failed!'
 
     mode = stat_info.st_mode
     if stat.S_ISDIR(mode):
@@ -176,8 +188,9 @@ def handle_file(
     file_with_dir,
     actual_file,
     flags='',
+    stat_info=None,
 ):
-    """handle a file"""
+    """handle a file with optional already known stat_info"""
 
     # Build entire line before printing to avoid newlines
 
@@ -199,10 +212,10 @@ def handle_file(
         'special': special,
     }
     if long_list(flags):
-        file_obj['long_format'] = long_format(actual_file)
+        file_obj['long_format'] = long_format(actual_file, stat_info)
 
     if file_info(flags):
-        file_obj['file_info'] = fileinfo_stat(actual_file)
+        file_obj['file_info'] = fileinfo_stat(actual_file, stat_info)
 
     listing.append(file_obj)
 
@@ -214,8 +227,9 @@ def handle_dir(
     dirname_with_dir,
     actual_dir,
     flags='',
+    stat_info=None,
 ):
-    """handle a dir"""
+    """handle a dir with optional already known stat_info"""
 
     # Recursion can get here when called without explicit invisible files
 
@@ -285,10 +299,10 @@ def handle_dir(
     }
 
     if long_list(flags):
-        dir_obj['actual_dir'] = long_format(actual_dir)
+        dir_obj['actual_dir'] = long_format(actual_dir, stat_info)
 
     if file_info(flags):
-        dir_obj['file_info'] = fileinfo_stat(actual_dir)
+        dir_obj['file_info'] = fileinfo_stat(actual_dir, stat_info)
 
     listing.append(dir_obj)
 
@@ -301,8 +315,12 @@ def handle_ls(
     real_path,
     flags='',
     depth=0,
+    page=None,
 ):
-    """Recursive function to emulate GNU ls (-R)"""
+    """Recursive function to emulate GNU ls (-R). The optional page
+    dictionary selects sort, order, offset and limit of a non-recursive
+    listing and gets the total number of entries in the listed dir added.
+    """
 
     _logger = configuration.logger
     op_name = 'ls'
@@ -327,11 +345,64 @@ def handle_ls(
     # Recursion can get here when called without explicit invisible files
 
     if invisible_path(relative_path):
+        if page is not None:
+            page['total'] = 0
         return
 
     if os.path.isfile(real_path):
         handle_file(configuration, listing, base_name, relative_path,
                     real_path, flags)
+        if page is not None:
+            page['total'] = 1
+    elif not recursive(flags) or depth < 0:
+        if page is None:
+            page = {}
+
+        def __visible(entry):
+            """Filter out invisible entries before they are counted and paged
+            as handle_file and handle_dir would skip them anyway.
+            """
+            path = real_path + os.sep + entry.name
+            return not invisible_path(path.replace(base_dir, ''))
+        try:
+            # Filter out dot files unless '-a' is used
+            (total, entries) = list_dir(real_path, all(flags),
+                                        page.get('sort', 'name'),
+                                        page.get('order', 'asc') == 'desc',
+                                        page.get('offset', 0),
+                                        page.get('limit', None),
+                                        __visible)
+        except Exception as exc:
+            _logger.error('%s failed on %r: %s' % (op_name, real_path, exc))
+            output_objects.append({'object_type': 'error_text', 'text':
+                                   'Failed to list contents of %r' % base_name
+                                   })
+            return (output_objects, returnvalues.SYSTEM_ERROR)
+        page['total'] = total
+
+        # listdir does not include '.' and '..' - add manually
+        # to ease navigation
+
+        if all(flags) and page.get('offset', 0) == 0:
+            handle_dir(configuration, listing, '.', relative_path,
+                       real_path, flags)
+            handle_dir(configuration, listing, '..',
+                       os.path.dirname(relative_path),
+                       os.path.dirname(real_path), flags)
+        # Only stat entries if needed and then just once
+        need_stat = long_list(flags) or file_info(flags)
+        for entry in entries:
+            path = real_path + os.sep + entry.name
+            rel_path = path.replace(base_dir, '')
+            stat_info = None
+            if need_stat:
+                stat_info = entry_stat(entry)
+            if entry_is_file(entry):
+                handle_file(configuration, listing, entry.name, rel_path,
+                            path, flags, stat_info)
+            else:
+                handle_dir(configuration, listing, entry.name, rel_path,
+                           path, flags, stat_info)
     else:
         try:
             contents = os.listdir(real_path)
@@ -348,53 +419,31 @@ def handle_ls(
             contents = [i for i in contents if not i.startswith('.')]
         contents.sort()
 
-        if not recursive(flags) or depth < 0:
-
-            # listdir does not include '.' and '..' - add manually
-            # to ease navigation
-
-            if all(flags):
-                handle_dir(configuration, listing, '.', relative_path,
-                           real_path, flags)
-                handle_dir(configuration, listing, '..',
-                           os.path.dirname(relative_path),
-                           os.path.dirname(real_path), flags)
-            for name in contents:
-                path = real_path + os.sep + name
-                rel_path = path.replace(base_dir, '')
-                if os.path.isfile(path):
-                    handle_file(configuration, listing, name, rel_path, path,
-                                flags)
-                else:
-                    handle_dir(configuration, listing, name, rel_path, path,
-                               flags)
-        else:
-
-            # Force pure content listing first by passing a negative depth
-
-            handle_ls(
-                configuration,
-                output_objects,
-                listing,
-                base_dir,
-                real_path,
-                flags,
-                -1,
-            )
-
-            for name in contents:
-                path = real_path + os.sep + name
-                rel_path = path.replace(base_dir, '')
-                if os.path.isdir(path):
-                    handle_ls(
-                        configuration,
-                        output_objects,
-                        listing,
-                        base_dir,
-                        path,
-                        flags,
-                        depth + 1,
-                    )
+        # Force pure content listing first by passing a negative depth
+
+        handle_ls(
+            configuration,
+            output_objects,
+            listing,
+            base_dir,
+            real_path,
+            flags,
+            -1,
+        )
+
+        for name in contents:
+            path = real_path + os.sep + name
+            rel_path = path.replace(base_dir, '')
+            if os.path.isdir(path):
+                handle_ls(
+                    configuration,
+                    output_objects,
+                    listing,
+                    base_dir,
+                    path,
+                    flags,
+                    depth + 1,
+                )
 
 
 def main(client_id, user_arguments_dict, environ=None):
@@ -422,6 +471,26 @@ def main(client_id, user_arguments_dict, environ=None):
     pattern_list = accepted['path']
     current_dir = accepted['current_dir'][-1].lstrip('/')
     share_id = accepted['share_id'][-1]
+    sort_by = accepted['sort'][-1]
+    order = accepted['order'][-1]
+    offset = accepted['offset'][-1]
+    limit = accepted['limit'][-1]
+    if not sort_by in sort_fields or not order in ('asc', 'desc'):
+        output_objects.append({'object_type': 'error_text', 'text':
+                               'Invalid sort %r or order %r requested!' %
+                               (sort_by, order)})
+        return (output_objects, returnvalues.CLIENT_ERROR)
+    try:
+        offset = int(offset)
+        if limit:
+            limit = int(limit)
+        else:
+            limit = None
+    except ValueError:
+        output_objects.append({'object_type': 'error_text', 'text':
+                               'Invalid offset %r or limit %r requested!' %
+                               (offset, limit)})
+        return (output_objects, returnvalues.CLIENT_ERROR)
 
     status = returnvalues.OK
 
@@ -712,6 +781,12 @@ Action on paths selected below
                 'entries': entries,
                 'flags': flags,
             }
+            # Recursive listings are never paged so they get no page info
+            page = None
+            if not recursive(flags):
+                page = {'sort': sort_by, 'order': order, 'offset': offset,
+                        'limit': limit}
+                dir_listing['page'] = page
             try:
                 gdp_iolog(configuration,
                           client_id,
@@ -726,7 +801,7 @@ Action on paths selected below
                                                             relative_path)})
                 continue
             handle_ls(configuration, output_objects, entries, base_dir,
-                      abs_path, flags, 0)
+                      abs_path, flags, 0, page)
             dir_listings.append(dir_listing)
 
     output_objects.append({'object_type': 'html_form', 'text': """<br/>
@@ -39,6 +39,7 @@ from mig.shared.handlers import safe_handler, get_csrf_limit
 from mig.shared.init import initialize_main_variables, find_entry
 from mig.shared.parseflags import parents, verbose
 from mig.shared.sharelinks import extract_mode_id
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.userio import GDPIOLogError, gdp_iolog
 from mig.shared.validstring import valid_user_path
 
@@ -220,6 +221,7 @@ CSRF-filtered POST requests to prevent unintended updates'''
                         os.makedirs(abs_path)
                 else:
                     os.mkdir(abs_path)
+                mark_disk_stats_path(configuration, abs_path)
                 logger.info('%s %s done' % (op_name, abs_path))
             except Exception as exc:
                 if not isinstance(exc, GDPIOLogError):
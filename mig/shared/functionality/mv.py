@@ -41,6 +41,7 @@ from mig.shared.handlers import safe_handler, get_csrf_limit
 from mig.shared.init import initialize_main_variables
 from mig.shared.parseflags import verbose
 from mig.shared.safeinput import valid_path_pattern
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.userio import GDPIOLogError, gdp_iolog
 from mig.shared.validstring import valid_user_path
 from mig.shared.vgrid import in_vgrid_share
@@ -239,6 +240,8 @@ move parent placeholders for %s shared folders!""" %
                           'moved',
                           [relative_path, relative_dest])
                 shutil.move(abs_path, abs_target)
+                mark_disk_stats_path(configuration, abs_path)
+                mark_disk_stats_path(configuration, abs_target)
                 logger.info('%s %s %s done' % (op_name, abs_path, abs_target))
             except Exception as exc:
                 if not isinstance(exc, GDPIOLogError):
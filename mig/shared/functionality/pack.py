@@ -35,13 +35,15 @@ import glob
 import os
 
 from mig.shared import returnvalues
-from mig.shared.archives import pack_archive
+from mig.shared.archives import pack_archive, stream_archive, \
+    stream_archive_format
 from mig.shared.base import client_id_dir
 from mig.shared.fileio import check_write_access
 from mig.shared.functional import validate_input_and_cert, REJECT_UNSET
 from mig.shared.handlers import safe_handler, get_csrf_limit
-from mig.shared.init import initialize_main_variables, find_entry
-from mig.shared.parseflags import verbose
+from mig.shared.init import initialize_main_variables, find_entry, \
+    make_start_entry
+from mig.shared.parseflags import keep, verbose
 from mig.shared.safeinput import valid_path_pattern
 from mig.shared.validstring import valid_user_path
 from mig.shared.vgrid import in_vgrid_share
@@ -80,6 +82,11 @@ def usage(output_objects):
          '- dst is the path where the generated archive will be stored. ' +
          'The file extension decides the archive format (zip, tar, tar.gz)'
          })
+    output_objects.append(
+        {'object_type': 'text', 'text':
+         '- with output_format=file the archive is streamed directly as a ' +
+         'download named like dst and only stored in dst with flags=k'
+         })
     return (output_objects, returnvalues.OK)
 
 
@@ -177,13 +184,24 @@ CSRF-filtered POST requests to prevent unintended updates'''
              "Invalid path! (%s expands to an illegal path)" % dst})
         return (output_objects, returnvalues.CLIENT_ERROR)
 
-    if not os.path.isdir(os.path.dirname(abs_dest)):
+    # Stream archive directly to the client without a temporary copy when
+    # output_format is file and only save it in dst with the keep flag
+    stream_download = \
+        user_arguments_dict.get('output_format', ['txt'])[0] == 'file'
+    save_archive = not stream_download or keep(flags)
+    if stream_download and stream_archive_format(dst)[0] is None:
+        output_objects.append({'object_type': 'error_text', 'text':
+                               "Unknown/unsupported archive format: %s" %
+                               relative_dest})
+        return (output_objects, returnvalues.CLIENT_ERROR)
+
+    if save_archive and not os.path.isdir(os.path.dirname(abs_dest)):
         output_objects.append({'object_type': 'error_text', 'text':
                                "No such destination directory: %s"
                                % os.path.dirname(relative_dest)})
         return (output_objects, returnvalues.CLIENT_ERROR)
 
-    if not check_write_access(abs_dest, parent_dir=True):
+    if save_archive and not check_write_access(abs_dest, parent_dir=True):
         logger.warning('%s called without write access: %s' %
                        (op_name, abs_dest))
         output_objects.append(
@@ -193,6 +211,7 @@ CSRF-filtered POST requests to prevent unintended updates'''
         return (output_objects, returnvalues.CLIENT_ERROR)
 
     status = returnvalues.OK
+    stream_srcs = []
 
     for pattern in pattern_list:
 
@@ -263,6 +282,9 @@ pack entire %s shared folders!""" % configuration.site_vgrid_label})
             if verbose(flags):
                 output_objects.append(
                     {'object_type': 'file', 'name': relative_path})
+            if stream_download:
+                stream_srcs.append(relative_path)
+                continue
 
             (pack_status, msg) = pack_archive(configuration, client_id,
                                               relative_path, relative_dest)
@@ -275,6 +297,28 @@ pack entire %s shared folders!""" % configuration.site_vgrid_label})
                                    'Added %s to %s' % (relative_path,
                                                        relative_dest)})
 
+    if stream_download:
+        if not stream_srcs:
+            return (output_objects, status)
+        try:
+            archive_stream = stream_archive(configuration, client_id,
+                                            stream_srcs, relative_dest,
+                                            save=save_archive)
+        except Exception as exc:
+            logger.error("%s: stream archive %s failed: %s" %
+                         (op_name, relative_dest, exc))
+            output_objects.append({'object_type': 'error_text', 'text':
+                                   'Error: could not stream archive %s' %
+                                   relative_dest})
+            return (output_objects, returnvalues.SYSTEM_ERROR)
+        output_objects.append(make_start_entry(
+            [('Content-Type', 'application/octet-stream'),
+             ('Content-Disposition', 'attachment; filename="%s";' %
+              os.path.basename(relative_dest))]))
+        output_objects.append({'object_type': 'file_output',
+                               'lines': archive_stream})
+        return (output_objects, status)
+
     output_objects.append({'object_type': 'text', 'text':
                            'Packed archive of %s is now available in %s'
                            % (', '.join(pattern_list), relative_dest)})
@@ -40,6 +40,7 @@ from mig.shared.init import initialize_main_variables, find_entry
 from mig.shared.parseflags import parents, verbose
 from mig.shared.safeinput import valid_path_pattern
 from mig.shared.sharelinks import extract_mode_id
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.validstring import valid_user_path
 
 
@@ -208,6 +209,7 @@ CSRF-filtered POST requests to prevent unintended updates'''
                     os.removedirs(abs_path)
                 else:
                     os.rmdir(abs_path)
+                mark_disk_stats_path(configuration, abs_path)
                 logger.info('%s %s done' % (op_name, abs_path))
             except Exception as exc:
                 output_objects.append({'object_type': 'error_text', 'text':
@@ -49,6 +49,7 @@ from mig.shared.init import initialize_main_variables, find_entry
 from mig.shared.parseflags import in_place, verbose
 from mig.shared.safeinput import valid_path
 from mig.shared.sharelinks import extract_mode_id
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.userio import GDPIOLogError, gdp_iolog
 from mig.shared.validstring import valid_user_path
 
@@ -427,6 +428,7 @@ def main(client_id, user_arguments_dict, environ=None):
                         raise IOError(
                             "failed to create dest_dir: %s" % dest_dir)
                     move(abs_src_path, dest_path)
+                    mark_disk_stats_path(configuration, dest_path)
                     moved = True
                 except Exception as exc:
                     if not isinstance(exc, GDPIOLogError):
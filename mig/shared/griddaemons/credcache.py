@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# credcache - bounded verified credential cache shared by grid daemons
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Bounded cache of verified password hash checks for the grid daemons.
+
+The check_hash function in pwcrypto accepts a hash_cache to skip the costly
+PBKDF2 derivation on repeated logins. A plain dict there is private to the
+daemon process and grows without bounds. The CredentialCache in this module
+can be used instead. It keeps a small LRU with a short TTL in each process in
+front of an sqlite table in mig_system_run shared by all daemon processes on
+the host, so that new worker processes and restarted daemons benefit from
+checks already done elsewhere. Both levels are bounded in size and entries
+expire after a TTL.
+
+Cache keys are an HMAC of service, username, password and the stored hash
+with a site secret, so the table never holds anything usable for offline
+password guessing without that secret. With the stored hash in the key any
+change to the authpasswords file or user DB hash automatically misses. In
+addition invalidate_user removes all entries for a user when the daemons
+notice changed credential files.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from mig.shared.defaults import credential_cache_ttl, \
+    credential_cache_local_ttl, credential_cache_max_entries
+from mig.shared.pwcrypto import best_crypt_salt
+from mig.shared.sqlitedb import open_sqlite_db
+
+_cred_cache_filename = "credential_cache.db"
+# Prune the shared table after this many stores in a process
+_prune_interval = 64
+
+
+def _encode(value):
+    """Bytes version of value for hashing"""
+    if isinstance(value, bytes):
+        return value
+    return ("%s" % value).encode('utf8')
+
+
+class CredentialCache(object):
+    """Two level LRU and TTL cache of verified credentials. Passed as the
+    hash_cache argument to check_hash and check_password_hash.
+    """
+
+    def __init__(self, configuration, max_entries=credential_cache_max_entries,
+                 ttl=credential_cache_ttl, local_ttl=credential_cache_local_ttl,
+                 shared=True):
+        """Init cache with a site secret from configuration. The shared
+        argument decides if the sqlite table in mig_system_run is used
+        behind the process local LRU.
+        """
+        self.configuration = configuration
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.local_ttl = min(local_ttl, ttl)
+        self.__secret = _encode(best_crypt_salt(configuration))
+        self.__local = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__conn = None
+        self.__stores = 0
+        self.__stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0,
+                        'stores': 0, 'evictions': 0, 'invalidations': 0,
+                        'computed': 0, 'compute_secs': 0.0}
+        self.db_path = None
+        if shared:
+            self.db_path = os.path.join(configuration.mig_system_run,
+                                        _cred_cache_filename)
+
+    def _key(self, service, username, password, hashed):
+        """Keyed digest identifying a verified credential"""
+        msg = b'\0'.join([_encode(i) for i in (service, username, password,
+                                                 hashed)])
+        return hmac.new(self.__secret, msg, hashlib.sha256).hexdigest()
+
+    def _open_db(self):
+        """Lazy open the shared table with the lock held"""
+        if self.__conn is None:
+            conn = open_sqlite_db(self.db_path, synchronous='OFF',
+                                  check_same_thread=False, native_text=True)
+            conn.execute("""CREATE TABLE IF NOT EXISTS verified (
+                            cache_key TEXT PRIMARY KEY,
+                            username TEXT NOT NULL,
+                            expire REAL NOT NULL)""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS verified_username
+                            ON verified (username)""")
+            conn.execute("""CREATE INDEX IF NOT EXISTS verified_expire
+                            ON verified (expire)""")
+            conn.commit()
+            self.__conn = conn
+        return self.__conn
+
+    def _shared_call(self, action, *args):
+        """Run action on the shared table with the lock held and disable the
+        shared level on errors so that a broken table never breaks logins.
+        """
+        if not self.db_path:
+            return None
+        try:
+            return action(self._open_db(), *args)
+        except Exception as exc:
+            self.configuration.logger.error(
+                "disabling shared credential cache in %s: %s" %
+                (self.db_path, exc))
+            self.db_path = None
+            return None
+
+    def _local_insert(self, key, username, expire):
+        """Insert entry in the local LRU and evict the oldest ones beyond
+        max_entries.
+        """
+        self.__local.pop(key, None)
+        self.__local[key] = (username, expire)
+        while len(self.__local) > self.max_entries:
+            self.__local.popitem(last=False)
+            self.__stats['evictions'] += 1
+
+    def lookup(self, service, username, password, hashed):
+        """Check if the credentials were recently verified"""
+        key = self._key(service, username, password, hashed)
+        now = time.time()
+        with self.__lock:
+            entry = self.__local.pop(key, None)
+            if entry is not None and entry[1] > now:
+                self.__local[key] = entry
+                self.__stats['local_hits'] += 1
+                return True
+
+            def _lookup(conn):
+                return conn.execute("SELECT expire FROM verified WHERE "
+                                    "cache_key=? AND expire>?",
+                                    (key, now)).fetchone()
+            row = self._shared_call(_lookup)
+            if row is not None:
+                self._local_insert(key, username,
+                                   min(row[0], now + self.local_ttl))
+                self.__stats['shared_hits'] += 1
+                return True
+            self.__stats['misses'] += 1
+        return False
+
+    def store(self, service, username, password, hashed):
+        """Remember that the credentials were verified"""
+        key = self._key(service, username, password, hashed)
+        now = time.time()
+        with self.__lock:
+            self._local_insert(key, username, now + self.local_ttl)
+            self.__stats['stores'] += 1
+            self.__stores += 1
+            prune = (self.__stores % _prune_interval == 0)
+
+            def _store(conn):
+                conn.execute("INSERT OR REPLACE INTO verified (cache_key, "
+                             "username, expire) VALUES (?, ?, ?)",
+                             (key, _encode(username).decode('utf8'),
+                              now + self.ttl))
+                if prune:
+                    self._prune(conn, now)
+                conn.commit()
+            self._shared_call(_store)
+
+    def _prune(self, conn, now):
+        """Remove expired entries and the ones expiring first beyond
+        max_entries from the shared table.
+        """
+        conn.execute("DELETE FROM verified WHERE expire<=?", (now, ))
+        conn.execute("DELETE FROM verified WHERE cache_key IN (SELECT "
+                     "cache_key FROM verified ORDER BY expire DESC LIMIT -1 "
+                     "OFFSET ?)", (self.max_entries, ))
+
+    def record_compute(self, elapsed):
+        """Account for a full hash derivation taking elapsed seconds"""
+        with self.__lock:
+            self.__stats['computed'] += 1
+            self.__stats['compute_secs'] += elapsed
+
+    def invalidate_user(self, username):
+        """Remove all cached entries for username in this process and in the
+        shared table. Other processes may keep their local entries for up to
+        local_ttl seconds.
+        """
+        username = _encode(username).decode('utf8')
+        with self.__lock:
+            for (key, entry) in list(self.__local.items()):
+                if _encode(entry[0]).decode('utf8') == username:
+                    del self.__local[key]
+            self.__stats['invalidations'] += 1
+
+            def _invalidate(conn):
+                conn.execute("DELETE FROM verified WHERE username=?",
+                             (username, ))
+                conn.commit()
+            self._shared_call(_invalidate)
+
+    def expire(self):
+        """Remove all expired entries"""
+        now = time.time()
+        with self.__lock:
+            for (key, entry) in list(self.__local.items()):
+                if entry[1] <= now:
+                    del self.__local[key]
+
+            def _expire(conn):
+                self._prune(conn, now)
+                conn.commit()
+            self._shared_call(_expire)
+
+    def clear(self):
+        """Remove all entries in this process and in the shared table"""
+        with self.__lock:
+            self.__local.clear()
+
+            def _clear(conn):
+                conn.execute("DELETE FROM verified")
+                conn.commit()
+            self._shared_call(_clear)
+
+    def close(self):
+        """Close the connection to the shared table"""
+        with self.__lock:
+            if self.__conn is not None:
+                self.__conn.close()
+                self.__conn = None
+
+    def __len__(self):
+        """Number of entries in the local LRU"""
+        return len(self.__local)
+
+    def stats(self):
+        """Returns dictionary with hit, miss and store counters along with
+        the hit rate and an estimate of the seconds of hash derivation saved
+        by cache hits in this process.
+        """
+        with self.__lock:
+            result = dict(self.__stats)
+            result['entries'] = len(self.__local)
+        hits = result['local_hits'] + result['shared_hits']
+        lookups = hits + result['misses']
+        result['hit_rate'] = float(hits) / max(lookups, 1)
+        avg_compute = result['compute_secs'] / max(result['computed'], 1)
+        result['saved_secs'] = hits * avg_compute
+        return result
+
+
+def get_hash_cache(configuration):
+    """Returns hash_cache for check_hash in daemons depending on the
+    configured credential_cache_backend. That is, a plain dict for the
+    default process local cache or a CredentialCache otherwise.
+    """
+    if configuration.site_credential_cache_backend == 'shared':
+        try:
+            return CredentialCache(configuration)
+        except Exception as exc:
+            configuration.logger.error("credential cache init failed: %s" %
+                                       exc)
+    return {}
+
+
+def log_hash_cache_stats(configuration, hash_cache):
+    """Log current stats for hash_cache if it is a CredentialCache"""
+    if isinstance(hash_cache, CredentialCache):
+        stats = hash_cache.stats()
+        configuration.logger.info(
+            "credential cache: %(entries)d entries, hit rate %(hit_rate).2f "
+            "(%(local_hits)d local, %(shared_hits)d shared, %(misses)d "
+            "misses), saved %(saved_secs).1fs of hashing" % stats)
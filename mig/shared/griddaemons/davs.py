@@ -29,9 +29,11 @@
 
 from mig.shared.griddaemons.base import default_username_validator, \
     get_fs_path, acceptable_chmod
+from mig.shared.griddaemons.credcache import get_hash_cache, \
+    log_hash_cache_stats
 from mig.shared.griddaemons.login import add_user_object, \
     refresh_user_creds, refresh_share_creds, update_login_map, \
-    login_map_lookup
+    login_map_lookup, LoginStore
 from mig.shared.griddaemons.ratelimits import default_max_user_hits, \
     default_user_abuse_hits, default_proto_abuse_hits, \
     default_max_secret_hits, hit_rate_limit, \
@@ -27,10 +27,15 @@
 
 """MiG login daemon functions"""
 
+from __future__ import absolute_import
+
+from past.builtins import basestring
+
 import glob
 import logging
 import os
 import socket
+import threading
 import time
 
 from mig.shared.base import client_dir_id, client_id_dir, client_alias, \
@@ -111,6 +116,94 @@ last_update: %s''' % self.last_update
         return out
 
 
+class LoginStore(object):
+    """Active Login objects in a bucket for each kind of login with the
+    logins for each username kept in a tuple under that username. Thus
+    replacing or removing the logins of a username only touches that entry
+    rather than all logins of the kind.
+
+    Updates are serialized with an internal lock and always install a new
+    tuple, so readers get a consistent snapshot of the logins for a username
+    without taking any lock.
+    """
+
+    kinds = ('users', 'jobs', 'shares', 'jupyter_mounts')
+
+    def __init__(self):
+        """Init empty store"""
+        self._lock = threading.Lock()
+        self._buckets = dict([(kind, {}) for kind in self.kinds])
+
+    def get(self, kind, username):
+        """Returns a list of the kind logins for username"""
+        return list(self._buckets[kind].get(username, ()))
+
+    def add(self, kind, login):
+        """Add the Login object login to the kind logins"""
+        with self._lock:
+            bucket = self._buckets[kind]
+            bucket[login.username] = bucket.get(login.username, ()) + (login, )
+
+    def remove(self, kind, username, keep=None):
+        """Remove kind logins for username. The optional keep function is
+        called with each login and any logins where it returns True are kept.
+        """
+        with self._lock:
+            bucket = self._buckets[kind]
+            old_logins = bucket.get(username, ())
+            if keep is None:
+                remain = ()
+            else:
+                remain = tuple([i for i in old_logins if keep(i)])
+            if remain:
+                bucket[username] = remain
+            elif username in bucket:
+                del bucket[username]
+
+    def remove_matching(self, kind, match):
+        """Remove all kind logins where the match function returns True. This
+        has to visit all kind logins so it is only meant for the rare cases
+        where logins are not identified by username.
+        """
+        with self._lock:
+            bucket = self._buckets[kind]
+            for (username, old_logins) in list(bucket.items()):
+                remain = tuple([i for i in old_logins if not match(i)])
+                if len(remain) == len(old_logins):
+                    continue
+                if remain:
+                    bucket[username] = remain
+                else:
+                    del bucket[username]
+
+    def logins(self, kind):
+        """Returns a list of all kind logins"""
+        with self._lock:
+            all_logins = []
+            for user_logins in self._buckets[kind].values():
+                all_logins += user_logins
+        return all_logins
+
+    def count(self, kind):
+        """Returns the number of usernames with kind logins"""
+        return len(self._buckets[kind])
+
+
+def get_login_store(conf):
+    """Returns the LoginStore of daemon conf. Creates it on first use if the
+    daemon did not and fills it with any logins from legacy 'users', 'jobs',
+    'shares' and 'jupyter_mounts' lists in conf.
+    """
+    login_store = conf.get('login_store', None)
+    if login_store is None:
+        login_store = LoginStore()
+        for kind in LoginStore.kinds:
+            for login in conf.get(kind, []):
+                login_store.add(kind, login)
+        login_store = conf.setdefault('login_store', login_store)
+    return login_store
+
+
 def get_creds_changes(conf, username, authkeys_path, authpasswords_path,
                       authdigests_path):
     """Check if creds changed for username using the provided auth files and
@@ -118,12 +211,7 @@ def get_creds_changes(conf, username, authkeys_path, authpasswords_path,
     Returns a list of changed auth files with the empty list if none changed.
     """
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
-    if creds_lock:
-        creds_lock.acquire()
-    old_users = [i for i in conf['users'] if i.username == username]
-    if creds_lock:
-        creds_lock.release()
+    old_users = get_login_store(conf).get('users', username)
     old_key_users = [i for i in old_users if i.public_key]
     old_pw_users = [i for i in old_users if i.password]
     old_digest_users = [i for i in old_users if i.digest]
@@ -187,12 +275,7 @@ def get_job_changes(conf, username, mrsl_path):
     Returns a list of changed mrsl files with the empty list if none changed.
     """
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
-    if creds_lock:
-        creds_lock.acquire()
-    old_users = [i for i in conf['jobs'] if i.username == username]
-    if creds_lock:
-        creds_lock.release()
+    old_users = get_login_store(conf).get('jobs', username)
     changed_paths = []
     if old_users:
         first = old_users[0]
@@ -215,13 +298,8 @@ def get_share_changes(conf, username, sharelink_path, authkeys_path):
     changed.
     """
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
-    if creds_lock:
-        creds_lock.acquire()
-    old_users = [i for i in conf['shares'] if i.username == username]
+    old_users = get_login_store(conf).get('shares', username)
     old_key_users = [i for i in old_users if i.public_key]
-    if creds_lock:
-        creds_lock.release()
     # We do not save share entry for key files without proper pub keys, so to
     # avoid repeatedly refreshing keys for such shares we check against any
     # other last update marker in case of no matching key shares.
@@ -268,7 +346,6 @@ def add_user_object(configuration,
     """Add a single Login object to active user list"""
     conf = configuration.daemon_conf
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     user = Login(configuration,
                  username=login,
                  home=home,
@@ -278,11 +355,7 @@ def add_user_object(configuration,
                  chroot=chroot,
                  user_dict=user_dict)
     # logger.debug("Adding user login:\n%s" % user)
-    if creds_lock:
-        creds_lock.acquire()
-    conf['users'].append(user)
-    if creds_lock:
-        creds_lock.release()
+    get_login_store(conf).add('users', user)
 
 
 def add_job_object(configuration,
@@ -296,7 +369,6 @@ def add_job_object(configuration,
     """Add a single Login object to active jobs list"""
     conf = configuration.daemon_conf
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     job = Login(configuration,
                 username=login,
                 home=home,
@@ -306,11 +378,7 @@ def add_job_object(configuration,
                 chroot=chroot,
                 ip_addr=ip_addr)
     # logger.debug("Adding job login:\n%s" % job)
-    if creds_lock:
-        creds_lock.acquire()
-    conf['jobs'].append(job)
-    if creds_lock:
-        creds_lock.release()
+    get_login_store(conf).add('jobs', job)
 
 
 def add_share_object(configuration, login, home, password=None, digest=None,
@@ -318,7 +386,6 @@ def add_share_object(configuration, login, home, password=None, digest=None,
     """Add a single Login object to active shares list"""
     conf = configuration.daemon_conf
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     share = Login(configuration,
                   username=login,
                   home=home,
@@ -328,11 +395,7 @@ def add_share_object(configuration, login, home, password=None, digest=None,
                   chroot=chroot,
                   ip_addr=ip_addr)
     # logger.debug("Adding share login:\n%s" % share)
-    if creds_lock:
-        creds_lock.acquire()
-    conf['shares'].append(share)
-    if creds_lock:
-        creds_lock.release()
+    get_login_store(conf).add('shares', share)
 
 
 def add_jupyter_object(configuration, login, home, password=None, digest=None,
@@ -340,7 +403,6 @@ def add_jupyter_object(configuration, login, home, password=None, digest=None,
     """Add a single Login object to active jupyter mount list"""
     conf = configuration.daemon_conf
     logger = conf.get('logger', logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     jupyter_mount = Login(configuration,
                           username=login,
                           home=home,
@@ -350,11 +412,7 @@ def add_jupyter_object(configuration, login, home, password=None, digest=None,
                           chroot=chroot,
                           ip_addr=ip_addr)
     # logger.debug("Adding jupyter login:\n%s" % jupyter_mount)
-    if creds_lock:
-        creds_lock.acquire()
-    conf['jupyter_mounts'].append(jupyter_mount)
-    if creds_lock:
-        creds_lock.release()
+    get_login_store(conf).add('jupyter_mounts', jupyter_mount)
 
 
 def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
@@ -366,15 +424,13 @@ def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
     """
     conf = configuration.daemon_conf
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
+    login_store = get_login_store(conf)
     proto_authkeys, proto_authpasswords, proto_authdigests = auth_protos
     user_id, user_alias, user_dir, short_id, short_alias = user_vars
     user_logins = (user_alias, short_id, short_alias)
     user_dict = None
 
     # Create user entry for each valid key and password
-    if creds_lock:
-        creds_lock.acquire()
     if not private_auth_file:
         user_dict = load_user_dict(logger, user_id, conf['db_path'])
     if auth_file == proto_authkeys:
@@ -388,9 +444,9 @@ def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
         all_passwords = []
         all_digests = []
         # Clean up all old key entries for this user
-        conf['users'] = [i for i in conf['users']
-                         if not i.username in user_logins or
-                         i.public_key is None]
+        for login_id in user_logins:
+            login_store.remove('users', login_id,
+                               keep=lambda i: i.public_key is None)
     elif auth_file == proto_authpasswords:
         all_keys = []
         if private_auth_file:
@@ -404,9 +460,9 @@ def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
             all_passwords = []
         all_digests = []
         # Clean up all old password entries for this user
-        conf['users'] = [i for i in conf['users']
-                         if not i.username in user_logins or
-                         i.password is None]
+        for login_id in user_logins:
+            login_store.remove('users', login_id,
+                               keep=lambda i: i.password is None)
     else:
         all_keys = []
         all_passwords = []
@@ -417,13 +473,12 @@ def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
         else:
             all_digests = []
         # Clean up all old digest entries for this user
-        conf['users'] = [i for i in conf['users']
-                         if not i.username in user_logins or
-                         i.digest is None]
+        for login_id in user_logins:
+            login_store.remove('users', login_id,
+                               keep=lambda i: i.digest is None)
     # logger.debug("after clean up old users list is:\n%s" %
-    #              '\n'.join(["%s" % i for i in conf['users']]))
-    if creds_lock:
-        creds_lock.release()
+    #              '\n'.join(["%s" % i for i in
+    #                         login_store.logins('users')]))
 
     user_id_list = [user_alias]
     if short_id:
@@ -455,13 +510,14 @@ def update_user_objects(configuration, auth_file, path, user_vars, auth_protos,
             add_user_object(configuration, login_id, user_dir,
                             digest=user_digest, user_dict=user_dict)
     # logger.debug("after update users list is:\n%s" %
-    #              '\n'.join(["%s" % i for i in conf['users']]))
+    #              '\n'.join(["%s" % i for i in
+    #                         login_store.logins('users')]))
 
 
 def refresh_user_creds(configuration, protocol, username):
     """Reload user credentials for username if they changed on disk. That is,
-    add user entries in configuration.daemon_conf['users'] for all active keys
-    and passwords enabled in configuration. Optionally add short ID username
+    add 'users' logins in the configuration.daemon_conf login store for all
+    active keys and passwords enabled in configuration. Optionally add short ID username
     alias entries for user if that is enabled in the configuration.
     Removes all aliased user entries if the user is no longer active, too.
     The protocol argument specifies which auth files to use.
@@ -583,13 +639,17 @@ def refresh_user_creds(configuration, protocol, username):
         logger.info("Refreshed user %s from configuration: %s" %
                     (username, changed_paths))
         changed_users.append(username)
+        # Drop any shared credential cache entries for the old credentials
+        hash_cache = conf.get('hash_cache', None)
+        if hash_cache is not None and not isinstance(hash_cache, dict):
+            hash_cache.invalidate_user(username)
     return (conf, changed_users)
 
 
 def refresh_job_creds(configuration, protocol, username):
     """Reload job credentials for username (SESSIONID) if they changed on disk.
-    That is, add user entries in configuration.daemon_conf['jobs'] for any
-    corresponding active job keys.
+    That is, add 'jobs' logins in the configuration.daemon_conf login store
+    for any corresponding active job keys.
     Removes all job login entries if the job is no longer active, too.
     The protocol argument specifies which auth files to use.
     Returns a tuple with the updated daemon_conf and the list of changed job
@@ -599,7 +659,6 @@ def refresh_job_creds(configuration, protocol, username):
     conf = configuration.daemon_conf
     last_update = conf['time_stamp']
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     if not protocol in ('sftp',):
         logger.error("invalid protocol: %s" % protocol)
         return (conf, changed_jobs)
@@ -667,11 +726,7 @@ def refresh_job_creds(configuration, protocol, username):
     # Job inative: remove from logins and mark as changed
     if not changed_jobs:
         logger.info("Removing login(s) for inactive job %s" % username)
-        if creds_lock:
-            creds_lock.acquire()
-        conf['jobs'] = [i for i in conf['jobs'] if i.username != username]
-        if creds_lock:
-            creds_lock.release()
+        get_login_store(conf).remove('jobs', username)
         changed_jobs.append(username)
     logger.info("Refreshed jobs from configuration")
     return (conf, changed_jobs)
@@ -680,8 +735,8 @@ def refresh_job_creds(configuration, protocol, username):
 def refresh_share_creds(configuration, protocol, username,
                         share_modes=['read-write']):
     """Reload sharelink credentials for username (SHARE_ID) if they changed on
-    disk. That is, add user entries in configuration.daemon_conf['shares'] for
-    any corresponding active sharelinks.
+    disk. That is, add 'shares' logins in the configuration.daemon_conf login
+    store for any corresponding active sharelinks.
     Removes all sharelink login entries if the sharelink is no longer active,
     too. The protocol argument specifies which auth files to use.
     Returns a tuple with the updated daemon_conf and the list of changed share
@@ -696,7 +751,6 @@ def refresh_share_creds(configuration, protocol, username,
     conf = configuration.daemon_conf
     last_update = conf['time_stamp']
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
     if not protocol in ('sftp', 'davs', 'ftps', ):
         logger.error("invalid protocol: %s" % protocol)
         return (conf, changed_shares)
@@ -769,9 +823,8 @@ def refresh_share_creds(configuration, protocol, username,
             all_keys = get_authkeys(authkeys_path)
         # Clean up all old key entries for this user
         # logger.debug("Clean share creds keys for %s" % share_id)
-        conf['shares'] = [i for i in conf['shares']
-                          if not i.username == share_id or
-                          i.public_key is None]
+        get_login_store(conf).remove('shares', share_id,
+                                     keep=lambda i: i.public_key is None)
 
         # TODO: load pickle from user_settings of owner (from link_dest)?
         share_dict = {'share_id': share_id, 'share_root': share_root,
@@ -808,11 +861,7 @@ def refresh_share_creds(configuration, protocol, username,
     # Share was removed: remove from logins and mark as changed
     if not changed_shares:
         logger.info("Removing login(s) for inactive share %s" % username)
-        if creds_lock:
-            creds_lock.acquire()
-        conf['shares'] = [i for i in conf['shares'] if i.username != username]
-        if creds_lock:
-            creds_lock.release()
+        get_login_store(conf).remove('shares', username)
         changed_shares.append(username)
     logger.info("Refreshed shares from configuration")
     return (conf, changed_shares)
@@ -827,7 +876,7 @@ def refresh_jupyter_creds(configuration, protocol, username):
     active_jupyter_creds = []
     conf = configuration.daemon_conf
     logger = conf.get("logger", logging.getLogger())
-    creds_lock = conf.get('creds_lock', None)
+    login_store = get_login_store(conf)
     if not protocol in ('sftp',):
         logger.error("invalid protocol: %s" % protocol)
         return (conf, active_jupyter_creds)
@@ -869,57 +918,45 @@ def refresh_jupyter_creds(configuration, protocol, username):
         if valid_pubkey:
             # Purge memory of any legacy keys that gives access to the
             # same user_dir
-            if creds_lock:
-                creds_lock.acquire()
-            conf['jupyter_mounts'] = [i for i in conf['jupyter_mounts']
-                                      if i.home != user_dir]
-            if creds_lock:
-                creds_lock.release()
+            login_store.remove_matching('jupyter_mounts',
+                                        lambda i: i.home == user_dir)
 
             # Add the new valid keyset that gives access to user_dir
             add_jupyter_object(configuration, user_alias,
                                user_dir, pubkey=user_key)
             active_jupyter_creds.append(user_alias)
 
-    if creds_lock:
-        creds_lock.acquire()
-    logger.info("Active jupyter_mounts: %s" % [(i.username, i.home) for i in
-                                               conf['jupyter_mounts']])
-    if creds_lock:
-        creds_lock.release()
+    logger.info("Active jupyter_mounts: %s" % [
+        (i.username, i.home) for i in login_store.logins('jupyter_mounts')])
     logger.info("Refreshed active jupyter creds")
     return (conf, active_jupyter_creds)
 
 
 def update_login_map(daemon_conf, changed_users, changed_jobs=[],
                      changed_shares=[], changed_jupyter=[]):
-    """Update internal login_map from contents of 'users', 'jobs' and
-    'shares' in daemon_conf. This is done considering Login objects matching
-    changed_users, changed_jobs, and changed_shares.
+    """Update internal login_map from the 'users', 'jobs', 'shares' and
+    'jupyter_mounts' logins in the daemon_conf login store. This is done
+    considering Login objects matching changed_users, changed_jobs,
+    changed_shares and changed_jupyter.
     The login_map is a dictionary for fast lookup and we create a list of
     matching Login objects since each user/job/share may have multiple logins
-    (e.g. public keys).
+    (e.g. public keys). Each entry is replaced with a new list rather than
+    modified in place so that lookups need no lock.
     """
     login_map = daemon_conf['login_map']
     logger = daemon_conf.get("logger", logging.getLogger())
+    login_store = get_login_store(daemon_conf)
     # logger.debug("update_login_map with changed users: %s" % changed_users)
     creds_lock = daemon_conf.get('creds_lock', None)
     if creds_lock:
         creds_lock.acquire()
-    for username in changed_users:
-        login_map[username] = [i for i in daemon_conf['users'] if username ==
-                               i.username]
+    for (kind, changed) in (('users', changed_users), ('jobs', changed_jobs),
+                            ('shares', changed_shares),
+                            ('jupyter_mounts', changed_jupyter)):
+        for username in changed:
+            login_map[username] = login_store.get(kind, username)
     # logger.debug("update_login_map for %s: %s" %
     #              (username, '\n'.join(["%s" % i for i in login_map[username]])))
-    for username in changed_jobs:
-        login_map[username] = [i for i in daemon_conf['jobs'] if username ==
-                               i.username]
-    for username in changed_shares:
-        login_map[username] = [i for i in daemon_conf['shares'] if username ==
-                               i.username]
-    for username in changed_jupyter:
-        login_map[username] = [i for i in daemon_conf['jupyter_mounts']
-                               if username == i.username]
     if creds_lock:
         creds_lock.release()
 
@@ -928,12 +965,60 @@ def login_map_lookup(daemon_conf, username):
     """Get creds associated with username in login_map in a thread-safe
     fashion. Returns a list of credential objects, which is empty if username
     is not found in login_map.
+    NOTE: update_login_map always installs a new list for a username so the
+    single dictionary lookup here is safe without taking creds_lock.
     """
     login_map = daemon_conf['login_map']
-    creds_lock = daemon_conf.get('creds_lock', None)
-    if creds_lock:
-        creds_lock.acquire()
-    creds = login_map.get(username, [])
-    if creds_lock:
-        creds_lock.release()
-    return creds
+    return login_map.get(username, [])
+
+
+if __name__ == "__main__":
+    import sys
+
+    class FakeConfiguration(object):
+        """Just the values used here"""
+
+        def __init__(self, daemon_conf):
+            self.daemon_conf = daemon_conf
+
+    print("Benchmark login store against plain login lists")
+    login_count = int((sys.argv[1:] or [100000])[0])
+    rounds = 1000
+    usernames = ['user-%d@example.org' % i for i in range(login_count // 2)]
+    old_conf = {'users': [], 'login_map': {}}
+    new_conf = {'login_store': LoginStore(), 'login_map': {}}
+    for username in usernames:
+        for secret in ('password', 'digest'):
+            login = Login(None, username, username, **{secret: 'secret'})
+            old_conf['users'].append(login)
+            new_conf['login_store'].add('users', login)
+    configuration = FakeConfiguration(new_conf)
+    picked = [usernames[(i * 7919) % len(usernames)] for i in range(rounds)]
+
+    start = time.time()
+    for username in picked:
+        old_conf['users'] = [i for i in old_conf['users']
+                             if not i.username == username or
+                             i.password is None]
+        old_conf['users'].append(Login(None, username, username,
+                                       password='secret'))
+        old_conf['login_map'][username] = [i for i in old_conf['users']
+                                           if i.username == username]
+    list_refresh_secs = time.time() - start
+    start = time.time()
+    for username in picked:
+        new_conf['login_store'].remove('users', username,
+                                       keep=lambda i: i.password is None)
+        add_user_object(configuration, username, username, password='secret')
+        update_login_map(new_conf, [username])
+    store_refresh_secs = time.time() - start
+    start = time.time()
+    for _ in range(100):
+        for username in picked:
+            login_map_lookup(new_conf, username)
+    lookup_secs = time.time() - start
+    print("%d logins and %d credential refreshes:" % (login_count, rounds))
+    print("    list refresh: %.3fs" % list_refresh_secs)
+    print("    store refresh: %.3fs" % store_refresh_secs)
+    print("    lookups: %d per second" % (100 * rounds / max(lookup_secs,
+                                                            1e-6)))
@@ -29,7 +29,7 @@
 
 from mig.shared.griddaemons.base import default_username_validator
 from mig.shared.griddaemons.login import refresh_user_creds, \
-    update_login_map, login_map_lookup
+    update_login_map, login_map_lookup, LoginStore
 from mig.shared.griddaemons.ratelimits import default_max_user_hits, \
     default_user_abuse_hits, default_proto_abuse_hits, \
     hit_rate_limit, expire_rate_limit
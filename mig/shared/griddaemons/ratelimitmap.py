@@ -0,0 +1,482 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# ratelimitmap - shared memory table backend for grid daemon rate limits
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Memory-mapped rate limit table shared by all grid daemon processes.
+
+The table is a fixed-layout file in mig_system_run mapped into each process.
+It is split into stripes of open addressing hash slots with a separate lock
+for each stripe, so concurrent auth attempts from different addresses rarely
+contend. Each slot holds either an address record with the total hits and
+fails for a client address or a user record with the hits and fails for a
+client_id from that address and a small fixed number of secret entries.
+Secrets beyond that number share a single overflow entry where every failure
+counts as a new hit.
+
+A full stripe makes room for new failures by evicting the user record with
+the oldest last failure. Address records are never evicted as that would
+throw away their failure counters. If a record still can't be stored the
+table fails closed and refuses all logins with keys in that stripe until
+expire frees some slots.
+
+Only the address, user and secret counters from the pickle backend in
+ratelimits are kept. With one table per protocol the proto counters are
+identical to the address counters there, so they are not stored twice.
+"""
+
+from __future__ import absolute_import
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+_rate_limit_map_filename = "rate_limits.map"
+_map_magic = b'MiGRLM01'
+_stripe_count = 64
+_stripe_slots = 64
+_secret_slots = 8
+_header = struct.Struct('<8sIII')
+_header_size = 64
+_secret_format = '8si4xd'
+_record = struct.Struct('<B3x16s16sii' + _secret_format * _secret_slots
+                        + 'iid')
+(_EMPTY, _ADDRESS, _USER, _TOMBSTONE) = (0, 1, 2, 3)
+# Field offsets in unpacked records
+(_KIND, _KEY, _ADDR_KEY, _HITS, _FAILS, _SECRETS) = (0, 1, 2, 3, 4, 5)
+_OVERFLOW = _SECRETS + 3 * _secret_slots
+# User hits reported for keys that do not fit in a full stripe
+_full_hits = 2 ** 31 - 1
+
+# Per-process map handles and stripe thread locks. POSIX record locks only
+# serialize between processes so threads need their own lock on top.
+__rate_limit_maps = {}
+__maps_lock = threading.Lock()
+
+
+def _map_path(configuration, proto):
+    """Path of the rate limit table for proto"""
+    return os.path.join(configuration.mig_system_run, "%s.%s" %
+                        (proto, _rate_limit_map_filename))
+
+
+def _map_size():
+    """Total size of the table file"""
+    return _header_size + _stripe_count * _stripe_slots * _record.size
+
+
+def _digest(value, size=16):
+    """Fixed size key digest for value"""
+    if not isinstance(value, bytes):
+        value = ("%s" % value).encode('utf8')
+    return hashlib.sha256(value).digest()[:size]
+
+
+def _empty_record():
+    """Unpacked form of an empty slot"""
+    return [_EMPTY, b'', b'', 0, 0] + [b'', 0, 0.0] * _secret_slots + \
+        [0, 0, 0.0]
+
+
+def _open_map(configuration, proto):
+    """Open and map the table for proto once per process. Initializes the
+    table if it is missing or has a different layout.
+    """
+    map_path = _map_path(configuration, proto)
+    with __maps_lock:
+        handle = __rate_limit_maps.get(map_path, None)
+        if handle is not None:
+            return handle
+        logger = configuration.logger
+        map_fd = os.open(map_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(map_fd, fcntl.LOCK_EX)
+        try:
+            expected = _header.pack(_map_magic, _stripe_count, _stripe_slots,
+                                    _secret_slots)
+            current = os.pread(map_fd, _header.size, 0) if \
+                hasattr(os, 'pread') else os.read(map_fd, _header.size)
+            if current != expected or \
+                    os.fstat(map_fd).st_size != _map_size():
+                logger.info("init %s rate limit table in %s" % (proto,
+                                                                map_path))
+                os.ftruncate(map_fd, 0)
+                os.ftruncate(map_fd, _map_size())
+                os.lseek(map_fd, 0, os.SEEK_SET)
+                os.write(map_fd, expected)
+        finally:
+            fcntl.lockf(map_fd, fcntl.LOCK_UN)
+        table = mmap.mmap(map_fd, _map_size())
+        stripe_locks = [threading.Lock() for _ in range(_stripe_count)]
+        handle = (map_fd, table, stripe_locks)
+        __rate_limit_maps[map_path] = handle
+        return handle
+
+
+def close_rate_limit_maps():
+    """Unmap and close all tables opened by this process"""
+    with __maps_lock:
+        for (map_fd, table, _) in __rate_limit_maps.values():
+            table.close()
+            os.close(map_fd)
+        __rate_limit_maps.clear()
+
+
+def _stripe_of(key):
+    """Stripe index for key"""
+    return struct.unpack('<I', key[:4])[0] % _stripe_count
+
+
+def _lock_stripes(handle, stripes, exclusive=True):
+    """Lock the given stripes in ascending order to avoid deadlocks"""
+    (map_fd, _, stripe_locks) = handle
+    mode = fcntl.LOCK_EX
+    if not exclusive:
+        mode = fcntl.LOCK_SH
+    ordered = sorted(set(stripes))
+    for stripe in ordered:
+        stripe_locks[stripe].acquire()
+        fcntl.lockf(map_fd, mode, 1, stripe)
+    return ordered
+
+
+def _unlock_stripes(handle, ordered):
+    """Release stripe locks taken with _lock_stripes"""
+    (map_fd, _, stripe_locks) = handle
+    for stripe in reversed(ordered):
+        fcntl.lockf(map_fd, fcntl.LOCK_UN, 1, stripe)
+        stripe_locks[stripe].release()
+
+
+def _slot_offset(slot):
+    """File offset of slot"""
+    return _header_size + slot * _record.size
+
+
+def _read_record(table, slot):
+    """Unpack the record in slot"""
+    return list(_record.unpack_from(table, _slot_offset(slot)))
+
+
+def _write_record(table, slot, record):
+    """Pack record into slot"""
+    _record.pack_into(table, _slot_offset(slot), *record)
+
+
+def _find_slot(table, key):
+    """Find the slot holding key in the stripe of key. Returns a tuple with
+    the slot index and a boolean telling if the key was found. The slot is
+    the first free one in the probe sequence if not found and None if the
+    stripe is full.
+    """
+    base = _stripe_of(key) * _stripe_slots
+    start = struct.unpack('<I', key[4:8])[0] % _stripe_slots
+    free_slot = None
+    for step in range(_stripe_slots):
+        slot = base + (start + step) % _stripe_slots
+        offset = _slot_offset(slot)
+        kind = struct.unpack_from('<B', table, offset)[0]
+        if kind == _EMPTY:
+            if free_slot is None:
+                free_slot = slot
+            return (free_slot, False)
+        elif kind == _TOMBSTONE:
+            if free_slot is None:
+                free_slot = slot
+        elif table[offset + 4:offset + 20] == key:
+            return (slot, True)
+    return (free_slot, False)
+
+
+def _clear_slot(table, slot):
+    """Mark slot deleted so that later probes continue past it"""
+    record = _empty_record()
+    record[_KIND] = _TOMBSTONE
+    _write_record(table, slot, record)
+
+
+def _compact_stripe(table, stripe):
+    """Reinsert all live records in stripe to get rid of tombstones"""
+    base = stripe * _stripe_slots
+    live = []
+    for slot in range(base, base + _stripe_slots):
+        record = _read_record(table, slot)
+        if record[_KIND] in (_ADDRESS, _USER):
+            live.append(record)
+        _write_record(table, slot, _empty_record())
+    for record in live:
+        (slot, _) = _find_slot(table, record[_KEY])
+        _write_record(table, slot, record)
+
+
+def _last_fail(record):
+    """Latest failure timestamp of any secret in user record"""
+    return max([record[_SECRETS + 3 * i + 2] for i in range(_secret_slots)]
+               + [record[_OVERFLOW + 2]])
+
+
+def _evict_slot(table, stripe, keep_keys):
+    """Free a slot in the full stripe by evicting the user record with the
+    oldest last failure. Records with a key in keep_keys and address records
+    are never evicted. The evicted user starts over with that oldest failure
+    history, which would be the next to expire anyway, while the address
+    record keeps all its counters. Returns the freed slot or None if there
+    is no user record to evict.
+    """
+    base = stripe * _stripe_slots
+    (victim, victim_time) = (None, None)
+    for slot in range(base, base + _stripe_slots):
+        record = _read_record(table, slot)
+        if record[_KEY] in keep_keys or record[_KIND] != _USER:
+            continue
+        last_fail = _last_fail(record)
+        if victim is None or last_fail < victim_time:
+            (victim, victim_time) = (slot, last_fail)
+    if victim is not None:
+        _clear_slot(table, victim)
+    return victim
+
+
+def map_hit_rate_limit(configuration, proto, client_address, client_id):
+    """Lookup the (proto_hits, user_hits) counters for client_id from
+    client_address in the proto table. Fails closed with user_hits beyond
+    any limit if either is missing from a full stripe, since its failures
+    could not be recorded then.
+    """
+    logger = configuration.logger
+    handle = _open_map(configuration, proto)
+    table = handle[1]
+    addr_key = _digest(client_address)
+    user_key = _digest("%s\0%s" % (client_address, client_id))
+    locked = _lock_stripes(handle, [_stripe_of(addr_key),
+                                    _stripe_of(user_key)], exclusive=False)
+    try:
+        (proto_hits, user_hits, full) = (0, 0, False)
+        (slot, found) = _find_slot(table, addr_key)
+        if found:
+            proto_hits = _read_record(table, slot)[_HITS]
+        full = slot is None
+        (slot, found) = _find_slot(table, user_key)
+        if found:
+            user_hits = _read_record(table, slot)[_HITS]
+        full = full or slot is None
+    finally:
+        _unlock_stripes(handle, locked)
+    if full:
+        logger.warning("%s rate limit table stripe full - refusing %s from "
+                       "%s" % (proto, client_id, client_address))
+        user_hits = _full_hits
+    return (proto_hits, user_hits)
+
+
+def map_update_rate_limit(configuration, proto, client_address, client_id,
+                          login_success, secret, timestamp):
+    """Update the proto table after a login from client_address with
+    client_id, like update_rate_limit does for the pickle backend.
+    Returns tuple with the old and new user hits and the updated hits:
+    (old_user_hits, address_hits, proto_hits, user_hits, secret_hits)
+    """
+    logger = configuration.logger
+    handle = _open_map(configuration, proto)
+    table = handle[1]
+    addr_key = _digest(client_address)
+    user_key = _digest("%s\0%s" % (client_address, client_id))
+    secret_key = _digest("%s" % secret, 8)
+    locked = _lock_stripes(handle, [_stripe_of(addr_key),
+                                    _stripe_of(user_key)])
+    try:
+        (addr_slot, addr_found) = _find_slot(table, addr_key)
+        (user_slot, user_found) = _find_slot(table, user_key)
+        # NOTE: a full stripe must not disable limits so make room for fails
+        for (key, slot) in ((addr_key, addr_slot), (user_key, user_slot)):
+            if slot is None and not login_success:
+                logger.warning("%s rate limit table stripe full - evicting "
+                               "oldest user entry for %s from %s" %
+                               (proto, client_id, client_address))
+                _evict_slot(table, _stripe_of(key), [addr_key, user_key])
+        if (addr_slot is None or user_slot is None) and not login_success:
+            (addr_slot, addr_found) = _find_slot(table, addr_key)
+            (user_slot, user_found) = _find_slot(table, user_key)
+        if login_success and not user_found:
+            # Nothing to record for a successful login without failures
+            address_hits = 0
+            if addr_found:
+                address_hits = _read_record(table, addr_slot)[_HITS]
+            return (0, address_hits, address_hits, 0, 0)
+        if user_slot is None or (addr_slot is None and not login_success):
+            logger.error("%s rate limit table full - could not record %s "
+                         "from %s so it is refused until entries expire" %
+                         (proto, client_id, client_address))
+            return (0, 0, 0, 0, 0)
+        addr_record = _empty_record()
+        if addr_found:
+            addr_record = _read_record(table, addr_slot)
+        (addr_record[_KIND], addr_record[_KEY]) = (_ADDRESS, addr_key)
+        user_record = _empty_record()
+        if user_found:
+            user_record = _read_record(table, user_slot)
+        (user_record[_KIND], user_record[_KEY]) = (_USER, user_key)
+        user_record[_ADDR_KEY] = addr_key
+        old_user_hits = user_record[_HITS]
+        secret_hits = 0
+        if login_success:
+            if addr_found:
+                addr_record[_HITS] -= user_record[_HITS]
+                addr_record[_FAILS] -= user_record[_FAILS]
+            user_record = None
+        else:
+            free_index = None
+            for index in range(_secret_slots):
+                field = _SECRETS + 3 * index
+                if user_record[field + 1] == 0:
+                    if free_index is None:
+                        free_index = index
+                elif user_record[field] == secret_key:
+                    secret_hits = user_record[field + 1]
+                    free_index = index
+                    break
+            if free_index is None:
+                field = _OVERFLOW
+                user_record[field] += 1
+            else:
+                field = _SECRETS + 3 * free_index
+                user_record[field] = secret_key
+            if secret_hits == 0:
+                addr_record[_HITS] += 1
+                user_record[_HITS] += 1
+            addr_record[_FAILS] += 1
+            user_record[_FAILS] += 1
+            secret_hits += 1
+            if field == _OVERFLOW:
+                user_record[field + 1] += 1
+            else:
+                user_record[field + 1] = secret_hits
+            user_record[field + 2] = timestamp
+        if user_record is not None:
+            _write_record(table, addr_slot, addr_record)
+            _write_record(table, user_slot, user_record)
+        else:
+            # NOTE: the address record may be gone after an eviction
+            if addr_found and addr_record[_FAILS] <= 0:
+                _clear_slot(table, addr_slot)
+            elif addr_found:
+                _write_record(table, addr_slot, addr_record)
+            _clear_slot(table, user_slot)
+            user_record = _empty_record()
+    finally:
+        _unlock_stripes(handle, locked)
+    return (old_user_hits, addr_record[_HITS], addr_record[_HITS],
+            user_record[_HITS], secret_hits)
+
+
+def map_expire_rate_limit(configuration, proto, fail_cache, now):
+    """Remove secret entries older than fail_cache seconds from the proto
+    table and return the number of expired entries. User records are expired
+    one stripe at a time and the collected address changes applied after
+    that to keep the lock order simple.
+    """
+    handle = _open_map(configuration, proto)
+    table = handle[1]
+    expired = 0
+    address_changes = {}
+    for stripe in range(_stripe_count):
+        locked = _lock_stripes(handle, [stripe])
+        try:
+            base = stripe * _stripe_slots
+            tombstones = False
+            for slot in range(base, base + _stripe_slots):
+                record = _read_record(table, slot)
+                if record[_KIND] == _TOMBSTONE:
+                    tombstones = True
+                if record[_KIND] != _USER:
+                    continue
+                (hits, fails) = (0, 0)
+                for field in [_SECRETS + 3 * i for i in
+                              range(_secret_slots)] + [_OVERFLOW]:
+                    secret_hits = record[field + 1]
+                    if secret_hits == 0 or \
+                            record[field + 2] + fail_cache >= now:
+                        continue
+                    if field == _OVERFLOW:
+                        hits += record[field]
+                        expired += record[field]
+                        record[field] = 0
+                    else:
+                        hits += 1
+                        expired += 1
+                        record[field] = b''
+                    fails += secret_hits
+                    record[field + 1] = 0
+                    record[field + 2] = 0.0
+                if not hits:
+                    continue
+                record[_HITS] -= hits
+                record[_FAILS] -= fails
+                changes = address_changes.setdefault(record[_ADDR_KEY],
+                                                     [0, 0])
+                changes[0] += hits
+                changes[1] += fails
+                if record[_FAILS] <= 0:
+                    _clear_slot(table, slot)
+                    tombstones = True
+                else:
+                    _write_record(table, slot, record)
+            if tombstones:
+                _compact_stripe(table, stripe)
+        finally:
+            _unlock_stripes(handle, locked)
+
+    for (addr_key, (hits, fails)) in address_changes.items():
+        locked = _lock_stripes(handle, [_stripe_of(addr_key)])
+        try:
+            (slot, found) = _find_slot(table, addr_key)
+            if not found:
+                continue
+            record = _read_record(table, slot)
+            record[_HITS] -= hits
+            record[_FAILS] -= fails
+            if record[_FAILS] <= 0:
+                _clear_slot(table, slot)
+            else:
+                _write_record(table, slot, record)
+        finally:
+            _unlock_stripes(handle, locked)
+    return expired
+
+
+def map_rate_limit_entries(configuration, proto):
+    """Return the number of address and user records in the proto table for
+    use in monitoring and tests.
+    """
+    handle = _open_map(configuration, proto)
+    table = handle[1]
+    counts = {_ADDRESS: 0, _USER: 0}
+    for slot in range(_stripe_count * _stripe_slots):
+        kind = struct.unpack_from('<B', table, _slot_offset(slot))[0]
+        if kind in counts:
+            counts[kind] += 1
+    return (counts[_ADDRESS], counts[_USER])
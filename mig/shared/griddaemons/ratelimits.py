@@ -32,6 +32,8 @@ import time
 import traceback
 from mig.shared.fileio import pickle, unpickle, acquire_file_lock, \
     release_file_lock, touch
+from mig.shared.griddaemons.ratelimitmap import map_hit_rate_limit, \
+    map_update_rate_limit, map_expire_rate_limit
 
 default_max_user_hits, default_fail_cache = 5, 120
 default_user_abuse_hits = 25
@@ -106,6 +108,11 @@ def _save_rate_limits(configuration,
     return result
 
 
+def _use_rate_limit_map(configuration):
+    """Check if the shared memory table backend is enabled"""
+    return configuration.site_rate_limit_backend == 'mmap'
+
+
 def _get_last_expire(configuration, proto):
     """Get last expire timestamp"""
     last_expired_filepath = os.path.join(configuration.mig_system_run,
@@ -147,12 +154,16 @@ def hit_rate_limit(configuration, proto, client_address, client_id,
     logger = configuration.logger
     refuse = False
 
-    _rate_limits = _load_rate_limits(configuration, proto)
-    _address_limits = _rate_limits.get(client_address, {})
-    _proto_limits = _address_limits.get(proto, {})
-    _user_limits = _proto_limits.get(client_id, {})
-    proto_hits = _proto_limits.get('hits', 0)
-    user_hits = _user_limits.get('hits', 0)
+    if _use_rate_limit_map(configuration):
+        (proto_hits, user_hits) = map_hit_rate_limit(
+            configuration, proto, client_address, client_id)
+    else:
+        _rate_limits = _load_rate_limits(configuration, proto)
+        _address_limits = _rate_limits.get(client_address, {})
+        _proto_limits = _address_limits.get(proto, {})
+        _user_limits = _proto_limits.get(client_id, {})
+        proto_hits = _proto_limits.get('hits', 0)
+        user_hits = _user_limits.get('hits', 0)
     if user_hits >= max_user_hits:
         refuse = True
 
@@ -214,6 +225,22 @@ def update_rate_limit(configuration, proto, client_address, client_id,
     if not secret:
         secret = timestamp
 
+    if _use_rate_limit_map(configuration):
+        try:
+            (old_user_hits, address_hits, proto_hits, user_hits,
+             secret_hits) = map_update_rate_limit(
+                configuration, proto, client_address, client_id,
+                login_success, secret, timestamp)
+        except Exception as exc:
+            logger.error("update %s Rate limit failed: %s" % (proto, exc))
+            logger.info(traceback.format_exc())
+        if user_hits != old_user_hits:
+            logger.info("update %s rate limit" % proto
+                        + " %s for %s" % (status[login_success],
+                                          client_address)
+                        + " from %d to %d hits" % (old_user_hits, user_hits))
+        return (address_hits, proto_hits, user_hits, secret_hits)
+
     rate_limits_lock = _acquire_rate_limits_lock(
         configuration, proto, exclusive=True)
     _rate_limits = _load_rate_limits(configuration, proto, do_lock=False)
@@ -329,6 +356,19 @@ def expire_rate_limit(configuration, proto,
                      % (-expired, expire_delay))
         return expired
 
+    if _use_rate_limit_map(configuration):
+        try:
+            expired = map_expire_rate_limit(configuration, proto, fail_cache,
+                                            now)
+        except Exception as exc:
+            logger.error("expire rate limit failed: %s" % exc)
+            logger.info(traceback.format_exc())
+        if expired:
+            logger.info("expire %s rate limit expired %d items" %
+                        (proto, expired))
+        _set_last_expire(configuration, proto)
+        return expired
+
     rate_limits_lock = _acquire_rate_limits_lock(
         configuration, proto, exclusive=True)
     _rate_limits = _load_rate_limits(configuration, proto, do_lock=False)
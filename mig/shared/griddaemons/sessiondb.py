@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# sessiondb - keyed session store backend for grid daemon session tracking
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Keyed session store shared by all grid daemon processes.
+
+The default pickle backend in sessions keeps all open sessions for a protocol
+in a single pickled dictionary, which must be loaded and rewritten in full
+under an exclusive lock on every session open and close. This module instead
+keeps one row per session in an sqlite database in mig_system_run, so that
+tracking a session only touches that row. The rows are indexed on client_id
+and timestamp, which lets the expire helpers visit just the sessions old
+enough to expire rather than scanning all open sessions.
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+
+from mig.shared.sqlitedb import open_sqlite_db
+
+_sessions_db_filename = "sessions.db"
+_session_fields = ('session_id', 'client_id', 'ip_addr', 'tcp_port',
+                   'authorized', 'timestamp')
+
+# Per-process connections shared by all threads with a lock to serialize use
+__session_dbs = {}
+__dbs_lock = threading.Lock()
+
+
+def _db_path(configuration, proto):
+    """Path of the session db for proto"""
+    return os.path.join(configuration.mig_system_run, "%s.%s" %
+                        (proto, _sessions_db_filename))
+
+
+def _open_db(configuration, proto):
+    """Open the session db for proto once per process and create the table
+    and indexes first if needed. The db lives on the typically tmpfs backed
+    mig_system_run and only holds volatile session state, so we skip fsync.
+    Returns tuple with connection and the lock guarding it.
+    """
+    db_path = _db_path(configuration, proto)
+    with __dbs_lock:
+        handle = __session_dbs.get(db_path, None)
+        if handle is not None:
+            return handle
+        conn = open_sqlite_db(db_path, synchronous='OFF',
+                              check_same_thread=False, native_text=True)
+        conn.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                        client_id TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        ip_addr TEXT,
+                        tcp_port INTEGER,
+                        authorized INTEGER,
+                        timestamp REAL NOT NULL,
+                        PRIMARY KEY (client_id, session_id))""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS sessions_timestamp
+                        ON sessions (timestamp)""")
+        conn.commit()
+        handle = (conn, threading.Lock())
+        __session_dbs[db_path] = handle
+        return handle
+
+
+def close_session_dbs():
+    """Close all session dbs opened by this process"""
+    with __dbs_lock:
+        for (conn, _) in __session_dbs.values():
+            conn.close()
+        __session_dbs.clear()
+
+
+def _row_session(row):
+    """Session dictionary from a db row in _session_fields order"""
+    session = dict(zip(_session_fields, row))
+    session['authorized'] = bool(session['authorized'])
+    return session
+
+
+def db_clear_sessions(configuration, proto):
+    """Remove all tracked proto sessions"""
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        conn.execute("DELETE FROM sessions")
+        conn.commit()
+    return True
+
+
+def db_track_open_session(configuration, proto, session):
+    """Insert or replace the row for session dictionary"""
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        conn.execute("INSERT OR REPLACE INTO sessions (%s) VALUES (%s)" %
+                     (', '.join(_session_fields),
+                      ', '.join(['?' for _ in _session_fields])),
+                     [session[name] for name in _session_fields])
+        conn.commit()
+    return session
+
+
+def db_get_session(configuration, proto, client_id, session_id):
+    """Returns tracked proto session_id for client_id or empty dictionary"""
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        row = conn.execute("SELECT %s FROM sessions WHERE client_id=? AND "
+                           "session_id=?" % ', '.join(_session_fields),
+                           (client_id, session_id)).fetchone()
+    if row is None:
+        return {}
+    return _row_session(row)
+
+
+def db_open_sessions(configuration, proto, client_id=None):
+    """Returns dictionary {session_id: session} with tracked proto sessions
+    for client_id or for all clients if client_id is None.
+    """
+    query = "SELECT %s FROM sessions" % ', '.join(_session_fields)
+    args = ()
+    if client_id is not None:
+        query += " WHERE client_id=?"
+        args = (client_id, )
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        rows = conn.execute(query, args).fetchall()
+    return dict([(row[0], _row_session(row)) for row in rows])
+
+
+def db_count_sessions(configuration, proto, client_id):
+    """Returns number of tracked proto sessions for client_id"""
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        row = conn.execute("SELECT COUNT(*) FROM sessions WHERE client_id=?",
+                           (client_id, )).fetchone()
+    return row[0]
+
+
+def db_stale_sessions(configuration, proto, cutoff, client_id=None):
+    """Returns list of tracked proto sessions for client_id or for all clients
+    if client_id is None with a timestamp before cutoff. Uses the timestamp
+    index so only the stale rows are visited.
+    """
+    query = "SELECT %s FROM sessions WHERE timestamp < ?" % \
+            ', '.join(_session_fields)
+    args = (cutoff, )
+    if client_id is not None:
+        query += " AND client_id=?"
+        args = (cutoff, client_id)
+    query += " ORDER BY timestamp"
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        rows = conn.execute(query, args).fetchall()
+    return [_row_session(row) for row in rows]
+
+
+def db_close_sessions(configuration, proto, session_keys):
+    """Remove tracked proto sessions given as a list of (client_id,
+    session_id, timestamp) tuples in a single transaction. Sessions are only
+    removed if timestamp is None or matches the tracked timestamp so that a
+    session reopened in the mean time is kept.
+    Returns list of (tracked, removed) tuples in session_keys order, where
+    tracked is the tracked session dictionary or None if not found and
+    removed tells if it was actually removed.
+    """
+    result = []
+    (conn, lock) = _open_db(configuration, proto)
+    with lock:
+        try:
+            for (client_id, session_id, timestamp) in session_keys:
+                row = conn.execute("SELECT %s FROM sessions WHERE "
+                                   "client_id=? AND session_id=?" %
+                                   ', '.join(_session_fields),
+                                   (client_id, session_id)).fetchone()
+                if row is None:
+                    result.append((None, False))
+                    continue
+                tracked = _row_session(row)
+                if timestamp is None or timestamp == tracked['timestamp']:
+                    conn.execute("DELETE FROM sessions WHERE client_id=? "
+                                 "AND session_id=?", (client_id, session_id))
+                    result.append((tracked, True))
+                else:
+                    result.append((tracked, False))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return result
@@ -28,6 +28,7 @@
 """MiG daemon session tracker functions"""
 
 import os
+import threading
 import time
 
 # NOTE: we rely on psutil for post-mortem expiring stale sessions not closed
@@ -40,9 +41,53 @@ from mig.shared.base import brief_list
 from mig.shared.defaults import io_session_timeout, io_session_stale
 from mig.shared.fileio import pickle, unpickle, acquire_file_lock, \
     release_file_lock
+from mig.shared.griddaemons.sessiondb import db_clear_sessions, \
+    db_track_open_session, db_get_session, db_open_sessions, \
+    db_count_sessions, db_stale_sessions, db_close_sessions
 
 _sessions_filename = "sessions.pck"
 
+# Per-process open and close latency stats for get_session_stats
+__session_stats = {}
+__stats_lock = threading.Lock()
+
+
+def _use_session_db(configuration):
+    """Check if the keyed session store backend is enabled"""
+    return configuration.site_session_backend == 'sqlite'
+
+
+def _record_latency(action, started):
+    """Add time spent since started to the latency stats for action"""
+    elapsed = time.time() - started
+    with __stats_lock:
+        stats = __session_stats.get(action, None)
+        if stats is None:
+            stats = __session_stats[action] = {'count': 0, 'total': 0.0,
+                                               'max': 0.0}
+        stats['count'] += 1
+        stats['total'] += elapsed
+        stats['max'] = max(stats['max'], elapsed)
+
+
+def get_session_stats():
+    """Returns dictionary with the number of calls and the total, average and
+    max latency in seconds for session open and close tracking in this
+    process. Useful for comparing the session backends under load.
+    """
+    result = {}
+    with __stats_lock:
+        for (action, stats) in __session_stats.items():
+            entry = result[action] = dict(stats)
+            entry['average'] = stats['total'] / max(stats['count'], 1)
+    return result
+
+
+def reset_session_stats():
+    """Reset session latency stats for this process"""
+    with __stats_lock:
+        __session_stats.clear()
+
 
 def _acquire_sessions_lock(configuration, proto, exclusive=True):
     """Acquire sessions lock for protocol proto"""
@@ -109,6 +154,12 @@ def _save_sessions(configuration,
 def clear_sessions(configuration, proto, do_lock=True):
     """Clear sessions"""
     logger = configuration.logger
+    if _use_session_db(configuration):
+        try:
+            return db_clear_sessions(configuration, proto)
+        except Exception as exc:
+            logger.error("clear %s sessions failed: %s" % (proto, exc))
+            return False
     return _save_sessions(configuration, proto, {}, do_lock=do_lock)
 
 
@@ -132,8 +183,22 @@ def track_open_session(configuration,
     #      (client_address, client_port, session_id)
     # logger.debug(msg)
     result = None
+    started = time.time()
     if not session_id:
         session_id = "%s:%s" % (client_address, client_port)
+    if _use_session_db(configuration):
+        _session = {'session_id': session_id, 'client_id': client_id,
+                    'ip_addr': client_address, 'tcp_port': client_port,
+                    'authorized': authorized, 'timestamp': time.time()}
+        try:
+            result = db_track_open_session(configuration, proto, _session)
+            logger.debug("tracking open %s session %s for %r" %
+                         (proto, session_id, client_id))
+        except Exception as exc:
+            logger.error("track open %s session %s for %r failed: %s" %
+                         (proto, session_id, client_id, exc))
+        _record_latency('open', started)
+        return result
     if do_lock:
         sessions_lock = _acquire_sessions_lock(
             configuration, proto, exclusive=True)
@@ -169,6 +234,7 @@ def track_open_session(configuration,
     if do_lock:
         _release_sessions_lock(sessions_lock)
 
+    _record_latency('open', started)
     return result
 
 
@@ -185,6 +251,8 @@ def get_active_session(configuration,
     #              % (proto, client_id, session_id) \
     #              + " do_lock: %s" % do_lock)
     result = None
+    if _use_session_db(configuration):
+        return db_get_session(configuration, proto, client_id, session_id)
     _active_sessions = _load_sessions(configuration, proto, do_lock=do_lock)
     result = _active_sessions.get(client_id, {}).get(proto,
                                                      {}).get(session_id, {})
@@ -200,12 +268,14 @@ def get_open_sessions(configuration, proto, client_id=None, do_lock=True):
     # logger.debug("proto: '%s', client_id: %s, do_lock: %s"
     #              % (proto, client_id, do_lock))
     result = {}
+    if _use_session_db(configuration):
+        return db_open_sessions(configuration, proto, client_id=client_id)
     _active_sessions = _load_sessions(configuration, proto, do_lock=do_lock)
     # logger.debug("__active_sessions: %s" % __active_sessions)
     if client_id is not None:
         result = _active_sessions.get(client_id, {}).get(proto, {})
     else:
-        for (_, open_sessions) in _active_sessions.iteritems():
+        for (_, open_sessions) in _active_sessions.items():
             open_proto_session = open_sessions.get(proto, {})
             if open_proto_session:
                 result.update(open_proto_session)
@@ -224,6 +294,24 @@ def track_close_session_list(configuration, proto, session_list, do_lock=True):
     if not session_list:
         return result
 
+    started = time.time()
+    if _use_session_db(configuration):
+        session_keys = [(i['client_id'], i['session_id'], i['timestamp'])
+                        for i in session_list]
+        try:
+            for (tracked, removed) in db_close_sessions(configuration, proto,
+                                                        session_keys):
+                if removed:
+                    result.append(tracked)
+        except Exception as exc:
+            _record_latency('close', started)
+            raise IOError("%s close sessions failed for %s: %s" %
+                          (proto, session_list, exc))
+        _record_latency('close', started)
+        logger.debug("track close session list for proto %s returns %s" %
+                     (proto, brief_list([i['session_id'] for i in result])))
+        return result
+
     # Lock for critical section with load, update and save sessions
     if do_lock:
         sessions_lock = _acquire_sessions_lock(configuration, proto,
@@ -264,6 +352,7 @@ def track_close_session_list(configuration, proto, session_list, do_lock=True):
     if do_lock:
         _release_sessions_lock(sessions_lock)
 
+    _record_latency('close', started)
     logger.debug("track close session list for proto %s returns %s" %
                  (proto, brief_list([i['session_id'] for i in result])))
     return result
@@ -285,9 +374,37 @@ def track_close_session(configuration,
           (client_address, client_port, session_id, client_id, do_lock)
     logger.debug(msg)
     result = {}
+    started = time.time()
     if not session_id:
         session_id = "%s:%s" % (client_address, client_port)
 
+    if _use_session_db(configuration):
+        try:
+            [(tracked, removed)] = db_close_sessions(
+                configuration, proto, [(client_id, session_id, timestamp)])
+            if tracked is None:
+                logger.warning("track close session: %r NOT found for "
+                               "proto: '%s', client: '%s'" %
+                               (session_id, proto, client_id))
+            else:
+                result = tracked
+                if removed:
+                    logger.debug("tracking close %s session %s for %r" %
+                                 (proto, session_id, client_id))
+                else:
+                    logger.debug("track close session skipping proto: %s, "
+                                 "session_id: %s, client_id: %s with "
+                                 "timestamp %s != %s" %
+                                 (proto, session_id, client_id, timestamp,
+                                  tracked['timestamp']))
+        except Exception as exc:
+            result = None
+            logger.error("track close session failed for client: %s with "
+                         "session id: %s, error: %s" %
+                         (client_id, session_id, exc))
+        _record_latency('close', started)
+        return result
+
     if do_lock:
         sessions_lock = _acquire_sessions_lock(
             configuration, proto, exclusive=True)
@@ -328,6 +445,38 @@ def track_close_session(configuration,
     if do_lock:
         _release_sessions_lock(sessions_lock)
 
+    _record_latency('close', started)
+    return result
+
+
+def _db_expire_sessions(configuration, proto, cutoff, client_id=None,
+                        live_sessions=None, chunk_size=None):
+    """Close proto sessions for client_id or all clients with a timestamp
+    before cutoff and not in the optional live_sessions list in the keyed
+    session store. Optionally closes them chunk_size sessions at a time to
+    keep each write transaction short.
+    Returns dictionary of closed sessions {session_id: session}
+    """
+    logger = configuration.logger
+    result = {}
+    expire_list = []
+    for cur_session in db_stale_sessions(configuration, proto, cutoff,
+                                         client_id=client_id):
+        if live_sessions and cur_session['session_id'] in live_sessions:
+            logger.debug("%s: ignore live session in expire: %s" %
+                         (proto, cur_session['session_id']))
+            continue
+        expire_list.append(cur_session)
+    if not chunk_size:
+        chunk_size = max(len(expire_list), 1)
+    for i in range(0, len(expire_list), chunk_size):
+        chunk = expire_list[i:i + chunk_size]
+        logger.debug("found %s sessions to expire: %s" %
+                     (proto, brief_list([j['session_id'] for j in chunk])))
+        for closed_session in track_close_session_list(configuration, proto,
+                                                       chunk):
+            if closed_session is not None:
+                result[closed_session['session_id']] = closed_session
     return result
 
 
@@ -345,6 +494,10 @@ def track_close_expired_sessions(
     # logger.debug(msg)
     result = {}
     session_timeout = io_session_timeout.get(proto, 0)
+    if _use_session_db(configuration):
+        return _db_expire_sessions(configuration, proto,
+                                   time.time() - session_timeout,
+                                   client_id=client_id)
     if do_lock:
         sessions_lock = _acquire_sessions_lock(
             configuration, proto, exclusive=True)
@@ -381,6 +534,9 @@ def active_sessions(configuration,
     """Look up how many active proto sessions client_id has running"""
     logger = configuration.logger
 
+    if _use_session_db(configuration):
+        return db_count_sessions(configuration, proto, client_id)
+
     open_sessions = get_open_sessions(configuration,
                                       proto,
                                       client_id=client_id,
@@ -429,6 +585,11 @@ def expire_dead_sessions(
         return result
     # logger.debug("expire dead %s sessions for %s with live_sessions: %s" %
     #             (proto, client_id, live_sessions))
+    if _use_session_db(configuration):
+        return _db_expire_sessions(configuration, proto,
+                                   time.time() - min_stale_secs,
+                                   client_id=client_id,
+                                   live_sessions=set(live_sessions))
     open_sessions = get_open_sessions(
         configuration, proto, client_id=client_id, do_lock=do_lock)
     # logger.debug("expire dead %s sessions for %s with open_sessions: %s" %
@@ -479,6 +640,12 @@ def expire_dead_sessions_chunked(configuration, proto, client_id=None,
         return result
     # logger.debug("expire dead %s sessions for %s with live_sessions: %s" %
     #             (proto, client_id, live_sessions))
+    if _use_session_db(configuration):
+        return _db_expire_sessions(configuration, proto,
+                                   time.time() - min_stale_secs,
+                                   client_id=client_id,
+                                   live_sessions=set(live_sessions),
+                                   chunk_size=chunk_size)
 
     # Read out current sessions and split into *guidance* chunks for expire.
     # Sessions might change before we actually lock and expire, but will only
@@ -560,13 +727,15 @@ if __name__ == "__main__":
     #sim_sessions = 257
     if sys.argv[1:]:
         sim_sessions = int(sys.argv[1])
+    if sys.argv[2:]:
+        configuration.site_session_backend = sys.argv[2]
     _sessions_filename = "dummy-sessions.pck"
     clear_sessions(configuration, proto, do_lock)
     print("cleared all %s sessions" % proto)
     expire_helper_funcs = (expire_dead_sessions, expire_dead_sessions_chunked)
     for expire_helper in expire_helper_funcs:
-        print("generating %d sessions in %s" %
-              (sim_sessions, _sessions_filename))
+        print("generating %d sessions with %s backend" %
+              (sim_sessions, configuration.site_session_backend))
         open_sessions = _load_sessions(configuration, proto, do_lock)
         now = time.time()
         for i in range(sim_sessions):
@@ -575,10 +744,21 @@ if __name__ == "__main__":
             session_id = "%s-session-%.6d" % (client_id, i)
             entry = {'session_id': session_id, 'client_id': client_id,
                      'timestamp': int(now) - i, 'proto': proto, 'ip_addr': ip_addr,
-                     'tcp_port': int(i)}
+                     'tcp_port': int(i), 'authorized': False}
             subsub[session_id] = entry
-        print("save %d sessions in %s" % (len(subsub), _sessions_filename))
-        _save_sessions(configuration, proto, open_sessions, do_lock)
+            if _use_session_db(configuration):
+                db_track_open_session(configuration, proto, entry)
+        print("save %d sessions" % len(subsub))
+        if not _use_session_db(configuration):
+            _save_sessions(configuration, proto, open_sessions, do_lock)
+        reset_session_stats()
+        for i in range(sim_sessions, sim_sessions + 100):
+            track_open_session(configuration, proto, client_id, ip_addr, i)
+            track_close_session(configuration, proto, client_id, ip_addr, i)
+        for (action, stats) in get_session_stats().items():
+            print("track %s session latency with %d others open: avg %.6fs, "
+                  "max %.6fs" % (action, sim_sessions, stats['average'],
+                                 stats['max']))
         active_cnt = active_sessions(configuration, proto, client_id, do_lock)
         print("now %s has %d active %s sessions recorded" % (client_id,
                                                              active_cnt,
@@ -37,6 +37,7 @@ from mig.shared.base import client_id_dir
 from mig.shared.defaults import job_output_dir, ignore_file_names
 from mig.shared.fileio import send_message_to_grid_script, pickle, unpickle, \
     delete_file, touch, walk, slow_walk
+from mig.shared.jobevents import log_job_event
 from mig.shared.notification import notify_user_thread
 try:
     from mig.shared import arcwrapper
@@ -503,6 +504,7 @@ def requeue_job(
                 del job_dict['RESOURCE_VGRID']
 
             pickle(job_dict, mrsl_file, logger)
+            log_job_event(configuration, mrsl_file, 'QUEUED', logger)
 
             # Requeue job last in queue for retry later
 
@@ -519,6 +521,7 @@ def requeue_job(
             job_dict['STATUS'] = 'FAILED'
             job_dict['FAILED_TIMESTAMP'] = failed_timestamp
             pickle(job_dict, mrsl_file, logger)
+            log_job_event(configuration, mrsl_file, 'FAILED', logger)
 
             # tell the user the sad news
 
@@ -650,5 +653,6 @@ def clean_arc_job(
                              client_dir,
                              job_dict['JOB_ID'] + '.mRSL')
     pickle(job_dict, mrsl_file, logger)
+    log_job_event(configuration, mrsl_file, status, logger)
 
     return
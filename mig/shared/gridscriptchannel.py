@@ -0,0 +1,357 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# gridscriptchannel - optional socket command channel for grid_script
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Unix socket command channel for the grid_script daemon.
+
+The classic grid_stdin named pipe is polled by grid_script, which sleeps a
+second whenever the pipe is empty, so commands may wait that long before they
+are even read. When the grid_socket option is set grid_script also listens on
+a Unix socket there. Clients send a batch of one or more newline separated
+command lines in a single length prefixed frame and get a frame back with
+'OK N' once all N commands are queued for handling, or 'ERROR reason'. The
+grid_script main loop blocks on the queue of commands, so a command is
+handled as soon as it arrives. The pipe is still read into the same queue,
+without polling, for any producers writing there directly.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import socket
+import struct
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from mig.shared.base import force_native_str
+from mig.shared.defaults import grid_script_ack_timeout, \
+    grid_script_max_frame
+
+# Frames are a 4 byte network order payload length followed by the payload
+_frame_header = struct.Struct('!I')
+_listen_backlog = 64
+
+
+class CommandsUnacknowledged(IOError):
+    """Commands were sent but never acknowledged, so the channel may still
+    queue them and they must not be sent again another way.
+    """
+
+
+def _recv_exact(sock, size):
+    """Read exactly size bytes from sock. Returns None if the peer closed the
+    connection before sending anything and raises IOError if it closed it in
+    the middle.
+    """
+    parts = []
+    remain = size
+    while remain > 0:
+        data = sock.recv(min(remain, 65536))
+        if not data:
+            if remain == size:
+                return None
+            raise IOError("connection closed in the middle of a frame")
+        parts.append(data)
+        remain -= len(data)
+    return b''.join(parts)
+
+
+def send_frame(sock, payload):
+    """Send the payload bytes as a single frame on sock"""
+    sock.sendall(_frame_header.pack(len(payload)) + payload)
+
+
+def recv_frame(sock, max_frame=grid_script_max_frame):
+    """Receive a single frame from sock. Returns the payload bytes or None if
+    the peer closed the connection. Raises ValueError if the frame is bigger
+    than max_frame bytes.
+    """
+    header = _recv_exact(sock, _frame_header.size)
+    if header is None:
+        return None
+    (size, ) = _frame_header.unpack(header)
+    if size > max_frame:
+        raise ValueError("frame of %d bytes exceeds limit of %d" %
+                         (size, max_frame))
+    if size == 0:
+        return b''
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        raise IOError("connection closed before frame payload")
+    return payload
+
+
+def _encode(value):
+    """Bytes version of value"""
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf8')
+
+
+def send_commands(socket_path, commands, timeout=grid_script_ack_timeout):
+    """Send the commands list of grid_script command lines to the channel
+    listening on socket_path in a single batch and wait for it to acknowledge
+    them. Returns the number of accepted commands. Raises an EnvironmentError
+    if the channel is unavailable, CommandsUnacknowledged if the batch was
+    sent but not acknowledged and ValueError if it refused the batch.
+    """
+    lines = [_encode(i).strip() for i in commands]
+    payload = b'\n'.join([i for i in lines if i])
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        send_frame(sock, payload)
+        try:
+            reply = recv_frame(sock)
+        except EnvironmentError as exc:
+            raise CommandsUnacknowledged("no acknowledgement from %s: %s" %
+                                         (socket_path, exc))
+    finally:
+        sock.close()
+    if reply is None:
+        raise CommandsUnacknowledged("no acknowledgement from %s" %
+                                     socket_path)
+    reply = force_native_str(reply)
+    if not reply.startswith('OK '):
+        raise ValueError("commands refused: %s" % reply)
+    return int(reply.split(' ', 1)[1])
+
+
+class CommandChannel(object):
+    """Queue of grid_script command lines fed by a Unix socket listener and
+    optionally by a reader of the legacy grid_stdin pipe.
+    """
+
+    def __init__(self, socket_path, logger, max_frame=grid_script_max_frame):
+        """Init channel without listening yet"""
+        self.socket_path = socket_path
+        self.logger = logger
+        self.max_frame = max_frame
+        self.commands = queue.Queue()
+        self.__listener = None
+        self.__stop = threading.Event()
+
+    def start(self):
+        """Listen on socket_path and accept clients in a background thread.
+        Any stale socket left by a previous run is replaced.
+        """
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        listener.listen(_listen_backlog)
+        self.__listener = listener
+        accept_thread = threading.Thread(target=self._accept_clients)
+        accept_thread.daemon = True
+        accept_thread.start()
+        self.logger.info("grid_script command channel listening on %s" %
+                         self.socket_path)
+
+    def _accept_clients(self):
+        """Accept clients and serve each in a thread of its own"""
+        while not self.__stop.is_set():
+            try:
+                (conn, _) = self.__listener.accept()
+            except Exception as exc:
+                if not self.__stop.is_set():
+                    self.logger.error("command channel accept failed: %s" %
+                                      exc)
+                continue
+            client_thread = threading.Thread(target=self._serve_client,
+                                             args=(conn, ))
+            client_thread.daemon = True
+            client_thread.start()
+
+    def _serve_client(self, conn):
+        """Queue the commands in each frame from conn and acknowledge them"""
+        try:
+            conn.settimeout(grid_script_ack_timeout)
+            while True:
+                try:
+                    payload = recv_frame(conn, self.max_frame)
+                except ValueError as vae:
+                    send_frame(conn, _encode('ERROR %s' % vae))
+                    break
+                if payload is None:
+                    break
+                lines = [i.strip() for i in
+                         force_native_str(payload).split('\n')]
+                lines = [i for i in lines if i]
+                for line in lines:
+                    self.commands.put(line)
+                send_frame(conn, _encode('OK %d' % len(lines)))
+        except Exception as exc:
+            self.logger.warning("command channel client failed: %s" % exc)
+        finally:
+            conn.close()
+
+    def put(self, line):
+        """Queue a single command line from another source"""
+        line = line.strip()
+        if line:
+            self.commands.put(line)
+
+    def get(self, timeout=None):
+        """Returns the next command line waiting up to timeout seconds or
+        forever if timeout is None. Returns None if no command arrived in
+        time.
+        """
+        try:
+            return self.commands.get(True, timeout)
+        except queue.Empty:
+            return None
+
+    def read_pipe(self, pipe_path, pipe):
+        """Queue all command lines written to the already opened pipe for
+        pipe_path in a background thread. We keep a writer open on the pipe
+        ourselves so that reads block until data arrives instead of returning
+        end of file whenever no producer has it open.
+        """
+        keep_open = os.open(pipe_path, os.O_WRONLY)
+
+        def __read_lines():
+            """Forward lines until pipe breaks"""
+            try:
+                for line in iter(pipe.readline, ''):
+                    self.put(line)
+            except Exception as exc:
+                self.logger.error("reading %s failed: %s" % (pipe_path, exc))
+            finally:
+                os.close(keep_open)
+        reader_thread = threading.Thread(target=__read_lines)
+        reader_thread.daemon = True
+        reader_thread.start()
+
+    def close(self):
+        """Stop listening and remove socket"""
+        self.__stop.set()
+        if self.__listener is not None:
+            self.__listener.close()
+            self.__listener = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+if __name__ == "__main__":
+    import fcntl
+    import logging
+    import shutil
+    import tempfile
+    import time
+
+    print("Benchmark grid_script command latency over pipe and channel")
+    logger = logging.getLogger('gridscriptchannel')
+    base_dir = tempfile.mkdtemp()
+    pipe_path = os.path.join(base_dir, 'server.stdin')
+    socket_path = os.path.join(base_dir, 'server.sock')
+    os.mkfifo(pipe_path)
+    rounds = 12
+    commands = []
+    for i in range(rounds):
+        commands.append('USERJOBFILE bench_user/%d_bench_job' % i)
+        commands.append('RESOURCEREQUEST exe.%d bench.0 3600 1 job 0 %d' %
+                        (i, i))
+    sent, handled = {}, {}
+
+    def legacy_loop(pipe):
+        """The old grid_script polling read loop"""
+        last_empty = False
+        while len(handled) < len(commands):
+            line = pipe.readline().strip()
+            if not line:
+                if last_empty:
+                    time.sleep(1)
+                last_empty = True
+                continue
+            last_empty = False
+            handled[line] = time.time()
+
+    def channel_loop(channel):
+        """The new grid_script blocking read loop"""
+        while len(handled) < len(commands):
+            line = channel.get(1)
+            if line:
+                handled[line] = time.time()
+
+    def write_pipe(line):
+        """What send_message_to_grid_script did for the pipe"""
+        pipe_fd = open(pipe_path, 'a')
+        fcntl.flock(pipe_fd.fileno(), fcntl.LOCK_EX)
+        pipe_fd.write(line + '\n')
+        pipe_fd.close()
+
+    def run(loop, loop_arg, send):
+        """Send commands with pauses and return latencies per command type"""
+        sent.clear()
+        handled.clear()
+        loop_thread = threading.Thread(target=loop, args=(loop_arg, ))
+        loop_thread.start()
+        for line in commands:
+            time.sleep(0.15)
+            sent[line] = time.time()
+            send(line)
+        loop_thread.join()
+        latency = {}
+        for line in commands:
+            kind = line.split(' ')[0]
+            latency[kind] = latency.get(kind, []) + [handled[line] -
+                                                     sent[line]]
+        return latency
+
+    try:
+        # Open like grid_script did so reads return EOF without producers
+        pipe_fd = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+        fcntl.fcntl(pipe_fd, fcntl.F_SETFL,
+                    fcntl.fcntl(pipe_fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+        pipe = os.fdopen(pipe_fd, 'r')
+        pipe_latency = run(legacy_loop, pipe, write_pipe)
+        pipe.close()
+        channel = CommandChannel(socket_path, logger)
+        channel.start()
+        channel_latency = run(channel_loop, channel,
+                              lambda line: send_commands(socket_path,
+                                                         [line]))
+        before = time.time()
+        accepted = send_commands(socket_path, commands * 100)
+        batch_secs = time.time() - before
+        channel.close()
+        for kind in ('USERJOBFILE', 'RESOURCEREQUEST'):
+            for (name, latency) in (('pipe', pipe_latency),
+                                    ('channel', channel_latency)):
+                values = sorted(latency[kind])
+                print("%s over %s: mean %.4fs max %.4fs" %
+                      (kind, name, sum(values) / len(values), values[-1]))
+        print("batch of %d commands acknowledged in %.4fs" % (accepted,
+                                                               batch_secs))
+    finally:
+        shutil.rmtree(base_dir)
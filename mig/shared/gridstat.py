@@ -36,6 +36,8 @@ import os
 
 from mig.shared.defaults import default_vgrid, pending_states
 from mig.shared.fileio import pickle, unpickle, touch, walk, slow_walk
+from mig.shared.jobevents import job_events_size, load_job_events_offset, \
+    read_job_events, compact_job_events
 from mig.shared.serial import pickle as py_pickle
 from mig.shared.vgrid import validated_vgrid_list, job_fits_res_vgrid
 
@@ -413,8 +415,40 @@ class GridStat:
         elif job_id in buildcache_dict:
             del buildcache_dict[job_id]
 
-    def update(self):
-        """Updates the statistics and cache from the mRSL files"""
+    def __update_from_job_file(self, filename, buildcache_dict):
+        """Load the mRSL file in filename and update the statistics and cache
+        for all the job vgrids.
+        """
+
+        job_dict = unpickle(filename, self.__logger)
+        if not job_dict:
+            msg = 'gridstat::update() could not load: %s '\
+                % filename
+            self.__logger.error(msg)
+            return False
+
+        name = os.path.basename(filename)
+        job_vgrids = validated_vgrid_list(self.__configuration,
+                                          job_dict)
+
+        for job_vgrid_name in job_vgrids:
+
+            # Update the statistics and cache
+            # from the job details
+
+            job_vgrid_name = job_vgrid_name.upper()
+            self.__update_statistics_from_job(name,
+                                              job_vgrid_name, buildcache_dict,
+                                              job_dict)
+        return True
+
+    def update(self, full_walk=False):
+        """Updates the statistics and cache from the mRSL files. Only the jobs
+        in the job event stream since last update are inspected unless
+        full_walk is set or the stream was never consumed before. In that
+        case all mRSL files modified since the last update are inspected along
+        with any files modified since the last full walk without a job event.
+        """
 
         self.__gridstat_dict = {}
 
@@ -425,13 +459,17 @@ class GridStat:
             + 'buildcache.pck'
         buildtimestamp_file = self.__configuration.gridstat_files_dir\
             + 'buildcache.timestamp'
+        walktimestamp_file = self.__configuration.gridstat_files_dir\
+            + 'buildcache.walktimestamp'
+        evented_file = self.__configuration.gridstat_files_dir\
+            + 'buildcache.evented'
 
         # We lock the buildcache, to make sure that only one vgrid is
         # updated at a time
 
         if os.path.exists(buildcache_file):
             try:
-                file_handle = open(buildcache_file, 'r+w')
+                file_handle = open(buildcache_file, 'rb+')
                 fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX)
                 buildcache_dict = py_pickle.load(file_handle)
             except Exception as err:
@@ -443,7 +481,7 @@ class GridStat:
         else:
             buildcache_dict = {}
             try:
-                file_handle = open(buildcache_file, 'w')
+                file_handle = open(buildcache_file, 'wb')
                 fcntl.flock(file_handle.fileno(), fcntl.LOCK_EX)
             except Exception as err:
                 msg = \
@@ -467,50 +505,76 @@ class GridStat:
 
         touch(buildtimestamp_file, self.__configuration)
 
-        # Traverse mRSL dir and update cache
+        events_offset = load_job_events_offset(self.__configuration)
+        if full_walk or events_offset is None:
 
-        if slow_walk:
-            self.__logger.warning(
-                "no optimized walk available - using old os.walk")
+            # Partial updates also bump the build timestamp so we keep a
+            # separate one for the last full walk to catch any changes
+            # without a job event since then. The files already inspected
+            # from events since then are only inspected again if modified
+            # since last update to avoid counting them twice.
+            # Fall back to the build timestamp on first full walk.
 
-        for (root, _, files) in walk(root_dir, topdown=True):
+            last_walktime = last_buildtime
+            if os.path.exists(walktimestamp_file):
+                last_walktime = os.path.getmtime(walktimestamp_file)
+            touch(walktimestamp_file, self.__configuration)
+            evented = unpickle(evented_file, self.__logger,
+                               allow_missing=True) or set()
 
-            # skip all dot dirs - they are from repos etc and _not_ jobs
+            # Any events logged during the walk are replayed next time
 
-            if root.find(os.sep + '.') != -1:
-                continue
-            for name in files:
-                filename = os.path.join(root, name)
+            events_offset = job_events_size(self.__configuration)
+
+            # Traverse mRSL dir and update cache
 
-                # Only files modified since last update is checked
+            if slow_walk:
+                self.__logger.warning(
+                    "no optimized walk available - using old os.walk")
 
-                if os.path.getmtime(filename) > last_buildtime:
-                    job_dict = unpickle(filename, self.__logger)
-                    if not job_dict:
-                        msg = 'gridstat::update() could not load: %s '\
-                            % filename
-                        self.__logger.error(msg)
-                        continue
+            for (root, _, files) in walk(root_dir, topdown=True):
 
-                    job_vgrids = validated_vgrid_list(self.__configuration,
-                                                      job_dict)
+                # skip all dot dirs - they are from repos etc and _not_ jobs
 
-                    for job_vgrid_name in job_vgrids:
+                if root.find(os.sep + '.') != -1:
+                    continue
+                for name in files:
+                    filename = os.path.join(root, name)
+
+                    # Only files modified since last update is checked
+
+                    modified = os.path.getmtime(filename)
+                    if modified > last_buildtime or \
+                            modified > last_walktime and \
+                            not os.path.normpath(filename) in evented:
+                        self.__update_from_job_file(filename,
+                                                    buildcache_dict)
+            evented = set()
+        else:
 
-                        # Update the statistics and cache
-                        # from the job details
+            # Only inspect each job changed since last update once
 
-                        job_vgrid_name = job_vgrid_name.upper()
-                        self.__update_statistics_from_job(name,
-                                                          job_vgrid_name, buildcache_dict,
-                                                          job_dict)
+            (events, events_offset) = read_job_events(self.__configuration,
+                                                      events_offset)
+            evented = unpickle(evented_file, self.__logger,
+                               allow_missing=True) or set()
+            seen = set()
+            for (_, _, filename) in events:
+                if filename in seen:
+                    continue
+                seen.add(filename)
+                self.__update_from_job_file(filename, buildcache_dict)
+                evented.add(os.path.normpath(filename))
 
         # Flush cache and unlock files
 
         try:
             file_handle.seek(0, 0)
             py_pickle.dump(buildcache_dict, file_handle, 0)
+            file_handle.truncate()
             self.__flush()
+            pickle(evented, evented_file, self.__logger)
+            compact_job_events(self.__configuration, events_offset)
             fcntl.flock(file_handle.fileno(), fcntl.LOCK_UN)
             file_handle.close()
         except Exception as err:
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# jobevents - append-only stream of job status changes
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Append-only stream of job status changes.
+
+The grid script and the job actions log an event line with the job mRSL file
+for every job status change they save. Consumers like GridStat keep their
+own offset into the stream and only need to look at the jobs changed since
+last time instead of walking all job files in mrsl_files_dir.
+Each line holds a time stamp, the new status and the mRSL path relative to
+mrsl_files_dir separated by tabs. Consumed events are periodically compacted
+away.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import fcntl
+import os
+import time
+
+JOB_EVENTS_NAME = 'jobevents.log'
+JOB_EVENTS_OFFSET = 'jobevents.offset'
+# Rewrite the stream without consumed events once they take up this much
+JOB_EVENTS_COMPACT_BYTES = 4 * 1024 * 1024
+
+
+def _events_path(configuration):
+    """Path of the job event stream"""
+    return os.path.join(configuration.gridstat_files_dir, JOB_EVENTS_NAME)
+
+
+def _offset_path(configuration):
+    """Path of the saved consumer offset"""
+    return os.path.join(configuration.gridstat_files_dir, JOB_EVENTS_OFFSET)
+
+
+def _open_locked(path, mode, lock_mode):
+    """Open path in mode and lock it with lock_mode. Retries if the file was
+    replaced by compaction while we waited for the lock.
+    """
+    while True:
+        handle = open(path, mode)
+        fcntl.flock(handle.fileno(), lock_mode)
+        try:
+            if os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino:
+                return handle
+        except OSError:
+            pass
+        handle.close()
+
+
+def log_job_event(configuration, mrsl_path, status, logger=None):
+    """Append an event for the job with mRSL file in mrsl_path changing to
+    status. Never raises an exception to avoid interfering with the actual
+    job handling.
+    """
+    if logger is None:
+        logger = configuration.logger
+    mrsl_base = configuration.mrsl_files_dir.rstrip(os.sep) + os.sep
+    rel_path = mrsl_path
+    if rel_path.startswith(mrsl_base):
+        rel_path = rel_path[len(mrsl_base):]
+    line = '%.6f\t%s\t%s\n' % (time.time(), status, rel_path)
+    if not isinstance(line, bytes):
+        line = line.encode('utf8')
+    try:
+        events_handle = _open_locked(_events_path(configuration), 'ab',
+                                     fcntl.LOCK_EX)
+        try:
+            events_handle.write(line)
+        finally:
+            events_handle.close()
+    except Exception as err:
+        logger.error('could not log job event for %s: %s' % (mrsl_path,
+                                                              err))
+        return False
+    return True
+
+
+def job_events_size(configuration):
+    """Current size of the job event stream"""
+    try:
+        return os.path.getsize(_events_path(configuration))
+    except OSError:
+        return 0
+
+
+def load_job_events_offset(configuration):
+    """Load saved consumer offset or None if the stream was never consumed"""
+    try:
+        with open(_offset_path(configuration), 'r') as offset_handle:
+            return int(offset_handle.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def save_job_events_offset(configuration, offset):
+    """Save consumer offset"""
+    offset_path = _offset_path(configuration)
+    tmp_path = offset_path + '.tmp'
+    with open(tmp_path, 'w') as offset_handle:
+        offset_handle.write('%d\n' % offset)
+    os.rename(tmp_path, offset_path)
+
+
+def read_job_events(configuration, offset):
+    """Read all complete events after offset. Returns a list of events as
+    (stamp, status, mrsl_path) tuples with absolute mrsl_path and the offset
+    to continue from next time.
+    """
+    events_path = _events_path(configuration)
+    if not os.path.exists(events_path):
+        return ([], 0)
+    events_handle = _open_locked(events_path, 'rb', fcntl.LOCK_SH)
+    try:
+        # NOTE: offset may be stale after an interrupted compaction
+        if offset > os.fstat(events_handle.fileno()).st_size:
+            offset = 0
+        events_handle.seek(offset)
+        data = events_handle.read()
+    finally:
+        events_handle.close()
+    end = data.rfind(b'\n') + 1
+    events = []
+    for line in data[:end].splitlines():
+        if not isinstance(line, str):
+            line = line.decode('utf8')
+        parts = line.split('\t', 2)
+        if len(parts) != 3:
+            continue
+        try:
+            stamp = float(parts[0])
+        except ValueError:
+            continue
+        events.append((stamp, parts[1], os.path.join(
+            configuration.mrsl_files_dir, parts[2])))
+    return (events, offset + end)
+
+
+def compact_job_events(configuration, offset,
+                       min_bytes=JOB_EVENTS_COMPACT_BYTES):
+    """Drop the events before offset from the stream if they take up at least
+    min_bytes. Saves and returns the offset to use from now on.
+    """
+    events_path = _events_path(configuration)
+    if offset < min_bytes or not os.path.exists(events_path):
+        save_job_events_offset(configuration, offset)
+        return offset
+    events_handle = _open_locked(events_path, 'rb', fcntl.LOCK_EX)
+    try:
+        events_handle.seek(offset)
+        remain = events_handle.read()
+        tmp_path = events_path + '.tmp'
+        with open(tmp_path, 'wb') as tmp_handle:
+            tmp_handle.write(remain)
+        os.rename(tmp_path, events_path)
+        save_job_events_offset(configuration, 0)
+    finally:
+        events_handle.close()
+    return 0
+
+
+if __name__ == '__main__':
+    import shutil
+    import sys
+    import tempfile
+
+    from mig.shared.fileio import walk
+    from mig.shared.logger import null_logger
+    from mig.shared.serial import dump
+
+    class BenchConfiguration(object):
+        """Minimal configuration for the benchmark"""
+        logger = null_logger('jobevents')
+
+    historic = 10000
+    changed = 1000
+    if sys.argv[1:]:
+        historic = int(sys.argv[1])
+    if sys.argv[2:]:
+        changed = int(sys.argv[2])
+
+    base_dir = tempfile.mkdtemp(prefix='jobevents-')
+    configuration = BenchConfiguration()
+    configuration.mrsl_files_dir = os.path.join(base_dir, 'mrsl_files') + \
+        os.sep
+    configuration.gridstat_files_dir = os.path.join(base_dir,
+                                                    'gridstat_files') + os.sep
+    os.makedirs(configuration.gridstat_files_dir)
+    try:
+        print("creating %d historic job files" % historic)
+        users = max(1, historic // 1000)
+        for i in range(users):
+            os.makedirs(os.path.join(configuration.mrsl_files_dir,
+                                     'user-%d' % i))
+        job_paths = []
+        for i in range(historic):
+            job_path = os.path.join(configuration.mrsl_files_dir,
+                                    'user-%d' % (i % users),
+                                    'job-%d.mRSL' % i)
+            dump({'JOB_ID': 'job-%d' % i, 'STATUS': 'FINISHED'}, job_path)
+            job_paths.append(job_path)
+        last_build = time.time()
+        time.sleep(0.01)
+        for job_path in job_paths[:changed]:
+            os.utime(job_path, None)
+            log_job_event(configuration, job_path, 'FINISHED')
+
+        before = time.time()
+        found = 0
+        for (root, _, files) in walk(configuration.mrsl_files_dir):
+            for name in files:
+                if os.path.getmtime(os.path.join(root, name)) > last_build:
+                    found += 1
+        print("mtime walk found %d changed jobs in %.3fs" %
+              (found, time.time() - before))
+
+        before = time.time()
+        (events, offset) = read_job_events(configuration, 0)
+        found = len(set([mrsl_path for (_, _, mrsl_path) in events]))
+        print("event stream found %d changed jobs in %.3fs" %
+              (found, time.time() - before))
+
+        before = time.time()
+        compact_job_events(configuration, offset, 0)
+        print("compacted %d consumed bytes in %.3fs" %
+              (offset, time.time() - before))
+    finally:
+        shutil.rmtree(base_dir)
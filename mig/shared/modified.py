@@ -36,9 +36,11 @@ import time
 
 from mig.shared.defaults import keyword_all
 from mig.shared.fileio import acquire_file_lock, release_file_lock
-from mig.shared.serial import load, dump, dumps
+from mig.shared.serial import load, dump, dumps, HIGHEST_PROTOCOL
 
-EMPTY_PICKLE_SIZE = len(dumps([]))
+# NOTE: modified files may be written with any of the pickle protocols
+EMPTY_PICKLE_SIZE = max([len(dumps([], i)) for i in
+                         range(HIGHEST_PROTOCOL + 1)])
 
 
 def mark_entity_modified(configuration, kind, name):
@@ -32,7 +32,6 @@ from __future__ import absolute_import
 
 import datetime
 import os
-import pickle
 import smtplib
 import threading
 import time
@@ -55,7 +54,7 @@ from mig.shared.base import force_utf8, generate_https_urls, extract_field, \
 from mig.shared.defaults import email_keyword_list, job_output_dir, \
     transfer_output_dir, keyword_auto, cert_auto_extend_days, \
     oid_auto_extend_days
-from mig.shared.fileio import send_message_to_grid_notify
+from mig.shared.notifyspool import spool_notifications
 from mig.shared.safeinput import is_valid_simple_email
 from mig.shared.settings import load_settings
 from mig.shared.url import quote, urlencode
@@ -579,6 +578,75 @@ def send_instant_message(
         return False
 
 
+class SMTPSession(object):
+    """Persistent connection to the configured SMTP server for sending a
+    number of messages without a new connect and EHLO handshake for each.
+    The connection is opened on first use and recycled after max_messages to
+    stay clear of any per-connection limits in the MTA. A connection dropped
+    by the server, e.g. after idling, is transparently reopened once.
+    """
+
+    def __init__(self, configuration, max_messages=100,
+                 smtp_class=smtplib.SMTP):
+        """Init session without connecting"""
+        self.configuration = configuration
+        self.max_messages = max_messages
+        self._smtp_class = smtp_class
+        self._server = None
+        self._session_messages = 0
+        self.connects = 0
+        self.messages = 0
+
+    def __connect(self):
+        """Open a new connection to the SMTP server"""
+        self._server = self._smtp_class(self.configuration.smtp_server)
+        self._server.set_debuglevel(0)
+        self._session_messages = 0
+        self.connects += 1
+
+    def sendmail(self, sender_email, recipients_list, msg_string):
+        """Send msg_string from sender_email to recipients_list on the
+        session connection and return any per-recipient errors like
+        smtplib.SMTP.sendmail does.
+        """
+        if self._server is not None and \
+                0 < self.max_messages <= self._session_messages:
+            self.close()
+        for retry in (False, True):
+            if self._server is None:
+                self.__connect()
+            try:
+                errors = self._server.sendmail(sender_email, recipients_list,
+                                               msg_string)
+                break
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if retry:
+                    raise
+            except smtplib.SMTPException:
+                # NOTE: the server refused this message but session is fine
+                raise
+            except Exception:
+                self.close()
+                raise
+        self._session_messages += 1
+        self.messages += 1
+        return errors
+
+    def close(self):
+        """Close any open connection"""
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+
 def send_email(
     recipients,
     subject,
@@ -586,7 +654,8 @@ def send_email(
     logger,
     configuration,
     files=[],
-    custom_sender=None
+    custom_sender=None,
+    smtp_session=None,
 ):
     """Send message to recipients by email:
     Force utf8 encoding to avoid accented characters appearing garbled.
@@ -602,6 +671,8 @@ def send_email(
     invitations and trigger various requests that may receive manual replies.
     If gnupg is available and configuration sets a gpg_passphrase it is used to
     enable automatic gpg-signing of outgoing messages.
+    The optional smtp_session is an SMTPSession to send the message on instead
+    of opening a new SMTP connection just for this message.
 
     UTF8 encoding inspired by e.g. the recipe at
     https://code.activestate.com/recipes/578150-sending-non-ascii-emails-from-python-3/
@@ -673,11 +744,15 @@ def send_email(
             mime_msg.attach(part)
         logger.debug('sending email from %s to %s:\n%s' %
                      (from_email, recipients, mime_msg.as_string()))
-        server = smtplib.SMTP(configuration.smtp_server)
-        server.set_debuglevel(0)
-        errors = server.sendmail(sender_email,
-                                 recipients_list, mime_msg.as_string())
-        server.quit()
+        if smtp_session is None:
+            server = smtplib.SMTP(configuration.smtp_server)
+            server.set_debuglevel(0)
+            errors = server.sendmail(sender_email,
+                                     recipients_list, mime_msg.as_string())
+            server.quit()
+        else:
+            errors = smtp_session.sendmail(sender_email, recipients_list,
+                                           mime_msg.as_string())
         if errors:
             _logger.warning('Partial error(s) sending email: %s'
                             % errors)
@@ -961,22 +1036,22 @@ def parse_im_relay(path):
     return (status, protocol, address, header, msg)
 
 
-def send_system_notification(user_id, category, message, configuration):
-    """Send system notification to *user_id* through grid_notify"""
+def send_system_notifications(notifications, configuration):
+    """Send the list of (user_id, category, message) system notifications
+    through grid_notify in one batch.
+    """
     logger = configuration.logger
     if not configuration.site_enable_notify:
         logger.warning("System notify helper is disabled in configuration!")
         return False
-    if not isinstance(category, list):
-        logger.error("send_system_notification: category must be a list")
-        return False
-    notification = {'category': category,
-                    'user_id': user_id,
-                    'message': message,
-                    'timestamp': time.time(),
-                    }
-    pickled_notification = pickle.dumps(notification)
-
-    return send_message_to_grid_notify(pickled_notification,
-                                       configuration.logger,
-                                       configuration)
+    for (_, category, _) in notifications:
+        if not isinstance(category, list):
+            logger.error("send_system_notifications: category must be a list")
+            return False
+    return spool_notifications(notifications, configuration)
+
+
+def send_system_notification(user_id, category, message, configuration):
+    """Send system notification to *user_id* through grid_notify"""
+    return send_system_notifications([(user_id, category, message)],
+                                     configuration)
@@ -0,0 +1,302 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# --- BEGIN_HEADER ---
+#
+# notifyspool - batched spool segments for grid_notify notifications
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Spool segments for notifications to the grid_notify daemon.
+
+Instead of a new file in notify_home for every notification each process
+appends its notifications to a spool segment file of its own there. A batch
+of notifications is written with a single append of compact length prefixed
+records, so bulk senders only cost one write. Each process starts a new
+segment once the current one exceeds notify_spool_segment_bytes or is older
+than notify_spool_segment_secs. Thus no process ever appends to a segment
+last modified more than that many seconds ago and grid_notify can safely
+remove such segments once it has read and delivered all their records.
+
+grid_notify reads the segments sequentially from where it left off, so a
+record still being appended is just picked up in the next round. It saves the
+offset up to which all records of a segment were delivered in an offset file
+next to it, so that a restart resumes there instead of sending everything
+in the segment again.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import socket
+import struct
+import threading
+import time
+
+from mig.shared.defaults import notify_spool_suffix, \
+    notify_spool_offset_suffix, notify_spool_segment_bytes, \
+    notify_spool_segment_secs
+from mig.shared.logger import null_logger
+from mig.shared.serial import dumps, loads, COMPAT_PROTOCOL
+
+_record_header = struct.Struct('!I')
+# Fixed width offsets are always rewritten in full with a single write
+_offset_format = '%020d\n'
+# One spool per process - we check the pid to start over after a fork
+_spool_lock = threading.Lock()
+_process_spool = {'pid': None, 'spool': None}
+
+
+def is_spool_segment(path):
+    """Check if path is a spool segment rather than a notification file"""
+    return path.endswith(notify_spool_suffix)
+
+
+def is_spool_offset(path):
+    """Check if path is the saved read offset of a spool segment"""
+    return path.endswith(notify_spool_suffix + notify_spool_offset_suffix)
+
+
+def spool_offset_path(segment_path):
+    """Returns the path of the saved read offset for segment_path"""
+    return segment_path + notify_spool_offset_suffix
+
+
+def load_spool_offset(segment_path, logger=None):
+    """Returns the saved read offset for segment_path or 0 if none was saved
+    or it can't be loaded.
+    """
+    if not logger:
+        logger = null_logger("dummy")
+    offset_path = spool_offset_path(segment_path)
+    try:
+        with open(offset_path, 'r') as offset_fd:
+            return int(offset_fd.read().strip())
+    except EnvironmentError:
+        return 0
+    except ValueError as exc:
+        logger.error("invalid spool offset in %s: %s" % (offset_path, exc))
+        return 0
+
+
+def save_spool_offset(segment_path, offset, logger=None):
+    """Save offset as the read offset for segment_path. Returns True on
+    success and False otherwise.
+    """
+    if not logger:
+        logger = null_logger("dummy")
+    offset_path = spool_offset_path(segment_path)
+    try:
+        # NOTE: no temporary file in notify_home to confuse grid_notify
+        offset_fd = os.open(offset_path, os.O_WRONLY | os.O_CREAT, 0o660)
+        try:
+            os.write(offset_fd, (_offset_format % offset).encode('ascii'))
+        finally:
+            os.close(offset_fd)
+        return True
+    except EnvironmentError as exc:
+        logger.error("could not save spool offset %s: %s" % (offset_path,
+                                                              exc))
+        return False
+
+
+def encode_notification(user_id, category, message, timestamp=None):
+    """Returns the spool record bytes for a single notification"""
+    if timestamp is None:
+        timestamp = time.time()
+    data = dumps((timestamp, user_id, category, message), COMPAT_PROTOCOL)
+    return _record_header.pack(len(data)) + data
+
+
+def read_spool_segment(path, offset=0, logger=None):
+    """Returns a tuple with a list of the notification dictionaries in all
+    complete records in the segment at path from offset and the offset after
+    the last of them. Each notification has the offset of its record in the
+    offset field. Complete records that can't be loaded are logged and
+    skipped based on their length header so that they are not retried
+    forever. Raises an EnvironmentError if path can't be read.
+    """
+    if not logger:
+        logger = null_logger("dummy")
+    notifications = []
+    with open(path, 'rb') as segment_fd:
+        segment_fd.seek(offset)
+        data = segment_fd.read()
+    pos = 0
+    while len(data) - pos >= _record_header.size:
+        (size, ) = _record_header.unpack_from(data, pos)
+        end = pos + _record_header.size + size
+        if end > len(data):
+            break
+        try:
+            (timestamp, user_id, category, message) = loads(
+                data[pos + _record_header.size:end])
+        except Exception as exc:
+            logger.error("skipping corrupt record at offset %d in %s: %s" %
+                         (offset + pos, path, exc))
+            pos = end
+            continue
+        notifications.append({'category': category, 'user_id': user_id,
+                              'message': message, 'timestamp': timestamp,
+                              'offset': offset + pos})
+        pos = end
+    return (notifications, offset + pos)
+
+
+class NotifySpool(object):
+    """Appender of notification records to the spool segments of this
+    process in notify_home.
+    """
+
+    def __init__(self, notify_home, max_bytes=notify_spool_segment_bytes,
+                 max_secs=notify_spool_segment_secs):
+        """Init spool without creating any segments yet"""
+        self.notify_home = notify_home
+        self.max_bytes = max_bytes
+        self.max_secs = max_secs
+        self.segment_path = None
+        self._lock = threading.Lock()
+        self.__segment_fd = None
+        self.__segment_bytes = 0
+        self.__segment_start = 0
+        self.__segment_count = 0
+
+    def _open_segment(self):
+        """Start a new segment for appending"""
+        self.close()
+        self.__segment_count += 1
+        name = 'spool.%s.%d.%d.%d%s' % (socket.gethostname(), os.getpid(),
+                                        int(time.time()),
+                                        self.__segment_count,
+                                        notify_spool_suffix)
+        self.segment_path = os.path.join(self.notify_home, name)
+        self.__segment_fd = os.open(self.segment_path, os.O_WRONLY |
+                                    os.O_CREAT | os.O_APPEND, 0o660)
+        self.__segment_bytes = 0
+        self.__segment_start = time.time()
+
+    def append(self, records):
+        """Append the list of encoded notification records to the current
+        segment in a single write.
+        """
+        data = b''.join(records)
+        if not data:
+            return
+        with self._lock:
+            if self.__segment_fd is None or \
+                    self.__segment_bytes >= self.max_bytes or \
+                    time.time() - self.__segment_start >= self.max_secs:
+                self._open_segment()
+            while data:
+                written = os.write(self.__segment_fd, data)
+                self.__segment_bytes += written
+                data = data[written:]
+
+    def close(self):
+        """Close the current segment"""
+        if self.__segment_fd is not None:
+            os.close(self.__segment_fd)
+            self.__segment_fd = None
+
+
+def get_notify_spool(configuration):
+    """Returns the notification spool of this process"""
+    with _spool_lock:
+        if _process_spool['pid'] != os.getpid():
+            _process_spool['pid'] = os.getpid()
+            _process_spool['spool'] = NotifySpool(configuration.notify_home)
+        return _process_spool['spool']
+
+
+def spool_notifications(notifications, configuration):
+    """Append the list of (user_id, category, message) notification tuples to
+    the spool of this process in a single write. Returns True on success and
+    False otherwise.
+    """
+    logger = configuration.logger
+    try:
+        records = [encode_notification(user_id, category, message) for
+                   (user_id, category, message) in notifications]
+        get_notify_spool(configuration).append(records)
+        return True
+    except Exception as err:
+        logger.error("Failed to spool %d notifications: %s" %
+                     (len(notifications), err))
+        return False
+
+
+if __name__ == "__main__":
+    import shutil
+    import sys
+    import tempfile
+    print("Benchmark spooled notifications against a file per notification")
+    from mig.shared.fileio import make_temp_file, unpickle
+    from mig.shared.serial import dumps as serial_dumps
+    logger = null_logger('notifyspool')
+    count = int((sys.argv[1:] or [10000])[0])
+    base_dir = tempfile.mkdtemp()
+    try:
+        file_dir = os.path.join(base_dir, 'files')
+        spool_dir = os.path.join(base_dir, 'spool')
+        os.mkdir(file_dir)
+        os.mkdir(spool_dir)
+        user_ids = ['/C=DK/CN=User %d/emailAddress=user%d@example.com' %
+                    (i, i) for i in range(count)]
+        notification = {'category': ['SFTP', 'ERROR'], 'user_id': None,
+                        'message': 'Your account expires in 7 days',
+                        'timestamp': time.time()}
+
+        before = time.time()
+        for user_id in user_ids:
+            notification['user_id'] = user_id
+            (filedescriptor, filepath) = make_temp_file(
+                suffix='.%s' % time.time(), prefix='', dir=file_dir)
+            os.write(filedescriptor, serial_dumps(notification))
+            os.close(filedescriptor)
+        file_send_secs = time.time() - before
+        before = time.time()
+        for name in os.listdir(file_dir):
+            unpickle(os.path.join(file_dir, name), logger)
+        file_recv_secs = time.time() - before
+
+        spool = NotifySpool(spool_dir)
+        before = time.time()
+        spool.append([encode_notification(i, notification['category'],
+                                          notification['message']) for i in
+                      user_ids])
+        spool.close()
+        spool_send_secs = time.time() - before
+        before = time.time()
+        received = 0
+        for name in os.listdir(spool_dir):
+            received += len(read_spool_segment(os.path.join(spool_dir,
+                                                            name))[0])
+        spool_recv_secs = time.time() - before
+        print("%d notifications:" % count)
+        print("    file per notification: %d files, send %.3fs, read %.3fs" %
+              (len(os.listdir(file_dir)), file_send_secs, file_recv_secs))
+        print("    spool segment: %d files, send %.3fs, read %.3fs" %
+              (len(os.listdir(spool_dir)), spool_send_secs,
+               spool_recv_secs))
+    finally:
+        shutil.rmtree(base_dir)
@@ -50,6 +50,36 @@ from mig.shared.safeinput import html_escape
 row_name = ('even', 'odd')
 _valid_output_formats = ['txt', 'html', 'soap', 'pickle', 'pickle1', 'pickle2',
                          'yaml', 'xmlrpc', 'resource', 'json', 'file']
+# Output formats delivering streamed file_output lines without buffering
+_stream_output_formats = ['txt', 'file']
+
+
+def is_stream(value):
+    """Check if value is a lazy iterator like the generators that backends
+    may use for file_output lines and that the stream output formats return
+    instead of a string.
+    """
+    return hasattr(value, '__next__') or hasattr(value, 'next')
+
+
+def stream_parts(parts):
+    """Generator yielding formatted output from the list of parts, where
+    each part is either a string or a stream of strings. Consecutive string
+    parts are joined and streams are passed on lazily chunk by chunk.
+    """
+    pending = []
+    for part in parts:
+        if not is_stream(part):
+            pending.append(part)
+            continue
+        if pending:
+            # NOTE: join with empty value of same type to allow bytes, too
+            yield pending[0][:0].join(pending)
+            pending = []
+        for chunk in part:
+            yield chunk
+    if pending:
+        yield pending[0][:0].join(pending)
 
 
 def reject_main(client_id, user_arguments_dict):
@@ -182,6 +212,7 @@ def txt_format(configuration, ret_val, ret_msg, out_obj):
 
     lines = []
     binary_output = False
+    streamed = False
     timing_info = 'no timing information'
     status_line = 'Exit code: %s Description %s (TIMING_INFO)\n' % (ret_val,
                                                                     ret_msg)
@@ -596,6 +627,10 @@ ctime\t%(ctime)s
         elif i['object_type'] == 'file_output':
             if 'path' in i:
                 lines.append('File: %s\n' % i['path'])
+            if is_stream(i['lines']):
+                lines.append(i['lines'])
+                streamed = True
+                continue
             for line in i['lines']:
                 # Do not add newlines here!
                 lines.append(line)
@@ -644,6 +679,9 @@ ctime\t%(ctime)s
         status_line = status_line.replace('TIMING_INFO', timing_info)
         lines = [status_line] + lines
 
+    if streamed:
+        return stream_parts(lines)
+
     # NOTE: careful handling required for binary on python3+
     if sys.version_info[0] > 2 and binary_output:
         return b''.join(lines)
@@ -2718,16 +2756,34 @@ def file_format(configuration, ret_val, ret_msg, out_obj):
 
     # TODO: use wsgi file_wrapper helper here if out_obj has wsgi entry?
 
-    file_content = ''
+    parts = []
 
     for entry in out_obj:
         if entry['object_type'] == 'file_output':
-            for line in entry['lines']:
-                file_content += line
+            if is_stream(entry['lines']):
+                parts.append(entry['lines'])
+            else:
+                parts += entry['lines']
         elif entry['object_type'] == 'binary':
-            file_content = entry['data']
+            parts = [entry['data']]
 
-    return file_content
+    if [i for i in parts if is_stream(i)]:
+        return stream_parts(parts)
+    elif not parts:
+        return ''
+    # NOTE: join with empty value of same type to allow bytes, too
+    return parts[0][:0].join(parts)
+
+
+def load_streamed_lines(entry):
+    """Return entry with any streamed file_output lines loaded into a list.
+    The original entry is left untouched.
+    """
+    if entry.get('object_type', None) == 'file_output' and \
+            is_stream(entry.get('lines', [])):
+        entry = entry.copy()
+        entry['lines'] = list(entry['lines'])
+    return entry
 
 
 def get_valid_outputformats():
@@ -2817,6 +2873,10 @@ def format_output(
     if not outputformat in ('txt', 'html', 'file'):
         out_obj = [i for i in out_obj if i['object_type'] != 'wsgi']
 
+    # NOTE: only some formats can stream so load any lazy file_output lines
+    if not outputformat in _stream_output_formats:
+        out_obj = [load_streamed_lines(i) for i in out_obj]
+
     #logger.debug("%s formatting output" % outputformat)
     try:
         # return eval('%s_format(configuration, ret_val, ret_msg, out_obj)' %
@@ -60,6 +60,13 @@ def interactive(flags, letter='i'):
 def in_place(flags, letter='i'):
     return contains_letter(flags, letter)
 
+
+def keep(flags, letter='k'):
+    """Verify if flags contain the keep flag"""
+
+    return contains_letter(flags, letter)
+
+
 def line_count(flags, letter='l'):
     return contains_letter(flags, letter)
 
@@ -129,7 +129,9 @@ def check_hash(configuration, service, username, password, hashed,
     """Check a password against an existing hash. First make sure the provided
     password satisfies the local password policy. The optional hash_cache
     dictionary argument can be used to cache recent lookups to save time in
-    e.g. webdav where each operation triggers hash check.
+    e.g. webdav where each operation triggers hash check. It may also be a
+    griddaemons.credcache CredentialCache to use a bounded cache shared by
+    all daemon processes.
     The optional boolean strict_policy argument decides whether or not the site
     password policy is enforced. It is used to disable checks for e.g.
     sharelinks where the policy is not guaranteed to apply.
@@ -140,11 +142,13 @@ def check_hash(configuration, service, username, password, hashed,
     _logger = configuration.logger
     # NOTE: hashlib works with bytes
     hash_bytes = force_utf8(hashed)
-    pw_hash = make_simple_hash(password)
-    if isinstance(hash_cache, dict) and \
-            hash_cache.get(pw_hash, None) == hash_bytes:
-
-        # _logger.debug("got cached hash: %s" % [hash_cache.get(pw_hash, None)])
+    if isinstance(hash_cache, dict):
+        pw_hash = make_simple_hash(password)
+        if hash_cache.get(pw_hash, None) == hash_bytes:
+            # _logger.debug("got cached hash: %s" % [hash_cache.get(pw_hash, None)])
+            return True
+    elif hash_cache is not None and \
+            hash_cache.lookup(service, username, password, hashed):
         return True
     # We check policy AFTER cache lookup since it is already verified for those
     if strict_policy:
@@ -162,6 +166,7 @@ def check_hash(configuration, service, username, password, hashed,
     hash_a = b64decode(hash_a)
     # NOTE: pbkdf2_hmac requires bytes for password and salt
     pw_bytes = force_utf8(password)
+    compute_start = time.time()
     hash_b = hashlib.pbkdf2_hmac(hash_function, pw_bytes, force_utf8(salt),
                                  int(cost_factor), len(hash_a))
     assert len(hash_a) == len(hash_b)  # we requested this from pbkdf2_hmac()
@@ -174,6 +179,10 @@ def check_hash(configuration, service, username, password, hashed,
     if isinstance(hash_cache, dict) and match:
         hash_cache[pw_hash] = hash_bytes
         # print("cached hash: %s" % hash_cache.get(pw_hash, None))
+    elif hash_cache is not None and not isinstance(hash_cache, dict):
+        hash_cache.record_compute(time.time() - compute_start)
+        if match:
+            hash_cache.store(service, username, password, hashed)
     return match
 
 
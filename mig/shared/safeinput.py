@@ -1816,6 +1816,7 @@ def guess_type(name):
         for key in (
             'max_jobs',
             'lines',
+            'limit',
             'cputime',
             'size',
             'software_entries',
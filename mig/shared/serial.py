@@ -37,12 +37,56 @@ except ImportError:
 import json
 import yaml
 
+# Pickle protocols of interest. The legacy ASCII protocol 0 remains the
+# default for compatibility, but it is several times bigger and slower than
+# the binary protocols for large state files like the entity maps.
+# NOTE: protocol 2 is the highest one readable with both python 2 and 3.
+LEGACY_PROTOCOL = 0
+COMPAT_PROTOCOL = 2
+HIGHEST_PROTOCOL = pickle.HIGHEST_PROTOCOL
 
-def dumps(data, protocol=0, serializer='pickle', **kwargs):
+# Process-wide pickle protocol used in dumps and dump unless one is passed
+# explicitly. Usually set from the pickle_protocol configuration option.
+__pickle_policy = {'protocol': LEGACY_PROTOCOL}
+
+
+def parse_pickle_protocol(value):
+    """Translate a pickle protocol value like 'legacy', 'compat', 'highest' or
+    an integer string to the corresponding protocol number. Raises ValueError
+    for invalid or unsupported values.
+    """
+    named = {'legacy': LEGACY_PROTOCOL, 'compat': COMPAT_PROTOCOL,
+             'highest': HIGHEST_PROTOCOL}
+    value = ("%s" % value).strip().lower()
+    if value in named:
+        return named[value]
+    protocol = int(value)
+    if protocol < 0 or protocol > HIGHEST_PROTOCOL:
+        raise ValueError("unsupported pickle protocol: %d" % protocol)
+    return protocol
+
+
+def set_pickle_protocol(protocol):
+    """Set the default pickle protocol used in this process. Reading is not
+    affected since pickle automatically detects the protocol of any data.
+    """
+    __pickle_policy['protocol'] = parse_pickle_protocol(protocol)
+
+
+def get_pickle_protocol():
+    """Get the default pickle protocol used in this process"""
+    return __pickle_policy['protocol']
+
+
+def dumps(data, protocol=None, serializer='pickle', **kwargs):
     """Dump data to serialized string using given serializer using native lib.
+    The default pickle protocol from set_pickle_protocol is used unless an
+    explicit protocol is given.
     """
     if serializer == 'pickle':
         serial_helper = pickle.dumps
+        if protocol is None:
+            protocol = __pickle_policy['protocol']
         if 'protocol' not in kwargs:
             kwargs['protocol'] = protocol
     if serializer == 'json':
@@ -52,7 +96,8 @@ def dumps(data, protocol=0, serializer='pickle', **kwargs):
     return serial_helper(data, **kwargs)
 
 
-def dump(data, path, protocol=0, serializer='pickle', mode='wb', **kwargs):
+def dump(data, path, protocol=None, serializer='pickle', mode='wb',
+         **kwargs):
     """Dump data to file given by path. Pass most handling through to dumps.
     """
     with open(path, mode) as fh:
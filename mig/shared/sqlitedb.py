@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# sqlitedb - shared helpers for the sqlite backed caches and maps
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Shared helpers for the sqlite backed caches and maps"""
+
+from __future__ import absolute_import
+
+import sqlite3
+
+from mig.shared.defaults import sqlite_lock_timeout
+
+
+def open_sqlite_db(db_path, synchronous=None, check_same_thread=True,
+                   native_text=False, timeout=sqlite_lock_timeout):
+    """Open and return a connection to the sqlite db in db_path. File backed
+    dbs use write-ahead logging so that readers are never blocked by an
+    on-going write, and the optional synchronous value relaxes fsync for dbs
+    holding only volatile or reproducible data. The native_text argument
+    makes text columns come back as native strings, which is needed where
+    raw client IDs or paths may be utf8 encoded byte strings on python2.
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout,
+                           check_same_thread=check_same_thread)
+    if native_text:
+        conn.text_factory = str
+    if db_path != ':memory:':
+        conn.execute("PRAGMA journal_mode=WAL")
+        if synchronous is not None:
+            conn.execute("PRAGMA synchronous=%s" % synchronous)
+    return conn
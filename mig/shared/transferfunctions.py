@@ -373,6 +373,31 @@ def del_worker_transfer(configuration, all_workers, client_id, transfer_id,
     else:
         return False
 
+
+def schedule_worker_transfers(configuration, queued, all_workers,
+                              max_workers, max_user_workers):
+    """Split the list of queued (client_id, transfer_id) tuples into a list
+    of transfers to launch now and a list to keep waiting, given the workers
+    already running in all_workers. The launch list respects max_workers in
+    total and max_user_workers for each client_id, where a limit of 0 or less
+    means unlimited. Queue order is preserved in both lists so that the
+    transfers waiting the longest get the first free worker slots.
+    """
+    user_workers = {}
+    for (client_id, _, _) in all_worker_transfers(configuration, all_workers):
+        user_workers[client_id] = user_workers.get(client_id, 0) + 1
+    running = sum(user_workers.values())
+    (launch, waiting) = ([], [])
+    for (client_id, transfer_id) in queued:
+        if 0 < max_workers <= running or \
+                0 < max_user_workers <= user_workers.get(client_id, 0):
+            waiting.append((client_id, transfer_id))
+            continue
+        launch.append((client_id, transfer_id))
+        user_workers[client_id] = user_workers.get(client_id, 0) + 1
+        running += 1
+    return (launch, waiting)
+
 # NOTE: Please refer to IMPORTANT note above about reassignments
 
 
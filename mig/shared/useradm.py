@@ -32,7 +32,6 @@ from __future__ import absolute_import
 
 from email.utils import parseaddr
 import datetime
-import fnmatch
 import os
 import re
 import sqlite3
@@ -74,6 +73,7 @@ from mig.shared.sharelinks import load_share_links, update_share_link, \
 from mig.shared.twofactorkeywords import get_twofactor_specs
 from mig.shared.userdb import lock_user_db, unlock_user_db, load_user_db, \
     load_user_dict, save_user_db, default_db_path
+from mig.shared.userdbquery import load_user_db_index, match_user_filter
 from mig.shared.validstring import possible_user_id, valid_email_addresses
 from mig.shared.vgrid import vgrid_add_owners, vgrid_remove_owners, \
     vgrid_add_members, vgrid_remove_members, in_vgrid_share, \
@@ -2254,6 +2254,9 @@ def search_users(search_filter, conf_path, db_path,
     """Search for matching users. The optional regex_match is a list of keys in
     search_filter to apply regular expression match rather than the usual
     fnmatch for.
+    User DBs loaded from db_path are queried through the cached indexes from
+    userdbquery and the returned user dictionaries are shallow copies, so
+    that changes to them do not leak into later searches.
     """
 
     if conf_path:
@@ -2267,11 +2270,12 @@ def search_users(search_filter, conf_path, db_path,
     if db_path == keyword_auto:
         db_path = default_db_path(configuration)
 
+    user_index = None
     try:
         if isinstance(db_path, dict):
             user_db = db_path
         else:
-            user_db = load_user_db(db_path, do_lock=do_lock)
+            user_index = load_user_db_index(db_path, do_lock=do_lock)
             if verbose:
                 print('Loaded existing user DB from: %s' % db_path)
     except Exception as err:
@@ -2281,30 +2285,15 @@ def search_users(search_filter, conf_path, db_path,
         _logger.error(err_msg)
         return (configuration, [])
 
+    if user_index is not None:
+        hits = [(uid, dict(user_dict)) for (uid, user_dict) in
+                user_index.query(search_filter, regex_match)]
+        return (configuration, hits)
+
     hits = []
     for (uid, user_dict) in user_db.items():
-        match = True
-        for (key, val) in search_filter.items():
-            if key == 'expire_after':
-                if user_dict.get('expire', val) < val:
-                    match = False
-                    break
-            elif key == 'expire_before':
-                if user_dict.get('expire', 0) > val:
-                    match = False
-                    break
-            elif key in regex_match and \
-                    not re.match(val, "%s" % user_dict.get(key, '')):
-                match = False
-                break
-            elif key not in regex_match and \
-                    not fnmatch.fnmatch("%s" % user_dict.get(key, ''), val):
-                match = False
-                break
-
-        if not match:
-            continue
-        hits.append((uid, user_dict))
+        if match_user_filter(user_dict, search_filter, regex_match):
+            hits.append((uid, user_dict))
     return (configuration, hits)
 
 
@@ -34,7 +34,7 @@ import fcntl
 import os
 import time
 
-from mig.shared.base import client_id_dir
+from mig.shared.base import client_id_dir, client_dir_id
 from mig.shared.fileio import walk
 from mig.shared.resource import list_resources
 from mig.shared.serial import load, dump
@@ -42,11 +42,16 @@ from mig.shared.serial import load, dump
 # Only refresh stats if at least this many seconds since last refresh
 JOB_REFRESH_DELAY = 120
 DISK_REFRESH_DELAY = 3600
+# Fall back to a full walk if more changed dirs than this are pending
+DISK_DIRTY_LIMIT = 10000
 # Internal field names
 TOTALS = (OWN, VGRID, JOBS) = (
     '__user_totals__', '__vgrid_totals__', '__jobs__')
 (FILES, DIRECTORIES, BYTES, KIND) = \
     ('__files__', '__directories__', '__bytes__', '__kind__')
+# Start time of last full disk walk and all non-dir disk stats entries
+WALK_STAMP = '__walk_stamp__'
+DISK_META = TOTALS + (WALK_STAMP, 'time_stamp')
 STATES = (PARSE, QUEUED, EXECUTING, FINISHED, RETRY, CANCELED, EXPIRED,
           FAILED, FROZEN) = \
     ("PARSE", "QUEUED", "EXECUTING", "FINISHED", "RETRY", "CANCELED",
@@ -144,57 +149,135 @@ def update_job_stats(stats, job_id, job):
     return stats
 
 
-def refresh_disk_stats(configuration, client_id):
-    """Refresh disk use stats for specified user"""
-    _logger = configuration.logger
-    dirty = False
-    client_dir = client_id_dir(client_id)
-    user_base = os.path.join(configuration.user_home, client_dir)
+def _disk_stats_paths(configuration, client_dir):
+    """Helper to get the disk stats, lock and changed dirs paths"""
     stats_base = os.path.join(configuration.user_cache, client_dir)
     stats_path = os.path.join(stats_base, "disk-stats.pck")
-    lock_path = stats_path + ".lock"
+    return (stats_base, stats_path, stats_path + ".lock",
+            stats_path + ".dirty")
 
-    try:
-        os.makedirs(stats_base)
-    except:
-        pass
-
-    lock_handle = open(lock_path, 'a')
-
-    fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX)
 
+def mark_disk_stats_dirty(configuration, client_id, rel_dirs):
+    """Record that the contents of rel_dirs in the home of client_id changed.
+    The next disk stats refresh then only rescans those dirs instead of the
+    entire home. Nothing is recorded before the first full stats refresh.
+    """
+    _logger = configuration.logger
+    client_dir = client_id_dir(client_id)
+    (_, stats_path, _, dirty_path) = _disk_stats_paths(configuration,
+                                                       client_dir)
+    if not os.path.exists(stats_path):
+        return False
+    # NOTE: names with line breaks can't go in the journal - periodic walk
+    lines = ['%s\n' % rel_dir.strip(os.sep) for rel_dir in rel_dirs
+             if '\n' not in rel_dir]
     try:
-        stats = load(stats_path)
-        stats_stamp = os.path.getmtime(stats_path)
-    except IOError:
-        _logger.warning("No disk stats to load - ok first time")
-        stats = {OWN: {FILES: 0, DIRECTORIES: 0, BYTES: 0},
-                 VGRID: {FILES: 0, DIRECTORIES: 0, BYTES: 0}}
-        stats_stamp = -1
-
-    now = time.time()
-    if now < stats_stamp + DISK_REFRESH_DELAY:
-        lock_handle.close()
-        return stats
-
-    # Walk entire home dir and update any parts that changed
-    # Please note that walk doesn't follow symlinks so we have
-    # to additionally walk vgrid dir symlinks explicitly
-    cur_roots = []
+        with open(dirty_path, 'a') as dirty_fd:
+            fcntl.flock(dirty_fd.fileno(), fcntl.LOCK_EX)
+            dirty_fd.write(''.join(lines))
+            fcntl.flock(dirty_fd.fileno(), fcntl.LOCK_UN)
+    except Exception as exc:
+        _logger.warning("could not mark disk stats dirty for %s: %s" %
+                        (client_id, exc))
+        return False
+    return True
+
+
+def mark_disk_stats_path(configuration, path):
+    """Record a change to path if inside a user home. Marks both the parent
+    dir and path itself to catch added and removed dirs.
+    """
+    user_home = configuration.user_home.rstrip(os.sep) + os.sep
+    abs_path = os.path.abspath(path)
+    if not abs_path.startswith(user_home):
+        return False
+    rel_path = abs_path[len(user_home):]
+    client_dir, _, rel_path = rel_path.partition(os.sep)
+    if not client_dir:
+        return False
+    rel_dirs = [os.path.dirname(rel_path)]
+    if rel_path:
+        rel_dirs.append(rel_path)
+    return mark_disk_stats_dirty(configuration, client_dir_id(client_dir),
+                                 rel_dirs)
+
+
+def _pop_disk_stats_dirty(configuration, dirty_path):
+    """Read and reset the changed dirs recorded for a user. Returns a list of
+    unique relative dirs or None if there are too many to bother.
+    """
+    _logger = configuration.logger
+    if not os.path.exists(dirty_path):
+        return []
+    try:
+        with open(dirty_path, 'r+') as dirty_fd:
+            fcntl.flock(dirty_fd.fileno(), fcntl.LOCK_EX)
+            lines = dirty_fd.readlines()
+            dirty_fd.seek(0)
+            dirty_fd.truncate()
+            fcntl.flock(dirty_fd.fileno(), fcntl.LOCK_UN)
+    except Exception as exc:
+        _logger.warning("could not read changed dirs in %s: %s" %
+                        (dirty_path, exc))
+        return None
+    if len(lines) > DISK_DIRTY_LIMIT:
+        return None
+    return sorted(set([line.rstrip('\n') for line in lines]))
+
+
+def _disk_stats_kind(stats, user_base, rel_root):
+    """Find the total kind of rel_root: VGRID if inside a dir symlink"""
+    if rel_root in stats and stats[rel_root].get(KIND, None):
+        return stats[rel_root][KIND]
+    parts = rel_root.split(os.sep) if rel_root else []
+    for i in range(1, len(parts) + 1):
+        if os.path.islink(os.path.join(user_base, *parts[:i])):
+            return VGRID
+    return OWN
+
+
+def _drop_disk_stats(configuration, stats, user_base, rel_root):
+    """Remove stats for rel_root no longer there and update totals"""
+    _logger = configuration.logger
+    root = os.path.join(user_base, rel_root)
+    # NOTE: legacy stats may lack KIND field - just ignore and delete
+    total = stats[rel_root].get(KIND, None)
+    if total:
+        stats[total][FILES] -= stats[rel_root][FILES]
+        stats[total][DIRECTORIES] -= stats[rel_root][DIRECTORIES]
+        stats[total][BYTES] -= stats[rel_root][BYTES]
+    else:
+        _logger.warning("Ignoring outdated stat entry for %s: %s" %
+                        (root, stats[rel_root]))
+    del stats[rel_root]
+
+
+def _walk_disk_stats(configuration, stats, user_base, top, total,
+                     ref_stamp=None, cur_roots=None):
+    """Walk top and update disk stats for all dirs found. Dirs with stats and
+    no changes since the optional ref_stamp are skipped. The optional
+    cur_roots list is extended with all relative dirs found.
+    Please note that walk doesn't follow symlinks so we have to additionally
+    walk vgrid dir symlinks in own dirs explicitly.
+    Returns a boolean indicating if any stats changed.
+    """
+    dirty = False
     vgrid_dirs = []
-    total = OWN
-    for (root, dirs, files) in walk(user_base):
+    for (root, dirs, files) in walk(top):
+        # Always use path relative to user base!
         rel_root = root.replace(user_base, '').lstrip(os.sep)
-        cur_roots.append(rel_root)
-        for dir_name in dirs:
-            dir_path = os.path.join(root, dir_name)
-            if os.path.islink(dir_path):
-                vgrid_dirs.append(dir_path)
+        if cur_roots is not None:
+            cur_roots.append(rel_root)
+        if total == OWN:
+            for dir_name in dirs:
+                dir_path = os.path.join(root, dir_name)
+                if os.path.islink(dir_path):
+                    vgrid_dirs.append(dir_path)
 
         # Directory and contents unchanged - ignore
 
-        if rel_root in stats and \
-                not contents_changed(configuration, root, files, stats_stamp):
+        if ref_stamp is not None and rel_root in stats and \
+                not contents_changed(configuration, root, files, ref_stamp):
             continue
 
         dirty = True
@@ -202,48 +285,156 @@ def refresh_disk_stats(configuration, client_id):
         update_disk_stats(configuration, stats, root, rel_root, dirs, files,
                           total)
 
-    # Now walk vgrid dir symlinks explicitly
-    total = VGRID
     for vgrid_base in vgrid_dirs:
-        for (root, dirs, files) in walk(vgrid_base):
-            # Still use path relative to user base!
-            rel_root = root.replace(user_base, '').lstrip(os.sep)
-            cur_roots.append(rel_root)
+        if _walk_disk_stats(configuration, stats, user_base, vgrid_base,
+                            VGRID, ref_stamp, cur_roots):
+            dirty = True
+    return dirty
+
+
+def _rescan_disk_stats(configuration, stats, user_base, rel_dirs):
+    """Update disk stats for just the changed rel_dirs and any dirs added or
+    removed there. Changed dirs without stats or no longer there are handled
+    by rescanning the closest parent dir with stats instead.
+    """
+    scan_roots = set()
+    for rel_root in rel_dirs:
+        while rel_root and (rel_root not in stats or not os.path.isdir(
+                os.path.join(user_base, rel_root))):
+            rel_root = os.path.dirname(rel_root)
+        scan_roots.add(rel_root)
+
+    present = {}
+    for rel_root in sorted(scan_roots):
+        root = os.path.join(user_base, rel_root)
+        total = _disk_stats_kind(stats, user_base, rel_root)
+        try:
+            (_, dirs, files) = next(walk(root))
+        except StopIteration:
+            continue
+        update_disk_stats(configuration, stats, root, rel_root, dirs, files,
+                          total)
+        present[rel_root] = dirs
+        for dir_name in dirs:
+            sub_root = os.path.join(rel_root, dir_name)
+            if sub_root in stats:
+                continue
+            dir_path = os.path.join(root, dir_name)
+            if total == OWN and os.path.islink(dir_path):
+                sub_total = VGRID
+            else:
+                sub_total = total
+            _walk_disk_stats(configuration, stats, user_base, dir_path,
+                             sub_total)
+
+    # Drop stats for removed dirs and everything below
+    removed = set()
+    for rel_root in list(stats):
+        if rel_root in DISK_META or not rel_root:
+            continue
+        parent, name = os.path.split(rel_root)
+        if parent in present and name not in present[parent]:
+            removed.add(rel_root)
+    if removed:
+        for rel_root in list(stats):
+            if rel_root in DISK_META or not rel_root:
+                continue
+            parts = rel_root.split(os.sep)
+            for i in range(1, len(parts) + 1):
+                if os.sep.join(parts[:i]) in removed:
+                    _drop_disk_stats(configuration, stats, user_base,
+                                     rel_root)
+                    break
+    return True
+
+
+def refresh_disk_stats(configuration, client_id, full_rebuild=False):
+    """Refresh disk use stats for specified user. Dirs recorded as changed
+    with mark_disk_stats_dirty are rescanned right away whereas the entire
+    home is only walked every DISK_REFRESH_DELAY seconds or if full_rebuild
+    is requested. The latter additionally discards all existing stats.
+    Callers get the last saved stats instead of waiting while another
+    process walks the home.
+    """
+    _logger = configuration.logger
+    dirty = False
+    client_dir = client_id_dir(client_id)
+    user_base = os.path.join(configuration.user_home, client_dir)
+    (stats_base, stats_path, lock_path, dirty_path) = \
+        _disk_stats_paths(configuration, client_dir)
+
+    try:
+        os.makedirs(stats_base)
+    except:
+        pass
 
-            # Directory and contents unchanged - ignore
+    lock_handle = open(lock_path, 'a')
 
-            if rel_root in stats and \
-                not contents_changed(configuration, root, files,
-                                     stats_stamp):
-                continue
+    try:
+        fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        locked = True
+    except (IOError, OSError):
+        locked = False
 
-            dirty = True
+    if not locked and not full_rebuild:
+        try:
+            stats = load(stats_path)
+            stats['time_stamp'] = os.path.getmtime(stats_path)
+            _logger.debug("disk stats refresh in progress - use saved")
+            lock_handle.close()
+            return stats
+        except Exception:
+            # No saved stats yet - wait for refresh
+            pass
+    if not locked:
+        fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX)
+
+    stats = None
+    if not full_rebuild:
+        try:
+            stats = load(stats_path)
+            stats_stamp = os.path.getmtime(stats_path)
+        except IOError:
+            _logger.warning("No disk stats to load - ok first time")
+    if stats is None:
+        stats = {OWN: {FILES: 0, DIRECTORIES: 0, BYTES: 0},
+                 VGRID: {FILES: 0, DIRECTORIES: 0, BYTES: 0}}
+        stats_stamp = -1
+    # NOTE: legacy stats lack walk stamp but were only saved after walks
+    walk_stamp = stats.get(WALK_STAMP, stats_stamp)
 
-            update_disk_stats(configuration, stats, root, rel_root, dirs,
-                              files, total)
+    rel_dirs = _pop_disk_stats_dirty(configuration, dirty_path)
+    now = time.time()
+    if rel_dirs is not None and now < walk_stamp + DISK_REFRESH_DELAY:
+        if rel_dirs:
+            _logger.debug("rescan %d changed dirs in %s" % (len(rel_dirs),
+                                                            user_base))
+            dirty = _rescan_disk_stats(configuration, stats, user_base,
+                                       rel_dirs)
+    else:
+        # Walk entire home dir and update any parts that changed since the
+        # last walk started
+        cur_roots = []
+        _walk_disk_stats(configuration, stats, user_base, user_base, OWN,
+                         walk_stamp, cur_roots)
 
-    # Update stats for any roots no longer there
-    # NOTE: use copy of list as we delete inline
+        # Update stats for any roots no longer there
 
-    for rel_root in list(stats):
-        if rel_root in list(TOTALS) + cur_roots:
-            continue
-        root = os.path.join(user_base, rel_root)
-        # NOTE: legacy stats may lack KIND field - just ignore and delete
-        total = stats[rel_root].get(KIND, None)
-        if total:
-            stats[total][FILES] -= stats[rel_root][FILES]
-            stats[total][DIRECTORIES] -= stats[rel_root][DIRECTORIES]
-            stats[total][BYTES] -= stats[rel_root][BYTES]
-        else:
-            _logger.warning("Ignoring outdated stat entry for %s: %s" %
-                            (root, stats[rel_root]))
-        del stats[rel_root]
+        cur_roots = set(list(DISK_META) + cur_roots)
+        for rel_root in list(stats):
+            if rel_root in cur_roots:
+                continue
+            _drop_disk_stats(configuration, stats, user_base, rel_root)
+        # NOTE: always save to record the new walk stamp
+        stats[WALK_STAMP] = now
         dirty = True
 
     if dirty:
+        # NOTE: save atomically to allow concurrent readers without lock
+        tmp_path = stats_path + ".tmp"
         try:
-            dump(stats, stats_path)
+            dump(stats, tmp_path)
+            os.rename(tmp_path, stats_path)
             stats_stamp = os.path.getmtime(stats_path)
         except Exception as exc:
             _logger.error("Could not save stats cache: %s" % exc)
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# userdbquery - indexed queries on the user database
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Indexed queries on the user database for search_users in useradm.
+
+The UserDBIndex holds secondary indexes on the most commonly searched user
+fields and a sorted expire index for the expire_after and expire_before range
+filters. Exact patterns on indexed fields are direct lookups and wildcard or
+regex patterns only need to be matched once per distinct field value rather
+than once per user. Remaining filters on other fields are then applied to the
+narrowed down candidates with the same match rules as the full scan.
+
+The index for the most recently used user DB file is cached in the process
+and reused until the file changes on disk.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+from bisect import bisect_left, bisect_right
+import fnmatch
+import os
+import re
+
+from mig.shared.defaults import user_db_index_fields
+from mig.shared.userdb import load_user_db, lock_user_db, unlock_user_db
+
+# Characters making a search value an fnmatch pattern rather than a literal
+_fnmatch_chars = ('*', '?', '[')
+_expire_filters = ('expire_after', 'expire_before')
+
+# Index of the most recently loaded user DB as (db_path, stamp, index)
+_index_cache = [None, None, None]
+
+
+def match_user_filter(user_dict, search_filter, regex_match=[]):
+    """Check if user_dict matches all entries in search_filter. The optional
+    regex_match is a list of keys in search_filter to apply regular expression
+    match rather than the usual fnmatch for.
+    """
+    for (key, val) in search_filter.items():
+        if key == 'expire_after':
+            if user_dict.get('expire', val) < val:
+                return False
+        elif key == 'expire_before':
+            if user_dict.get('expire', 0) > val:
+                return False
+        elif key in regex_match:
+            if not re.match(val, "%s" % user_dict.get(key, '')):
+                return False
+        elif not fnmatch.fnmatch("%s" % user_dict.get(key, ''), val):
+            return False
+    return True
+
+
+class UserDBIndex(object):
+    """Secondary indexes on a loaded user DB dictionary. Each index is built
+    on first use so that a single query only pays for the fields it needs.
+    """
+
+    def __init__(self, user_db, fields=user_db_index_fields):
+        """Prepare indexes for fields and expire over all users in user_db"""
+        self.user_db = user_db
+        self.index_fields = fields
+        self.order = dict([(uid, position) for (position, uid) in
+                           enumerate(user_db)])
+        self.fields = {}
+        self.sorted_values = {}
+        self.expire_keys = None
+        self.expire_ids = None
+        # Users without expire pass any range and odd values need a recheck
+        self.expire_missing = set()
+        self.expire_other = set()
+
+    def __len__(self):
+        """Number of indexed users"""
+        return len(self.order)
+
+    def _field_index(self, field):
+        """Lazy build and return index mapping field values to user IDs"""
+        values = self.fields.get(field, None)
+        if values is None:
+            values = {}
+            for (uid, user_dict) in self.user_db.items():
+                value = "%s" % user_dict.get(field, '')
+                ids = values.get(value, None)
+                if ids is None:
+                    ids = values[value] = set()
+                ids.add(uid)
+            self.fields[field] = values
+            self.sorted_values[field] = sorted(values)
+        return values
+
+    def _expire_index(self):
+        """Lazy build the sorted expire index"""
+        if self.expire_keys is not None:
+            return
+        expire_pairs = []
+        for (uid, user_dict) in self.user_db.items():
+            if not 'expire' in user_dict:
+                self.expire_missing.add(uid)
+            elif isinstance(user_dict['expire'], (int, float)) and \
+                    not isinstance(user_dict['expire'], bool):
+                expire_pairs.append((user_dict['expire'], uid))
+            else:
+                self.expire_other.add(uid)
+        expire_pairs.sort(key=lambda pair: pair[0])
+        self.expire_keys = [pair[0] for pair in expire_pairs]
+        self.expire_ids = [pair[1] for pair in expire_pairs]
+
+    def field_matches(self, field, pattern, regex=False):
+        """Returns set of user IDs with indexed field matching pattern or None
+        if pattern matches anything.
+        """
+        if not regex and pattern == '*':
+            return None
+        values = self._field_index(field)
+        if regex:
+            candidates = values
+            matcher = re.compile(pattern)
+        else:
+            first_special = min([pattern.find(i) for i in _fnmatch_chars
+                                 if i in pattern] or [-1])
+            if first_special < 0:
+                return set(values.get(pattern, ()))
+            # Only values sharing the literal prefix of pattern can match
+            prefix = pattern[:first_special]
+            sorted_values = self.sorted_values[field]
+            candidates = []
+            for pos in range(bisect_left(sorted_values, prefix),
+                             len(sorted_values)):
+                if not sorted_values[pos].startswith(prefix):
+                    break
+                candidates.append(sorted_values[pos])
+            matcher = re.compile(fnmatch.translate(pattern))
+        result = set()
+        for value in candidates:
+            if matcher.match(value):
+                result.update(values[value])
+        return result
+
+    def expire_range(self, after=None, before=None):
+        """Returns set of user IDs with expire at or after after and at or
+        before before. Users without expire are always included like in the
+        full scan and so are the ones with non-numeric expire values, which
+        must be checked by the caller.
+        """
+        self._expire_index()
+        start, end = 0, len(self.expire_keys)
+        if after is not None:
+            start = bisect_left(self.expire_keys, after)
+        if before is not None:
+            end = bisect_right(self.expire_keys, before)
+        result = set(self.expire_ids[start:end])
+        result.update(self.expire_missing)
+        result.update(self.expire_other)
+        return result
+
+    def query(self, search_filter, regex_match=[]):
+        """Returns list of (uid, user_dict) tuples matching search_filter in
+        user DB order. The regex_match argument is used like in
+        match_user_filter.
+        """
+        candidates = None
+        residual = {}
+        after = search_filter.get('expire_after', None)
+        before = search_filter.get('expire_before', None)
+        if after is not None or before is not None:
+            candidates = self.expire_range(after, before)
+            if self.expire_other:
+                for key in _expire_filters:
+                    if key in search_filter:
+                        residual[key] = search_filter[key]
+        for (key, val) in search_filter.items():
+            if key in _expire_filters:
+                continue
+            elif key not in self.index_fields:
+                # NOTE: plain '*' matches any value just like in field_matches
+                if val != '*' or key in regex_match:
+                    residual[key] = val
+                continue
+            ids = self.field_matches(key, val, key in regex_match)
+            if ids is None:
+                continue
+            elif candidates is None:
+                candidates = ids
+            else:
+                candidates &= ids
+            if not candidates:
+                return []
+
+        hits = []
+        if candidates is None or len(candidates) * 4 > len(self.order):
+            # Just walk all users in order for broad queries
+            for (uid, user_dict) in self.user_db.items():
+                if candidates is not None and not uid in candidates:
+                    continue
+                if match_user_filter(user_dict, residual, regex_match):
+                    hits.append((uid, user_dict))
+        else:
+            for uid in sorted(candidates, key=self.order.get):
+                user_dict = self.user_db[uid]
+                if match_user_filter(user_dict, residual, regex_match):
+                    hits.append((uid, user_dict))
+        return hits
+
+
+def _db_stamp(db_path):
+    """Stamp used to detect changes to the user DB file"""
+    stat_res = os.stat(db_path)
+    return (stat_res.st_mtime, stat_res.st_size, stat_res.st_ino)
+
+
+def load_user_db_index(db_path, do_lock=True):
+    """Load user DB from db_path and return a UserDBIndex for it. The index
+    of the most recently loaded user DB is reused as long as the file stays
+    unchanged.
+    """
+    if do_lock:
+        flock = lock_user_db(db_path, exclusive=False)
+    try:
+        stamp = _db_stamp(db_path)
+        (cached_path, cached_stamp, cached_index) = _index_cache
+        if cached_path == db_path and cached_stamp == stamp:
+            return cached_index
+        user_db = load_user_db(db_path, do_lock=False)
+        user_index = UserDBIndex(user_db)
+        _index_cache[:] = [db_path, stamp, user_index]
+        return user_index
+    finally:
+        if do_lock:
+            unlock_user_db(flock)
+
+
+def clear_user_db_index():
+    """Drop any cached user DB index"""
+    _index_cache[:] = [None, None, None]
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+    import time
+
+    # Benchmark full scan and indexed queries on a synthetic user DB
+    user_count = 100000
+    if sys.argv[1:]:
+        user_count = int(sys.argv[1])
+    random.seed(42)
+    now = int(time.time())
+    orgs = ['Org %d' % i for i in range(200)]
+    countries = ['DK', 'SE', 'NO', 'DE', 'FR', 'GB', 'US']
+    user_db = {}
+    for i in range(user_count):
+        org = random.choice(orgs)
+        country = random.choice(countries)
+        full_name = 'User Number %d' % i
+        email = 'user%d@org%d.example.org' % (i, orgs.index(org))
+        uid = '/C=%s/O=%s/CN=%s/emailAddress=%s' % (country, org, full_name,
+                                                     email)
+        user_db[uid] = {'distinguished_name': uid, 'full_name': full_name,
+                        'organization': org, 'country': country,
+                        'email': email, 'state': '', 'locality': '',
+                        'organizational_unit': '',
+                        'role': random.choice(['', '', 'student', 'staff']),
+                        'status': random.choice(['active'] * 9 +
+                                                ['suspended']),
+                        'expire': now + random.randint(-90, 365) * 86400}
+    queries = [
+        ('email', {'email': 'user4242@org*.example.org'}, []),
+        ('expire in 30 days', {'distinguished_name': '*',
+                               'expire_after': now,
+                               'expire_before': now + 30 * 86400}, []),
+        ('org and status', {'organization': 'Org 17',
+                            'status': 'suspended'}, []),
+        ('role regex', {'role': 'st(aff|udent)', 'country': 'DK'},
+         ['role']),
+        ('full name', {'full_name': 'User Number 99*'}, []),
+    ]
+    print("benchmark queries on %d synthetic users" % user_count)
+    user_index = UserDBIndex(user_db)
+    # NOTE: first round includes lazy index build and second reuses indexes
+    for (round_name, (name, search_filter, regex_match)) in \
+            [('cold', i) for i in queries] + [('warm', i) for i in queries]:
+        before = time.time()
+        scan_hits = [(uid, user_dict) for (uid, user_dict) in
+                     user_db.items() if
+                     match_user_filter(user_dict, search_filter, regex_match)]
+        scan_secs = time.time() - before
+        before = time.time()
+        index_hits = user_index.query(search_filter, regex_match)
+        index_secs = time.time() - before
+        if [i[0] for i in scan_hits] != [i[0] for i in index_hits]:
+            print("ERROR: %s query results differ" % name)
+            sys.exit(1)
+        print("%s %-18s %6d hits: scan %.4fs, indexed %.4fs" %
+              (round_name, name, len(index_hits), scan_secs, index_secs))
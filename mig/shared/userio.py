@@ -39,6 +39,7 @@ from mig.shared.base import invisible_path
 from mig.shared.defaults import trash_destdir, trash_linkname
 from mig.shared.fileio import walk, slow_walk
 from mig.shared.gdp.all import get_project_from_client_id, project_log
+from mig.shared.usercache import mark_disk_stats_path
 from mig.shared.vgrid import in_vgrid_legacy_share, in_vgrid_writable, \
     in_vgrid_priv_web, in_vgrid_pub_web
 
@@ -274,6 +275,7 @@ def delete_path(configuration, path):
 
     if result:
         commit_changes(configuration, changeset)
+        mark_disk_stats_path(configuration, path)
     else:
         abort_changes(configuration, changeset)
     return (result, errors)
@@ -345,6 +347,8 @@ def remove_path(configuration, path):
 
     if result:
         commit_changes(configuration, changeset)
+        mark_disk_stats_path(configuration, path)
+        mark_disk_stats_path(configuration, trash_path)
     else:
         abort_changes(configuration, changeset)
     return (result, errors)
@@ -40,6 +40,8 @@ from mig.shared.conf import get_all_exe_vgrids, get_all_store_vgrids, \
     get_resource_fields, get_resource_configuration
 from mig.shared.defaults import settings_filename, profile_filename, \
     default_vgrid, keyword_all, vgrid_pub_base_dir, vgrid_priv_base_dir
+from mig.shared.entitymapdb import FLAT_SECTION, load_entity_db, \
+    load_entity_db_entries, save_entity_db
 from mig.shared.fileio import acquire_file_lock, release_file_lock
 from mig.shared.modified import mark_resource_modified, mark_vgrid_modified, \
     check_users_modified, check_resources_modified, check_vgrids_modified, \
@@ -75,6 +77,20 @@ last_load = {USERS: 0, RESOURCES: 0, VGRIDS: 0}
 last_map = {USERS: {}, RESOURCES: {}, VGRIDS: {}}
 
 
+def _entity_map_sections(kind):
+    """Sections to nest entities under in the map of given kind. Only the
+    vgrid map has sections whereas the user and resource maps are flat.
+    """
+    if kind == 'vgrid':
+        return MAP_SECTIONS
+    return None
+
+
+def _use_entity_db(configuration):
+    """Check if the entity maps are stored in the per-entity db backend"""
+    return configuration.site_entity_map_backend == 'sqlite'
+
+
 def load_entity_map(configuration, kind, do_lock, caching):
     """Load map of given entities and their configuration. Uses a pickled
     dictionary for efficiency. The do_lock option is used to enable and
@@ -88,6 +104,11 @@ def load_entity_map(configuration, kind, do_lock, caching):
     the main version if no cached version exists.
     """
     _logger = configuration.logger
+    if _use_entity_db(configuration):
+        # NOTE: the db handles concurrency itself and never blocks readers
+        #       so neither locking nor the cached copy is needed here.
+        return load_entity_db(configuration, kind,
+                              _entity_map_sections(kind))
     map_path = os.path.join(configuration.mig_system_files, "%s.map" % kind)
     lock_path = os.path.join(configuration.mig_system_files, "%s.lock" % kind)
     cache_map_path = os.path.join(
@@ -175,11 +196,21 @@ def _load_entity_map_before_update(configuration, kind, flush):
 
 
 def _save_entity_map_after_update(configuration, kind, entity_map, map_stamp,
-                                  lock_handle):
+                                  lock_handle, dirty=None):
     """Helper to save entity map of given kind in the refresh process.
     With optional saving of cache if requested.
+    The optional dirty dictionary maps sections to lists of changed entity IDs
+    and is used to only write those entities with the db backend. All entities
+    are written if it is left unset.
     """
     _logger = configuration.logger
+    if _use_entity_db(configuration):
+        _logger.info("Saving %s map changes in db" % kind)
+        save_entity_db(configuration, kind, entity_map, dirty, map_stamp,
+                       _entity_map_sections(kind))
+        _logger.info("Saved %s map changes in db" % kind)
+        return True
+
     real_base = configuration.mig_system_files
     cache_base = configuration.mig_system_run
     map_path = os.path.join(real_base, "%s.map" % kind)
@@ -283,8 +314,12 @@ def refresh_user_map(configuration, clean=False):
         dirty += [user]
 
     if dirty:
+        changed = {FLAT_SECTION: dirty}
+        if clean:
+            changed = None
         _save_entity_map_after_update(
-            configuration, 'user', user_map, start_time, lock_handle)
+            configuration, 'user', user_map, start_time, lock_handle,
+            changed)
 
     last_refresh[USERS] = start_time
     release_file_lock(lock_handle)
@@ -351,8 +386,12 @@ def refresh_resource_map(configuration, clean=False):
         dirty += [res]
 
     if dirty:
+        changed = {FLAT_SECTION: dirty}
+        if clean:
+            changed = None
         _save_entity_map_after_update(
-            configuration, 'resource', resource_map, start_time, lock_handle)
+            configuration, 'resource', resource_map, start_time, lock_handle,
+            changed)
 
     last_refresh[RESOURCES] = start_time
     release_file_lock(lock_handle)
@@ -606,8 +645,16 @@ def refresh_vgrid_map(configuration, clean=False):
             vgrid_map[USERS][user][ALLOW] = allow
 
     if dirty:
+        # NOTE: participation updates also change users and resources that
+        #       were not dirty on their own.
+        changed = {USERS: dirty.get(USERS, []) + update_user,
+                   RESOURCES: dirty.get(RESOURCES, []) + update_res,
+                   VGRIDS: dirty.get(VGRIDS, [])}
+        if clean:
+            changed = None
         _save_entity_map_after_update(
-            configuration, 'vgrid', vgrid_map, start_time, lock_handle)
+            configuration, 'vgrid', vgrid_map, start_time, lock_handle,
+            changed)
 
     last_refresh[VGRIDS] = start_time
     release_file_lock(lock_handle)
@@ -763,6 +810,24 @@ def _get_entity_map(configuration, key, caching=False):
     return entity_map
 
 
+def _entity_db_lookup(configuration, key, caching=False):
+    """Check if lookups in the entity map with given last_X key can fetch just
+    the needed rows from the db backend instead of loading the full map. That
+    is the case with the db backend unless a recent full map is already kept
+    in memory or pending updates require a refresh through the full map.
+    """
+    if not _use_entity_db(configuration):
+        return False
+    if last_load[key] + MAP_CACHE_SECONDS > time.time():
+        return False
+    if caching:
+        return True
+    pending_helpers = {USERS: pending_users_update,
+                       RESOURCES: pending_resources_update,
+                       VGRIDS: pending_vgrids_update}
+    return not pending_helpers[key](configuration)
+
+
 def get_user_map(configuration, caching=False):
     """Returns the current map of users and their configurations.
     Automatically reuses any map loaded within the last MAP_CACHE_SECONDS for
@@ -853,7 +918,21 @@ def check_vgrid_access(configuration, client_id, vgrid_name, recursive=True,
     the vgrid module and should replace that one everywhere that only vgrid map
     (cached) lookups are needed.
     """
-    vgrid_access = [default_vgrid]
+    if _entity_db_lookup(configuration, VGRIDS, caching):
+        # Only fetch the vgrid and any parents it inherits participation from
+        lookup_vgrids = [vgrid_name]
+        if recursive:
+            lookup_vgrids += vgrid_list_parents(vgrid_name, configuration)
+        entries = load_entity_db_entries(configuration, 'vgrid',
+                                         lookup_vgrids, VGRIDS)
+        if not vgrid_name in entries:
+            return False
+        owners, members = [], []
+        for vgrid_entry in entries.values():
+            owners += vgrid_entry.get(OWNERS, [])
+            members += vgrid_entry.get(MEMBERS, [])
+        return vgrid_allowed(client_id, owners) or \
+            vgrid_allowed(client_id, members)
     vgrid_map = get_vgrid_map(configuration, recursive, caching)
     vgrid_entry = vgrid_map.get(VGRIDS, {}).get(
         vgrid_name, {OWNERS: [], MEMBERS: []})
@@ -926,7 +1005,6 @@ def user_allowed_res_confs(configuration, client_id, caching=False):
 
     vgrid_map = get_vgrid_map(configuration, caching=caching)
     vgrid_map_res = vgrid_map[RESOURCES]
-    resource_map = get_resource_map(configuration, caching)
 
     # Map only contains the raw resource names - anonymize as requested
 
@@ -938,6 +1016,7 @@ def user_allowed_res_confs(configuration, client_id, caching=False):
     # TODO: should we prefilter to ALLOWEXE+ALLOWSTORE+[default_vgrid]?
     #       like we do in user_allowed_res_units
 
+    shared_res = []
     for (res, res_data) in vgrid_map_res.items():
         # Gracefully update any legacy values
         res_data[ASSIGNEXE] = res_data.get(ASSIGNEXE, res_data[ASSIGN])
@@ -947,6 +1026,16 @@ def user_allowed_res_confs(configuration, client_id, caching=False):
         shared = [i for i in assignexe + assignstore if i in allowed_vgrids]
         if not shared:
             continue
+        shared_res.append(res)
+
+    # Only fetch the confs of shared resources if the db backend allows it
+
+    if _entity_db_lookup(configuration, RESOURCES, caching):
+        resource_map = load_entity_db_entries(configuration, 'resource',
+                                              shared_res)
+    else:
+        resource_map = get_resource_map(configuration, caching)
+    for res in shared_res:
         allowed[anon_map[res]] = resource_map.get(res, {CONF: {}})[CONF]
     return allowed
 
@@ -1321,6 +1410,38 @@ def is_vgrid_parent_placeholder(configuration, path, real_path, cache=None,
         return None
 
 
+def migrate_entity_map_to_db(configuration, kind):
+    """Copy the pickled entity map of given kind into the per-entity db
+    backend. Holds the exclusive map lock during migration to prevent
+    concurrent refresh from interfering. Returns the number of migrated
+    entities or -1 if the map could not be migrated.
+    """
+    _logger = configuration.logger
+    real_base = configuration.mig_system_files
+    map_path = os.path.join(real_base, "%s.map" % kind)
+    lock_path = os.path.join(real_base, "%s.lock" % kind)
+    lock_handle = acquire_file_lock(lock_path, exclusive=True)
+    try:
+        entity_map = load(map_path)
+        map_stamp = os.path.getmtime(map_path)
+    except Exception as exc:
+        _logger.error("could not load %s map for migration: %s" %
+                      (kind, exc))
+        release_file_lock(lock_handle)
+        return -1
+    sections = _entity_map_sections(kind)
+    if save_entity_db(configuration, kind, entity_map, None, map_stamp,
+                      sections):
+        if sections:
+            migrated = sum([len(entity_map.get(i, {})) for i in sections])
+        else:
+            migrated = len(entity_map)
+    else:
+        migrated = -1
+    release_file_lock(lock_handle)
+    return migrated
+
+
 def unmap_resource(configuration, res_id):
     """Remove res_id from resource and vgrid maps - simply force refresh"""
     mark_resource_modified(configuration, res_id)
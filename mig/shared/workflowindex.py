@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# workflowindex - secondary indexes on the workflow pattern and recipe maps
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Secondary indexes on the workflow pattern and recipe maps.
+
+The workflow maps in the workflows module are dictionaries mapping each
+workflow object file name to a dictionary with the loaded object under the
+CONF key. A WorkflowIndex keeps sets of map keys for each value of the
+persistence_id, vgrid, owner and name fields and for each of the input_paths
+of patterns. The candidates method uses them to narrow a query down to the
+map entries that can possibly match, so that only those need to be built and
+matched in full. The index is updated incrementally for the keys of changed
+map entries.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+from past.builtins import basestring
+
+# Map entry key holding the actual workflow object - must match workflows
+CONF = '__conf__'
+INDEX_FIELDS = ('persistence_id', 'vgrid', 'owner', 'name', 'input_paths')
+# Fields always checked for plain value equality in queries
+_EQUALITY_FIELDS = ('persistence_id', 'vgrid')
+
+
+class WorkflowIndex(object):
+    """Indexes on a workflow map"""
+
+    def __init__(self, workflow_map=None):
+        """Init index and build it for optional workflow_map"""
+        self.workflow_map = {}
+        self.indexes = dict([(field, {}) for field in INDEX_FIELDS])
+        # Keys of entries without a usable value for each field
+        self.missing = dict([(field, set()) for field in INDEX_FIELDS])
+        self.entries = {}
+        if workflow_map is not None:
+            self.rebuild(workflow_map)
+
+    def __len__(self):
+        """Number of indexed map entries"""
+        return len(self.entries)
+
+    def _field_values(self, workflow_conf, field):
+        """Extract list of index values for field from workflow_conf or None
+        if the field is missing or has an unexpected value type.
+        """
+        value = workflow_conf.get(field, None)
+        if isinstance(value, basestring):
+            return [value]
+        elif field == 'input_paths' and isinstance(value, list) and \
+                not [i for i in value if not isinstance(i, basestring)]:
+            return value
+        return None
+
+    def _index_entry(self, key, entry):
+        """Add map entry with key to all indexes"""
+        workflow_conf = entry.get(CONF, None)
+        if not isinstance(workflow_conf, dict):
+            workflow_conf = {}
+        fields = {}
+        for field in INDEX_FIELDS:
+            values = self._field_values(workflow_conf, field)
+            fields[field] = values
+            if values is None:
+                self.missing[field].add(key)
+                continue
+            field_index = self.indexes[field]
+            for value in values:
+                keys = field_index.get(value, None)
+                if keys is None:
+                    keys = field_index[value] = set()
+                keys.add(key)
+        self.entries[key] = fields
+
+    def _unindex_entry(self, key):
+        """Remove map entry with key from all indexes"""
+        fields = self.entries.pop(key, None)
+        if fields is None:
+            return
+        for (field, values) in fields.items():
+            if values is None:
+                self.missing[field].discard(key)
+                continue
+            field_index = self.indexes[field]
+            for value in values:
+                keys = field_index.get(value, None)
+                if keys is None:
+                    continue
+                keys.discard(key)
+                if not keys:
+                    del field_index[value]
+
+    def rebuild(self, workflow_map):
+        """Rebuild all indexes from workflow_map"""
+        self.workflow_map = workflow_map
+        self.indexes = dict([(field, {}) for field in INDEX_FIELDS])
+        self.missing = dict([(field, set()) for field in INDEX_FIELDS])
+        self.entries = {}
+        for (key, entry) in workflow_map.items():
+            self._index_entry(key, entry)
+
+    def update(self, workflow_map, keys):
+        """Reindex the entries with given keys from workflow_map and drop the
+        ones no longer in there. Falls back to a full rebuild if the indexed
+        keys then still differ from the ones in workflow_map.
+        """
+        self.workflow_map = workflow_map
+        for key in keys:
+            self._unindex_entry(key)
+            if key in workflow_map:
+                self._index_entry(key, workflow_map[key])
+        if len(self.entries) != len(workflow_map) or \
+                any(key not in self.entries for key in workflow_map):
+            self.rebuild(workflow_map)
+
+    def _lookup(self, field, value):
+        """Keys with value in field plus the ones we can't tell about"""
+        result = set(self.indexes[field].get(value, ()))
+        result.update(self.missing[field])
+        return result
+
+    def candidates(self, client_id=None, user_query=False, **kwargs):
+        """Returns list of map keys for entries that may match a query for
+        client_id with kwargs in workflow_match. The list is a superset of the
+        actual matches and follows the map order.
+        """
+        selected = None
+        lookups = []
+        if client_id:
+            lookups.append(('owner', client_id))
+        for field in _EQUALITY_FIELDS:
+            if isinstance(kwargs.get(field, None), basestring):
+                lookups.append((field, kwargs[field]))
+        # NOTE: user queries on persistence_id only compare that and vgrid
+        if not (user_query and 'persistence_id' in kwargs):
+            for field in ('owner', 'name'):
+                if isinstance(kwargs.get(field, None), basestring):
+                    lookups.append((field, kwargs[field]))
+            input_paths = kwargs.get('input_paths', None)
+            if isinstance(input_paths, list):
+                for path in input_paths:
+                    if isinstance(path, basestring):
+                        lookups.append(('input_paths', path))
+        for (field, value) in lookups:
+            keys = self._lookup(field, value)
+            if selected is None:
+                selected = keys
+            else:
+                selected &= keys
+            if not selected:
+                return []
+        if selected is None:
+            return list(self.workflow_map)
+        return [key for key in self.workflow_map if key in selected]
+
+
+def _synthetic_map(patterns, vgrids, owners, paths):
+    """Build a synthetic workflow pattern map for benchmarks"""
+    workflow_map = {}
+    for i in range(patterns):
+        persistence_id = 'wp%08d' % i
+        workflow_map[persistence_id] = {CONF: {
+            'object_type': 'workflowpattern',
+            'persistence_id': persistence_id,
+            'vgrid': 'vgrid%d' % (i % vgrids),
+            'owner': '/C=DK/CN=User %d' % (i % owners),
+            'name': 'pattern%d' % i,
+            'input_paths': ['in/%d/*.dat' % (i % paths)],
+            'input_file': 'input',
+            'output': {},
+            'recipes': [],
+            'variables': {},
+            'parameterize_over': {},
+        }}
+    return workflow_map
+
+
+def _scan_map(workflow_map, client_id=None, **kwargs):
+    """Linear scan like the workflows query for comparison"""
+    matches = []
+    for (key, entry) in workflow_map.items():
+        workflow_conf = entry[CONF]
+        if client_id and workflow_conf.get('owner', None) != client_id:
+            continue
+        match = True
+        for (field, value) in kwargs.items():
+            if isinstance(value, list):
+                if [i for i in value
+                        if i not in workflow_conf.get(field, [])]:
+                    match = False
+            elif workflow_conf.get(field, None) != value:
+                match = False
+        if match:
+            matches.append(key)
+    return matches
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    patterns = 10000
+    if sys.argv[1:]:
+        patterns = int(sys.argv[1])
+    rounds = 100
+    workflow_map = _synthetic_map(patterns, 50, 200, 500)
+    queries = [
+        ('owner', {'client_id': '/C=DK/CN=User 7'}),
+        ('vgrid', {'vgrid': 'vgrid3'}),
+        ('owner+vgrid', {'client_id': '/C=DK/CN=User 7', 'vgrid': 'vgrid7'}),
+        ('name', {'name': 'pattern%d' % (patterns // 2)}),
+        ('input path', {'input_paths': ['in/42/*.dat']}),
+    ]
+
+    before = time.time()
+    index = WorkflowIndex(workflow_map)
+    print("built index for %d patterns in %.3fs" % (len(index),
+                                                   time.time() - before))
+    for (title, query) in queries:
+        kwargs = dict(query)
+        client_id = kwargs.pop('client_id', None)
+        expected = _scan_map(workflow_map, client_id, **kwargs)
+        found = [key for key in index.candidates(client_id, **kwargs)
+                 if key in expected]
+        if found != expected:
+            print("index mismatch for %s query: %d vs %d" %
+                  (title, len(found), len(expected)))
+        before = time.time()
+        for _ in range(rounds):
+            _scan_map(workflow_map, client_id, **kwargs)
+        scan_time = (time.time() - before) / rounds
+        before = time.time()
+        for _ in range(rounds):
+            index.candidates(client_id, **kwargs)
+        index_time = (time.time() - before) / rounds
+        print("%s query with %d matches: scan %.6fs index %.6fs" %
+              (title, len(expected), scan_time, index_time))
+
+    changed = ['wp%08d' % i for i in range(0, patterns, patterns // 10 or 1)]
+    for key in changed:
+        workflow_map[key][CONF]['owner'] = '/C=DK/CN=Moved User'
+    before = time.time()
+    index.update(workflow_map, changed)
+    update_time = time.time() - before
+    before = time.time()
+    WorkflowIndex(workflow_map)
+    print("update of %d entries in %.6fs vs rebuild in %.6fs" %
+          (len(changed), update_time, time.time() - before))
@@ -27,6 +27,7 @@
 from __future__ import print_function
 from __future__ import absolute_import
 
+import copy
 import datetime
 import fcntl
 import os
@@ -46,7 +47,8 @@ from mig.shared.base import force_utf8_rec
 from mig.shared.conf import get_configuration_object
 from mig.shared.defaults import src_dst_sep, workflow_id_charset, \
     workflow_id_length, session_id_length, session_id_charset, default_vgrid, \
-    workflows_db_filename, workflows_db_lockfile, maxfill_fields
+    workflows_db_filename, workflows_db_lockfile, maxfill_fields, \
+    keyword_all, workflows_map_full_refresh_secs
 from mig.shared.fileio import delete_file, write_file, makedirs_rec, touch
 from mig.shared.map import load_system_map
 from mig.shared.modified import check_workflow_p_modified, \
@@ -63,6 +65,7 @@ from mig.shared.vgrid import vgrid_add_triggers, vgrid_remove_triggers, \
     vgrid_triggers, vgrid_set_triggers, init_vgrid_script_add_rem, \
     init_vgrid_script_list
 from mig.shared.vgridaccess import get_vgrid_map, VGRIDS, user_vgrid_access
+from mig.shared.workflowindex import WorkflowIndex
 
 
 WRITE_LOCK = 'write.lock'
@@ -88,6 +91,7 @@ MAP_CACHE_SECONDS = 60
 last_load = {WORKFLOW_PATTERNS: 0, WORKFLOW_RECIPES: 0}
 last_refresh = {WORKFLOW_PATTERNS: 0, WORKFLOW_RECIPES: 0}
 last_map = {WORKFLOW_PATTERNS: {}, WORKFLOW_RECIPES: {}}
+last_index = {WORKFLOW_PATTERNS: None, WORKFLOW_RECIPES: None}
 
 job_env_vars_map = {
     'PATH': 'ENV_WORKFLOW_INPUT_PATH',
@@ -1267,18 +1271,117 @@ def __load_wr(configuration, wr_path):
     return {}
 
 
+def __map_key(workflow_type=WORKFLOW_PATTERN):
+    """
+    Get the key used for the given workflow_type in the in-process map cache.
+    :param workflow_type: A MiG workflow type.
+    :return: (string) The last_map key of the given workflow_type.
+    """
+    if workflow_type == WORKFLOW_RECIPE:
+        return WORKFLOW_RECIPES
+    return WORKFLOW_PATTERNS
+
+
+def __map_name(workflow_type=WORKFLOW_PATTERN):
+    """
+    Get the system map name for the given workflow_type.
+    :param workflow_type: A MiG workflow type.
+    :return: (string) The name of the system map of the given workflow_type.
+    """
+    if workflow_type == WORKFLOW_RECIPE:
+        return 'workflowrecipes'
+    return 'workflowpatterns'
+
+
 def __load_map(configuration, workflow_type=WORKFLOW_PATTERN, do_lock=True):
     """
     Load map of workflow patterns. Uses a pickled dictionary for efficiency.
+    The map from the last load or refresh in this process is reused as long
+    as the map file on disk is unchanged since then.
     :param configuration: The MiG configuration object.
     :param workflow_type: A MiG workflow type.
     :param do_lock: [optional] enable and disable locking during load.
     :return: (dictionary) The system dictionary of the given workflow_type.
     """
+    if workflow_type not in WORKFLOW_CONSTRUCT_TYPES:
+        return None
+    map_key = __map_key(workflow_type)
+    map_name = __map_name(workflow_type)
+    map_path = os.path.join(configuration.mig_system_files, '%s.map'
+                            % map_name)
+    try:
+        map_stamp = os.path.getmtime(map_path)
+    except OSError:
+        map_stamp = -1
+    if last_map[map_key] and map_stamp == last_load[map_key]:
+        return (last_map[map_key], map_stamp)
+    workflow_map, map_stamp = load_system_map(configuration, map_name,
+                                              do_lock)
+    last_map[map_key] = workflow_map
+    last_load[map_key] = map_stamp
+    return (workflow_map, map_stamp)
+
+
+def __get_map_index(workflow_type, workflow_map):
+    """
+    Get the secondary indexes for workflow_map. The indexes of the map cached
+    in this process are reused and kept up to date by __refresh_map.
+    :param workflow_type: A MiG workflow type.
+    :param workflow_map: The system dictionary of the given workflow_type.
+    :return: (WorkflowIndex) The indexes on workflow_map.
+    """
+    map_key = __map_key(workflow_type)
+    index = last_index[map_key]
+    if index is None or index.workflow_map is not workflow_map:
+        index = WorkflowIndex(workflow_map)
+        if workflow_map is last_map[map_key]:
+            last_index[map_key] = index
+    return index
+
+
+def __load_workflow_file(configuration, workflow_type, workflow_path):
+    """
+    Load a single workflow object of workflow_type from workflow_path.
+    :param configuration: The MiG configuration object.
+    :param workflow_type: A MiG workflow type.
+    :param workflow_path: path to an expected workflow object.
+    :return: (dictionary) The loaded workflow object dict.
+    """
     if workflow_type == WORKFLOW_PATTERN:
-        return load_system_map(configuration, 'workflowpatterns', do_lock)
+        return __load_wp(configuration, workflow_path)
     elif workflow_type == WORKFLOW_RECIPE:
-        return load_system_map(configuration, 'workflowrecipes', do_lock)
+        return __load_wr(configuration, workflow_path)
+    return ''
+
+
+def __find_workflow_file(configuration, workflow_type, workflow_file,
+                         workflow_entry=None):
+    """
+    Find the path of a single workflow object file. The vgrid of any existing
+    map entry is checked first before looking through all vgrids.
+    :param configuration: The MiG configuration object.
+    :param workflow_type: A MiG workflow type.
+    :param workflow_file: The workflow object file name, i.e. persistence_id.
+    :param workflow_entry: [optional] The current map entry of the object.
+    :return: (string or None) The path of the workflow object file if found.
+    """
+    workflow_conf = (workflow_entry or {}).get(CONF, None)
+    vgrid_list = []
+    if isinstance(workflow_conf, dict) and workflow_conf.get('vgrid', None):
+        vgrid_list.append(workflow_conf['vgrid'])
+    vgrid_map = get_vgrid_map(configuration)
+    vgrid_list += [vgrid for vgrid in vgrid_map.get(VGRIDS, {})
+                   if vgrid not in vgrid_list]
+    if workflow_type == WORKFLOW_RECIPE:
+        home_name = configuration.workflows_vgrid_recipes_home
+    else:
+        home_name = configuration.workflows_vgrid_patterns_home
+    for vgrid in vgrid_list:
+        home = os.path.join(configuration.vgrid_home, vgrid, home_name)
+        workflow_path = os.path.join(home, workflow_file)
+        if os.path.isfile(workflow_path):
+            return workflow_path
+    return None
 
 
 def __refresh_map(configuration, workflow_type=WORKFLOW_PATTERN,
@@ -1287,10 +1390,15 @@ def __refresh_map(configuration, workflow_type=WORKFLOW_PATTERN,
     Refresh map of workflow objects. Uses a pickled dictionary for efficiency.
     Only update map for workflow objects that appeared, disappeared, or have
     changed after last map save.
+    If an existing map is refreshed with a list of specific modified objects
+    only those are looked up and reloaded. Otherwise, or if the last full
+    listing is more than workflows_map_full_refresh_secs old, all workflow
+    object files are listed to find the changes.
     NOTE: Save start time so that any concurrent updates get caught next time
     :param configuration: The MiG configuration object.
     :param workflow_type: A MiG workflow type.
-    :param client_id: [optional] A MiG user client. Default is None
+    :param client_id: [optional] A MiG user client. Default is None. The map
+    always covers the workflow objects of all vgrids.
     :param modified: [optional] A list of modified objects to be reload. Is
     required if several patterns and recipes are defined together, updates are
     not always loaded otherwise.
@@ -1300,73 +1408,96 @@ def __refresh_map(configuration, workflow_type=WORKFLOW_PATTERN,
     start_time = time.time()
     _logger.debug("WP: __refresh_map workflow_type: %s, start_time: %s"
                   % (workflow_type, start_time))
+    if modified is None:
+        modified = []
     dirty = []
 
-    map_path = ''
-    if workflow_type == WORKFLOW_PATTERN:
-        map_path = os.path.join(configuration.mig_system_files,
-                                'workflowpatterns.map')
-    elif workflow_type == WORKFLOW_RECIPE:
-        map_path = os.path.join(configuration.mig_system_files,
-                                'workflowrecipes.map')
+    map_key = __map_key(workflow_type)
+    map_path = os.path.join(configuration.mig_system_files, '%s.map'
+                            % __map_name(workflow_type))
     workflow_map = {}
     # Update the map from disk
     lock_path = map_path.replace('.map', '.lock')
+    # Time stamp of last full listing to catch changes not marked as modified
+    listed_path = map_path.replace('.map', '.listed')
     with open(lock_path, 'a') as lock_handle:
         fcntl.flock(lock_handle.fileno(), fcntl.LOCK_EX)
         workflow_map, map_stamp = __load_map(
             configuration, workflow_type, do_lock=False)
+        try:
+            listed_stamp = os.path.getmtime(listed_path)
+        except OSError:
+            listed_stamp = -1
+        listing_due = start_time - listed_stamp > \
+            workflows_map_full_refresh_secs
+
+        if workflow_map and modified and keyword_all not in modified \
+                and not listing_due:
+            # Only look up and reload the objects marked as modified
+            for workflow_file in set(modified):
+                workflow_path = __find_workflow_file(
+                    configuration, workflow_type, workflow_file,
+                    workflow_map.get(workflow_file, None))
+                if workflow_path is None:
+                    if workflow_file in workflow_map:
+                        del workflow_map[workflow_file]
+                        dirty.append(workflow_file)
+                    continue
+                workflow_object = __load_workflow_file(
+                    configuration, workflow_type, workflow_path)
+                workflow_map[workflow_file] = {CONF: workflow_object,
+                                               MODTIME: map_stamp}
+                dirty.append(workflow_file)
+        else:
+            # Find all workflow objects
+            all_objects = __list_path(configuration,
+                                      workflow_type=workflow_type)
 
-        # Find all workflow objects
-        all_objects = __list_path(configuration, workflow_type=workflow_type,
-                                  client_id=client_id)
-
-        for workflow_dir, workflow_file in all_objects:
-            workflow_map[workflow_file] = workflow_map.get(workflow_file, {})
-            wp_mtime = os.path.getmtime(os.path.join(workflow_dir,
-                                                     workflow_file))
-
-            # Cannot rely on mtime here, appears to be slight inconsistency in
-            # rounding mod times meaning >= does not match all the expected
-            # files if patterns and recipes are defined together.
-            if CONF not in workflow_map[workflow_file] \
-                    or wp_mtime >= map_stamp \
-                    or workflow_file in modified:
-                workflow_object = ''
-                if workflow_type == WORKFLOW_PATTERN:
-                    workflow_object = __load_wp(configuration,
-                                                os.path.join(workflow_dir,
-                                                             workflow_file))
-                elif workflow_type == WORKFLOW_RECIPE:
-                    workflow_object = __load_wr(configuration,
-                                                os.path.join(workflow_dir,
-                                                             workflow_file))
-                workflow_map[workflow_file][CONF] = workflow_object
-                workflow_map[workflow_file][MODTIME] = map_stamp
-                dirty.append([workflow_file])
-
-        # Remove any missing workflow patterns from map
-        missing_workflow = [workflow_file for workflow_file in
-                            workflow_map
-                            if workflow_file not in
-                            [_workflow_file for _workflow_path, _workflow_file
-                             in all_objects]]
-
-        for workflow_file in missing_workflow:
-            del workflow_map[workflow_file]
-            dirty.append([workflow_file])
+            for workflow_dir, workflow_file in all_objects:
+                workflow_map[workflow_file] = workflow_map.get(workflow_file,
+                                                               {})
+                wp_mtime = os.path.getmtime(os.path.join(workflow_dir,
+                                                         workflow_file))
+
+                # Cannot rely on mtime here, appears to be slight
+                # inconsistency in rounding mod times meaning >= does not
+                # match all the expected files if patterns and recipes are
+                # defined together.
+                if CONF not in workflow_map[workflow_file] \
+                        or wp_mtime >= map_stamp \
+                        or workflow_file in modified \
+                        or keyword_all in modified:
+                    workflow_object = __load_workflow_file(
+                        configuration, workflow_type,
+                        os.path.join(workflow_dir, workflow_file))
+                    workflow_map[workflow_file][CONF] = workflow_object
+                    workflow_map[workflow_file][MODTIME] = map_stamp
+                    dirty.append(workflow_file)
+
+            # Remove any missing workflow patterns from map
+            found = set([workflow_file for _, workflow_file in all_objects])
+            missing_workflow = [workflow_file for workflow_file in
+                                workflow_map if workflow_file not in found]
+
+            for workflow_file in missing_workflow:
+                del workflow_map[workflow_file]
+                dirty.append(workflow_file)
+            touch(listed_path, configuration, start_time)
 
         if dirty:
+            index = last_index[map_key]
+            if index is not None and index.workflow_map is workflow_map:
+                index.update(workflow_map, dirty)
             try:
                 dump(workflow_map, map_path)
                 os.utime(map_path, (start_time, start_time))
+                map_stamp = start_time
                 _logger.debug('Accessed map and updated to %.10f' % start_time)
             except Exception as err:
                 _logger.error('Workflows: could not save map, or %s' % err)
-        if workflow_type == WORKFLOW_PATTERN:
-            last_refresh[WORKFLOW_PATTERNS] = start_time
-        elif workflow_type == WORKFLOW_RECIPE:
-            last_refresh[WORKFLOW_RECIPES] = start_time
+        last_map[map_key] = workflow_map
+        last_load[map_key] = map_stamp
+        last_refresh[map_key] = start_time
         fcntl.flock(lock_handle, fcntl.LOCK_UN)
     return workflow_map
 
@@ -1439,32 +1570,42 @@ def __query_workflow_map(configuration, client_id=None, first=False,
     _logger.debug('__query_workflow_map, client_id: %s, '
                   'workflow_type: %s, kwargs: %s' % (client_id, workflow_type,
                                                      kwargs))
-    workflow_map = None
-    if workflow_type == WORKFLOW_PATTERN:
-        workflow_map = get_wp_map(configuration, client_id=client_id)
-
-    if workflow_type == WORKFLOW_RECIPE:
-        workflow_map = get_wr_map(configuration, client_id=client_id)
-
-    if workflow_type == WORKFLOW_ANY:
-        # Load every type into workflow_map
-        workflow_map = get_wr_map(configuration, client_id=client_id)
-        workflow_map.update(get_wp_map(configuration, client_id=client_id))
-
-    if not workflow_map:
-        _logger.debug("WP: __query_workflow_map, empty map retrieved: '%s'"
-                      ", workflow_type: %s" % (workflow_map, workflow_type))
+    workflow_maps = []
+    if workflow_type in (WORKFLOW_RECIPE, WORKFLOW_ANY):
+        workflow_maps.append(
+            (WORKFLOW_RECIPE, get_wr_map(configuration, client_id=client_id)))
+    if workflow_type in (WORKFLOW_PATTERN, WORKFLOW_ANY):
+        workflow_maps.append(
+            (WORKFLOW_PATTERN, get_wp_map(configuration, client_id=client_id)))
+
+    if not [workflow_map for (_, workflow_map) in workflow_maps
+            if workflow_map]:
+        _logger.debug("WP: __query_workflow_map, empty map retrieved, "
+                      "workflow_type: %s" % workflow_type)
         if first:
             return None
         return []
 
+    # Narrow the search down to the entries that may match using the indexes
+    # on owner and the main kwargs fields. Pattern entries override recipe
+    # entries with the same key like when merging the maps.
+    candidates = []
+    for (map_type, workflow_map) in workflow_maps:
+        if not workflow_map:
+            continue
+        index = __get_map_index(map_type, workflow_map)
+        candidates = [(key, value) for (key, value) in candidates
+                      if key not in workflow_map]
+        candidates += [(key, workflow_map[key]) for key in
+                       index.candidates(client_id, user_query, **kwargs)]
+
     if client_id:
-        workflow_map = {key: value for key, value in workflow_map.items()
-                        if value.get(CONF, None) and 'owner' in value[CONF]
-                        and client_id == value[CONF]['owner']}
+        candidates = [(key, value) for (key, value) in candidates
+                      if value.get(CONF, None) and 'owner' in value[CONF]
+                      and client_id == value[CONF]['owner']]
 
     matches = []
-    for _, workflow in workflow_map.items():
+    for _, workflow in candidates:
         workflow_conf = workflow.get(CONF, None)
         if not workflow_conf:
             _logger.error('WP: __query_workflow_map, no configuration '
@@ -1472,11 +1613,12 @@ def __query_workflow_map(configuration, client_id=None, first=False,
                           'workflow %s' % workflow)
             continue
 
+        # NOTE: the map is cached in-process so never hand out shared parts
         workflow_obj = __build_workflow_object(
             configuration,
             user_query,
             workflow_conf['object_type'],
-            **workflow_conf
+            **copy.deepcopy(workflow_conf)
         )
         _logger.info("WP: __build_workflow_object result '%s'" % workflow_obj)
         if not workflow_obj:
@@ -1836,10 +1978,10 @@ def get_wp_map(configuration, client_id=None):
     _logger.info("get_wp_map - modified_patterns: %s " % modified_patterns)
 
     if modified_patterns:
-        map_stamp = time.time()
         workflow_p_map = __refresh_map(configuration, client_id=client_id,
                                        modified=modified_patterns)
         reset_workflow_p_modified(configuration)
+        map_stamp = last_load[WORKFLOW_PATTERNS]
     else:
         workflow_p_map, map_stamp = __load_map(configuration)
     last_map[WORKFLOW_PATTERNS] = workflow_p_map
@@ -1865,12 +2007,12 @@ def get_wr_map(configuration, client_id=None):
     _logger.info("get_wr_map - modified_recipes: %s " % modified_recipes)
 
     if modified_recipes:
-        map_stamp = time.time()
         workflow_r_map = __refresh_map(configuration,
                                        workflow_type=WORKFLOW_RECIPE,
                                        client_id=client_id,
                                        modified=modified_recipes)
         reset_workflow_r_modified(configuration)
+        map_stamp = last_load[WORKFLOW_RECIPES]
     else:
         workflow_r_map, map_stamp = __load_map(configuration,
                                                workflow_type=WORKFLOW_RECIPE)
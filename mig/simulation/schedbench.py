@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# schedbench - benchmark scheduling with and without resource index
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+# -- END_HEADER ---
+#
+
+"""Benchmark the schedule_filter pass of a simulated server with a
+heterogeneous resource pool. Runs the same scenario with the resource
+candidate index enabled and disabled and checks that both select the same
+targets.
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+
+import getopt
+import logging
+import random
+import sys
+import time
+
+from mig.simulation.server import Server
+from mig.shared.configuration import Configuration
+
+architectures = ['X86', 'AMD64', 'ARM', 'POWER']
+runtime_envs = ['PYTHON-3', 'POVRAY-3.6', 'MATLAB', 'R', 'JULIA', 'OCTAVE']
+
+
+def usage():
+    print('Usage:', sys.argv[0], '[OPTIONS]')
+    print('OPTIONS:')
+    print('\t-h/--help')
+    print('\t-c/--config path to MiGserver.conf')
+    print('\t-j/--jobs number of queued jobs')
+    print('\t-p/--passes number of schedule_filter passes')
+    print('\t-r/--resources number of resources')
+    print('\t-s/--seed random seed')
+
+
+def setup_server(config, resource_cnt, job_cnt, seed):
+    """Create a simulated server with resource_cnt resources of varying
+    capabilities and job_cnt queued jobs with matching requirements.
+    """
+    rand = random.Random(seed)
+    logger = logging.getLogger('schedbench')
+    logger.setLevel(logging.WARNING)
+    server = Server(config.mig_server_id, logger, config)
+    for i in range(resource_cnt):
+        res = {'RESOURCE_ID': 'resource-%d_0' % i,
+               'ARCHITECTURE': rand.choice(architectures),
+               'RUNTIMEENVIRONMENT': [(name, []) for name in
+                                      rand.sample(runtime_envs, 2)],
+               'CPUCOUNT': rand.choice([1, 4, 16, 64]),
+               'NODECOUNT': rand.choice([1, 2, 8]),
+               'MEMORY': rand.choice([1024, 8192, 65536]),
+               'DISK': rand.choice([10, 100, 1000]),
+               'CPUTIME': 86400,
+               'MINPRICE': "%s" % (42.0 + i / 3.0),
+               'VGRID': ['Generic'],
+               'ANONYMOUS': False}
+        res = server.scheduler.update_resources(res)
+        server.scheduler.update_seen(res)
+    for i in range(job_cnt):
+        server.submit('user-%d' % (i % 10), 60, "%s" % 1000.0,
+                      ['Generic'])
+        job = server.job_queue.get_job(i)
+        job['ARCHITECTURE'] = rand.choice(architectures)
+        job['RUNTIMEENVIRONMENT'] = rand.sample(runtime_envs, 1)
+        job['CPUCOUNT'] = rand.choice([1, 2, 8, 32])
+        job['MEMORY'] = rand.choice([512, 4096, 32768])
+        job['STATUS'] = 'QUEUED'
+    return server
+
+
+def run_passes(server, passes, use_index):
+    """Time passes rounds of schedule_filter for the first resource and
+    return the elapsed time and the resulting schedule targets.
+    """
+    scheduler = server.scheduler
+    scheduler.use_resource_index = use_index
+    res_conf = {'RESOURCE_ID': 'resource-0_0'}
+    qlen = server.job_queue.queue_length()
+    start = time.time()
+    for _ in range(passes):
+        for i in range(qlen):
+            scheduler.clear_schedule(server.job_queue.get_job(i))
+        scheduler.schedule_filter(res_conf)
+    elapsed = time.time() - start
+    targets = [server.job_queue.get_job(i)['SCHEDULE_TARGETS'] for i in
+               range(qlen)]
+    return (elapsed, targets)
+
+
+if __name__ == '__main__':
+    conf_path = 'MiGserver.conf'
+    resource_cnt = 500
+    job_cnt = 200
+    passes = 3
+    seed = 42
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 'hc:j:p:r:s:', [
+            'help',
+            'config=',
+            'jobs=',
+            'passes=',
+            'resources=',
+            'seed=',
+        ])
+    except getopt.GetoptError as err:
+        print('Error: ' + err.msg)
+        usage()
+        sys.exit(1)
+
+    for (opt, val) in opts:
+        if opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif opt in ('-c', '--config'):
+            conf_path = val
+        else:
+            try:
+                if opt in ('-j', '--jobs'):
+                    job_cnt = int(val)
+                elif opt in ('-p', '--passes'):
+                    passes = int(val)
+                elif opt in ('-r', '--resources'):
+                    resource_cnt = int(val)
+                elif opt in ('-s', '--seed'):
+                    seed = int(val)
+            except ValueError as err:
+                print('Error: invalid %s argument %s - expected integer'
+                      % (opt, val))
+                sys.exit(1)
+
+    config = Configuration(conf_path)
+    config.peers = {}
+
+    print('Scheduling %d jobs on %d resources in %d passes' %
+          (job_cnt, resource_cnt, passes))
+    results = {}
+    for use_index in (False, True):
+        server = setup_server(config, resource_cnt, job_cnt, seed)
+        results[use_index] = run_passes(server, passes, use_index)
+        print('%s: %.3fs per schedule_filter pass' %
+              (use_index and 'indexed' or 'full scan',
+               results[use_index][0] / passes))
+
+    if results[False][1] != results[True][1]:
+        print('Error: indexed scheduling picked different targets!')
+        sys.exit(1)
+    print('Speedup: %.1fx with identical schedule targets' %
+          (results[False][0] / max(results[True][0], 1e-9)))
@@ -36,9 +36,10 @@ from mig.shared.bailout import bailout_helper, crash_helper, compact_string
 from mig.shared.base import requested_backend, allow_script, \
     is_default_str_coding, force_default_str_coding_rec
 from mig.shared.defaults import download_block_size, default_fs_coding
-from mig.shared.conf import get_configuration_object
+from mig.shared.conf import get_cached_configuration_object
 from mig.shared.objecttypes import get_object_type_info
-from mig.shared.output import validate, format_output, dummy_main, reject_main
+from mig.shared.output import validate, format_output, dummy_main, \
+    reject_main, is_stream
 from mig.shared.safeinput import valid_backend_name, html_escape, InputException
 from mig.shared.scriptinput import fieldstorage_to_dict
 
@@ -242,7 +243,10 @@ def application(environ, start_response):
     if sys.version_info[0] < 3:
         sys.stdout = sys.stderr
 
-    configuration = get_configuration_object()
+    # NOTE: reuse parsed configuration from previous requests in this worker
+    #       unless the conf file changed since then. Parsing the full conf
+    #       on every single request is a significant part of request latency.
+    configuration = get_cached_configuration_object()
     _logger = configuration.logger
 
     # NOTE: replace default wsgi errors to apache error log with our own logs
@@ -368,7 +372,11 @@ def application(environ, start_response):
     # _logger.debug("formatted %s output to %s" % (backend, output_format))
     # _logger.debug("output:\n%s" % [output])
 
-    if output_format != 'file' and not is_default_str_coding(output):
+    # NOTE: streamed output is produced lazily while sending to the client
+    streamed = is_stream(output)
+
+    if not streamed and output_format != 'file' and \
+            not is_default_str_coding(output):
         _logger.error(
             "Formatted output is NOT on default str coding: %s" % [output[:100]])
         err_mark = '__****__'
@@ -386,8 +394,10 @@ def application(environ, start_response):
         _logger.error("WSGI %s output formatting failed" % output_format)
         output = 'Error: output could not be correctly delivered!'
 
-    content_length = len(output)
-    if not 'Content-Length' in dict(response_headers):
+    content_length = 0
+    if not streamed:
+        content_length = len(output)
+    if not streamed and not 'Content-Length' in dict(response_headers):
         # _logger.debug("WSGI adding explicit content length %s" % content_length)
         response_headers.append(('Content-Length', "%d" % content_length))
 
@@ -402,25 +412,36 @@ def application(environ, start_response):
         #       the problem for the exact same files. It seems wsgi has a limited
         #       output buffer, so we explicitly force significantly smaller chunks
         #       here as a workaround.
-        chunk_parts = 1
-        if content_length > download_block_size:
-            chunk_parts = content_length // download_block_size
-            if content_length % download_block_size != 0:
-                chunk_parts += 1
-            _logger.info("WSGI %s yielding %d output parts (%db)" %
-                         (backend, chunk_parts, content_length))
-        # _logger.debug("send chunked %r response to client" % backend)
-        for i in xrange(chunk_parts):
-            # _logger.debug("WSGI %s yielding part %d / %d output parts" %
-            #              (backend, i+1, chunk_parts))
-            # end index may be after end of content - but no problem
-            part = output[i*download_block_size:(i+1)*download_block_size]
-            yield part
-        if chunk_parts > 1:
-            _logger.info("WSGI %s finished yielding all %d output parts" %
-                         (backend, chunk_parts))
-        _logger.debug("done sending %d chunk(s) of %r response to client" %
-                      (chunk_parts, backend))
+        if streamed:
+            chunk_parts = 0
+            # NOTE: stream chunks are usually small but split any huge ones
+            for chunk in output:
+                for offset in range(0, len(chunk), download_block_size):
+                    yield chunk[offset:offset+download_block_size]
+                    chunk_parts += 1
+                content_length += len(chunk)
+            _logger.debug("done streaming %d chunk(s) of %r response (%db)" %
+                          (chunk_parts, backend, content_length))
+        else:
+            chunk_parts = 1
+            if content_length > download_block_size:
+                chunk_parts = content_length // download_block_size
+                if content_length % download_block_size != 0:
+                    chunk_parts += 1
+                _logger.info("WSGI %s yielding %d output parts (%db)" %
+                             (backend, chunk_parts, content_length))
+            # _logger.debug("send chunked %r response to client" % backend)
+            for i in xrange(chunk_parts):
+                # _logger.debug("WSGI %s yielding part %d / %d output parts" %
+                #              (backend, i+1, chunk_parts))
+                # end index may be after end of content - but no problem
+                part = output[i*download_block_size:(i+1)*download_block_size]
+                yield part
+            if chunk_parts > 1:
+                _logger.info("WSGI %s finished yielding all %d output parts" %
+                             (backend, chunk_parts))
+            _logger.debug("done sending %d chunk(s) of %r response to client" %
+                          (chunk_parts, backend))
     except IOError as ioe:
         _logger.warning("WSGI %s for %s could not deliver output: %s" %
                         (backend, client_id, ioe))
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_server_grid_notify - unit test of the corresponding mig server
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test grid_notify delivery against a local SMTP stand-in"""
+
+import os
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.server import grid_notify
+from mig.server.grid_notify import deliver_notifications, \
+    cleanup_notify_home, recv_spool_segment
+from mig.shared.notification import SMTPSession
+from mig.shared.notifyspool import NotifySpool, encode_notification
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of the SMTP protocol for smtplib to deliver messages"""
+
+    def reply(self, line):
+        self.wfile.write(('%s\r\n' % line).encode('ascii'))
+
+    def handle(self):
+        self.server.connects += 1
+        self.reply('220 localhost fake smtp')
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.decode('utf8', 'replace').rstrip('\r\n')
+            if in_data:
+                if line == '.':
+                    in_data = False
+                    with self.server.lock:
+                        self.server.messages += 1
+                    self.reply('250 queued')
+                continue
+            command = line[:4].upper()
+            if command == 'EHLO':
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                in_data = True
+                self.reply('354 go ahead')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                break
+            else:
+                self.reply('250 ok')
+
+
+class FakeSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Local SMTP stand-in counting connections and messages"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        socketserver.TCPServer.__init__(self, ('127.0.0.1', 0),
+                                        FakeSMTPHandler)
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.messages = 0
+
+
+class FakeNotifyConfiguration(object):
+    """The configuration values used in notification delivery"""
+
+    def __init__(self, logger, smtp_server, workers, session_messages):
+        self.logger = logger
+        self.smtp_server = smtp_server
+        self.smtp_sender = 'MiG Server <mig@localhost>'
+        self.smtp_reply_to = ''
+        self.smtp_send_as_user = False
+        self.site_gpg_passphrase = None
+        self.site_notify_smtp_workers = workers
+        self.site_notify_smtp_session_messages = session_messages
+
+
+class MigServerGridNotify(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigServerGridNotify, self).setUp()
+        self.smtp = FakeSMTPServer()
+        self.smtp_thread = threading.Thread(target=self.smtp.serve_forever)
+        self.smtp_thread.daemon = True
+        self.smtp_thread.start()
+        self.smtp_address = '127.0.0.1:%d' % self.smtp.server_address[1]
+
+    def tearDown(self):
+        self.smtp.shutdown()
+        self.smtp.server_close()
+        super(MigServerGridNotify, self).tearDown()
+
+    def test_session_reuses_and_recycles_connection(self):
+        configuration = FakeNotifyConfiguration(self.logger,
+                                                self.smtp_address, 1, 2)
+        session = SMTPSession(configuration, max_messages=2)
+        for i in range(5):
+            errors = session.sendmail('mig@localhost', ['user@localhost'],
+                                      'Subject: test %d\r\n\r\nbody' % i)
+            self.assertEqual(errors, {})
+        session.close()
+        self.assertEqual(session.messages, 5)
+        self.assertEqual(session.connects, 3)
+        self.assertEqual(self.smtp.messages, 5)
+
+    def test_deliver_notifications_with_worker_pool(self):
+        configuration = FakeNotifyConfiguration(self.logger,
+                                                self.smtp_address, 3, 100)
+        outgoing = [('/CN=user %d' % i, 'User %d <user%d@localhost>' % (i, i),
+                     'notification', 'Found 1 new events', 1)
+                    for i in range(20)]
+        notified = deliver_notifications(configuration, outgoing)
+        self.assertEqual(sorted(notified), sorted([i[0] for i in outgoing]))
+        self.assertEqual(self.smtp.messages, 20)
+        self.assertTrue(self.smtp.connects <= 3)
+
+    def test_spool_segment_removed_after_delivery(self):
+        configuration = FakeNotifyConfiguration(self.logger,
+                                                self.smtp_address, 1, 100)
+        configuration.user_home = temppath('user_home', self)
+        configuration.notify_home = temppath('notify_home', self)
+        os.makedirs(configuration.notify_home)
+        for state in (grid_notify.received_notifications,
+                      grid_notify.spool_offsets, grid_notify.spool_refs,
+                      grid_notify.spool_saved):
+            self.addCleanup(state.clear)
+        (alice, bob) = ['/CN=%s/emailAddress=%s@localhost' % (i, i) for i in
+                        ('alice', 'bob')]
+        spool = NotifySpool(configuration.notify_home)
+        spool.append([encode_notification(alice, ['SFTP'], 'failed login'),
+                      encode_notification(alice, ['SFTP'], 'failed login'),
+                      encode_notification(bob, ['DAVS'], 'failed login')])
+        spool.close()
+        segment_path = spool.segment_path
+
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+
+        received = grid_notify.received_notifications
+        self.assertEqual(received[alice]['messages'],
+                         {'SFTP': {'failed login': 2}})
+        self.assertEqual(received[bob]['messages'],
+                         {'DAVS': {'failed login': 1}})
+        old = time.time() - 3600
+        os.utime(segment_path, (old, old))
+        cleanup_notify_home(configuration, notified_users=[alice])
+        self.assertTrue(os.path.exists(segment_path))
+        cleanup_notify_home(configuration, notified_users=[bob])
+        self.assertFalse(os.path.exists(segment_path))
+        self.assertEqual(grid_notify.spool_offsets, {})
+        # Notifications only from segments are no reason to complain
+        self.assertEqual(self.logger.channels_dict['error'], [])
+
+    def test_spool_segment_resumed_after_restart(self):
+        configuration = FakeNotifyConfiguration(self.logger,
+                                                self.smtp_address, 1, 100)
+        configuration.user_home = temppath('user_home', self)
+        configuration.notify_home = temppath('notify_home', self)
+        os.makedirs(configuration.notify_home)
+        states = (grid_notify.received_notifications,
+                  grid_notify.spool_offsets, grid_notify.spool_refs,
+                  grid_notify.spool_saved)
+        for state in states:
+            self.addCleanup(state.clear)
+        (alice, bob) = ['/CN=%s/emailAddress=%s@localhost' % (i, i) for i in
+                        ('alice', 'bob')]
+        spool = NotifySpool(configuration.notify_home)
+        spool.append([encode_notification(alice, ['SFTP'], 'failed login'),
+                      encode_notification(bob, ['DAVS'], 'failed login'),
+                      encode_notification(alice, ['SFTP'], 'failed login')])
+        spool.close()
+        segment_path = spool.segment_path
+
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+        cleanup_notify_home(configuration, notified_users=[alice])
+        for state in states:
+            state.clear()
+
+        # Only notifications from the first undelivered one are read again
+        # and thus the delivered one after it is sent twice
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+        received = grid_notify.received_notifications
+        self.assertEqual(received[bob]['messages'],
+                         {'DAVS': {'failed login': 1}})
+        self.assertEqual(received[alice]['messages'],
+                         {'SFTP': {'failed login': 1}})
+        cleanup_notify_home(configuration, notified_users=[alice, bob])
+        for state in states:
+            state.clear()
+
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+        self.assertEqual(grid_notify.received_notifications, {})
+        self.assertTrue(os.path.exists(segment_path))
+
+    def test_stale_spool_segment_with_torn_tail_removed(self):
+        configuration = FakeNotifyConfiguration(self.logger,
+                                                self.smtp_address, 1, 100)
+        configuration.user_home = temppath('user_home', self)
+        configuration.notify_home = temppath('notify_home', self)
+        os.makedirs(configuration.notify_home)
+        for state in (grid_notify.received_notifications,
+                      grid_notify.spool_offsets, grid_notify.spool_refs,
+                      grid_notify.spool_saved):
+            self.addCleanup(state.clear)
+        alice = '/CN=alice/emailAddress=alice@localhost'
+        spool = NotifySpool(configuration.notify_home)
+        spool.append([encode_notification(alice, ['SFTP'], 'failed login'),
+                      encode_notification(alice, ['SFTP'], 'torn')[:9]])
+        spool.close()
+        segment_path = spool.segment_path
+        old = time.time() - 3600
+        os.utime(segment_path, (old, old))
+
+        self.assertTrue(recv_spool_segment(configuration, segment_path))
+        cleanup_notify_home(configuration, notified_users=[alice])
+        self.assertFalse(os.path.exists(segment_path))
+        self.assertEqual(grid_notify.spool_offsets, {})
+        self.assertEqual(len(self.logger.channels_dict['warning']), 1)
+
+
+if __name__ == '__main__':
+    testmain()
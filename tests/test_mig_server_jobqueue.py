@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_server_jobqueue - unit test of the corresponding mig server module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test job queue functions"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.server.jobqueue import JobQueue
+from mig.shared.serial import dumps, loads
+
+
+def make_job(num, owner='alice', vgrid='Generic'):
+    """Create a minimal job dictionary"""
+    return {'JOB_ID': 'job%d' % num, 'USER_CERT': owner, 'VGRID': [vgrid]}
+
+
+class MigServerJobqueue(MigTestCase):
+    """Coverage of the indexed job queue"""
+
+    def setUp(self):
+        super(MigServerJobqueue, self).setUp()
+        self.job_queue = JobQueue(self.logger)
+
+    def assertQueueJobs(self, expected_ids):
+        qlen = self.job_queue.queue_length()
+        found_ids = [self.job_queue.get_job(i)['JOB_ID'] for i in range(qlen)]
+        self.assertEqual(found_ids, expected_ids)
+        for job_id in expected_ids:
+            self.assertTrue(self.job_queue.has_job(job_id))
+
+    def test_enqueue_rejects_duplicate(self):
+        self.assertTrue(self.job_queue.enqueue_job(make_job(1), 0))
+        self.assertFalse(self.job_queue.enqueue_job(make_job(1), 1))
+        self.assertEqual(self.job_queue.queue_length(), 1)
+
+    def test_lookup_by_id_owner_and_vgrid(self):
+        for i in range(6):
+            self.job_queue.enqueue_job(make_job(i, 'user%d' % (i % 2),
+                                                'vgrid%d' % (i % 3)),
+                                       self.job_queue.queue_length())
+        self.assertEqual(self.job_queue.get_job_by_id('job4')['JOB_ID'],
+                         'job4')
+        owned = [j['JOB_ID'] for j in self.job_queue.get_jobs_by_owner(
+            'user1')]
+        self.assertEqual(sorted(owned), ['job1', 'job3', 'job5'])
+        in_vgrid = [j['JOB_ID'] for j in self.job_queue.get_jobs_by_vgrid(
+            'vgrid0')]
+        self.assertEqual(sorted(in_vgrid), ['job0', 'job3'])
+        self.job_queue.dequeue_job_by_id('job3')
+        in_vgrid = [j['JOB_ID'] for j in self.job_queue.get_jobs_by_vgrid(
+            'vgrid0')]
+        self.assertEqual(in_vgrid, ['job0'])
+
+    def test_mixed_operations_keep_order(self):
+        expected = []
+        rand = random.Random(42)
+        for i in range(500):
+            action = rand.randint(0, 3)
+            if action == 0 or not expected:
+                index = rand.randint(0, len(expected))
+                self.job_queue.enqueue_job(make_job(i), index)
+                expected.insert(index, 'job%d' % i)
+            elif action == 1:
+                job_id = rand.choice(expected)
+                job = self.job_queue.dequeue_job_by_id(job_id)
+                self.assertEqual(job['JOB_ID'], job_id)
+                expected.remove(job_id)
+            elif action == 2:
+                index = rand.randint(0, len(expected) - 1)
+                job = self.job_queue.dequeue_job(index)
+                self.assertEqual(job['JOB_ID'], expected.pop(index))
+            else:
+                self.job_queue.enqueue_job(make_job(i),
+                                           self.job_queue.queue_length())
+                expected.append('job%d' % i)
+            self.assertEqual(self.job_queue.queue_length(), len(expected))
+        self.assertQueueJobs(expected)
+
+    def test_get_job_leaves_tombstones_alone(self):
+        for i in range(6):
+            self.job_queue.enqueue_job(make_job(i), i)
+        self.job_queue.dequeue_job_by_id('job2')
+        state = (list(self.job_queue.queue), self.job_queue.head,
+                 self.job_queue.tombstones, dict(self.job_queue.positions))
+
+        self.assertEqual(self.job_queue.get_job(2)['JOB_ID'], 'job3')
+        self.assertEqual(self.job_queue.get_job(-1)['JOB_ID'], 'job5')
+        self.assertEqual((list(self.job_queue.queue), self.job_queue.head,
+                          self.job_queue.tombstones,
+                          dict(self.job_queue.positions)), state)
+        self.assertEqual(self.job_queue.dequeue_job_by_id('job4')['JOB_ID'],
+                         'job4')
+        self.assertQueueJobs(['job0', 'job1', 'job3', 'job5'])
+
+    def test_restore_legacy_pickled_queue(self):
+        for i in range(3):
+            self.job_queue.enqueue_job(make_job(i), i)
+        legacy_state = {'queue': list(self.job_queue.queue), 'logger': None}
+        legacy_queue = JobQueue.__new__(JobQueue)
+        legacy_queue.__dict__.update(legacy_state)
+        self.job_queue = loads(dumps(legacy_queue))
+        self.job_queue.logger = self.logger
+
+        self.assertQueueJobs(['job0', 'job1', 'job2'])
+        self.assertEqual(self.job_queue.dequeue_job_by_id('job1')['JOB_ID'],
+                         'job1')
+        self.assertQueueJobs(['job0', 'job2'])
+
+
+if __name__ == '__main__':
+    testmain()
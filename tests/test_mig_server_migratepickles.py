@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_server_migratepickles - unit test of the corresponding mig server module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test migratepickles functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.server.migratepickles import migrate_pickle, pickle_protocol
+from mig.shared.serial import dumps
+
+TEST_OBJECT = {'JOB_ID': 'job1', 'CPUTIME': 60, 'EXECUTE': ['uname -a']}
+
+
+class MigServerMigratePickles(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def test_detect_all_protocols(self):
+        for protocol in range(3):
+            self.assertEqual(pickle_protocol(dumps(TEST_OBJECT, protocol)),
+                             protocol)
+
+    def test_protocol_1_pickle_not_rewritten_again(self):
+        pickle_path = temppath('protocol1.pck', self)
+        with open(pickle_path, 'wb') as pickle_fd:
+            pickle_fd.write(dumps(TEST_OBJECT, 0))
+
+        self.assertTrue(migrate_pickle(pickle_path, 1)['migrated'])
+        stats = migrate_pickle(pickle_path, 1)
+        self.assertEqual(stats['old_protocol'], 1)
+        self.assertFalse(stats['migrated'])
+
+
+if __name__ == '__main__':
+    testmain()
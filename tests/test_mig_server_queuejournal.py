@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_server_queuejournal - unit test of the corresponding mig server module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test queue journal functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.server.jobqueue import JobQueue
+from mig.server.queuejournal import QueueJournal
+
+
+def make_job(num, status='QUEUED'):
+    """Create a minimal job dictionary"""
+    return {'JOB_ID': 'job%d' % num, 'USER_CERT': 'alice',
+            'VGRID': ['Generic'], 'STATUS': status}
+
+
+class MigServerQueuejournal(MigTestCase):
+    """Coverage of the job queue journal"""
+
+    def setUp(self):
+        super(MigServerQueuejournal, self).setUp()
+        self.state_dir = temppath('queuejournal', self)
+        os.makedirs(self.state_dir)
+        self.journal = QueueJournal(self.state_dir, self.logger,
+                                    snapshot_interval=5)
+        self.job_queue = JobQueue(self.logger)
+        self.executing_queue = JobQueue(self.logger)
+        self.journal.attach('job_queue', self.job_queue)
+        self.journal.attach('executing_queue', self.executing_queue)
+
+    def tearDown(self):
+        self.journal.close()
+        super(MigServerQueuejournal, self).tearDown()
+
+    def _queue_ids(self, queue):
+        return [queue.get_job(i)['JOB_ID'] for i in
+                range(queue.queue_length())]
+
+    def test_recover_snapshot_and_journal_tail(self):
+        for i in range(4):
+            self.job_queue.enqueue_job(make_job(i), i)
+        # The fifth record triggers a snapshot and the rest go in the tail
+        self.job_queue.enqueue_job(make_job(4), 0)
+        job = self.job_queue.dequeue_job_by_id('job2')
+        job['STATUS'] = 'EXECUTING'
+        self.executing_queue.enqueue_job(job, 0)
+        self.journal.close()
+
+        queues = QueueJournal(self.state_dir, self.logger).recover()
+
+        self.assertEqual(self._queue_ids(queues['job_queue']),
+                         ['job4', 'job0', 'job1', 'job3'])
+        self.assertEqual(self._queue_ids(queues['executing_queue']),
+                         ['job2'])
+        self.assertEqual(
+            queues['executing_queue'].get_job_by_id('job2')['STATUS'],
+            'EXECUTING')
+
+    def test_recover_frozen_job_status(self):
+        self.journal.snapshot_interval = 100
+        for i in range(2):
+            self.job_queue.enqueue_job(make_job(i), i)
+        self.journal.snapshot()
+        job = self.job_queue.get_job_by_id('job1')
+        job['STATUS'] = 'FROZEN'
+        self.assertTrue(self.job_queue.update_job(job))
+        self.journal.close()
+
+        queues = QueueJournal(self.state_dir, self.logger).recover()
+
+        self.assertEqual(self._queue_ids(queues['job_queue']),
+                         ['job0', 'job1'])
+        self.assertEqual(queues['job_queue'].get_job_by_id('job1')['STATUS'],
+                         'FROZEN')
+        self.assertEqual(queues['job_queue'].get_job_by_id('job0')['STATUS'],
+                         'QUEUED')
+
+    def test_recover_ignores_torn_tail(self):
+        self.job_queue.enqueue_job(make_job(0), 0)
+        self.job_queue.enqueue_job(make_job(1), 1)
+        self.journal.close()
+        journal_size = os.path.getsize(self.journal.journal_path)
+        with open(self.journal.journal_path, 'ab') as journal_fd:
+            journal_fd.write(b'\x00\x00\x01\x00partial')
+
+        queues = QueueJournal(self.state_dir, self.logger).recover()
+
+        self.assertEqual(self._queue_ids(queues['job_queue']),
+                         ['job0', 'job1'])
+        self.assertEqual(os.path.getsize(self.journal.journal_path),
+                         journal_size)
+
+    def test_recover_without_state(self):
+        self.assertIsNone(QueueJournal(self.state_dir, self.logger).recover())
+
+
+if __name__ == '__main__':
+    testmain()
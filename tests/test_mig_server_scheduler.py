@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_server_scheduler - unit test of the corresponding mig server module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test scheduler resource candidate index"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.server.scheduler import Scheduler
+
+
+class FakeSchedulerConfiguration(object):
+    """The few configuration values used by the scheduler itself"""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.expire_after = 86400
+        self.expire_peer = 600
+        self.mig_server_id = 'localhost'
+        self.server_fqdn = 'localhost'
+        self.peers = {}
+
+
+def make_resource(num, arch, res_envs, vgrids, nodes, memory):
+    """Create a minimal local resource configuration"""
+    return {'RESOURCE_ID': 'res%d_0' % num, 'ARCHITECTURE': arch,
+            'RUNTIMEENVIRONMENT': [(name, []) for name in res_envs],
+            'VGRID': vgrids, 'NODECOUNT': nodes, 'CPUCOUNT': 1,
+            'CPUTIME': 3600, 'DISK': 10, 'MEMORY': memory,
+            'MINPRICE': '1.0', 'SERVER': 'localhost', 'ANONYMOUS': False}
+
+
+def make_job(num, arch, res_envs, nodes, memory):
+    """Create a minimal job dictionary"""
+    return {'JOB_ID': 'job%d' % num, 'USER_CERT': 'alice',
+            'ARCHITECTURE': arch, 'RUNTIMEENVIRONMENT': res_envs,
+            'VGRID': ['Generic'], 'NODECOUNT': nodes, 'CPUCOUNT': 1,
+            'CPUTIME': 60, 'DISK': 1, 'MEMORY': memory}
+
+
+class MigServerScheduler(MigTestCase):
+    """Coverage of the scheduler resource candidate index"""
+
+    def setUp(self):
+        super(MigServerScheduler, self).setUp()
+        self.scheduler = Scheduler(self.logger,
+                                   FakeSchedulerConfiguration(self.logger))
+
+    def candidate_ids(self, job):
+        return [res_id for (res_id, _) in
+                self.scheduler.resource_candidates(job)]
+
+    def test_candidates_superset_of_fitting_resources(self):
+        rand = random.Random(42)
+        archs = ['X86', 'AMD64', 'ARM']
+        res_envs = ['PYTHON', 'POVRAY', 'MATLAB']
+        vgrids = [['Generic'], [''], ['Other'], []]
+        for i in range(60):
+            self.scheduler.update_resources(make_resource(
+                i, rand.choice(archs), rand.sample(res_envs, rand.randint(0, 2)),
+                rand.choice(vgrids), rand.randint(1, 16),
+                rand.choice([512, 1024, 4096, 'broken'])))
+        for i in range(40):
+            job = make_job(i, rand.choice(archs + ['']),
+                           rand.sample(res_envs, rand.randint(0, 2)),
+                           rand.randint(1, 16), rand.choice([256, 1024, 2048]))
+            candidates = self.candidate_ids(job)
+            fitting = [res_id for (res_id, res) in
+                       self.scheduler.resources.items() if
+                       self.scheduler.job_fits_resource(job, res)]
+            self.assertTrue(set(candidates).issuperset(fitting))
+
+    def test_index_follows_updates_and_removals(self):
+        job = make_job(1, 'X86', ['PYTHON'], 4, 1024)
+        self.scheduler.update_resources(make_resource(
+            1, 'X86', ['PYTHON'], ['Generic'], 8, 2048))
+        self.scheduler.update_resources(make_resource(
+            2, 'X86', ['PYTHON'], ['Generic'], 8, 2048))
+        self.assertEqual(self.candidate_ids(job), ['res1_0', 'res2_0'])
+        self.scheduler.update_resources(make_resource(
+            1, 'ARM', ['PYTHON'], ['Generic'], 8, 2048))
+        self.assertEqual(self.candidate_ids(job), ['res2_0'])
+        self.scheduler.update_resources(make_resource(
+            1, 'X86', ['PYTHON'], ['Generic'], 8, 2048))
+        self.assertEqual(self.candidate_ids(job), ['res1_0', 'res2_0'])
+        self.scheduler.remove_peer_resources('localhost',
+                                             self.scheduler.resources)
+        self.assertEqual(self.candidate_ids(job), [])
+
+    def test_index_resyncs_on_direct_resource_changes(self):
+        job = make_job(1, 'X86', [], 1, 1)
+        self.scheduler.update_resources(make_resource(
+            1, 'X86', [], ['Generic'], 1, 1))
+        self.scheduler.resources['res2_0'] = make_resource(
+            2, 'X86', [], ['Generic'], 1, 1)
+        self.assertEqual(self.candidate_ids(job), ['res1_0', 'res2_0'])
+
+    def test_index_disabled_returns_all(self):
+        job = make_job(1, 'ARM', [], 1, 1)
+        self.scheduler.update_resources(make_resource(
+            1, 'X86', [], ['Generic'], 1, 1))
+        self.assertEqual(self.candidate_ids(job), [])
+        self.scheduler.use_resource_index = False
+        self.assertEqual(self.candidate_ids(job), ['res1_0'])
+
+
+if __name__ == '__main__':
+    testmain()
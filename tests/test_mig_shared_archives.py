@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_archives - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test archives functions"""
+
+import io
+import os
+import sys
+import tarfile
+import unittest
+import zipfile
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.archives import stream_archive
+from mig.shared.base import client_id_dir
+
+TEST_CLIENT_ID = '/C=DK/ST=NA/L=NA/O=Test Org/OU=NA/CN=Test User/emailAddress=test@example.com'
+
+
+class FakeArchivesConfiguration(object):
+    """The configuration values used by the archive helpers"""
+
+    def __init__(self, logger, user_home):
+        self.logger = logger
+        self.user_home = user_home
+
+
+class MigSharedArchives__stream_archive(MigTestCase):
+    """Wrap unit tests for the streaming archive helper"""
+
+    def setUp(self):
+        super(MigSharedArchives__stream_archive, self).setUp()
+        user_home = temppath('archives', self)
+        self.configuration = FakeArchivesConfiguration(self.logger, user_home)
+        self.home_dir = os.path.join(user_home, client_id_dir(TEST_CLIENT_ID))
+        os.makedirs(os.path.join(self.home_dir, 'src', 'sub'))
+        os.makedirs(os.path.join(self.home_dir, 'src', 'empty'))
+        self.contents = {'src/data.bin': os.urandom(300000),
+                         'src/sub/notes.txt': b'some notes\n'}
+        for (name, data) in self.contents.items():
+            with open(os.path.join(self.home_dir, name), 'wb') as data_fd:
+                data_fd.write(data)
+
+    def _stream(self, dst, **kwargs):
+        """Collect streamed archive chunks"""
+        return list(stream_archive(self.configuration, TEST_CLIENT_ID,
+                                   ['src'], dst, **kwargs))
+
+    @unittest.skipIf(sys.version_info[0] < 3, "requires python 3")
+    def test_zip_stream_in_bounded_chunks(self):
+        chunks = self._stream('src.zip', chunk_size=65536)
+
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(max([len(chunk) for chunk in chunks[:-1]]) < 2 * 65536)
+        pack_file = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(pack_file.testzip())
+        self.assertIn('src/empty/', pack_file.namelist())
+        for (name, data) in self.contents.items():
+            self.assertEqual(pack_file.read(name), data)
+        self.assertFalse(os.path.exists(os.path.join(self.home_dir,
+                                                     'src.zip')))
+
+    def test_tar_gz_stream_and_save(self):
+        chunks = self._stream('src.tar.gz', save=True)
+
+        with open(os.path.join(self.home_dir, 'src.tar.gz'), 'rb') as tar_fd:
+            self.assertEqual(tar_fd.read(), b''.join(chunks))
+        pack_file = tarfile.open(fileobj=io.BytesIO(b''.join(chunks)))
+        for (name, data) in self.contents.items():
+            self.assertEqual(pack_file.extractfile(name).read(), data)
+
+    def test_aborted_stream_removes_saved_archive(self):
+        streamed = stream_archive(self.configuration, TEST_CLIENT_ID, ['src'],
+                                  'src.tar', save=True, chunk_size=1024,
+                                  max_buffers=1)
+        next(streamed)
+        streamed.close()
+
+        self.assertFalse(os.path.exists(os.path.join(self.home_dir,
+                                                     'src.tar')))
+
+    def test_unconsumed_stream_leaves_no_saved_archive(self):
+        streamed = stream_archive(self.configuration, TEST_CLIENT_ID, ['src'],
+                                  'src.tar', save=True)
+
+        self.assertFalse(os.path.exists(os.path.join(self.home_dir,
+                                                     'src.tar')))
+        streamed.close()
+
+    def test_save_to_missing_dir_raises(self):
+        with self.assertRaises(EnvironmentError):
+            stream_archive(self.configuration, TEST_CLIENT_ID, ['src'],
+                           'missing/src.tar', save=True)
+
+    def test_reject_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            stream_archive(self.configuration, TEST_CLIENT_ID, ['src'],
+                           'src.rar')
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_checksumcache - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test checksumcache functions"""
+
+import hashlib
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.checksumcache import ChecksumCache, checksum_files, \
+    _stat_key
+from mig.shared.fileio import checksum_file
+
+ALGOS = ['md5', 'sha256']
+
+
+class FakeChecksumConfiguration(object):
+    """The configuration values used by the checksum service"""
+
+    def __init__(self, logger, base_dir):
+        self.logger = logger
+        self.mig_system_files = base_dir
+
+
+class MigSharedChecksumCache(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedChecksumCache, self).setUp()
+        self.base_dir = temppath('checksumcache', self)
+        os.makedirs(self.base_dir)
+        self.configuration = FakeChecksumConfiguration(self.logger,
+                                                       self.base_dir)
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.base_dir, 'file-%d.txt' % i)
+            self._write(path, b'data %d\n' % i * (i + 1) * 1000)
+            self.paths.append(path)
+
+    def _write(self, path, data):
+        with open(path, 'wb') as data_fd:
+            data_fd.write(data)
+
+    def _expected(self, path, algo):
+        with open(path, 'rb') as data_fd:
+            return hashlib.new(algo, data_fd.read()).hexdigest()
+
+    def test_parallel_multi_algo_matches_plain(self):
+        results = checksum_files(self.configuration, self.paths, ALGOS,
+                                 max_chunks=-1, workers=3, cache=False)
+        for path in self.paths:
+            for algo in ALGOS:
+                self.assertEqual(results[path][algo],
+                                 self._expected(path, algo))
+        # Partial checksums keep the checksum_file format
+        results = checksum_files(self.configuration, self.paths[-1:], ALGOS,
+                                 chunk_size=1024, max_chunks=2, cache=False)
+        self.assertEqual(results[self.paths[-1]]['md5'],
+                         checksum_file(self.paths[-1], 'md5', 1024, 2))
+
+    def test_cache_hits_until_file_changes(self):
+        cache = ChecksumCache(self.configuration)
+        path = self.paths[0]
+        checksum_files(self.configuration, [path], ALGOS, cache=cache)
+        stat_key = _stat_key(path)
+        self.assertEqual(sorted(cache.lookup(stat_key, ALGOS, 0)), ALGOS)
+        # Cached values are returned without reading the file
+        cache.store(stat_key, {'md5': 'cached'}, 0)
+        results = checksum_files(self.configuration, [path], ['md5'],
+                                 cache=cache)
+        self.assertEqual(results[path]['md5'], 'cached')
+        # A new version of the file misses and replaces old entries
+        self._write(path, b'changed contents\n')
+        os.utime(path, (0, 0))
+        results = checksum_files(self.configuration, [path], ['md5'],
+                                 cache=cache)
+        self.assertEqual(results[path]['md5'], self._expected(path, 'md5'))
+        self.assertEqual(cache.lookup(stat_key, ALGOS, 0), {})
+        cache.close()
+
+
+if __name__ == '__main__':
+    testmain()
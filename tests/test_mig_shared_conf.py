@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_conf - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test conf functions"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, cleanpath, fixturepath, temppath, testmain
+
+from mig.shared.conf import get_cached_configuration_object, \
+    invalidate_configuration_cache
+
+DUMMY_SALT = '084528A93A4E0A40905609A729394F5C'
+
+
+class MigSharedConf__cached_configuration(MigTestCase):
+    """Coverage of the process-wide configuration cache"""
+
+    def setUp(self):
+        super(MigSharedConf__cached_configuration, self).setUp()
+        self._skip_logging = True
+        state_dir = temppath('conf/state', self, skip_clean=True)
+        cleanpath('conf', self)
+        os.makedirs(os.path.join(state_dir, 'log'))
+        with io.open(fixturepath('confs-stdlocal/MiGserver.conf')) as conf_fd:
+            conf_data = conf_fd.read()
+        conf_data = conf_data.replace('/home/mig/state', state_dir)
+        for name in ('DIGEST', 'CRYPTO'):
+            conf_data = conf_data.replace(
+                '000000000000000_TEST_%s_SALT' % name, DUMMY_SALT)
+        self.config_file = temppath('conf/MiGserver.conf', self,
+                                    skip_clean=True)
+        with io.open(self.config_file, 'w') as conf_fd:
+            conf_fd.write(conf_data)
+        invalidate_configuration_cache()
+
+    def tearDown(self):
+        invalidate_configuration_cache()
+        super(MigSharedConf__cached_configuration, self).tearDown()
+
+    def test_reuses_parsed_configuration(self):
+        first = get_cached_configuration_object(self.config_file, True)
+        second = get_cached_configuration_object(self.config_file, True)
+
+        self.assertIsNot(first, second)
+        self.assertIs(first.logger_obj, second.logger_obj)
+        self.assertEqual(first.mig_server_id, second.mig_server_id)
+
+    def test_attribute_changes_do_not_leak(self):
+        first = get_cached_configuration_object(self.config_file, True)
+        first.vgrids = ['leaked']
+        second = get_cached_configuration_object(self.config_file, True)
+
+        self.assertNotEqual(getattr(second, 'vgrids', None), ['leaked'])
+
+    def test_reloads_on_conf_change(self):
+        first = get_cached_configuration_object(self.config_file, True)
+        later = time.time() + 10
+        os.utime(self.config_file, (later, later))
+        second = get_cached_configuration_object(self.config_file, True)
+
+        self.assertIsNot(first.logger_obj, second.logger_obj)
+
+    def test_reloads_after_invalidate(self):
+        first = get_cached_configuration_object(self.config_file, True)
+        invalidate_configuration_cache(self.config_file)
+        second = get_cached_configuration_object(self.config_file, True)
+
+        self.assertIsNot(first.logger_obj, second.logger_obj)
+
+
+if __name__ == '__main__':
+    testmain()
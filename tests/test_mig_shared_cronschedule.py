@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_cronschedule - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test cronschedule functions"""
+
+import datetime
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.shared.cronschedule import CronSchedule
+
+CRONTAB_PATH = '/settings/user/crontab'
+ATJOBS_PATH = '/settings/user/atjobs'
+START = datetime.datetime(2024, 3, 4, 12, 0)
+
+
+def _cron_entry(minute, hour='*'):
+    """Crontab entry running ls at minute and hour"""
+    return {'minute': minute, 'hour': hour, 'dayofmonth': '*', 'month': '*',
+            'dayofweek': '*', 'command': ['ls'], 'run_as': 'user'}
+
+
+class MigSharedCronSchedule(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def _run_minutes(self, schedule, count):
+        """Pop due entries for count minutes from START"""
+        fired = []
+        for i in range(count):
+            tick = START + datetime.timedelta(minutes=i, seconds=5)
+            (due, _) = schedule.pop_due(tick)
+            fired += [(i, entry['minute']) for (_, entry) in due]
+        return fired
+
+    def test_crontab_entries_fire_and_reschedule(self):
+        schedule = CronSchedule()
+        schedule.set_crontab(CRONTAB_PATH, [_cron_entry('*/5'),
+                                            _cron_entry('7')], START)
+        self.assertEqual(len(schedule), 2)
+        self.assertEqual(schedule.next_fire(), START)
+        fired = self._run_minutes(schedule, 12)
+        self.assertEqual(fired, [(0, '*/5'), (5, '*/5'), (7, '7'),
+                                 (10, '*/5')])
+        self.assertEqual(len(schedule), 2)
+
+    def test_replace_and_atjobs(self):
+        schedule = CronSchedule()
+        schedule.set_crontab(CRONTAB_PATH, [_cron_entry('*')], START)
+        schedule.set_crontab(CRONTAB_PATH, [_cron_entry('3')], START)
+        at_entry = {'time_stamp': START + datetime.timedelta(minutes=1),
+                    'command': ['ls'], 'run_as': 'user', 'minute': 'at'}
+        schedule.set_atjobs(ATJOBS_PATH, [at_entry])
+        self.assertEqual(len(schedule), 2)
+        fired = self._run_minutes(schedule, 5)
+        self.assertEqual(fired, [(1, 'at'), (3, '3')])
+        self.assertEqual(len(schedule), 1)
+        schedule.remove(CRONTAB_PATH)
+        self.assertEqual(len(schedule), 0)
+        self.assertEqual(schedule.next_fire(), None)
+
+    def test_late_tick_reports_missed(self):
+        schedule = CronSchedule()
+        schedule.set_crontab(CRONTAB_PATH, [_cron_entry('1')], START)
+        (due, missed) = schedule.pop_due(START + datetime.timedelta(minutes=2))
+        self.assertEqual(due, [])
+        self.assertEqual([when for (_, _, when) in missed],
+                         [START + datetime.timedelta(minutes=1)])
+        self.assertEqual(schedule.next_fire(),
+                         START + datetime.timedelta(hours=1, minutes=1))
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_dircache - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test dircache functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.dircache import DirCache, scan_dir_tree
+
+
+class MigSharedDirCache(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedDirCache, self).setUp()
+        self.base_dir = temppath('dircache', self)
+        os.makedirs(self.base_dir)
+        self.db_path = os.path.join(self.base_dir, 'test.dir_cache.db')
+        self.dir_cache = DirCache(self.db_path, self.logger)
+
+    def tearDown(self):
+        self.dir_cache.close()
+        super(MigSharedDirCache, self).tearDown()
+
+    def test_remove_subtree_keeps_prefix_siblings(self):
+        self.dir_cache.set_many([('vgrid', 1.0), ('vgrid/data', 2.0),
+                                 ('vgrid/data/raw', 3.0),
+                                 ('vgrid/data-old', 4.0)])
+
+        self.dir_cache.remove('vgrid/data')
+
+        self.assertEqual(self.dir_cache.paths(), ['vgrid', 'vgrid/data-old'])
+
+    def test_subtree_paths_and_persistence(self):
+        self.dir_cache.set_mtime('vgrid', 1.0)
+        self.dir_cache.set_mtime('vgrid/a', 2.0)
+        self.dir_cache.set_mtime('vgrid/a/b', 3.0)
+        self.dir_cache.set_mtime('vgrid/ab', 4.0)
+        self.dir_cache.close()
+
+        reopened = DirCache(self.db_path, self.logger)
+        try:
+            self.assertEqual(reopened.paths('vgrid/a'),
+                             ['vgrid/a', 'vgrid/a/b'])
+            self.assertEqual(reopened.get_mtime('vgrid/a/b'), 3.0)
+            self.assertIsNone(reopened.get_mtime('vgrid/missing'))
+            self.assertEqual(len(reopened), 4)
+        finally:
+            reopened.close()
+
+    def test_utf8_bytes_and_native_paths_match(self):
+        self.dir_cache.set_mtime('vgrid/a', 1.0)
+        self.dir_cache.set_mtime(b'vgrid/a', 2.0)
+        self.dir_cache.set_many([(b'vgrid/a/b', 3.0)])
+
+        self.assertEqual(len(self.dir_cache), 2)
+        self.assertEqual(self.dir_cache.get_mtime(b'vgrid/a'), 2.0)
+        self.assertIn(b'vgrid/a/b', self.dir_cache)
+        self.assertEqual(self.dir_cache.paths(b'vgrid'),
+                         ['vgrid/a', 'vgrid/a/b'])
+        self.dir_cache.remove(b'vgrid')
+        self.assertEqual(len(self.dir_cache), 0)
+
+    def test_scan_dir_tree_in_parallel(self):
+        files_home = os.path.join(self.base_dir, 'vgrid_files_home')
+        for i in range(6):
+            os.makedirs(os.path.join(files_home, 'vgrid', 'top-%d' % i,
+                                     'sub'))
+        with open(os.path.join(files_home, 'vgrid', 'file.txt'), 'w') as fd:
+            fd.write('not a dir')
+
+        found = scan_dir_tree(self.dir_cache, files_home, 'vgrid', workers=3)
+
+        self.assertEqual(found, 13)
+        self.assertIn('vgrid', self.dir_cache)
+        self.assertIn('vgrid/top-5/sub', self.dir_cache)
+        self.assertNotIn('vgrid/file.txt', self.dir_cache)
+
+
+if __name__ == '__main__':
+    testmain()
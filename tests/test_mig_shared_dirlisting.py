@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_dirlisting - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test dirlisting functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.dirlisting import list_dir, entry_is_file, entry_stat
+from mig.shared.functionality.ls import handle_ls
+
+
+class FakeLsConfiguration(object):
+    """The configuration values used by plain ls listings"""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+
+class MigSharedDirlisting(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedDirlisting, self).setUp()
+        self.base_dir = temppath('dirlisting', self)
+        os.makedirs(os.path.join(self.base_dir, 'sub'))
+        for (name, size) in (('c.txt', 3), ('a.txt', 1), ('b.txt', 20),
+                             ('.hidden', 5)):
+            with open(os.path.join(self.base_dir, name), 'w') as data_fd:
+                data_fd.write('x' * size)
+        os.symlink('missing', os.path.join(self.base_dir, 'broken'))
+
+    def test_name_sorted_pages(self):
+        (total, first) = list_dir(self.base_dir, limit=2)
+        (_, rest) = list_dir(self.base_dir, offset=2, limit=10)
+
+        self.assertEqual(total, 5)
+        self.assertEqual([i.name for i in first + rest],
+                         ['a.txt', 'b.txt', 'broken', 'c.txt', 'sub'])
+        self.assertEqual([entry_is_file(i) for i in rest],
+                         [False, True, False])
+        self.assertIsNone(entry_stat(rest[0]))
+
+    def test_size_sorted_with_hidden(self):
+        (total, entries) = list_dir(self.base_dir, include_hidden=True,
+                                    sort_by='size', limit=4)
+
+        self.assertEqual(total, 6)
+        self.assertEqual([i.name for i in entries],
+                         ['broken', 'a.txt', 'c.txt', '.hidden'])
+
+    def test_handle_ls_page_with_file_info(self):
+        configuration = FakeLsConfiguration(self.logger)
+        listing, output_objects = [], []
+        page = {'sort': 'name', 'order': 'desc', 'offset': 0, 'limit': 2}
+
+        handle_ls(configuration, output_objects, listing,
+                  self.base_dir + os.sep, self.base_dir, 'f', 0, page)
+
+        self.assertEqual(output_objects, [])
+        self.assertEqual(page['total'], 5)
+        self.assertEqual([(i['name'], i['type']) for i in listing],
+                         [('sub', 'directory'), ('c.txt', 'file')])
+        self.assertEqual(listing[0]['file_info']['ext'], 'dir')
+        self.assertEqual(listing[1]['file_info']['size'], 3)
+        self.assertEqual(listing[1]['file_info']['ext'], 'txt')
+
+    def test_handle_ls_pages_only_visible_entries(self):
+        configuration = FakeLsConfiguration(self.logger)
+        open(os.path.join(self.base_dir, '.htaccess'), 'w').close()
+        listing, output_objects = [], []
+        page = {'sort': 'name', 'order': 'desc', 'offset': 5, 'limit': 1}
+
+        handle_ls(configuration, output_objects, listing,
+                  self.base_dir + os.sep, self.base_dir, 'a', 0, page)
+
+        self.assertEqual(output_objects, [])
+        self.assertEqual(page['total'], 6)
+        self.assertEqual([i['name'] for i in listing], ['.hidden'])
+
+    def test_handle_ls_page_of_file(self):
+        configuration = FakeLsConfiguration(self.logger)
+        listing, output_objects = [], []
+        page = {'sort': 'name', 'order': 'asc', 'offset': 0, 'limit': 2}
+
+        handle_ls(configuration, output_objects, listing,
+                  self.base_dir + os.sep,
+                  os.path.join(self.base_dir, 'a.txt'), '', 0, page)
+
+        self.assertEqual(page['total'], 1)
+        self.assertEqual([i['name'] for i in listing], ['a.txt'])
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_entitymapdb - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test entitymapdb functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.entitymapdb import FLAT_SECTION, load_entity_db, \
+    load_entity_db_entries, save_entity_db
+
+DUMMY_SECTIONS = ('__users__', '__vgrids__')
+
+
+class DummyConfiguration:
+    """Minimal configuration with the fields used in entitymapdb"""
+
+    def __init__(self, logger, mig_system_files):
+        self.logger = logger
+        self.mig_system_files = mig_system_files
+
+
+class MigSharedEntitymapdb(MigTestCase):
+    """Coverage of the per-entity map storage"""
+
+    def setUp(self):
+        super(MigSharedEntitymapdb, self).setUp()
+        system_files = temppath('entitymapdb', self)
+        os.makedirs(system_files)
+        self.configuration = DummyConfiguration(self.logger, system_files)
+
+    def test_load_missing_db(self):
+        (entity_map, map_stamp) = load_entity_db(self.configuration, 'user')
+
+        self.assertEqual(entity_map, {})
+        self.assertEqual(map_stamp, -1)
+
+    def test_flat_map_round_trip(self):
+        orig = {'alice': {'__conf__': {'ANONYMOUS': False}},
+                'bob': {'__conf__': {}}}
+        save_entity_db(self.configuration, 'user', orig, None, 42.0)
+        (entity_map, map_stamp) = load_entity_db(self.configuration, 'user')
+
+        self.assertEqual(entity_map, orig)
+        self.assertEqual(map_stamp, 42.0)
+
+    def test_sectioned_map_round_trip(self):
+        orig = {'__users__': {'alice': {'__allow__': ['Generic']}},
+                '__vgrids__': {'Generic': {'__owners__': []}}}
+        save_entity_db(self.configuration, 'vgrid', orig, None, 42.0,
+                       DUMMY_SECTIONS)
+        (entity_map, _) = load_entity_db(self.configuration, 'vgrid',
+                                         DUMMY_SECTIONS)
+
+        self.assertEqual(entity_map, orig)
+
+    def test_only_dirty_entities_saved(self):
+        orig = {'alice': {'age': 1}, 'bob': {'age': 2}}
+        save_entity_db(self.configuration, 'user', orig, None, 1.0)
+        orig['alice']['age'] = 10
+        orig['bob']['age'] = 20
+        del orig['alice']
+        orig['carol'] = {'age': 3}
+        save_entity_db(self.configuration, 'user', orig,
+                       {FLAT_SECTION: ['alice', 'carol']}, 2.0)
+        (entity_map, map_stamp) = load_entity_db(self.configuration, 'user')
+
+        self.assertEqual(entity_map, {'bob': {'age': 2}, 'carol': {'age': 3}})
+        self.assertEqual(map_stamp, 2.0)
+
+    def test_load_selected_entries(self):
+        orig = {'alice': {'age': 1}, 'bob': {'age': 2}, 'carol': {'age': 3}}
+        save_entity_db(self.configuration, 'user', orig, None, 1.0)
+        entries = load_entity_db_entries(self.configuration, 'user',
+                                         ['alice', 'carol', 'dave'])
+
+        self.assertEqual(entries, {'alice': {'age': 1}, 'carol': {'age': 3}})
+
+
+if __name__ == '__main__':
+    testmain()
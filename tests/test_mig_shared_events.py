@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_events - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test events functions"""
+
+import datetime
+import fnmatch
+import os
+import re
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.shared.events import build_trigger_matcher, match_trigger_rules, \
+    trigger_literal_dir, parse_cron_field, compile_cron_entry, cron_next_fire
+
+VGRID_BASE = '/srv/vgrid_files_home/'
+TARGET_PATHS = [
+    'eScience/*.txt',
+    'eScience/sub/*',
+    'eScience/sub/data-?.csv',
+    'eScience/*/results/*.dat',
+    'eScience/[ab]*/in.txt',
+    'eScience/plain.txt',
+    'eScience-Management/*',
+    '*',
+]
+EVENT_PATHS = [
+    'eScience/notes.txt',
+    'eScience/sub/notes.txt',
+    'eScience/sub/data-1.csv',
+    'eScience/sub/data-10.csv',
+    'eScience/run/results/out.dat',
+    'eScience/run/deep/results/out.dat',
+    'eScience/abc/in.txt',
+    'eScience/cde/in.txt',
+    'eScience/plain.txt',
+    'eScience-Management/minutes.pdf',
+    'Other/readme',
+]
+
+
+def plain_matches(rules_map, src_path):
+    """The original per-event fnmatch matching used in grid_events"""
+    hits = []
+    for (target_path, rule_list) in rules_map.items():
+        recursive_regexp = fnmatch.translate(target_path)
+        direct_regexp = recursive_regexp.replace('.*', '[^/]*')
+        recursive_hit = re.match(recursive_regexp, src_path)
+        direct_hit = re.match(direct_regexp, src_path)
+        if direct_hit or recursive_hit:
+            hits.append((target_path, rule_list, direct_hit is not None))
+    return hits
+
+
+class MigSharedEvents(MigTestCase):
+    """Coverage of the compiled trigger matcher"""
+
+    def test_literal_dir(self):
+        self.assertEqual(trigger_literal_dir('/a/b/*.txt'), '/a/b/')
+        self.assertEqual(trigger_literal_dir('/a/b?/c'), '/a/')
+        self.assertEqual(trigger_literal_dir('/a/[bc]/d'), '/a/')
+        self.assertEqual(trigger_literal_dir('/a/b/c.txt'), '/a/b/')
+        self.assertEqual(trigger_literal_dir('*.txt'), '')
+
+    def test_matcher_agrees_with_plain_matching(self):
+        rules_map = {}
+        for (index, target_path) in enumerate(TARGET_PATHS):
+            rules_map[os.path.join(VGRID_BASE, target_path)] = [
+                {'rule_id': 'rule-%d' % index}]
+        matcher = build_trigger_matcher(rules_map)
+        self.assertEqual(matcher['patterns'], len(TARGET_PATHS))
+        for event_path in EVENT_PATHS:
+            src_path = os.path.join(VGRID_BASE, event_path)
+            self.assertEqual(match_trigger_rules(matcher, src_path),
+                             plain_matches(rules_map, src_path))
+
+    def test_matcher_rebuild_drops_removed_patterns(self):
+        src_path = os.path.join(VGRID_BASE, 'eScience/notes.txt')
+        target_path = os.path.join(VGRID_BASE, 'eScience/*.txt')
+        rules_map = {target_path: [{'rule_id': 'txt'}]}
+        matcher = build_trigger_matcher(rules_map)
+        self.assertEqual(len(match_trigger_rules(matcher, src_path)), 1)
+        del rules_map[target_path]
+        matcher = build_trigger_matcher(rules_map)
+        self.assertEqual(match_trigger_rules(matcher, src_path), [])
+
+
+class MigSharedEventsCron(MigTestCase):
+    """Coverage of the crontab time field helpers"""
+
+    def test_parse_cron_field_syntax(self):
+        self.assertEqual(parse_cron_field('*', 0, 6), set(range(7)))
+        self.assertEqual(parse_cron_field('*/15', 0, 59),
+                         set([0, 15, 30, 45]))
+        self.assertEqual(parse_cron_field('1-10/3,20', 0, 59),
+                         set([1, 4, 7, 10, 20]))
+        self.assertEqual(parse_cron_field('50/5', 0, 59), set([50, 55]))
+        self.assertEqual(parse_cron_field('07', 0, 59), set([7]))
+        for invalid in ['60', '*/0', '5-1', '1-', 'x']:
+            self.assertRaises(ValueError, parse_cron_field, invalid, 0, 59)
+
+    def test_cron_next_fire(self):
+        entry = {'minute': '*/20', 'hour': '9-17', 'dayofmonth': '*',
+                 'month': '*', 'dayofweek': '0-4'}
+        compiled = compile_cron_entry(entry)
+        # Friday 2024-03-01 at 17:50 rolls over the weekend to monday 9:00
+        after = datetime.datetime(2024, 3, 1, 17, 50, 30)
+        self.assertEqual(cron_next_fire(compiled, after),
+                         datetime.datetime(2024, 3, 4, 9, 0))
+        after = datetime.datetime(2024, 3, 4, 9, 0)
+        self.assertEqual(cron_next_fire(compiled, after),
+                         datetime.datetime(2024, 3, 4, 9, 20))
+        leap = compile_cron_entry({'minute': '0', 'hour': '0',
+                                   'dayofmonth': '29', 'month': '2',
+                                   'dayofweek': '*'})
+        self.assertEqual(cron_next_fire(leap, after),
+                         datetime.datetime(2028, 2, 29, 0, 0))
+        never = compile_cron_entry({'minute': '0', 'hour': '0',
+                                    'dayofmonth': '31', 'month': '2',
+                                    'dayofweek': '*'})
+        self.assertEqual(cron_next_fire(never, after), None)
+
+
+if __name__ == '__main__':
+    testmain()
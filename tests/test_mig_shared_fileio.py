@@ -46,6 +46,7 @@ DUMMY_UNICODE = u'UniCode123½¾µßðþđŋħĸþł@ª€£$¥©®'
 DUMMY_UNICODE_LENGTH = len(DUMMY_UNICODE)
 DUMMY_FILE_WRITECHUNK = 'fileio/write_chunk'
 DUMMY_FILE_WRITEFILE = 'fileio/write_file'
+DUMMY_FILE_STREAMFILE = 'fileio/stream_file'
 
 assert isinstance(DUMMY_BYTES, bytes)
 
@@ -210,5 +211,54 @@ class MigSharedFileio__write_file(MigTestCase):
             self.assertEqual(content[:], DUMMY_UNICODE)
 
 
+class MigSharedFileio__stream_file(MigTestCase):
+    """Coverage of the streaming and partial file read helpers"""
+
+    def setUp(self):
+        super(MigSharedFileio__stream_file, self).setUp()
+        self.tmp_path = temppath(DUMMY_FILE_STREAMFILE, self, skip_clean=True)
+        cleanpath(os.path.dirname(DUMMY_FILE_STREAMFILE), self)
+        os.makedirs(os.path.dirname(self.tmp_path))
+        self.lines = ['line %d\n' % i for i in range(1000)]
+        with open(self.tmp_path, 'w') as stream_fd:
+            stream_fd.write(''.join(self.lines))
+
+    def test_stream_file_in_bounded_chunks(self):
+        chunks = list(fileio.stream_file(self.tmp_path, self.logger,
+                                         mode='rb', chunk_size=100))
+
+        self.assertTrue(max([len(chunk) for chunk in chunks]) <= 100)
+        self.assertEqual(b''.join(chunks), ''.join(self.lines).encode())
+
+    def test_stream_file_lines(self):
+        streamed = fileio.stream_file_lines(self.tmp_path, self.logger)
+
+        self.assertEqual(next(streamed), self.lines[0])
+        self.assertEqual(list(streamed), self.lines[1:])
+
+    def test_stream_file_raises_on_missing_file(self):
+        with self.assertRaises(IOError):
+            fileio.stream_file(self.tmp_path + '.missing', self.logger)
+
+    def test_stream_file_opens_lazily(self):
+        if not os.path.isdir('/proc/self/fd'):
+            self.skipTest("no /proc/self/fd to count open files")
+        fds_before = len(os.listdir('/proc/self/fd'))
+        streams = [fileio.stream_file_lines(self.tmp_path, self.logger) for
+                   _ in range(100)]
+
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds_before)
+        for streamed in streams:
+            self.assertEqual(list(streamed), self.lines)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds_before)
+
+    def test_read_head_and_tail_lines(self):
+        head = fileio.read_head_lines(self.tmp_path, 3, self.logger)
+        tail = fileio.read_tail_lines(self.tmp_path, 3, self.logger)
+
+        self.assertEqual(head, self.lines[:3])
+        self.assertEqual(tail, self.lines[-3:])
+
+
 if __name__ == '__main__':
     testmain()
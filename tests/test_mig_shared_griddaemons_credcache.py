@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_griddaemons_credcache - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test the shared verified credential cache"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.griddaemons.credcache import CredentialCache, \
+    get_hash_cache
+from mig.shared.pwcrypto import check_hash
+
+USER = 'alice@example.org'
+PASSWORD = 'Cache.Test.Pw-42'
+HASHED = 'PBKDF2$sha256$10000$c2FsdHNhbHRzYWx0$ZGVyaXZlZGRlcml2ZWQ='
+OTHER_HASHED = 'PBKDF2$sha256$10000$b3RoZXJvdGhlcm90$ZGVyaXZlZGRlcml2ZWQ='
+
+
+class FakeCredCacheConfiguration(object):
+    """The configuration values used by the credential cache"""
+
+    def __init__(self, logger, run_dir, backend='shared'):
+        self.logger = logger
+        self.mig_system_run = run_dir
+        self.site_crypto_salt = '084528A93A4E0A40905609A729394F5C'
+        self.site_credential_cache_backend = backend
+
+
+class MigSharedGriddaemonsCredcache(MigTestCase):
+    """Exercise the local and shared cache levels"""
+
+    def setUp(self):
+        super(MigSharedGriddaemonsCredcache, self).setUp()
+        run_dir = temppath('credcache', self)
+        os.makedirs(run_dir)
+        self.configuration = FakeCredCacheConfiguration(self.logger, run_dir)
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        super(MigSharedGriddaemonsCredcache, self).tearDown()
+
+    def new_cache(self, **kwargs):
+        cache = CredentialCache(self.configuration, **kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def test_lookup_requires_exact_credentials(self):
+        cache = self.new_cache()
+        self.assertFalse(cache.lookup('davs', USER, PASSWORD, HASHED))
+        cache.store('davs', USER, PASSWORD, HASHED)
+        self.assertTrue(cache.lookup('davs', USER, PASSWORD, HASHED))
+        self.assertFalse(cache.lookup('davs', USER, PASSWORD + 'x', HASHED))
+        self.assertFalse(cache.lookup('sftp', USER, PASSWORD, HASHED))
+        # A changed password hash in the user files must never hit
+        self.assertFalse(cache.lookup('davs', USER, PASSWORD, OTHER_HASHED))
+
+    def test_shared_between_processes_and_invalidate(self):
+        first, second = self.new_cache(), self.new_cache()
+        first.store('davs', USER, PASSWORD, HASHED)
+        self.assertTrue(second.lookup('davs', USER, PASSWORD, HASHED))
+        self.assertEqual(second.stats()['shared_hits'], 1)
+        first.invalidate_user(USER)
+        third = self.new_cache()
+        self.assertFalse(first.lookup('davs', USER, PASSWORD, HASHED))
+        self.assertFalse(third.lookup('davs', USER, PASSWORD, HASHED))
+
+    def test_bounded_and_ttl(self):
+        cache = self.new_cache(max_entries=3, shared=False)
+        for i in range(5):
+            cache.store('davs', USER, '%s-%d' % (PASSWORD, i), HASHED)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.stats()['evictions'], 2)
+        self.assertFalse(cache.lookup('davs', USER, '%s-0' % PASSWORD,
+                                      HASHED))
+        self.assertTrue(cache.lookup('davs', USER, '%s-4' % PASSWORD,
+                                     HASHED))
+        expired = self.new_cache(ttl=-1)
+        expired.store('davs', USER, PASSWORD, HASHED)
+        self.assertFalse(expired.lookup('davs', USER, PASSWORD, HASHED))
+        expired.expire()
+        self.assertEqual(len(expired), 0)
+
+    def test_check_hash_uses_cache_and_stats(self):
+        cache = self.new_cache()
+        cache.record_compute(0.5)
+        cache.store('davs', USER, PASSWORD, HASHED)
+        # NOTE: a hit returns before any policy check or hash derivation
+        self.assertTrue(check_hash(self.configuration, 'davs', USER,
+                                   PASSWORD, HASHED, cache))
+        self.assertFalse(cache.lookup('davs', USER, 'wrong', HASHED))
+        stats = cache.stats()
+        self.assertEqual(stats['local_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['saved_secs'], 0.5)
+
+    def test_get_hash_cache_backends(self):
+        self.configuration.site_credential_cache_backend = 'dict'
+        self.assertEqual(get_hash_cache(self.configuration), {})
+        self.configuration.site_credential_cache_backend = 'shared'
+        cache = get_hash_cache(self.configuration)
+        self.caches.append(cache)
+        self.assertTrue(isinstance(cache, CredentialCache))
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_griddaemons_login - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+"""Unit test the griddaemons login store helpers"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.shared.griddaemons.login import Login, LoginStore, \
+    add_user_object, get_login_store, login_map_lookup, update_login_map
+
+USER = 'alice@example.org'
+OTHER_USER = 'bob@example.org'
+
+
+class FakeLoginConfiguration(object):
+    """The configuration values used by the login helpers"""
+
+    def __init__(self, logger):
+        self.daemon_conf = {'logger': logger, 'login_store': LoginStore(),
+                            'login_map': {}}
+
+
+class MigSharedGriddaemonsLogin(MigTestCase):
+    """Wrap unit tests for the login store"""
+
+    def setUp(self):
+        super(MigSharedGriddaemonsLogin, self).setUp()
+        self.configuration = FakeLoginConfiguration(self.logger)
+        self.daemon_conf = self.configuration.daemon_conf
+
+    def test_remove_keeps_other_logins(self):
+        add_user_object(self.configuration, USER, USER, password='pw')
+        add_user_object(self.configuration, USER, USER, digest='digest')
+        add_user_object(self.configuration, OTHER_USER, OTHER_USER,
+                        password='pw')
+        login_store = self.daemon_conf['login_store']
+
+        login_store.remove('users', USER, keep=lambda i: i.password is None)
+
+        self.assertEqual([i.digest for i in login_store.get('users', USER)],
+                         ['digest'])
+        self.assertEqual(len(login_store.get('users', OTHER_USER)), 1)
+
+    def test_update_login_map_installs_new_lists(self):
+        add_user_object(self.configuration, USER, USER, password='pw')
+        update_login_map(self.daemon_conf, [USER])
+        before = login_map_lookup(self.daemon_conf, USER)
+
+        self.daemon_conf['login_store'].remove('users', USER)
+        update_login_map(self.daemon_conf, [USER])
+
+        self.assertEqual(len(before), 1)
+        self.assertEqual(login_map_lookup(self.daemon_conf, USER), [])
+        self.assertEqual(login_map_lookup(self.daemon_conf, OTHER_USER), [])
+
+    def test_legacy_lists_are_imported(self):
+        share = Login(self.configuration, 'share-id', 'owner/dir',
+                      password='pw')
+        daemon_conf = {'users': [], 'shares': [share]}
+
+        login_store = get_login_store(daemon_conf)
+
+        self.assertIs(daemon_conf['login_store'], login_store)
+        self.assertEqual(login_store.get('shares', 'share-id'), [share])
+        self.assertEqual(login_store.count('users'), 0)
+
+
+if __name__ == '__main__':
+    testmain()
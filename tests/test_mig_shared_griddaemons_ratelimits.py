@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_griddaemons_ratelimits - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test grid daemon rate limit functions for both backends"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.griddaemons.ratelimitmap import close_rate_limit_maps, \
+    map_rate_limit_entries
+from mig.shared.griddaemons.ratelimits import hit_rate_limit, \
+    update_rate_limit, expire_rate_limit
+
+PROTO = 'sftp'
+ADDRESS = '10.0.0.1'
+OTHER_ADDRESS = '10.0.0.2'
+USER = 'alice@example.org'
+
+
+class FakeRateLimitConfiguration(object):
+    """The configuration values used by the rate limit functions"""
+
+    def __init__(self, logger, run_dir, backend):
+        self.logger = logger
+        self.mig_system_run = run_dir
+        self.site_rate_limit_backend = backend
+
+
+class MigSharedGriddaemonsRatelimits(MigTestCase):
+    """Run the same login sequences against the pickle and mmap backends"""
+
+    def setUp(self):
+        super(MigSharedGriddaemonsRatelimits, self).setUp()
+        self.configs = {}
+        for backend in ('pickle', 'mmap'):
+            run_dir = temppath('ratelimits-%s' % backend, self)
+            os.makedirs(run_dir)
+            self.configs[backend] = FakeRateLimitConfiguration(
+                self.logger, run_dir, backend)
+
+    def tearDown(self):
+        close_rate_limit_maps()
+        super(MigSharedGriddaemonsRatelimits, self).tearDown()
+
+    def update_both(self, *args, **kwargs):
+        results = [update_rate_limit(self.configs[backend], PROTO, *args,
+                                     **kwargs) for backend in
+                   ('pickle', 'mmap')]
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def hit_both(self, *args, **kwargs):
+        results = [hit_rate_limit(self.configs[backend], PROTO, *args,
+                                  **kwargs) for backend in ('pickle', 'mmap')]
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_failures_count_distinct_secrets(self):
+        self.assertEqual(self.update_both(ADDRESS, USER, False, 'bad-1'),
+                         (1, 1, 1, 1))
+        self.assertEqual(self.update_both(ADDRESS, USER, False, 'bad-1'),
+                         (1, 1, 1, 2))
+        self.assertEqual(self.update_both(ADDRESS, 'bob', False, 'bad-2'),
+                         (2, 2, 1, 1))
+        self.assertEqual(self.update_both(OTHER_ADDRESS, USER, False,
+                                          'bad-1'), (1, 1, 1, 1))
+        for secret in range(2, 6):
+            self.update_both(ADDRESS, USER, False, 'bad-%d' % secret)
+        self.assertTrue(self.hit_both(ADDRESS, USER, max_user_hits=5))
+        self.assertFalse(self.hit_both(OTHER_ADDRESS, USER, max_user_hits=5))
+
+    def test_success_clears_user_limits(self):
+        self.update_both(ADDRESS, USER, False, 'bad-1')
+        self.update_both(ADDRESS, 'bob', False, 'bad-2')
+        self.assertEqual(self.update_both(ADDRESS, USER, True, 'good'),
+                         (1, 1, 0, 0))
+        self.assertEqual(self.update_both(ADDRESS, 'bob', True, 'good'),
+                         (0, 0, 0, 0))
+        self.assertEqual(map_rate_limit_entries(self.configs['mmap'],
+                                                PROTO), (0, 0))
+
+    def test_secret_overflow_keeps_counting(self):
+        for secret in range(20):
+            self.update_both(ADDRESS, USER, False, 'bad-%d' % secret)
+        mmap_result = update_rate_limit(self.configs['mmap'], PROTO, ADDRESS,
+                                        USER, False, 'bad-20')
+        self.assertEqual(mmap_result, (21, 21, 21, 1))
+
+    def test_success_without_failures_records_nothing(self):
+        self.update_both(ADDRESS, USER, False, 'bad-1')
+        self.assertEqual(self.update_both(ADDRESS, 'bob', True, 'good'),
+                         (1, 1, 0, 0))
+        self.assertEqual(map_rate_limit_entries(self.configs['mmap'],
+                                                PROTO), (1, 1))
+
+    def test_full_table_keeps_limiting(self):
+        configuration = self.configs['mmap']
+        # Fail from enough addresses to fill every stripe of the table
+        for i in range(6000):
+            update_rate_limit(configuration, PROTO, '10.1.%d.%d' %
+                              (i // 256, i % 256), 'user-%d' % i, False,
+                              'bad')
+        for secret in range(3):
+            update_rate_limit(configuration, PROTO, ADDRESS, USER, False,
+                              'bad-%d' % secret)
+        self.assertTrue(hit_rate_limit(configuration, PROTO, ADDRESS, USER,
+                                       max_user_hits=3))
+        # Address records are never evicted so new clients are refused
+        self.assertTrue(hit_rate_limit(configuration, PROTO, '10.9.9.9',
+                                       'newcomer', max_user_hits=3))
+
+    def test_expire_removes_old_entries(self):
+        self.update_both(ADDRESS, USER, False, 'bad-1')
+        self.update_both(ADDRESS, USER, False, 'bad-1')
+        self.update_both(ADDRESS, 'bob', False, 'bad-2')
+        for backend in ('pickle', 'mmap'):
+            self.assertEqual(expire_rate_limit(self.configs[backend], PROTO,
+                                               fail_cache=-1, expire_delay=0),
+                             2)
+            self.assertEqual(update_rate_limit(self.configs[backend], PROTO,
+                                               ADDRESS, USER, False, 'bad-1'),
+                             (1, 1, 1, 1))
+        self.assertEqual(map_rate_limit_entries(self.configs['mmap'],
+                                                PROTO), (1, 1))
+
+
+if __name__ == '__main__':
+    testmain()
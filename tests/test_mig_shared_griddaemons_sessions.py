@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_griddaemons_sessions - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test grid daemon session tracking functions for both backends"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.defaults import io_session_timeout
+from mig.shared.griddaemons.sessiondb import close_session_dbs
+from mig.shared.griddaemons.sessions import clear_sessions, \
+    track_open_session, track_close_session, track_close_session_list, \
+    track_close_expired_sessions, get_active_session, get_open_sessions, \
+    active_sessions, get_session_stats, reset_session_stats
+
+PROTO = 'dummy'
+USER = 'alice@example.org'
+OTHER_USER = 'bob@example.org'
+BACKENDS = ('pickle', 'sqlite')
+
+
+class FakeSessionConfiguration(object):
+    """The configuration values used by the session functions"""
+
+    def __init__(self, logger, run_dir, backend):
+        self.logger = logger
+        self.mig_system_run = run_dir
+        self.site_session_backend = backend
+
+
+class MigSharedGriddaemonsSessions(MigTestCase):
+    """Run the same session sequences against the pickle and sqlite
+    backends.
+    """
+
+    def setUp(self):
+        super(MigSharedGriddaemonsSessions, self).setUp()
+        self.configs = {}
+        for backend in BACKENDS:
+            run_dir = temppath('sessions-%s' % backend, self)
+            os.makedirs(run_dir)
+            self.configs[backend] = FakeSessionConfiguration(
+                self.logger, run_dir, backend)
+            clear_sessions(self.configs[backend], PROTO)
+        reset_session_stats()
+
+    def tearDown(self):
+        close_session_dbs()
+        io_session_timeout.pop(PROTO, None)
+        super(MigSharedGriddaemonsSessions, self).tearDown()
+
+    def open_all(self, configuration):
+        """Open a few sessions for two users"""
+        for port in range(3):
+            track_open_session(configuration, PROTO, USER, '10.0.0.1',
+                               2000 + port, authorized=True)
+        track_open_session(configuration, PROTO, OTHER_USER, '10.0.0.2',
+                           3000, session_id='custom-id')
+
+    def test_open_and_lookup(self):
+        for backend in BACKENDS:
+            configuration = self.configs[backend]
+            self.open_all(configuration)
+            self.assertEqual(active_sessions(configuration, PROTO, USER), 3)
+            self.assertEqual(
+                active_sessions(configuration, PROTO, OTHER_USER), 1)
+            session = get_active_session(configuration, PROTO, USER,
+                                         '10.0.0.1:2001')
+            self.assertEqual(session['tcp_port'], 2001)
+            self.assertTrue(session['authorized'])
+            self.assertEqual(get_active_session(configuration, PROTO, USER,
+                                                'custom-id'), {})
+            self.assertEqual(sorted(get_open_sessions(configuration,
+                                                      PROTO)),
+                             ['10.0.0.1:2000', '10.0.0.1:2001',
+                              '10.0.0.1:2002', 'custom-id'])
+
+    def test_close(self):
+        for backend in BACKENDS:
+            configuration = self.configs[backend]
+            self.open_all(configuration)
+            session = get_active_session(configuration, PROTO, USER,
+                                         '10.0.0.1:2000')
+            # A stale timestamp must leave a reopened session alone
+            track_close_session(configuration, PROTO, USER, '10.0.0.1',
+                                2000, timestamp=session['timestamp'] - 1)
+            self.assertEqual(active_sessions(configuration, PROTO, USER), 3)
+            closed = track_close_session(configuration, PROTO, USER,
+                                         '10.0.0.1', 2000,
+                                         timestamp=session['timestamp'])
+            self.assertEqual(closed['session_id'], '10.0.0.1:2000')
+            self.assertEqual(track_close_session(
+                configuration, PROTO, USER, '10.0.0.1', 2000), {})
+            closed = track_close_session_list(
+                configuration, PROTO,
+                list(get_open_sessions(configuration, PROTO,
+                                       client_id=USER).values()))
+            self.assertEqual(sorted([i['session_id'] for i in closed]),
+                             ['10.0.0.1:2001', '10.0.0.1:2002'])
+            self.assertEqual(active_sessions(configuration, PROTO, USER), 0)
+            self.assertEqual(
+                active_sessions(configuration, PROTO, OTHER_USER), 1)
+
+    def test_close_expired(self):
+        for backend in BACKENDS:
+            configuration = self.configs[backend]
+            self.open_all(configuration)
+            io_session_timeout[PROTO] = 3600
+            self.assertEqual(track_close_expired_sessions(configuration,
+                                                          PROTO), {})
+            io_session_timeout[PROTO] = -1
+            closed = track_close_expired_sessions(configuration, PROTO,
+                                                  client_id=OTHER_USER)
+            self.assertEqual(list(closed), ['custom-id'])
+            closed = track_close_expired_sessions(configuration, PROTO)
+            self.assertEqual(len(closed), 3)
+            self.assertEqual(get_open_sessions(configuration, PROTO), {})
+
+    def test_latency_stats(self):
+        configuration = self.configs['sqlite']
+        self.open_all(configuration)
+        track_close_session(configuration, PROTO, OTHER_USER, '10.0.0.2',
+                            3000, session_id='custom-id')
+        stats = get_session_stats()
+        self.assertEqual(stats['open']['count'], 4)
+        self.assertEqual(stats['close']['count'], 1)
+        self.assertTrue(stats['open']['max'] >= stats['open']['average'])
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_gridscriptchannel - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test gridscriptchannel functions"""
+
+import os
+import socket
+import sys
+import threading
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.fileio import send_message_to_grid_script
+from mig.shared.gridscriptchannel import CommandChannel, send_commands, \
+    recv_frame
+
+
+class FakeGridScriptConfiguration(object):
+    """The configuration values used to send grid_script commands"""
+
+    def __init__(self, grid_socket, grid_stdin):
+        self.grid_socket = grid_socket
+        self.grid_stdin = grid_stdin
+
+
+class MigSharedGridscriptchannel(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedGridscriptchannel, self).setUp()
+        base_dir = temppath('gridchan', self)
+        os.makedirs(base_dir)
+        self.socket_path = os.path.join(base_dir, 'server.sock')
+        self.channel = CommandChannel(self.socket_path, self.logger,
+                                      max_frame=1024)
+        self.channel.start()
+
+    def tearDown(self):
+        self.channel.close()
+        super(MigSharedGridscriptchannel, self).tearDown()
+
+    def test_batch_is_acknowledged_and_queued_in_order(self):
+        accepted = send_commands(self.socket_path,
+                                 ['USERJOBFILE user/1_job\n', '',
+                                  'SHUTDOWN\nJOBQUEUEINFO'])
+
+        self.assertEqual(accepted, 3)
+        self.assertEqual([self.channel.get(1) for _ in range(3)],
+                         ['USERJOBFILE user/1_job', 'SHUTDOWN',
+                          'JOBQUEUEINFO'])
+        self.assertIsNone(self.channel.get(0.01))
+
+    def test_oversized_batch_is_refused(self):
+        with self.assertRaises(ValueError):
+            send_commands(self.socket_path, ['JOBQUEUEINFO %s' % ('x' * 2048)])
+
+        self.assertIsNone(self.channel.get(0.01))
+
+
+    def test_unacknowledged_command_not_resent_on_pipe(self):
+        socket_path = self.socket_path + '.mute'
+        grid_stdin = self.socket_path + '.stdin'
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(socket_path)
+        server.listen(1)
+        received = []
+
+        def __read_and_hang_up():
+            """Read a frame and close without acknowledging it"""
+            (conn, _) = server.accept()
+            received.append(recv_frame(conn))
+            conn.close()
+        mute = threading.Thread(target=__read_and_hang_up)
+        mute.start()
+        configuration = FakeGridScriptConfiguration(socket_path, grid_stdin)
+
+        self.assertFalse(send_message_to_grid_script('USERJOBFILE user/1_job',
+                                                     self.logger,
+                                                     configuration))
+        mute.join()
+        self.assertEqual(received, [b'USERJOBFILE user/1_job'])
+        self.assertFalse(os.path.exists(grid_stdin))
+
+
+if __name__ == '__main__':
+    testmain()
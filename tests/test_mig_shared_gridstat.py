@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_gridstat - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test gridstat functions"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.fileio import pickle
+from mig.shared.gridstat import GridStat
+from mig.shared.jobevents import log_job_event
+
+
+class FakeGridStatConfiguration(object):
+    """The configuration values used by the gridstat functions"""
+
+    def __init__(self, logger, base_dir):
+        self.logger = logger
+        self.mrsl_files_dir = os.path.join(base_dir, 'mrsl_files') + os.sep
+        self.gridstat_files_dir = os.path.join(base_dir,
+                                               'gridstat_files') + os.sep
+
+
+class MigSharedGridStat(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedGridStat, self).setUp()
+        self.configuration = FakeGridStatConfiguration(
+            self.logger, temppath('gridstat', self))
+        os.makedirs(os.path.join(self.configuration.mrsl_files_dir, 'user'))
+        os.makedirs(self.configuration.gridstat_files_dir)
+
+    def _write_job(self, job_id, modified):
+        job_path = os.path.join(self.configuration.mrsl_files_dir, 'user',
+                                '%s.mRSL' % job_id)
+        job_dict = {'JOB_ID': job_id, 'STATUS': 'CANCELED', 'NODECOUNT': 1,
+                    'CPUTIME': 60, 'CPUCOUNT': 1, 'DISK': 1, 'MEMORY': 1,
+                    'RUNTIMEENVIRONMENT': []}
+        pickle(job_dict, job_path, self.logger)
+        os.utime(job_path, (modified, modified))
+        return job_path
+
+    def _canceled(self):
+        grid_stat = GridStat(self.configuration, self.logger)
+        return grid_stat.get_value(grid_stat.VGRID, 'GENERIC', 'CANCELED')
+
+    def test_full_walk_catches_changes_missed_by_partial_updates(self):
+        grid_stat = GridStat(self.configuration, self.logger)
+        self.assertTrue(grid_stat.update(full_walk=True))
+        now = time.time()
+        evented_path = self._write_job('evented', now - 50)
+        log_job_event(self.configuration, evented_path, 'CANCELED')
+        self.assertTrue(grid_stat.update())
+        self.assertEqual(self._canceled(), 1)
+
+        # A change without an event after the full walk but before the
+        # partial update
+        self._write_job('silent', now - 50)
+        for (name, stamp) in (('walktimestamp', now - 100),
+                              ('timestamp', now - 10)):
+            stamp_path = os.path.join(self.configuration.gridstat_files_dir,
+                                      'buildcache.%s' % name)
+            os.utime(stamp_path, (stamp, stamp))
+
+        self.assertTrue(grid_stat.update(full_walk=True))
+        self.assertEqual(self._canceled(), 2)
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_jobevents - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test jobevents functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.jobevents import log_job_event, read_job_events, \
+    compact_job_events, load_job_events_offset, job_events_size
+
+
+class FakeJobEventsConfiguration(object):
+    """The configuration values used by the job event functions"""
+
+    def __init__(self, logger, base_dir):
+        self.logger = logger
+        self.mrsl_files_dir = os.path.join(base_dir, 'mrsl_files') + os.sep
+        self.gridstat_files_dir = os.path.join(base_dir,
+                                               'gridstat_files') + os.sep
+
+
+class MigSharedJobEvents(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedJobEvents, self).setUp()
+        self.configuration = FakeJobEventsConfiguration(
+            self.logger, temppath('jobevents', self))
+        os.makedirs(self.configuration.gridstat_files_dir)
+
+    def _job_path(self, job_id):
+        return os.path.join(self.configuration.mrsl_files_dir, 'user',
+                            '%s.mRSL' % job_id)
+
+    def test_read_events_incrementally(self):
+        self.assertEqual(read_job_events(self.configuration, 0), ([], 0))
+        self.assertEqual(load_job_events_offset(self.configuration), None)
+        log_job_event(self.configuration, self._job_path('a'), 'QUEUED')
+        log_job_event(self.configuration, self._job_path('b'), 'QUEUED')
+        (events, offset) = read_job_events(self.configuration, 0)
+        self.assertEqual([(status, path) for (_, status, path) in events],
+                         [('QUEUED', self._job_path('a')),
+                          ('QUEUED', self._job_path('b'))])
+        self.assertEqual(offset, job_events_size(self.configuration))
+
+        log_job_event(self.configuration, self._job_path('a'), 'EXECUTING')
+        (events, next_offset) = read_job_events(self.configuration, offset)
+        self.assertEqual([(status, path) for (_, status, path) in events],
+                         [('EXECUTING', self._job_path('a'))])
+        self.assertEqual(read_job_events(self.configuration, next_offset),
+                         ([], next_offset))
+
+    def test_compact_keeps_unconsumed_events(self):
+        log_job_event(self.configuration, self._job_path('a'), 'QUEUED')
+        (_, offset) = read_job_events(self.configuration, 0)
+        log_job_event(self.configuration, self._job_path('b'), 'QUEUED')
+
+        # Small streams are left alone and just get the offset saved
+        self.assertEqual(compact_job_events(self.configuration, offset),
+                         offset)
+        self.assertEqual(load_job_events_offset(self.configuration), offset)
+
+        self.assertEqual(compact_job_events(self.configuration, offset, 0),
+                         0)
+        self.assertEqual(load_job_events_offset(self.configuration), 0)
+        log_job_event(self.configuration, self._job_path('c'), 'FINISHED')
+        (events, _) = read_job_events(self.configuration, 0)
+        self.assertEqual([path for (_, _, path) in events],
+                         [self._job_path('b'), self._job_path('c')])
+
+        # A stale offset beyond the end after interrupted compaction
+        (events, _) = read_job_events(self.configuration, 10 * offset)
+        self.assertEqual(len(events), 2)
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_notifyspool - unit test of the corresponding mig shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test notifyspool functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.notification import send_system_notifications
+from mig.shared.notifyspool import NotifySpool, encode_notification, \
+    is_spool_segment, read_spool_segment
+
+TEST_USER_ID = '/C=DK/CN=Test User/emailAddress=test@example.com'
+
+
+class FakeSpoolConfiguration(object):
+    """The configuration values used by the notification spool"""
+
+    def __init__(self, logger, notify_home):
+        self.logger = logger
+        self.notify_home = notify_home
+        self.site_enable_notify = True
+
+
+class MigSharedNotifyspool(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedNotifyspool, self).setUp()
+        self.notify_home = temppath('notify_home', self)
+        os.makedirs(self.notify_home)
+
+    def _segments(self):
+        return sorted([os.path.join(self.notify_home, i) for i in
+                       os.listdir(self.notify_home)])
+
+    def test_batch_in_one_segment_with_partial_tail(self):
+        configuration = FakeSpoolConfiguration(self.logger, self.notify_home)
+        batch = [(TEST_USER_ID, ['SFTP', 'ERROR'], 'message %d' % i) for i
+                 in range(100)]
+
+        self.assertTrue(send_system_notifications(batch, configuration))
+        self.assertTrue(send_system_notifications(batch[:1], configuration))
+
+        segments = self._segments()
+        self.assertEqual(len(segments), 1)
+        self.assertTrue(is_spool_segment(segments[0]))
+        complete_size = os.path.getsize(segments[0])
+        with open(segments[0], 'ab') as segment_fd:
+            segment_fd.write(encode_notification(TEST_USER_ID, [], 'x')[:7])
+        (notifications, offset) = read_spool_segment(segments[0])
+        self.assertEqual(len(notifications), 101)
+        self.assertEqual(offset, complete_size)
+        self.assertEqual(notifications[42]['message'], 'message 42')
+        self.assertEqual(notifications[42]['category'], ['SFTP', 'ERROR'])
+        self.assertEqual(read_spool_segment(segments[0], offset)[0], [])
+
+    def test_rotate_full_segments(self):
+        spool = NotifySpool(self.notify_home, max_bytes=1)
+        try:
+            for i in range(3):
+                spool.append([encode_notification(TEST_USER_ID, ['SFTP'],
+                                                  'message %d' % i)])
+        finally:
+            spool.close()
+
+        segments = self._segments()
+        self.assertEqual(len(segments), 3)
+        messages = [read_spool_segment(i)[0][0]['message'] for i in segments]
+        self.assertEqual(sorted(messages),
+                         ['message 0', 'message 1', 'message 2'])
+
+    def test_corrupt_record_skipped(self):
+        records = [encode_notification(TEST_USER_ID, ['SFTP'],
+                                       'message %d' % i) for i in range(3)]
+        bogus = b'\xff' * (len(records[1]) - 4)
+        records[1] = records[1][:4] + bogus
+        segment_path = os.path.join(self.notify_home, 'corrupt.spool')
+        with open(segment_path, 'wb') as segment_fd:
+            segment_fd.write(b''.join(records))
+
+        (notifications, offset) = read_spool_segment(segment_path,
+                                                     logger=self.logger)
+        self.assertEqual([i['message'] for i in notifications],
+                         ['message 0', 'message 2'])
+        self.assertEqual(offset, os.path.getsize(segment_path))
+        self.assertEqual(len(self.logger.channels_dict['error']), 1)
+
+    def test_invalid_category_rejected(self):
+        configuration = FakeSpoolConfiguration(self.logger, self.notify_home)
+
+        self.assertFalse(send_system_notifications(
+            [(TEST_USER_ID, 'SFTP', 'message')], configuration))
+        self.assertEqual(self._segments(), [])
+
+
+if __name__ == '__main__':
+    testmain()
@@ -50,5 +50,42 @@ class BasicSerial(MigTestCase):
         data = load(tmp_path)
         self.assertEqual(data, orig, "mismatch pickling string")
 
+
+class PickleProtocolSerial(MigTestCase):
+    BASIC_OBJECT = BasicSerial.BASIC_OBJECT
+
+    def tearDown(self):
+        set_pickle_protocol(LEGACY_PROTOCOL)
+        super(PickleProtocolSerial, self).tearDown()
+
+    def test_default_is_legacy_protocol(self):
+        self.assertEqual(get_pickle_protocol(), LEGACY_PROTOCOL)
+        self.assertNotEqual(dumps([])[:1], b'\x80')
+
+    def test_parse_named_protocols(self):
+        self.assertEqual(parse_pickle_protocol('legacy'), LEGACY_PROTOCOL)
+        self.assertEqual(parse_pickle_protocol('compat'), COMPAT_PROTOCOL)
+        self.assertEqual(parse_pickle_protocol('highest'), HIGHEST_PROTOCOL)
+        self.assertEqual(parse_pickle_protocol('1'), 1)
+
+    def test_parse_invalid_protocol(self):
+        self.assertRaises(ValueError, parse_pickle_protocol, 'bogus')
+        self.assertRaises(ValueError, parse_pickle_protocol,
+                          HIGHEST_PROTOCOL + 1)
+
+    def test_policy_protocol_used_in_dumps(self):
+        set_pickle_protocol('compat')
+        self.assertEqual(dumps([])[:2], b'\x80\x02')
+        self.assertNotEqual(dumps([], LEGACY_PROTOCOL)[:1], b'\x80')
+
+    def test_legacy_file_read_with_new_policy(self):
+        tmp_path = temppath("dummyserial.tmp", self)
+        orig = PickleProtocolSerial.BASIC_OBJECT
+        dump(orig, tmp_path)
+        set_pickle_protocol('highest')
+        data = load(tmp_path)
+        self.assertEqual(data, orig, "mismatch reading legacy pickle")
+
+
 if __name__ == '__main__':
     testmain()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_transferfunctions - unit test of the corresponding mig
+# shared module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test transferfunctions functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.shared.transferfunctions import add_worker_transfer, \
+    schedule_worker_transfers
+
+
+class MigSharedTransferFunctions(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def test_schedule_respects_user_and_global_limits(self):
+        all_workers = {}
+        add_worker_transfer(None, all_workers, 'alice', 'running', 'worker')
+        queued = [('alice', 'a1'), ('alice', 'a2'), ('bob', 'b1'),
+                  ('bob', 'b2'), ('carol', 'c1')]
+        (launch, waiting) = schedule_worker_transfers(None, queued,
+                                                      all_workers, 4, 2)
+        self.assertEqual(launch, [('alice', 'a1'), ('bob', 'b1'),
+                                  ('bob', 'b2')])
+        self.assertEqual(waiting, [('alice', 'a2'), ('carol', 'c1')])
+
+    def test_schedule_without_limits(self):
+        queued = [('alice', 'a%d' % i) for i in range(10)]
+        (launch, waiting) = schedule_worker_transfers(None, queued, {}, 0, 0)
+        self.assertEqual(launch, queued)
+        self.assertEqual(waiting, [])
+
+
+if __name__ == '__main__':
+    testmain()
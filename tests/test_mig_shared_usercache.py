@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_usercache - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test usercache functions"""
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.base import client_id_dir
+from mig.shared.usercache import refresh_disk_stats, mark_disk_stats_path, \
+    OWN, VGRID, FILES, DIRECTORIES, BYTES
+
+CLIENT_ID = '/C=DK/CN=Test User/emailAddress=test@example.org'
+
+
+class FakeUserCacheConfiguration(object):
+    """The configuration values used by the user cache functions"""
+
+    def __init__(self, logger, base_dir):
+        self.logger = logger
+        self.user_home = os.path.join(base_dir, 'user_home')
+        self.user_cache = os.path.join(base_dir, 'user_cache')
+
+
+def write_bytes(path, size):
+    """Create file at path with size bytes"""
+    with open(path, 'w') as file_fd:
+        file_fd.write('x' * size)
+
+
+class MigSharedUsercache(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def setUp(self):
+        super(MigSharedUsercache, self).setUp()
+        base_dir = temppath('usercache', self)
+        self.configuration = FakeUserCacheConfiguration(self.logger,
+                                                        base_dir)
+        self.user_base = os.path.join(self.configuration.user_home,
+                                      client_id_dir(CLIENT_ID))
+        self.vgrid_base = os.path.join(base_dir, 'vgrid_files_home', 'shared')
+        os.makedirs(os.path.join(self.user_base, 'sub', 'deep'))
+        os.makedirs(self.vgrid_base)
+        os.makedirs(self.configuration.user_cache)
+        os.symlink(self.vgrid_base, os.path.join(self.user_base, 'shared'))
+        write_bytes(os.path.join(self.user_base, 'top.txt'), 10)
+        write_bytes(os.path.join(self.user_base, 'sub', 'deep', 'a.txt'), 20)
+        write_bytes(os.path.join(self.vgrid_base, 'v.txt'), 30)
+
+    def _full_stats(self):
+        """Fresh stats from a full rebuild"""
+        return refresh_disk_stats(self.configuration, CLIENT_ID,
+                                  full_rebuild=True)
+
+    def test_changed_dirs_match_full_rebuild(self):
+        stats = self._full_stats()
+        self.assertEqual(stats[OWN][FILES], 2)
+        self.assertEqual(stats[VGRID][FILES], 1)
+
+        # Add a new tree, grow a file and remove a dir behind the back of
+        # the periodic walk and only record the changes
+        new_dir = os.path.join(self.user_base, 'new', 'nested')
+        os.makedirs(new_dir)
+        write_bytes(os.path.join(new_dir, 'b.txt'), 40)
+        write_bytes(os.path.join(self.user_base, 'top.txt'), 15)
+        write_bytes(os.path.join(self.vgrid_base, 'w.txt'), 50)
+        os.remove(os.path.join(self.user_base, 'sub', 'deep', 'a.txt'))
+        os.rmdir(os.path.join(self.user_base, 'sub', 'deep'))
+        for path in (new_dir, os.path.join(self.user_base, 'top.txt'),
+                     os.path.join(self.user_base, 'shared', 'w.txt'),
+                     os.path.join(self.user_base, 'sub', 'deep')):
+            self.assertTrue(mark_disk_stats_path(self.configuration, path))
+
+        before = time.time()
+        stats = refresh_disk_stats(self.configuration, CLIENT_ID)
+        self.assertTrue(stats['time_stamp'] >= int(before) - 1)
+        expected = self._full_stats()
+        for total in (OWN, VGRID):
+            for field in (FILES, DIRECTORIES, BYTES):
+                self.assertEqual(stats[total][field], expected[total][field])
+        self.assertNotIn(os.path.join('sub', 'deep'), stats)
+        self.assertIn(os.path.join('new', 'nested'), stats)
+
+    def test_changes_outside_homes_ignored(self):
+        self.assertFalse(mark_disk_stats_path(self.configuration,
+                                              self.vgrid_base))
+        # Nothing is recorded before the first stats refresh
+        self.assertFalse(mark_disk_stats_path(
+            self.configuration, os.path.join(self.user_base, 'top.txt')))
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_userdbquery - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test userdbquery functions"""
+
+import os
+import random
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, temppath, testmain
+
+from mig.shared.serial import dump
+from mig.shared.userdbquery import UserDBIndex, clear_user_db_index, \
+    load_user_db_index, match_user_filter
+
+NOW = 1700000000
+
+
+def make_user_db(user_count=500):
+    """Build a user DB with a mix of field values and expire values"""
+    rand = random.Random(4242)
+    user_db = {}
+    for i in range(user_count):
+        uid = '/C=DK/O=Org %d/CN=User %d' % (i % 7, i)
+        user_dict = {'distinguished_name': uid, 'full_name': 'User %d' % i,
+                     'organization': 'Org %d' % (i % 7),
+                     'email': 'user%d@org%d.example.org' % (i, i % 7),
+                     'role': rand.choice(['', 'staff', 'student']),
+                     'status': rand.choice(['active', 'suspended'])}
+        if i % 50 == 1:
+            user_dict['expire'] = NOW + 0.5
+        elif i % 50 != 2:
+            user_dict['expire'] = NOW + rand.randint(-100, 100) * 3600
+        user_db[uid] = user_dict
+    return user_db
+
+
+class MigSharedUserdbquery(MigTestCase):
+    """Indexed queries must give the same hits as the full scan"""
+
+    def setUp(self):
+        super(MigSharedUserdbquery, self).setUp()
+        self.user_db = make_user_db()
+        clear_user_db_index()
+
+    def scan(self, search_filter, regex_match=[]):
+        return [uid for (uid, user_dict) in self.user_db.items() if
+                match_user_filter(user_dict, search_filter, regex_match)]
+
+    def test_queries_match_full_scan(self):
+        user_index = UserDBIndex(self.user_db)
+        queries = [
+            ({'distinguished_name': '*'}, []),
+            ({'email': 'user42@org0.example.org'}, []),
+            ({'email': 'user4*@org?.example.org'}, []),
+            ({'organization': 'Org [12]', 'status': 'suspended'}, []),
+            ({'role': 'st(aff|udent)$', 'full_name': 'User 1*'}, ['role']),
+            ({'expire_after': NOW, 'expire_before': NOW + 24 * 3600}, []),
+            ({'expire_before': NOW - 50 * 3600, 'role': 'staff'}, []),
+            ({'email': 'nobody@nowhere'}, []),
+        ]
+        # NOTE: run twice to cover both lazy index build and reuse
+        for (search_filter, regex_match) in queries * 2:
+            hits = [uid for (uid, _) in
+                    user_index.query(search_filter, regex_match)]
+            self.assertEqual(hits, self.scan(search_filter, regex_match))
+
+    def test_cached_index_follows_file_changes(self):
+        db_path = temppath('MiG-users.db', self)
+        dump(self.user_db, db_path)
+        first = load_user_db_index(db_path)
+        self.assertTrue(load_user_db_index(db_path) is first)
+        self.user_db['/C=DK/CN=Newcomer'] = {'email': 'new@example.org'}
+        dump(self.user_db, db_path)
+        second = load_user_db_index(db_path)
+        self.assertFalse(second is first)
+        self.assertEqual(second.query({'email': 'new@example.org'})[0][0],
+                         '/C=DK/CN=Newcomer')
+
+
+if __name__ == '__main__':
+    testmain()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# --- BEGIN_HEADER ---
+#
+# test_mig_shared_workflowindex - unit test of the corresponding mig shared
+# module
+# Copyright (C) 2003-2024  The MiG Project by the Science HPC Center at UCPH
+#
+# This file is part of MiG.
+#
+# MiG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# MiG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+# USA.
+#
+# --- END_HEADER ---
+#
+
+"""Unit test workflowindex functions"""
+
+import os
+import sys
+
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), ".")))
+
+from support import MigTestCase, testmain
+
+from mig.shared.workflowindex import CONF, WorkflowIndex, _scan_map, \
+    _synthetic_map
+
+
+class MigSharedWorkflowIndex(MigTestCase):
+    """Wrap unit tests for the corresponding module"""
+
+    def test_candidates_cover_scan_matches(self):
+        workflow_map = _synthetic_map(300, 7, 11, 13)
+        # An entry without owner and input_paths must never be left out
+        workflow_map['broken'] = {CONF: {'persistence_id': 'broken'}}
+        index = WorkflowIndex(workflow_map)
+        queries = [
+            {},
+            {'client_id': '/C=DK/CN=User 3'},
+            {'vgrid': 'vgrid2'},
+            {'client_id': '/C=DK/CN=User 3', 'vgrid': 'vgrid2'},
+            {'name': 'pattern17'},
+            {'input_paths': ['in/5/*.dat']},
+            {'vgrid': 'vgrid2', 'name': 'no such pattern'},
+        ]
+        for query in queries:
+            kwargs = dict(query)
+            client_id = kwargs.pop('client_id', None)
+            expected = _scan_map(workflow_map, client_id, **kwargs)
+            candidates = index.candidates(client_id, **kwargs)
+            self.assertEqual([key for key in candidates if key in expected],
+                             expected)
+            if kwargs or client_id:
+                self.assertTrue(len(candidates) <= len(expected) + 1)
+        self.assertIn('broken', index.candidates('/C=DK/CN=User 3'))
+        self.assertEqual(index.candidates(vgrid='vgrid2', name='nothing'),
+                         ['broken'])
+        # User queries on persistence_id only compare that and vgrid
+        self.assertEqual(index.candidates(None, True,
+                                          persistence_id='wp00000017',
+                                          name='other'), ['wp00000017'])
+
+    def test_incremental_update(self):
+        workflow_map = _synthetic_map(50, 3, 5, 7)
+        index = WorkflowIndex(workflow_map)
+        workflow_map['wp00000001'][CONF]['vgrid'] = 'moved'
+        del workflow_map['wp00000002']
+        workflow_map['new'] = {CONF: {'persistence_id': 'new',
+                                      'vgrid': 'moved', 'owner': 'me',
+                                      'name': 'new', 'input_paths': []}}
+        index.update(workflow_map, ['wp00000001', 'wp00000002', 'new'])
+        self.assertEqual(index.candidates(vgrid='moved'),
+                         ['wp00000001', 'new'])
+        self.assertEqual(index.candidates(persistence_id='wp00000002'), [])
+        self.assertEqual(len(index), 50)
+        rebuilt = WorkflowIndex(workflow_map)
+        self.assertEqual(index.indexes, rebuilt.indexes)
+        self.assertEqual(index.missing, rebuilt.missing)
+
+    def test_update_catches_unlisted_changes(self):
+        workflow_map = _synthetic_map(50, 3, 5, 7)
+        index = WorkflowIndex(workflow_map)
+        del workflow_map['wp00000002']
+        workflow_map['new'] = {CONF: {'persistence_id': 'new',
+                                      'vgrid': 'moved', 'owner': 'me',
+                                      'name': 'new', 'input_paths': []}}
+        index.update(workflow_map, ['wp00000001'])
+        self.assertEqual(index.candidates(vgrid='moved'), ['new'])
+        self.assertEqual(index.candidates(persistence_id='wp00000002'), [])
+        rebuilt = WorkflowIndex(workflow_map)
+        self.assertEqual(index.indexes, rebuilt.indexes)
+        self.assertEqual(index.missing, rebuilt.missing)
+
+
+if __name__ == '__main__':
+    testmain()